@@ -3,11 +3,13 @@ from urllib.parse import urlencode
 
 from django.conf import settings
 from django.contrib.auth.tokens import default_token_generator
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage
 from django.urls import reverse
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
 
+from notifications.email import send_pooled
+
 logger = logging.getLogger(__name__)
 
 
@@ -54,12 +56,15 @@ def send_verification_email(*, user, request=None) -> bool:
     )
 
     try:
-        send_mail(
-            subject=subject,
-            message=body,
-            from_email=getattr(settings, "DEFAULT_FROM_EMAIL", ""),
-            recipient_list=[user.email],
-            fail_silently=False,
+        send_pooled(
+            [
+                EmailMessage(
+                    subject=subject,
+                    body=body,
+                    from_email=getattr(settings, "DEFAULT_FROM_EMAIL", ""),
+                    to=[user.email],
+                )
+            ]
         )
         return True
     except Exception:
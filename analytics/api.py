@@ -1,14 +1,29 @@
-from rest_framework import permissions
+from django.http import StreamingHttpResponse
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import permissions, status
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from core.metrics import metrics
+
+from .cache import DashboardCache, QueryCache, dashboard_etag
+from .models import AnalyticsRollup
+from .queries import AnalyticsQuery
 from .selectors import (
     get_admin_dashboard,
     get_shop_dashboard,
     get_supplier_dashboard,
+    get_supplier_product_analytics,
 )
 
 
+class AnalyticsQueryPagination(PageNumberPagination):
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+
 class IsShopOwner(permissions.BasePermission):
     def has_permission(self, request, view):
         return bool(
@@ -27,6 +42,18 @@ class IsSupplier(permissions.BasePermission):
         )
 
 
+def _conditional_response(request, data, etag):
+    """Answer 304 when the client already holds `etag`; dashboards are revalidated on every use."""
+    etag = quote_etag(etag)
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(data)
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
 class ShopAnalyticsDashboardView(APIView):
     permission_classes = [permissions.IsAuthenticated, IsShopOwner]
 
@@ -46,18 +73,71 @@ class ShopAnalyticsDashboardView(APIView):
                     "last_7_days": [],
                 }
             )
-        return Response(get_shop_dashboard(shop))
+        data, etag = DashboardCache.get(AnalyticsRollup.Scope.SHOP, shop.id, lambda: get_shop_dashboard(shop))
+        return _conditional_response(request, data, etag)
 
 
 class SupplierAnalyticsDashboardView(APIView):
     permission_classes = [permissions.IsAuthenticated, IsSupplier]
 
     def get(self, request):
-        return Response(get_supplier_dashboard(request.user))
+        user = request.user
+        analytics, _ = DashboardCache.get(
+            AnalyticsRollup.Scope.SUPPLIER,
+            user.id,
+            lambda: get_supplier_product_analytics(user),
+            variant="products",
+        )
+        # pending_payout moves with payouts, not with analytics events, so it is never cached.
+        data = get_supplier_dashboard(user, analytics)
+        return _conditional_response(request, data, dashboard_etag(data))
 
 
 class AdminAnalyticsDashboardView(APIView):
     permission_classes = [permissions.IsAdminUser]
 
     def get(self, request):
-        return Response(get_admin_dashboard())
+        data, etag = DashboardCache.get(AnalyticsRollup.Scope.PLATFORM, "", get_admin_dashboard)
+        return _conditional_response(request, data, etag)
+
+
+class AdminDashboardCacheStatsView(APIView):
+    """Hit, stale and miss counts of the dashboard cache since the process started."""
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({**DashboardCache.hit_ratio(), "counters": metrics.snapshot("analytics.dashboard")})
+
+
+class AnalyticsQueryView(APIView):
+    """
+    Metrics over any window from the rollups: ?start=&end=&granularity=hour|day|month|total
+    &group_by=platform|shop|supplier|product|category&subject=&metrics=&ordering=.
+
+    JSON pages are cached until the next rollup batch; ?file_format=csv|ndjson
+    streams every row instead, for exports.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+    pagination_class = AnalyticsQueryPagination
+
+    def get(self, request):
+        file_format = request.query_params.get("file_format")
+        try:
+            query = AnalyticsQuery.from_params(request.query_params)
+            content_type = query.content_type(file_format) if file_format else None
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if file_format:
+            response = StreamingHttpResponse(query.stream(file_format), content_type=content_type)
+            response["Content-Disposition"] = f'attachment; filename="analytics-{query.group_by}.{file_format}"'
+            return response
+
+        def build():
+            paginator = self.pagination_class()
+            page = paginator.paginate_queryset(query.queryset(), request, view=self)
+            return paginator.get_paginated_response([query.format_row(values) for values in page]).data
+
+        return Response(QueryCache.get(request.query_params.lists(), build))
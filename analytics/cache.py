@@ -0,0 +1,172 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+Builder = Callable[[], Dict[str, Any]]
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _refresh_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="dashboard-refresh")
+    return _executor
+
+
+def _bump(keys: Iterable[str]) -> None:
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Missing (never set or evicted); any value differs from what entries recorded.
+            cache.set(key, int(time.time() * 1000), None)
+
+
+def dashboard_etag(data: Dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class DashboardCache:
+    """
+    Stale-while-revalidate cache of dashboard payloads, one entry per (scope, subject, variant).
+
+    Each entry records the subject's generation when it was built. The rollup
+    worker bumps the generation of every subject it writes (after commit), and
+    rebuilds bump a global generation, so entries go stale exactly when their
+    data changed. Entries are fresh for ANALYTICS_DASHBOARD_FRESH_SECONDS;
+    stale entries are still served for up to ANALYTICS_DASHBOARD_STALE_SECONDS
+    while one request rebuilds them in the background. Hits, stale serves and
+    misses are counted under "analytics.dashboard.*".
+
+    The worker bumps generations from its own process, so invalidation needs
+    a cache shared between processes (CACHE_URL); with a per-process cache
+    entries only expire by time, and check analytics.W001 says so. Payloads
+    of one subject built by different builders are kept apart by `variant`
+    and share the subject's generation.
+    """
+
+    ENTRY_KEY = "analytics:dashboard:{scope}:{subject_id}:{variant}"
+    GENERATION_KEY = "analytics:dashboard:gen:{scope}:{subject_id}"
+    GLOBAL_GENERATION_KEY = "analytics:dashboard:gen"
+    LOCK_KEY = "analytics:dashboard:refresh:{scope}:{subject_id}:{variant}"
+
+    @classmethod
+    def get(cls, scope: str, subject_id: Any, builder: Builder, variant: str = "") -> Tuple[Dict[str, Any], str]:
+        """Return (payload, etag) for the subject, building it with `builder` when needed."""
+        names = {"scope": scope, "subject_id": subject_id or "", "variant": variant}
+        entry_key = cls.ENTRY_KEY.format(**names)
+        generation_key = cls.GENERATION_KEY.format(**names)
+        values = cache.get_many([entry_key, generation_key, cls.GLOBAL_GENERATION_KEY])
+        # The day is part of the generation so "today" and the 7-day series roll over at midnight.
+        generation = (
+            values.get(generation_key, 0),
+            values.get(cls.GLOBAL_GENERATION_KEY, 0),
+            timezone.localdate().isoformat(),
+        )
+        entry = values.get(entry_key)
+
+        if entry is not None:
+            current = tuple(entry["generation"]) == generation
+            if current and time.time() < entry["fresh_until"]:
+                metrics.incr("analytics.dashboard.hit")
+                return entry["data"], entry["etag"]
+            if cls._background_refresh():
+                metrics.incr("analytics.dashboard.stale")
+                if cache.add(cls.LOCK_KEY.format(**names), 1, timeout=30):
+                    _refresh_executor().submit(cls._refresh, names, generation, builder)
+                return entry["data"], entry["etag"]
+
+        metrics.incr("analytics.dashboard.miss")
+        return cls._store(names, generation, builder())
+
+    @classmethod
+    def invalidate(cls, subjects: Iterable[Tuple[str, Any]]) -> None:
+        """Mark the subjects' entries stale once the current transaction commits."""
+        keys = sorted(
+            {cls.GENERATION_KEY.format(scope=scope, subject_id=subject_id or "") for scope, subject_id in subjects}
+        )
+        if keys:
+            transaction.on_commit(lambda: _bump(keys))
+
+    @classmethod
+    def invalidate_all(cls) -> None:
+        transaction.on_commit(lambda: _bump([cls.GLOBAL_GENERATION_KEY]))
+
+    @staticmethod
+    def hit_ratio() -> Dict[str, float]:
+        counts = {name: metrics.get(f"analytics.dashboard.{name}") for name in ("hit", "stale", "miss")}
+        total = sum(counts.values())
+        return {**counts, "hit_ratio": (counts["hit"] + counts["stale"]) / total if total else 0.0}
+
+    @staticmethod
+    def _background_refresh() -> bool:
+        return bool(getattr(settings, "ANALYTICS_DASHBOARD_BACKGROUND_REFRESH", True))
+
+    @classmethod
+    def _store(cls, names: Dict[str, Any], generation: Tuple, data: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+        etag = dashboard_etag(data)
+        fresh = getattr(settings, "ANALYTICS_DASHBOARD_FRESH_SECONDS", 60)
+        stale = getattr(settings, "ANALYTICS_DASHBOARD_STALE_SECONDS", 600)
+        cache.set(
+            cls.ENTRY_KEY.format(**names),
+            {"data": data, "etag": etag, "generation": generation, "fresh_until": time.time() + fresh},
+            fresh + stale,
+        )
+        return data, etag
+
+    @classmethod
+    def _refresh(cls, names: Dict[str, Any], generation: Tuple, builder: Builder) -> None:
+        try:
+            cls._store(names, generation, builder())
+            metrics.incr("analytics.dashboard.refreshed")
+        except Exception:
+            logger.exception("Dashboard refresh failed for %s:%s", names["scope"], names["subject_id"])
+        finally:
+            cache.delete(cls.LOCK_KEY.format(**names))
+            connection.close()
+
+
+class QueryCache:
+    """
+    Cache of analytics query API pages, keyed by a digest of the normalized query.
+
+    Any rollup write may change any range, so a single generation bumped by
+    the rollup worker (after commit) retires every cached page at once.
+    """
+
+    GENERATION_KEY = "analytics:query:gen"
+    ENTRY_KEY = "analytics:query:{generation}:{digest}"
+
+    @classmethod
+    def get(cls, params: Iterable[Tuple[str, Any]], builder: Builder) -> Dict[str, Any]:
+        digest = hashlib.sha1(json.dumps(sorted(params), default=str).encode()).hexdigest()
+        key = cls.ENTRY_KEY.format(generation=cache.get(cls.GENERATION_KEY, 0), digest=digest)
+        data = cache.get(key)
+        if data is not None:
+            metrics.incr("analytics.query.hit")
+            return data
+        metrics.incr("analytics.query.miss")
+        data = builder()
+        cache.set(key, data, getattr(settings, "ANALYTICS_QUERY_CACHE_SECONDS", 300))
+        return data
+
+    @classmethod
+    def invalidate(cls) -> None:
+        transaction.on_commit(lambda: _bump([cls.GENERATION_KEY]))
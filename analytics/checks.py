@@ -0,0 +1,21 @@
+from django.core.checks import Warning, register
+
+from core.cache import is_shared_cache
+
+
+@register()
+def check_dashboard_cache(app_configs, **kwargs):
+    """Dashboard and query caches are invalidated by rollup_analytics, a separate process."""
+    if is_shared_cache():
+        return []
+    return [
+        Warning(
+            "The default cache is per process, so rollup_analytics cannot invalidate the dashboards "
+            "and query pages cached by web processes.",
+            hint=(
+                "Set CACHE_URL to a shared Redis cache. Without it dashboards refresh only after "
+                "ANALYTICS_DASHBOARD_FRESH_SECONDS and query pages after ANALYTICS_QUERY_CACHE_SECONDS."
+            ),
+            id="analytics.W001",
+        )
+    ]
@@ -0,0 +1,58 @@
+from typing import Any, Dict
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+UPSERT_VENDORS = {"postgresql", "sqlite"}
+
+
+def upsert_increment(model, keys: Dict[str, Any], increments: Dict[str, Any], using: str = DEFAULT_DB_ALIAS) -> None:
+    """
+    Add `increments` to the row identified by `keys`, creating it if needed.
+
+    Issues a single INSERT ... ON CONFLICT (keys) DO UPDATE SET col = col +
+    EXCLUDED.col, so there is no read, no explicit row lock and no race
+    between two writers creating the same row. `keys` must match a unique
+    constraint of the model; foreign keys are given by attname ("shop_id").
+    Backends without ON CONFLICT fall back to lock-then-update.
+    """
+    connection = connections[using]
+    if connection.vendor not in UPSERT_VENDORS:
+        _locked_increment(model, keys, increments, using)
+        return
+
+    opts = model._meta
+    qn = connection.ops.quote_name
+    # Django-side defaults are not part of the schema, so a new row needs them spelled out.
+    values = {field.attname: field.get_default() for field in opts.concrete_fields if field.has_default()}
+    values.update(keys)
+    values.update(increments)
+    values["updated_at"] = timezone.now()
+    fields = {name: opts.get_field(name) for name in values}
+    columns = [fields[name].column for name in values]
+    params = [fields[name].get_db_prep_save(value, connection) for name, value in values.items()]
+    assignments = [
+        f"{qn(fields[name].column)} = {qn(opts.db_table)}.{qn(fields[name].column)} + EXCLUDED.{qn(fields[name].column)}"
+        for name in increments
+    ]
+    assignments.append(f"{qn(fields['updated_at'].column)} = EXCLUDED.{qn(fields['updated_at'].column)}")
+    sql = (
+        f"INSERT INTO {qn(opts.db_table)} ({', '.join(qn(column) for column in columns)}) "
+        f"VALUES ({', '.join(['%s'] * len(columns))}) "
+        f"ON CONFLICT ({', '.join(qn(fields[name].column) for name in keys)}) "
+        f"DO UPDATE SET {', '.join(assignments)}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def _locked_increment(model, keys: Dict[str, Any], increments: Dict[str, Any], using: str) -> None:
+    with transaction.atomic(using=using):
+        manager = model.objects.using(using)
+        row = manager.select_for_update().filter(**keys).first() or manager.create(**keys)
+        manager.filter(pk=row.pk).update(
+            updated_at=timezone.now(),
+            **{name: F(name) + value for name, value in increments.items()},
+        )
+
@@ -0,0 +1,317 @@
+import csv
+import gzip
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+
+from order.models import Order, OrderItem
+from payment.models import Payment
+
+from .models import (
+    AnalyticsExportWatermark,
+    CategoryDailyAnalytics,
+    MarketerDailyAnalytics,
+    PlatformDailyAnalytics,
+    ProductDailyAnalytics,
+    ShopDailyAnalytics,
+    SupplierDailyAnalytics,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ExportDataset:
+    """One exported table: the model, the columns read and the timestamp that orders it."""
+
+    name: str
+    model: type
+    fields: Tuple[str, ...]
+    watermark: str = "updated_at"
+
+    @property
+    def headers(self) -> List[str]:
+        return [name.replace("__", "_") for name in self.fields]
+
+    def queryset(self, cutoff: datetime, after: Optional[Tuple[datetime, str]] = None) -> QuerySet:
+        """Rows changed up to `cutoff` (and strictly after the `after` position), in watermark order."""
+        rows = self.model.objects.filter(**{f"{self.watermark}__lte": cutoff})
+        if after is not None:
+            last_updated_at, last_pk = after
+            rows = rows.filter(
+                Q(**{f"{self.watermark}__gt": last_updated_at})
+                | Q(**{self.watermark: last_updated_at, "pk__gt": last_pk})
+            )
+        return rows.order_by(self.watermark, "pk").values_list(self.watermark, "pk", *self.fields)
+
+
+def _daily(name: str, model: type, key: str, metrics: Sequence[str]) -> ExportDataset:
+    return ExportDataset(name, model, ("id", key, "date", *metrics, "updated_at"))
+
+
+DATASETS: Dict[str, ExportDataset] = {
+    dataset.name: dataset
+    for dataset in [
+        ExportDataset(
+            "orders",
+            Order,
+            (
+                "id",
+                "order_number",
+                "user_id",
+                "shop_id",
+                "status",
+                "subtotal",
+                "delivery_fee",
+                "total_amount",
+                "payment_method",
+                "payment_reference",
+                "delivery_method",
+                "created_at",
+                "updated_at",
+            ),
+        ),
+        # Items are written once with their order, so they follow the order's timestamp.
+        ExportDataset(
+            "order_items",
+            OrderItem,
+            (
+                "id",
+                "order_id",
+                "product_id",
+                "variant_id",
+                "marketer_contract_id",
+                "product_name",
+                "sku",
+                "price",
+                "quantity",
+                "total",
+                "order__updated_at",
+            ),
+            watermark="order__updated_at",
+        ),
+        ExportDataset(
+            "payments",
+            Payment,
+            (
+                "id",
+                "order_id",
+                "user_id",
+                "amount",
+                "currency",
+                "status",
+                "provider",
+                "provider_reference",
+                "is_verified",
+                "refunded_total",
+                "created_at",
+                "updated_at",
+            ),
+        ),
+        _daily(
+            "shop_daily",
+            ShopDailyAnalytics,
+            "shop_id",
+            (
+                "revenue",
+                "orders_count",
+                "units_sold",
+                "refund_amount",
+                "commission_paid",
+                "platform_fee",
+                "referred_orders",
+            ),
+        ),
+        _daily("supplier_daily", SupplierDailyAnalytics, "supplier_id", ("revenue", "units_sold", "orders_count")),
+        _daily(
+            "product_daily",
+            ProductDailyAnalytics,
+            "product_id",
+            ("revenue", "units_sold", "orders_count", "refund_amount"),
+        ),
+        _daily(
+            "category_daily",
+            CategoryDailyAnalytics,
+            "category_id",
+            ("revenue", "units_sold", "orders_count", "refund_amount"),
+        ),
+        _daily(
+            "marketer_daily",
+            MarketerDailyAnalytics,
+            "contract_id",
+            ("revenue", "orders_count", "units_sold", "commission_paid"),
+        ),
+        _daily("platform_daily", PlatformDailyAnalytics, "shard", ("total_gmv", "total_platform_fee", "total_orders")),
+    ]
+}
+
+
+@dataclass
+class ExportResult:
+    dataset: str
+    rows: int = 0
+    files: List[str] = field(default_factory=list)
+    watermark: Optional[datetime] = None
+
+
+def _format(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.astimezone(dt_timezone.utc).isoformat() if timezone.is_aware(value) else value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    return value
+
+
+class ExportChunkWriter:
+    """
+    Writes one gzip-compressed CSV or NDJSON chunk file.
+
+    Rows go to a ".tmp" file that is renamed when the chunk is closed, so
+    readers picking up the directory never see a partial chunk.
+    """
+
+    EXTENSIONS = {
+        "csv": "csv.gz",
+        "ndjson": "ndjson.gz",
+    }
+
+    def __init__(self, path: Path, headers: List[str], file_format: str) -> None:
+        self.path = path
+        self.headers = headers
+        self.file_format = file_format
+        self.rows = 0
+        self._tmp = path.with_name(path.name + ".tmp")
+        os.makedirs(path.parent, exist_ok=True)
+        self._handle = gzip.open(self._tmp, "wt", encoding="utf-8", newline="")
+        self._csv = None
+        if file_format == "csv":
+            self._csv = csv.writer(self._handle)
+            self._csv.writerow(headers)
+
+    def write(self, values: Iterable[Any]) -> None:
+        values = [_format(value) for value in values]
+        if self._csv is not None:
+            self._csv.writerow(values)
+        else:
+            self._handle.write(json.dumps(dict(zip(self.headers, values))) + "\n")
+        self.rows += 1
+
+    def close(self) -> str:
+        self._handle.close()
+        os.replace(self._tmp, self.path)
+        return str(self.path)
+
+    def discard(self) -> None:
+        self._handle.close()
+        self._tmp.unlink(missing_ok=True)
+
+
+class AnalyticsExporter:
+    """
+    Exports orders, order items, payments and the daily analytics tables to chunk files.
+
+    Each dataset is read once in (updated_at, pk) order with
+    QuerySet.iterator(), which uses a server-side cursor on PostgreSQL, and
+    written to files of at most chunk_rows rows, so memory use does not
+    depend on the size of the table. With incremental exports the dataset's
+    AnalyticsExportWatermark is advanced after every finished chunk: a run
+    only moves rows changed since the previous one, and a crashed run
+    resumes after its last complete file. Rows changed in the last
+    settle_seconds are left for the next run, which gives transactions that
+    stamped an earlier updated_at time to commit.
+
+    Incremental files are change logs, not snapshots: a row appears again
+    every time it changes, so consumers keep the latest updated_at per id
+    (per subject and date for the daily datasets, whose ids change when
+    rebuild_analytics deletes and re-inserts a range). Deletions are not
+    exported; after a rebuild, a --full export is the complete picture and
+    replaces what was loaded before.
+    """
+
+    FORMATS = tuple(ExportChunkWriter.EXTENSIONS)
+
+    def __init__(
+        self,
+        directory: str,
+        file_format: str = "csv",
+        chunk_rows: int = 100000,
+        incremental: bool = True,
+        settle_seconds: float = 60.0,
+        fetch_size: int = 2000,
+    ) -> None:
+        if file_format not in self.FORMATS:
+            raise ValueError(f"Unsupported export format: {file_format}")
+        if chunk_rows <= 0 or fetch_size <= 0:
+            raise ValueError("chunk_rows and fetch_size must be greater than 0")
+        self.directory = Path(directory)
+        self.file_format = file_format
+        self.chunk_rows = chunk_rows
+        self.incremental = incremental
+        self.settle_seconds = settle_seconds
+        self.fetch_size = fetch_size
+
+    def run(self, datasets: Optional[Iterable[str]] = None, now: Optional[datetime] = None) -> List[ExportResult]:
+        names = list(datasets or DATASETS)
+        unknown = set(names) - set(DATASETS)
+        if unknown:
+            raise ValueError(f"Unknown dataset: {', '.join(sorted(unknown))}")
+        now = now or timezone.now()
+        return [self.export(DATASETS[name], now) for name in names]
+
+    def export(self, dataset: ExportDataset, now: datetime) -> ExportResult:
+        mark, _ = AnalyticsExportWatermark.objects.get_or_create(dataset=dataset.name)
+        after = (mark.last_updated_at, mark.last_pk) if self.incremental and mark.last_updated_at else None
+        rows = dataset.queryset(now - timedelta(seconds=self.settle_seconds), after=after)
+        result = ExportResult(dataset.name, watermark=mark.last_updated_at)
+
+        writer = None
+        position = None
+        try:
+            for values in rows.iterator(chunk_size=self.fetch_size):
+                if writer is None:
+                    writer = self._writer(dataset, now, len(result.files) + 1)
+                writer.write(values[2:])
+                position = values[:2]
+                if writer.rows >= self.chunk_rows:
+                    self._finish(writer, mark, position, result)
+                    writer = None
+            if writer is not None:
+                self._finish(writer, mark, position, result)
+                writer = None
+        finally:
+            if writer is not None:
+                writer.discard()
+
+        if result.rows:
+            logger.info("Analytics export %s rows=%s files=%s", dataset.name, result.rows, len(result.files))
+        return result
+
+    def _writer(self, dataset: ExportDataset, now: datetime, part: int) -> ExportChunkWriter:
+        extension = ExportChunkWriter.EXTENSIONS[self.file_format]
+        path = self.directory / dataset.name / f"{dataset.name}-{now:%Y%m%dT%H%M%S%f}-{part:05d}.{extension}"
+        return ExportChunkWriter(path, dataset.headers, self.file_format)
+
+    @staticmethod
+    def _finish(
+        writer: ExportChunkWriter,
+        mark: AnalyticsExportWatermark,
+        position: Tuple[datetime, Any],
+        result: ExportResult,
+    ) -> None:
+        result.files.append(writer.close())
+        result.rows += writer.rows
+        mark.last_updated_at, mark.last_pk = position[0], str(position[1])
+        mark.rows_exported += writer.rows
+        mark.save(update_fields=["last_updated_at", "last_pk", "rows_exported", "updated_at"])
+        result.watermark = mark.last_updated_at
@@ -0,0 +1,131 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from analytics.models import AnalyticsRebuild
+from analytics.rebuild import partitions, rebuild_partitions, swap_partition
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the daily shop, supplier, platform, product, category and marketer rows (and their hour/day "
+        "rollups) from orders, refunds and commissions, one date partition at a time. Partitions are "
+        "computed in worker processes and swapped in date order, each in one transaction; an interrupted "
+        "run resumes from its last swapped partition."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="start", default=None, help="First date to rebuild (YYYY-MM-DD).")
+        parser.add_argument("--to", dest="end", default=None, help="Last date to rebuild; defaults to --from.")
+        parser.add_argument("--name", default=None, help="Run name used to resume; defaults to rebuild-FROM-TO.")
+        parser.add_argument("--partition-days", type=int, default=1, help="Days per partition.")
+        parser.add_argument("--workers", type=int, default=1, help="Processes computing partitions.")
+        parser.add_argument("--dry-run", action="store_true", help="Report the diff without swapping anything.")
+        parser.add_argument("--restart", action="store_true", help="Start the named run over from --from.")
+        parser.add_argument("--show-diff", type=int, default=20, help="Changed fields printed per partition.")
+
+    def handle(self, *args, **options):
+        if options["partition_days"] <= 0 or options["workers"] <= 0:
+            raise CommandError("--partition-days and --workers must be greater than 0.")
+        run = self._run(options)
+        start = run.start_date if run.completed_through is None else run.completed_through + timedelta(days=1)
+        pending = partitions(start, run.end_date, run.partition_days)
+        if not pending:
+            if run.pk:
+                run.status = AnalyticsRebuild.Status.COMPLETED
+                run.save(update_fields=["status", "updated_at"])
+            self.stdout.write(self.style.SUCCESS(f"{run.name} is already complete."))
+            return
+        if run.completed_through:
+            self.stdout.write(f"Resuming {run.name} from {start}.")
+
+        workers = options["workers"]
+        pool = None
+        if workers > 1:
+            # Forked workers must not share the parent's database connections.
+            connections.close_all()
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"))
+        try:
+            # Bounded windows keep at most 2 * workers computed partitions waiting to be swapped.
+            window = workers * 2
+            done = changed = 0
+            for offset in range(0, len(pending), window):
+                results = rebuild_partitions(pending[offset : offset + window], mapper=pool.map if pool else map)
+                for partition, changes in results:
+                    done += 1
+                    changed += len(changes)
+                    rows = 0 if options["dry_run"] else swap_partition(partition)
+                    self.stdout.write(
+                        f"[{done}/{len(pending)}] {partition.start}..{partition.end} "
+                        f"rebuilt={len(partition.totals)} changed={len(changes)} swapped_rows={rows}"
+                    )
+                    for change in changes[: options["show_diff"]]:
+                        self.stdout.write(f"  {change}")
+                    if len(changes) > options["show_diff"]:
+                        self.stdout.write(f"  ... {len(changes) - options['show_diff']} more")
+                    if run.pk:
+                        run.completed_through = partition.end
+                        run.rows_changed += len(changes)
+                        run.save(update_fields=["completed_through", "rows_changed", "updated_at"])
+        except BaseException:
+            if run.pk:
+                run.status = AnalyticsRebuild.Status.FAILED
+                run.save(update_fields=["status", "updated_at"])
+            raise
+        finally:
+            if pool:
+                pool.shutdown()
+
+        if run.pk:
+            run.status = AnalyticsRebuild.Status.COMPLETED
+            run.save(update_fields=["status", "updated_at"])
+        verb = "Would change" if options["dry_run"] else "Changed"
+        self.stdout.write(self.style.SUCCESS(f"{run.name}: {verb} {changed} daily row fields."))
+
+    def _run(self, options) -> AnalyticsRebuild:
+        """The stored run to resume, a new one, or an unsaved one for --dry-run."""
+        try:
+            start = date.fromisoformat(options["start"]) if options["start"] else None
+            end = date.fromisoformat(options["end"]) if options["end"] else start
+        except ValueError:
+            raise CommandError("--from and --to must be dates in YYYY-MM-DD format.")
+
+        name = options["name"] or (f"rebuild-{start}-{end}" if start else None)
+        if not name:
+            raise CommandError("Pass --from (and --to) or the --name of a run to resume.")
+        if start and end < start:
+            raise CommandError("--to must not be before --from.")
+
+        run = AnalyticsRebuild.objects.filter(name=name).first()
+        if options["dry_run"]:
+            if run is None and start is None:
+                raise CommandError(f"No rebuild run named {name}.")
+            # A dry run reports on the whole range and never records progress.
+            return AnalyticsRebuild(
+                name=name,
+                start_date=start or run.start_date,
+                end_date=end or run.end_date,
+                partition_days=options["partition_days"],
+            )
+        if run is None:
+            if start is None:
+                raise CommandError(f"No rebuild run named {name}.")
+            return AnalyticsRebuild.objects.create(
+                name=name,
+                start_date=start,
+                end_date=end,
+                partition_days=options["partition_days"],
+            )
+        if options["restart"]:
+            run.start_date, run.end_date = start or run.start_date, end or run.end_date
+            run.partition_days = options["partition_days"]
+            run.completed_through = None
+            run.rows_changed = 0
+        elif start and (start, end) != (run.start_date, run.end_date):
+            raise CommandError(f"{name} covers {run.start_date}..{run.end_date}; pass --restart to change it.")
+        run.status = AnalyticsRebuild.Status.RUNNING
+        run.save()
+        return run
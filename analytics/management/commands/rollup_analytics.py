@@ -0,0 +1,60 @@
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from analytics.models import AnalyticsRebuild
+from analytics.rollup import AnalyticsRollupWorker
+
+
+class Command(BaseCommand):
+    help = "Fold recorded analytics events into the daily shop, supplier and platform tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Keep rolling up until interrupted.")
+        parser.add_argument("--interval", type=float, default=5.0, help="Seconds to sleep when no events are due.")
+        parser.add_argument("--batch-size", type=int, default=None, help="Events applied per transaction.")
+        parser.add_argument(
+            "--rebuild-from",
+            default=None,
+            help="Recompute the daily rows and rollups from this date (YYYY-MM-DD) with rebuild_analytics.",
+        )
+        parser.add_argument("--rebuild-to", default=None, help="Last date to recompute; defaults to --rebuild-from.")
+
+    def handle(self, *args, **options):
+        if options["rebuild_from"]:
+            # Rebuilt from orders, refunds and commissions: dates before the event stream have no events to replay.
+            end = options["rebuild_to"] or options["rebuild_from"]
+            call_command(
+                "rebuild_analytics",
+                "--from",
+                options["rebuild_from"],
+                "--to",
+                end,
+                "--restart",
+                stdout=self.stdout,
+            )
+            return
+
+        # Rebuilds queued by migrations run before new events are folded in.
+        queued = AnalyticsRebuild.objects.filter(status=AnalyticsRebuild.Status.QUEUED).order_by("created_at")
+        for name in queued.values_list("name", flat=True):
+            self.stdout.write(f"Running queued rebuild {name}.")
+            call_command("rebuild_analytics", "--name", name, stdout=self.stdout)
+
+        worker = AnalyticsRollupWorker(
+            batch_size=options["batch_size"] or getattr(settings, "ANALYTICS_ROLLUP_BATCH_SIZE", 1000),
+            settle_seconds=getattr(settings, "ANALYTICS_ROLLUP_SETTLE_SECONDS", 5.0),
+        )
+
+        while True:
+            result = worker.run()
+            if result.events:
+                self.stdout.write(
+                    f"Analytics events={result.events} rows={result.rows} "
+                    f"batches={result.batches} checkpoint={result.last_event_id}"
+                )
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0002_delete_marketerdailyanalytics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='platformdailyanalytics',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='platformdailyanalytics',
+            name='date',
+            field=models.DateField(db_index=True),
+        ),
+        migrations.AddConstraint(
+            model_name='platformdailyanalytics',
+            constraint=models.UniqueConstraint(fields=('date', 'shard'), name='uniq_platform_daily_date_shard'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0003_platform_daily_shards'),
+        ('shop', '0004_remove_shop_marketers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_event_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AnalyticsEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('order_paid', 'Order paid'), ('refund_approved', 'Refund approved'), ('commission_approved', 'Commission approved')], max_length=30)),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('date', models.DateField()),
+                ('payload', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('shop', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='shop.shop')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date'], name='analytics_a_date_392558_idx'), models.Index(fields=['created_at'], name='analytics_a_created_546677_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:31
+
+import django.utils.timezone
+from datetime import datetime, time, timezone as dt_timezone
+from decimal import Decimal
+from django.db import migrations, models
+from django.utils import timezone
+
+METRICS = ("revenue", "orders_count", "units_sold", "refund_amount", "commission_paid", "platform_fee")
+
+
+def backfill_rollups(apps, schema_editor):
+    """Seed day, month and all-time buckets from the daily tables; hours start empty."""
+    AnalyticsRollup = apps.get_model("analytics", "AnalyticsRollup")
+    sources = [
+        ("shop", apps.get_model("analytics", "ShopDailyAnalytics"), "shop_id", {}),
+        ("supplier", apps.get_model("analytics", "SupplierDailyAnalytics"), "supplier_id", {}),
+        (
+            "platform",
+            apps.get_model("analytics", "PlatformDailyAnalytics"),
+            None,
+            {"total_gmv": "revenue", "total_orders": "orders_count", "total_platform_fee": "platform_fee"},
+        ),
+    ]
+    all_time = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+    totals = {}
+    for scope, model, subject_field, renames in sources:
+        for row in model.objects.all().iterator():
+            subject_id = str(getattr(row, subject_field)) if subject_field else ""
+            day = timezone.make_aware(datetime.combine(row.date, time.min))
+            month = timezone.make_aware(datetime.combine(row.date.replace(day=1), time.min))
+            for granularity, bucket in (("day", day), ("month", month), ("all", all_time)):
+                bucket_totals = totals.setdefault((scope, subject_id, granularity, bucket), {})
+                for field in model._meta.concrete_fields:
+                    name = renames.get(field.name, field.name)
+                    if name in METRICS:
+                        bucket_totals[name] = bucket_totals.get(name, 0) + getattr(row, field.name)
+    AnalyticsRollup.objects.bulk_create(
+        [
+            AnalyticsRollup(scope=scope, subject_id=subject_id, granularity=granularity, bucket_start=bucket, **values)
+            for (scope, subject_id, granularity, bucket), values in totals.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0004_analytics_event_stream'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analyticsevent',
+            name='occurred_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.CreateModel(
+            name='AnalyticsRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('shop', 'Shop'), ('supplier', 'Supplier'), ('platform', 'Platform')], max_length=10)),
+                ('subject_id', models.CharField(blank=True, max_length=64)),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day'), ('month', 'Month'), ('all', 'All time')], max_length=5)),
+                ('bucket_start', models.DateTimeField()),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('orders_count', models.IntegerField(default=0)),
+                ('units_sold', models.IntegerField(default=0)),
+                ('refund_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('commission_paid', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('platform_fee', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('scope', 'subject_id', 'granularity', 'bucket_start'), name='uniq_analytics_rollup_bucket')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0005_analytics_rollup_tiers'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='analyticsrollup',
+            index=models.Index(fields=['scope', 'granularity', 'bucket_start'], name='analytics_rollup_range_idx'),
+        ),
+    ]
@@ -0,0 +1,227 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:48
+
+import django.db.models.deletion
+from datetime import datetime, time, timezone as dt_timezone
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+
+PAID_STATUSES = ("paid", "confirmed", "processing", "shipped", "delivered", "refunded")
+# Statuses a refund moves through once approved; approval is when analytics counts it.
+APPROVED_REFUND_STATUSES = ("APPROVED", "QUEUED", "PROCESSING", "COMPLETED", "FAILED")
+CHUNK_SIZE = 500
+
+
+def _chunks(values, size=CHUNK_SIZE):
+    for index in range(0, len(values), size):
+        yield values[index : index + size]
+
+
+def _occurrences(AnalyticsEvent, prefix, section, rows):
+    """
+    (id, occurred_at, date) of the (id, timestamp) `rows` whose event has no `section` yet.
+
+    A row with a recorded event is dated like the event, as rebuild_analytics
+    does; one whose event already carries `section` is left to the rollup worker.
+    """
+    for chunk in _chunks(rows):
+        events = AnalyticsEvent.objects.filter(key__in=[f"{prefix}:{pk}" for pk, _ in chunk])
+        counted = set(events.filter(payload__has_key=section).values_list("key", flat=True))
+        dated = {key: (occurred_at, day) for key, occurred_at, day in events.values_list("key", "occurred_at", "date")}
+        for pk, fallback in chunk:
+            key = f"{prefix}:{pk}"
+            if key not in counted:
+                occurred_at, day = dated.get(key) or (fallback, timezone.localdate(fallback))
+                yield pk, occurred_at, day
+
+
+def _product_lines(OrderItem, order_ids):
+    """
+    ({order id: {"products"|"categories": {subject id: [amount, units]}}}, {order id: item total}).
+
+    Amounts are at the price the customer paid, as AnalyticsService splits them.
+    """
+    lines, item_totals = {}, {}
+    items = OrderItem.objects.filter(order_id__in=order_ids).values_list(
+        "order_id",
+        "product_id",
+        "product__category_id",
+        "variant__product_id",
+        "variant__product__category_id",
+        "total",
+        "quantity",
+    )
+    for order_id, product_id, category_id, variant_product_id, variant_category_id, total, quantity in items:
+        item_totals[order_id] = item_totals.get(order_id, Decimal("0.00")) + (total or Decimal("0.00"))
+        if not product_id:
+            product_id, category_id = variant_product_id, variant_category_id
+        if not product_id:
+            continue
+        order_lines = lines.setdefault(order_id, {"products": {}, "categories": {}})
+        for section, subject_id in (("products", product_id), ("categories", category_id)):
+            if subject_id:
+                line = order_lines[section].setdefault(str(subject_id), [Decimal("0.00"), 0])
+                line[0] += total or Decimal("0.00")
+                line[1] += int(quantity)
+    return lines, item_totals
+
+
+def backfill_product_sales(apps, schema_editor):
+    """
+    Fill the product and category rows and rollups from the orders and approved refunds recorded so far.
+
+    Readers rank products from these rollups, so they start with the
+    history instead of zero. Orders and refunds whose event already has a
+    products section are counted by the rollup worker instead.
+    """
+    AnalyticsEvent = apps.get_model("analytics", "AnalyticsEvent")
+    AnalyticsRollup = apps.get_model("analytics", "AnalyticsRollup")
+    Order = apps.get_model("order", "Order")
+    OrderItem = apps.get_model("order", "OrderItem")
+    Refund = apps.get_model("payment", "Refund")
+    targets = {
+        "products": (apps.get_model("analytics", "ProductDailyAnalytics"), "product_id", "product"),
+        "categories": (apps.get_model("analytics", "CategoryDailyAnalytics"), "category_id", "category"),
+    }
+    all_time = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+    totals = {}
+
+    def add(occurred_at, day, section, subject_id, increments):
+        model, key_field, scope = targets[section]
+        buckets = (
+            ("hour", timezone.localtime(occurred_at).replace(minute=0, second=0, microsecond=0)),
+            ("day", timezone.make_aware(datetime.combine(day, time.min))),
+            ("month", timezone.make_aware(datetime.combine(day.replace(day=1), time.min))),
+            ("all", all_time),
+        )
+        keys = [(model, (("date", day), (key_field, subject_id)))]
+        keys += [
+            (
+                AnalyticsRollup,
+                (("scope", scope), ("subject_id", subject_id), ("granularity", granularity), ("bucket_start", bucket)),
+            )
+            for granularity, bucket in buckets
+        ]
+        for key in keys:
+            row = totals.setdefault(key, {})
+            for name, value in increments.items():
+                row[name] = row.get(name, 0) + value
+
+    orders = list(Order.objects.filter(status__in=PAID_STATUSES).values_list("id", "created_at").iterator())
+    for chunk in _chunks(list(_occurrences(AnalyticsEvent, "order_paid", "products", orders))):
+        lines, _ = _product_lines(OrderItem, [order_id for order_id, _, _ in chunk])
+        for order_id, occurred_at, day in chunk:
+            for section, subjects in lines.get(order_id, {}).items():
+                for subject_id, (amount, units) in subjects.items():
+                    increments = {"revenue": amount, "units_sold": units, "orders_count": 1}
+                    add(occurred_at, day, section, subject_id, increments)
+
+    refunds = Refund.objects.filter(status__in=APPROVED_REFUND_STATUSES)
+    amounts = {
+        pk: (order_id, amount) for pk, order_id, amount in refunds.values_list("id", "payment__order_id", "amount")
+    }
+    rows = list(refunds.values_list("id", "updated_at"))
+    for chunk in _chunks(list(_occurrences(AnalyticsEvent, "refund_approved", "products", rows))):
+        lines, item_totals = _product_lines(OrderItem, [amounts[refund_id][0] for refund_id, _, _ in chunk])
+        for refund_id, occurred_at, day in chunk:
+            order_id, refund_amount = amounts[refund_id]
+            item_total = item_totals.get(order_id, Decimal("0.00"))
+            if item_total <= Decimal("0.00"):
+                continue
+            ratio = min(Decimal("1.00"), refund_amount / item_total)
+            for section, subjects in lines.get(order_id, {}).items():
+                for subject_id, (amount, _) in subjects.items():
+                    share = (amount * ratio).quantize(Decimal("0.01"))
+                    add(occurred_at, day, section, subject_id, {"revenue": -share, "refund_amount": share})
+
+    # Rows the rollup worker already wrote for newer events are added to, not replaced.
+    for (model, keys), increments in totals.items():
+        keys = dict(keys)
+        if not model.objects.filter(**keys).update(**{name: F(name) + value for name, value in increments.items()}):
+            model.objects.create(**keys, **increments)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0006_rollup_range_index'),
+        ('catalog', '0011_rename_catalog_pro_product_cccc4c_idx_catalog_pro_product_adc547_idx_and_more'),
+        ('order', '0004_order_delivery_method'),
+        ('payment', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryDailyAnalytics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('units_sold', models.IntegerField(default=0)),
+                ('orders_count', models.IntegerField(default=0)),
+                ('refund_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProductDailyAnalytics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('units_sold', models.IntegerField(default=0)),
+                ('orders_count', models.IntegerField(default=0)),
+                ('refund_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='analyticsrollup',
+            name='scope',
+            field=models.CharField(choices=[('shop', 'Shop'), ('supplier', 'Supplier'), ('platform', 'Platform'), ('product', 'Product'), ('category', 'Category')], max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='analyticsrollup',
+            index=models.Index(fields=['scope', 'granularity', 'bucket_start', '-units_sold'], name='analytics_rollup_top_units'),
+        ),
+        migrations.AddIndex(
+            model_name='analyticsrollup',
+            index=models.Index(fields=['scope', 'granularity', 'bucket_start', '-revenue'], name='analytics_rollup_top_revenue'),
+        ),
+        migrations.AddField(
+            model_name='categorydailyanalytics',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_analytics', to='catalog.category'),
+        ),
+        migrations.AddField(
+            model_name='productdailyanalytics',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_analytics', to='catalog.product'),
+        ),
+        migrations.AddIndex(
+            model_name='categorydailyanalytics',
+            index=models.Index(fields=['date', '-units_sold'], name='analytics_category_day_units'),
+        ),
+        migrations.AddIndex(
+            model_name='categorydailyanalytics',
+            index=models.Index(fields=['date', '-revenue'], name='analytics_category_day_revenue'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='categorydailyanalytics',
+            unique_together={('category', 'date')},
+        ),
+        migrations.AddIndex(
+            model_name='productdailyanalytics',
+            index=models.Index(fields=['date', '-units_sold'], name='analytics_product_day_units'),
+        ),
+        migrations.AddIndex(
+            model_name='productdailyanalytics',
+            index=models.Index(fields=['date', '-revenue'], name='analytics_product_day_revenue'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='productdailyanalytics',
+            unique_together={('product', 'date')},
+        ),
+        migrations.RunPython(backfill_product_sales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0007_product_category_analytics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsRebuild',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('partition_days', models.PositiveIntegerField(default=1)),
+                ('completed_through', models.DateField(blank=True, null=True)),
+                ('rows_changed', models.PositiveIntegerField(default=0)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='running', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,175 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:03
+
+import django.db.models.deletion
+from datetime import datetime, time, timezone as dt_timezone
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+
+PAID_STATUSES = ("paid", "confirmed", "processing", "shipped", "delivered", "refunded")
+# Statuses a refund moves through once approved; approval is when analytics counts it.
+APPROVED_REFUND_STATUSES = ("APPROVED", "QUEUED", "PROCESSING", "COMPLETED", "FAILED")
+CHUNK_SIZE = 500
+
+
+def _chunks(values, size=CHUNK_SIZE):
+    for index in range(0, len(values), size):
+        yield values[index : index + size]
+
+
+def _occurrences(AnalyticsEvent, prefix, rows):
+    """
+    (id, occurred_at, date) of the (id, timestamp) `rows` whose event has no contracts section yet.
+
+    A row with a recorded event is dated like the event, as rebuild_analytics
+    does; one whose event already carries contracts is left to the rollup worker.
+    """
+    for chunk in _chunks(rows):
+        events = AnalyticsEvent.objects.filter(key__in=[f"{prefix}:{pk}" for pk, _ in chunk])
+        counted = set(events.filter(payload__has_key="contracts").values_list("key", flat=True))
+        dated = {key: (occurred_at, day) for key, occurred_at, day in events.values_list("key", "occurred_at", "date")}
+        for pk, fallback in chunk:
+            key = f"{prefix}:{pk}"
+            if key not in counted:
+                occurred_at, day = dated.get(key) or (fallback, timezone.localdate(fallback))
+                yield pk, occurred_at, day
+
+
+def _contract_lines(OrderItem, order_ids):
+    """({order id: {contract id: [amount, units]}}, {order id: item total}) of the referred items."""
+    lines, item_totals = {}, {}
+    items = OrderItem.objects.filter(order_id__in=order_ids).values_list(
+        "order_id",
+        "marketer_contract_id",
+        "total",
+        "quantity",
+    )
+    for order_id, contract_id, total, quantity in items:
+        item_totals[order_id] = item_totals.get(order_id, Decimal("0.00")) + (total or Decimal("0.00"))
+        if contract_id:
+            line = lines.setdefault(order_id, {}).setdefault(str(contract_id), [Decimal("0.00"), 0])
+            line[0] += total or Decimal("0.00")
+            line[1] += int(quantity)
+    return lines, item_totals
+
+
+def backfill_contract_sales(apps, schema_editor):
+    """
+    Fill the contract rows and rollups from the referred orders, refunds and approved commissions so far.
+
+    The marketer dashboard reads its earnings and referred sales from these
+    rollups, so existing marketers keep their history. Sources whose event
+    already has a contracts section are counted by the rollup worker instead.
+    """
+    AnalyticsEvent = apps.get_model("analytics", "AnalyticsEvent")
+    AnalyticsRollup = apps.get_model("analytics", "AnalyticsRollup")
+    MarketerDailyAnalytics = apps.get_model("analytics", "MarketerDailyAnalytics")
+    MarketerCommission = apps.get_model("marketer", "MarketerCommission")
+    Order = apps.get_model("order", "Order")
+    OrderItem = apps.get_model("order", "OrderItem")
+    Refund = apps.get_model("payment", "Refund")
+    all_time = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+    totals = {}
+
+    def add(occurred_at, day, contract_id, increments):
+        buckets = (
+            ("hour", timezone.localtime(occurred_at).replace(minute=0, second=0, microsecond=0)),
+            ("day", timezone.make_aware(datetime.combine(day, time.min))),
+            ("month", timezone.make_aware(datetime.combine(day.replace(day=1), time.min))),
+            ("all", all_time),
+        )
+        keys = [(MarketerDailyAnalytics, (("date", day), ("contract_id", contract_id)))]
+        keys += [
+            (
+                AnalyticsRollup,
+                (
+                    ("scope", "contract"),
+                    ("subject_id", contract_id),
+                    ("granularity", granularity),
+                    ("bucket_start", bucket),
+                ),
+            )
+            for granularity, bucket in buckets
+        ]
+        for key in keys:
+            row = totals.setdefault(key, {})
+            for name, value in increments.items():
+                row[name] = row.get(name, 0) + value
+
+    referred = Order.objects.filter(status__in=PAID_STATUSES, items__marketer_contract__isnull=False).distinct()
+    orders = list(referred.values_list("id", "created_at").iterator())
+    for chunk in _chunks(list(_occurrences(AnalyticsEvent, "order_paid", orders))):
+        lines, _ = _contract_lines(OrderItem, [order_id for order_id, _, _ in chunk])
+        for order_id, occurred_at, day in chunk:
+            for contract_id, (amount, units) in lines.get(order_id, {}).items():
+                add(occurred_at, day, contract_id, {"revenue": amount, "units_sold": units, "orders_count": 1})
+
+    refunds = Refund.objects.filter(
+        status__in=APPROVED_REFUND_STATUSES,
+        payment__order__items__marketer_contract__isnull=False,
+    ).distinct()
+    amounts = {
+        pk: (order_id, amount) for pk, order_id, amount in refunds.values_list("id", "payment__order_id", "amount")
+    }
+    rows = list(refunds.values_list("id", "updated_at"))
+    for chunk in _chunks(list(_occurrences(AnalyticsEvent, "refund_approved", rows))):
+        lines, item_totals = _contract_lines(OrderItem, [amounts[refund_id][0] for refund_id, _, _ in chunk])
+        for refund_id, occurred_at, day in chunk:
+            order_id, refund_amount = amounts[refund_id]
+            item_total = item_totals.get(order_id, Decimal("0.00"))
+            if item_total <= Decimal("0.00"):
+                continue
+            ratio = min(Decimal("1.00"), refund_amount / item_total)
+            for contract_id, (amount, _) in lines.get(order_id, {}).items():
+                add(occurred_at, day, contract_id, {"revenue": -(amount * ratio).quantize(Decimal("0.01"))})
+
+    commissions = MarketerCommission.objects.filter(status="APPROVED", approved_at__isnull=False)
+    contracts = {
+        pk: (contract_id, amount) for pk, contract_id, amount in commissions.values_list("id", "contract_id", "amount")
+    }
+    rows = list(commissions.values_list("id", "approved_at"))
+    for commission_id, occurred_at, day in _occurrences(AnalyticsEvent, "commission_approved", rows):
+        contract_id, amount = contracts[commission_id]
+        add(occurred_at, day, str(contract_id), {"commission_paid": amount})
+
+    # Rows the rollup worker already wrote for newer events are added to, not replaced.
+    for (model, keys), increments in totals.items():
+        keys = dict(keys)
+        if not model.objects.filter(**keys).update(**{name: F(name) + value for name, value in increments.items()}):
+            model.objects.create(**keys, **increments)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0009_export_watermark'),
+        ('marketer', '0001_initial'),
+        ('order', '0004_order_delivery_method'),
+        ('payment', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='analyticsrollup',
+            name='scope',
+            field=models.CharField(choices=[('shop', 'Shop'), ('supplier', 'Supplier'), ('platform', 'Platform'), ('product', 'Product'), ('category', 'Category'), ('contract', 'Marketer contract')], max_length=10),
+        ),
+        migrations.CreateModel(
+            name='MarketerDailyAnalytics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('orders_count', models.IntegerField(default=0)),
+                ('units_sold', models.IntegerField(default=0)),
+                ('commission_paid', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('contract', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_analytics', to='marketer.marketercontract')),
+            ],
+            options={
+                'unique_together': {('contract', 'date')},
+            },
+        ),
+        migrations.RunPython(backfill_contract_sales, migrations.RunPython.noop),
+    ]
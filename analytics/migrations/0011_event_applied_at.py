@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:18
+
+from django.db import migrations, models
+from django.db.models import Max, Min
+from django.utils import timezone
+
+REBUILD_NAME = "event-applied-at"
+
+
+def mark_applied_events(apps, schema_editor):
+    """
+    Mark the events at or below the worker's checkpoint applied and queue a rebuild of their dates.
+
+    The id-ordered worker skipped events whose transaction committed after
+    a higher id was applied, and which of them it skipped is not recorded.
+    Marking them applied keeps the others from being counted twice; the
+    queued rebuild_analytics run, which rollup_analytics starts before
+    folding new events, recomputes those dates from orders, refunds and
+    commissions and so restores the skipped ones.
+    """
+    AnalyticsCheckpoint = apps.get_model("analytics", "AnalyticsCheckpoint")
+    AnalyticsEvent = apps.get_model("analytics", "AnalyticsEvent")
+    AnalyticsRebuild = apps.get_model("analytics", "AnalyticsRebuild")
+    checkpoint = AnalyticsCheckpoint.objects.filter(name="daily").first()
+    if checkpoint is None:
+        return
+    applied = AnalyticsEvent.objects.filter(id__lte=checkpoint.last_event_id)
+    dates = applied.aggregate(start=Min("date"), end=Max("date"))
+    applied.update(applied_at=timezone.now())
+    if dates["start"] is not None:
+        AnalyticsRebuild.objects.update_or_create(
+            name=REBUILD_NAME,
+            defaults={
+                "start_date": dates["start"],
+                "end_date": dates["end"],
+                "completed_through": None,
+                "rows_changed": 0,
+                "status": "queued",
+            },
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0010_marketer_daily_analytics'),
+        ('shop', '0004_remove_shop_marketers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analyticsevent',
+            name='applied_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='analyticsevent',
+            index=models.Index(condition=models.Q(('applied_at__isnull', True)), fields=['id'], name='analytics_event_pending'),
+        ),
+        migrations.AlterField(
+            model_name='analyticsrebuild',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='running', max_length=10),
+        ),
+        migrations.RunPython(mark_applied_events, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:36
+
+from datetime import datetime, time, timezone as dt_timezone
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+
+PAID_STATUSES = ("paid", "confirmed", "processing", "shipped", "delivered", "refunded")
+CHUNK_SIZE = 500
+
+
+def backfill_referred_orders(apps, schema_editor):
+    """
+    Count the paid orders with a marketer-referred item into the shop rows and rollups they were counted in.
+
+    The shop owner's dashboard reads orders influenced from the shop's
+    all-time bucket. Orders whose event already carries referred_orders are
+    counted by the rollup worker instead.
+    """
+    AnalyticsEvent = apps.get_model("analytics", "AnalyticsEvent")
+    AnalyticsRollup = apps.get_model("analytics", "AnalyticsRollup")
+    ShopDailyAnalytics = apps.get_model("analytics", "ShopDailyAnalytics")
+    Order = apps.get_model("order", "Order")
+    all_time = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+    referred = Order.objects.filter(status__in=PAID_STATUSES, items__marketer_contract__isnull=False).distinct()
+    orders = list(referred.values_list("id", "shop_id", "created_at").iterator())
+    days, buckets = {}, {}
+    for index in range(0, len(orders), CHUNK_SIZE):
+        chunk = orders[index : index + CHUNK_SIZE]
+        events = AnalyticsEvent.objects.filter(key__in=[f"order_paid:{order_id}" for order_id, _, _ in chunk])
+        counted = set(events.filter(payload__shop__has_key="referred_orders").values_list("key", flat=True))
+        dated = {key: (occurred_at, day) for key, occurred_at, day in events.values_list("key", "occurred_at", "date")}
+        for order_id, shop_id, created_at in chunk:
+            key = f"order_paid:{order_id}"
+            if key in counted or not shop_id:
+                continue
+            occurred_at, day = dated.get(key) or (created_at, timezone.localdate(created_at))
+            days[(shop_id, day)] = days.get((shop_id, day), 0) + 1
+            for bucket in (
+                ("hour", timezone.localtime(occurred_at).replace(minute=0, second=0, microsecond=0)),
+                ("day", timezone.make_aware(datetime.combine(day, time.min))),
+                ("month", timezone.make_aware(datetime.combine(day.replace(day=1), time.min))),
+                ("all", all_time),
+            ):
+                buckets[(str(shop_id), *bucket)] = buckets.get((str(shop_id), *bucket), 0) + 1
+
+    # Only rows already holding the order's revenue are updated; hours before the rollup tiers have none.
+    for (shop_id, day), count in days.items():
+        rows = ShopDailyAnalytics.objects.filter(shop_id=shop_id, date=day)
+        rows.update(referred_orders=F("referred_orders") + count)
+    for (shop_id, granularity, bucket), count in buckets.items():
+        AnalyticsRollup.objects.filter(
+            scope="shop",
+            subject_id=shop_id,
+            granularity=granularity,
+            bucket_start=bucket,
+        ).update(referred_orders=F("referred_orders") + count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0011_event_applied_at'),
+        ('order', '0004_order_delivery_method'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analyticsrollup',
+            name='referred_orders',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='shopdailyanalytics',
+            name='referred_orders',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_referred_orders, migrations.RunPython.noop),
+    ]
@@ -2,7 +2,10 @@ from decimal import Decimal
 
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
+from catalog.models import Category, Product
+from marketer.models import MarketerContract
 from shop.models import Shop
 
 
@@ -15,6 +18,8 @@ class ShopDailyAnalytics(models.Model):
     refund_amount = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
     commission_paid = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
     platform_fee = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    # Paid orders with at least one marketer-referred item, each counted once however many contracts referred it.
+    referred_orders = models.IntegerField(default=0)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
@@ -49,12 +54,243 @@ class SupplierDailyAnalytics(models.Model):
         return f"{self.supplier_id} - {self.date}"
 
 
+class ProductDailyAnalytics(models.Model):
+    """Sales of one product on one day, at the item price paid by the customer."""
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="daily_analytics")
+    date = models.DateField()
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    units_sold = models.IntegerField(default=0)
+    orders_count = models.IntegerField(default=0)
+    refund_amount = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("product", "date")
+        indexes = [
+            models.Index(fields=["date", "-units_sold"], name="analytics_product_day_units"),
+            models.Index(fields=["date", "-revenue"], name="analytics_product_day_revenue"),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} - {self.date}"
+
+
+class CategoryDailyAnalytics(models.Model):
+    """Sales of the products directly in one category on one day."""
+
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="daily_analytics")
+    date = models.DateField()
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    units_sold = models.IntegerField(default=0)
+    orders_count = models.IntegerField(default=0)
+    refund_amount = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("category", "date")
+        indexes = [
+            models.Index(fields=["date", "-units_sold"], name="analytics_category_day_units"),
+            models.Index(fields=["date", "-revenue"], name="analytics_category_day_revenue"),
+        ]
+
+    def __str__(self):
+        return f"{self.category_id} - {self.date}"
+
+
+class MarketerDailyAnalytics(models.Model):
+    """
+    Sales a marketer brought one shop on one day and the commission approved for them.
+
+    Keyed by the contract, which is one marketer at one shop, so a marketer's
+    totals sum their contracts and a shop's sum the contracts it signed.
+    """
+
+    contract = models.ForeignKey(MarketerContract, on_delete=models.CASCADE, related_name="daily_analytics")
+    date = models.DateField()
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    orders_count = models.IntegerField(default=0)
+    units_sold = models.IntegerField(default=0)
+    commission_paid = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("contract", "date")
+
+    def __str__(self):
+        return f"{self.contract_id} - {self.date}"
+
+
 class PlatformDailyAnalytics(models.Model):
-    date = models.DateField(unique=True, db_index=True)
+    """
+    Platform totals for one day.
+
+    The rollup worker is the only writer and adds to shard 0. Days counted
+    before the rollup may still be split over several shards, so readers
+    sum the shards of a date.
+    """
+
+    date = models.DateField(db_index=True)
+    shard = models.PositiveSmallIntegerField(default=0)
     total_gmv = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
     total_platform_fee = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
     total_orders = models.IntegerField(default=0)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["date", "shard"], name="uniq_platform_daily_date_shard"),
+        ]
+
+    def __str__(self):
+        return f"{self.date} #{self.shard}"
+
+
+class AnalyticsEvent(models.Model):
+    """
+    Append-only record of a business event that feeds the daily rollups.
+
+    Written by AnalyticsService inside the webhook/admin transaction (one
+    INSERT) and folded into the daily tables by rollup_analytics. `key` makes
+    recording idempotent; `payload` carries the amounts already split per
+    supplier so the rollup never has to reload orders.
+    """
+
+    class Type(models.TextChoices):
+        ORDER_PAID = "order_paid", "Order paid"
+        REFUND_APPROVED = "refund_approved", "Refund approved"
+        COMMISSION_APPROVED = "commission_approved", "Commission approved"
+
+    type = models.CharField(max_length=30, choices=Type.choices)
+    key = models.CharField(max_length=100, unique=True)
+    occurred_at = models.DateTimeField(default=timezone.now)
+    date = models.DateField()
+    shop = models.ForeignKey(Shop, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Set by the rollup worker in the transaction that applies the event.
+    applied_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["date"]),
+            models.Index(fields=["created_at"]),
+            models.Index(fields=["id"], condition=models.Q(applied_at__isnull=True), name="analytics_event_pending"),
+        ]
+
+    def __str__(self):
+        return self.key
+
+
+class AnalyticsCheckpoint(models.Model):
+    """Lock row of a rollup consumer, with the highest AnalyticsEvent id it has applied."""
+
+    name = models.CharField(max_length=50, unique=True)
+    last_event_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}@{self.last_event_id}"
+
+
+class AnalyticsRebuild(models.Model):
+    """
+    Progress of one rebuild_analytics run, so an interrupted run can resume.
+
+    Partitions are swapped in date order; `completed_through` is the last
+    date whose rows were replaced. Queued runs are started by
+    rollup_analytics before it folds new events.
+    """
+
+    class Status(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        RUNNING = "running", "Running"
+        COMPLETED = "completed", "Completed"
+        FAILED = "failed", "Failed"
+
+    name = models.CharField(max_length=100, unique=True)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    partition_days = models.PositiveIntegerField(default=1)
+    completed_through = models.DateField(null=True, blank=True)
+    rows_changed = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.RUNNING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} {self.start_date}..{self.end_date} ({self.status})"
+
+
+class AnalyticsExportWatermark(models.Model):
+    """
+    Last row export_analytics wrote for one dataset, as an (updated_at, pk) position.
+
+    Incremental exports resume strictly after it, so each nightly run only
+    moves the rows changed since the previous one.
+    """
+
+    dataset = models.CharField(max_length=50, unique=True)
+    last_updated_at = models.DateTimeField(null=True, blank=True)
+    last_pk = models.CharField(max_length=64, blank=True)
+    rows_exported = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.dataset}@{self.last_updated_at}"
+
+
+class AnalyticsRollup(models.Model):
+    """
+    Totals of one subject over one time bucket, at hour, day, month and all-time resolution.
+
+    Maintained incrementally by the rollup worker next to the daily tables.
+    Selectors answer a range from the coarsest buckets that cover it, so the
+    rows read do not grow with the age of a shop. Platform totals use an
+    empty subject_id and store GMV in `revenue`.
+    """
+
+    class Scope(models.TextChoices):
+        SHOP = "shop", "Shop"
+        SUPPLIER = "supplier", "Supplier"
+        PLATFORM = "platform", "Platform"
+        PRODUCT = "product", "Product"
+        CATEGORY = "category", "Category"
+        CONTRACT = "contract", "Marketer contract"
+
+    class Granularity(models.TextChoices):
+        HOUR = "hour", "Hour"
+        DAY = "day", "Day"
+        MONTH = "month", "Month"
+        ALL = "all", "All time"
+
+    scope = models.CharField(max_length=10, choices=Scope.choices)
+    subject_id = models.CharField(max_length=64, blank=True)
+    granularity = models.CharField(max_length=5, choices=Granularity.choices)
+    bucket_start = models.DateTimeField()
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    orders_count = models.IntegerField(default=0)
+    units_sold = models.IntegerField(default=0)
+    refund_amount = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    commission_paid = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    platform_fee = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    referred_orders = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["scope", "subject_id", "granularity", "bucket_start"],
+                name="uniq_analytics_rollup_bucket",
+            ),
+        ]
+        indexes = [
+            # Range queries across subjects (analytics.queries grouped by shop or supplier).
+            models.Index(fields=["scope", "granularity", "bucket_start"], name="analytics_rollup_range_idx"),
+            # Top-N of one bucket (best sellers all time, this month, today).
+            models.Index(fields=["scope", "granularity", "bucket_start", "-units_sold"], name="analytics_rollup_top_units"),
+            models.Index(fields=["scope", "granularity", "bucket_start", "-revenue"], name="analytics_rollup_top_revenue"),
+        ]
+
     def __str__(self):
-        return f"{self.date}"
+        return f"{self.scope}:{self.subject_id} {self.granularity} {self.bucket_start:%Y-%m-%d %H:%M}"
@@ -0,0 +1,208 @@
+import csv
+import json
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from django.conf import settings
+from django.db.models import Q, QuerySet, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import AnalyticsRollup
+from .rollup import ROLLUP_METRICS, covering_buckets, day_start, hour_start, month_start, resolve_buckets
+
+Granularity = AnalyticsRollup.Granularity
+TOTAL = "total"
+
+
+class _EchoBuffer:
+    """File-like object whose write() hands the formatted line straight back."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def parse_bound(value: Optional[str], end: bool = False) -> Optional[datetime]:
+    """Parse an ISO datetime or date; a bare end date includes that whole day."""
+    if not value:
+        return None
+    try:
+        day = parse_date(value)
+        parsed = None if day else parse_datetime(value)
+    except ValueError:
+        day = parsed = None
+    if day:
+        parsed = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+    elif parsed is None:
+        raise ValueError(f"Invalid date: {value}")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class AnalyticsQuery:
+    """
+    Metrics of many subjects over an arbitrary window, read from AnalyticsRollup.
+
+    granularity "hour", "day" or "month" returns one row per subject and
+    bucket (buckets without activity have no row); "total" returns one row
+    per subject summed over the window from at most five runs of whole
+    buckets. The window is rounded outwards to whole buckets and may span at
+    most ANALYTICS_QUERY_MAX_BUCKETS of them, so the rows read per subject
+    are bounded. Rows are streamed with QuerySet.iterator() for exports.
+    """
+
+    GROUPS = {
+        "platform": AnalyticsRollup.Scope.PLATFORM,
+        "shop": AnalyticsRollup.Scope.SHOP,
+        "supplier": AnalyticsRollup.Scope.SUPPLIER,
+        "product": AnalyticsRollup.Scope.PRODUCT,
+        "category": AnalyticsRollup.Scope.CATEGORY,
+        "contract": AnalyticsRollup.Scope.CONTRACT,
+    }
+    GRANULARITIES = (Granularity.HOUR, Granularity.DAY, Granularity.MONTH, TOTAL)
+    FORMATS = {
+        "csv": "text/csv",
+        "ndjson": "application/x-ndjson",
+    }
+
+    def __init__(
+        self,
+        start: datetime,
+        end: Optional[datetime] = None,
+        granularity: str = Granularity.DAY,
+        group_by: str = "platform",
+        subjects: Optional[Iterable[Any]] = None,
+        metrics: Optional[Iterable[str]] = None,
+        ordering: Optional[str] = None,
+        chunk_size: int = 2000,
+    ) -> None:
+        if start is None:
+            raise ValueError("start is required")
+        end = end or timezone.now()
+        if start >= end:
+            raise ValueError("start must be before end")
+        if granularity not in self.GRANULARITIES:
+            raise ValueError(f"Unsupported granularity: {granularity}")
+        if group_by not in self.GROUPS:
+            raise ValueError(f"Unsupported group_by: {group_by}")
+        metrics = list(metrics or ROLLUP_METRICS)
+        unknown = set(metrics) - set(ROLLUP_METRICS)
+        if unknown:
+            raise ValueError(f"Unknown metric: {', '.join(sorted(unknown))}")
+        if ordering and ordering.lstrip("-") not in metrics:
+            raise ValueError("ordering must be one of the selected metrics")
+        if ordering and granularity != TOTAL:
+            raise ValueError("ordering is only supported with granularity=total")
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be greater than 0")
+
+        self.granularity = granularity
+        self.start = self._align(start) if granularity != TOTAL else start
+        self.end = end
+        buckets = self.bucket_count()
+        max_buckets = getattr(settings, "ANALYTICS_QUERY_MAX_BUCKETS", 1000)
+        if buckets > max_buckets:
+            raise ValueError(f"The window spans {buckets} {granularity} buckets; the limit is {max_buckets}")
+
+        self.group_by = group_by
+        self.scope = self.GROUPS[group_by]
+        self.subjects = [str(subject) for subject in subjects or []]
+        self.metrics = metrics
+        self.ordering = ordering
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def from_params(cls, params) -> "AnalyticsQuery":
+        """Build a query from request query params; raises ValueError on bad input."""
+        metrics = [name for name in params.get("metrics", "").split(",") if name]
+        subjects = [subject for value in params.getlist("subject") for subject in value.split(",") if subject]
+        return cls(
+            start=parse_bound(params.get("start")),
+            end=parse_bound(params.get("end"), end=True),
+            granularity=params.get("granularity", Granularity.DAY),
+            group_by=params.get("group_by", "platform"),
+            subjects=subjects,
+            metrics=metrics,
+            ordering=params.get("ordering") or None,
+        )
+
+    @classmethod
+    def content_type(cls, file_format: str) -> str:
+        try:
+            return cls.FORMATS[file_format]
+        except KeyError:
+            raise ValueError(f"Unsupported export format: {file_format}") from None
+
+    @property
+    def headers(self) -> List[str]:
+        headers = ["subject_id"] if self.granularity == TOTAL else ["subject_id", "bucket_start"]
+        return headers + self.metrics
+
+    def bucket_count(self) -> int:
+        if self.granularity == TOTAL:
+            return len(covering_buckets(self.start, self.end))
+        if self.granularity != Granularity.MONTH:
+            size = 3600 if self.granularity == Granularity.HOUR else 86400
+            return -(-int((self.end - self.start).total_seconds()) // size)
+        first = timezone.localtime(self.start).date()
+        last = timezone.localtime(self.end - timedelta(microseconds=1)).date()
+        return (last.year - first.year) * 12 + last.month - first.month + 1
+
+    def queryset(self) -> QuerySet:
+        rows = AnalyticsRollup.objects.filter(scope=self.scope)
+        if self.subjects:
+            rows = rows.filter(subject_id__in=self.subjects)
+        if self.granularity != TOTAL:
+            rows = rows.filter(granularity=self.granularity, bucket_start__gte=self.start, bucket_start__lt=self.end)
+            return rows.order_by("subject_id", "bucket_start").values_list(*self.headers)
+
+        condition = Q(pk__in=[])
+        for granularity, run_start, run_end in resolve_buckets(
+            self.scope, self.start, self.end, self.subjects or None
+        ):
+            condition |= Q(granularity=granularity, bucket_start__gte=run_start, bucket_start__lt=run_end)
+        totals = rows.filter(condition).values("subject_id").annotate(**{name: Sum(name) for name in self.metrics})
+        ordering = [self.ordering, "subject_id"] if self.ordering else ["subject_id"]
+        return totals.order_by(*ordering).values_list(*self.headers)
+
+    def format_row(self, values: Iterable[Any]) -> Dict[str, Any]:
+        return {key: self._format(value) for key, value in zip(self.headers, values)}
+
+    def rows(self) -> Iterator[Dict[str, Any]]:
+        for values in self.queryset().iterator(chunk_size=self.chunk_size):
+            yield self.format_row(values)
+
+    def stream(self, file_format: str) -> Iterator[str]:
+        self.content_type(file_format)
+        if file_format == "csv":
+            return self._stream_csv()
+        return self._stream_ndjson()
+
+    def _align(self, value: datetime) -> datetime:
+        if self.granularity == Granularity.HOUR:
+            return hour_start(value)
+        if self.granularity == Granularity.DAY:
+            return day_start(timezone.localtime(value).date())
+        return month_start(timezone.localtime(value).date())
+
+    def _stream_csv(self) -> Iterator[str]:
+        writer = csv.writer(_EchoBuffer())
+        yield writer.writerow(self.headers)
+        for row in self.rows():
+            yield writer.writerow([row[key] for key in self.headers])
+
+    def _stream_ndjson(self) -> Iterator[str]:
+        for row in self.rows():
+            yield json.dumps(row) + "\n"
+
+    @staticmethod
+    def _format(value: Any) -> Any:
+        if value is None:
+            return None
+        if isinstance(value, datetime):
+            return timezone.localtime(value).isoformat()
+        if isinstance(value, Decimal):
+            return f"{value:.2f}"
+        return value
@@ -0,0 +1,221 @@
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Set, Tuple
+
+from django.db import models, transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from marketer.models import MarketerCommission
+from order.models import Order, OrderItem
+from payment.models import Refund
+
+from .models import AnalyticsEvent, AnalyticsRollup
+from .rollup import TARGETS, AnalyticsRollupWorker, Granularity, aggregate_events, apply_totals, day_start
+from .services import AnalyticsService
+
+# Orders that went through payment; refunds and cancellations after payment are separate events.
+PAID_STATUSES = (
+    Order.Status.PAID,
+    Order.Status.CONFIRMED,
+    Order.Status.PROCESSING,
+    Order.Status.SHIPPED,
+    Order.Status.DELIVERED,
+    Order.Status.REFUNDED,
+)
+DAILY_TIERS = (Granularity.HOUR, Granularity.DAY)
+DAILY_MODELS = [model for model, _, _ in TARGETS.values()]
+CHUNK_SIZE = 500
+
+
+@dataclass
+class PartitionTotals:
+    """Daily rows and hour/day rollups recomputed for [start, end], and the event keys they include."""
+
+    start: date
+    end: date
+    totals: Dict[Tuple, Dict[str, Any]]
+    keys: Set[str] = field(default_factory=set)
+    computed_at: datetime = field(default_factory=timezone.now)
+
+
+@dataclass
+class DiffRow:
+    model: str
+    keys: Tuple
+    metric: str
+    current: Any
+    rebuilt: Any
+
+    def __str__(self):
+        subject = " ".join(f"{name}={value}" for name, value in self.keys)
+        return f"{self.model} {subject} {self.metric}: {self.current} -> {self.rebuilt}"
+
+
+def partitions(start: date, end: date, days: int = 1) -> List[Tuple[date, date]]:
+    if days <= 0:
+        raise ValueError("days must be greater than 0")
+    ranges = []
+    while start <= end:
+        ranges.append((start, min(end, start + timedelta(days=days - 1))))
+        start += timedelta(days=days)
+    return ranges
+
+
+def _chunks(values: List[Any], size: int = CHUNK_SIZE) -> Iterator[List[Any]]:
+    for index in range(0, len(values), size):
+        yield values[index : index + size]
+
+
+def _dated_ids(prefix: str, start: date, end: date, candidates: Dict[str, datetime]) -> Dict[str, datetime]:
+    """
+    Ids (with their occurrence time) of the source rows that belong to [start, end].
+
+    A row with a recorded event is dated like that event, so a rebuild agrees
+    with the incremental path; `candidates` (rows whose own timestamp falls in
+    the range) only count when they have no event dated elsewhere.
+    """
+    recorded = AnalyticsEvent.objects.filter(key__startswith=f"{prefix}:", date__gte=start, date__lte=end)
+    dated = {key.split(":", 1)[1]: occurred_at for key, occurred_at in recorded.values_list("key", "occurred_at")}
+    undated = [source_id for source_id in candidates if source_id not in dated]
+    elsewhere = set()
+    for chunk in _chunks(undated):
+        keys = AnalyticsEvent.objects.filter(key__in=[f"{prefix}:{source_id}" for source_id in chunk])
+        elsewhere.update(key.split(":", 1)[1] for key in keys.values_list("key", flat=True))
+    dated.update({source_id: candidates[source_id] for source_id in undated if source_id not in elsewhere})
+    return dated
+
+
+def source_events(start: date, end: date) -> List[AnalyticsEvent]:
+    """The events of [start, end] derived from orders, refunds and commissions instead of the event log."""
+    lower, upper = day_start(start), day_start(end + timedelta(days=1))
+    items = Prefetch("items", queryset=OrderItem.objects.select_related("product", "variant__product"))
+    events = []
+
+    orders = Order.objects.filter(status__in=PAID_STATUSES, created_at__gte=lower, created_at__lt=upper)
+    candidates = {str(pk): at for pk, at in orders.values_list("id", "created_at")}
+    dated = _dated_ids("order_paid", start, end, candidates)
+    for chunk in _chunks(list(dated)):
+        for order in Order.objects.filter(id__in=chunk).prefetch_related(items):
+            order_items = list(order.items.all())
+            events.append(AnalyticsService.payment_success_event(order, order_items, dated[str(order.id)]))
+
+    refunds = Refund.objects.filter(status=Refund.Status.APPROVED, updated_at__gte=lower, updated_at__lt=upper)
+    candidates = {str(pk): at for pk, at in refunds.values_list("id", "updated_at")}
+    dated = _dated_ids("refund_approved", start, end, candidates)
+    refund_items = Prefetch("payment__order__items", queryset=items.queryset)
+    for chunk in _chunks(list(dated)):
+        chunk_refunds = Refund.objects.filter(id__in=chunk).select_related("payment__order")
+        for refund in chunk_refunds.prefetch_related(refund_items):
+            order = refund.payment.order
+            order_items = list(order.items.all())
+            event = AnalyticsService.refund_approved_event(refund, order, order_items, dated[str(refund.id)])
+            if event is not None:
+                events.append(event)
+
+    commissions = MarketerCommission.objects.filter(
+        status=MarketerCommission.Status.APPROVED,
+        approved_at__gte=lower,
+        approved_at__lt=upper,
+    )
+    candidates = {str(pk): at for pk, at in commissions.values_list("id", "approved_at")}
+    dated = _dated_ids("commission_approved", start, end, candidates)
+    for chunk in _chunks(list(dated)):
+        for commission in MarketerCommission.objects.filter(id__in=chunk).select_related("order"):
+            events.append(AnalyticsService.commission_approved_event(commission, dated[str(commission.id)]))
+    return events
+
+
+def compute_partition(bounds: Tuple[date, date]) -> PartitionTotals:
+    """Recompute one partition from the source tables; read-only, so it can run in a worker process."""
+    start, end = bounds
+    computed_at = timezone.now()
+    events = source_events(start, end)
+    return PartitionTotals(
+        start,
+        end,
+        aggregate_events(events, tiers=DAILY_TIERS),
+        {event.key for event in events},
+        computed_at,
+    )
+
+
+def current_totals(start: date, end: date) -> Dict[Tuple, Dict[str, Any]]:
+    """The daily rows of [start, end] keyed like aggregate_events, platform shards summed."""
+    totals: Dict[Tuple, Dict[str, Any]] = {}
+    for model, key_field, _ in TARGETS.values():
+        metrics = _metric_fields(model)
+        for row in model.objects.filter(date__gte=start, date__lte=end).values(key_field or "shard", "date", *metrics):
+            subject = ("shard", 0) if key_field is None else (key_field, str(row[key_field]))
+            current = totals.setdefault((model, (("date", row["date"]), subject)), {})
+            for name in metrics:
+                current[name] = current.get(name, 0) + row[name]
+    return totals
+
+
+def diff(current: Dict[Tuple, Dict[str, Any]], rebuilt: Dict[Tuple, Dict[str, Any]]) -> List[DiffRow]:
+    """Daily row fields whose rebuilt value differs from the stored one (rollup buckets are left out)."""
+    rows = []
+    for model, keys in sorted(set(current) | set(rebuilt), key=lambda entry: (entry[0]._meta.label, str(entry[1]))):
+        if model is AnalyticsRollup:
+            continue
+        before, after = current.get((model, keys), {}), rebuilt.get((model, keys), {})
+        for name in _metric_fields(model):
+            if before.get(name, 0) != after.get(name, 0):
+                rows.append(DiffRow(model.__name__, keys, name, before.get(name, 0), after.get(name, 0)))
+    return rows
+
+
+@transaction.atomic
+def swap_partition(partition: PartitionTotals, checkpoint: str = "daily") -> int:
+    """
+    Replace the daily rows and hour/day rollups of the partition with the rebuilt ones.
+
+    Runs under the rollup checkpoint lock. Events the worker has not applied
+    yet and that the rebuild already counted are subtracted, since the worker
+    will add them again. Events the worker applied after the partition was
+    computed and that the rebuild did not see are added, since the rows
+    being replaced already held them. Months and all-time buckets are then
+    re-summed.
+    """
+    worker = AnalyticsRollupWorker(name=checkpoint)
+    worker.lock_checkpoint()
+    start, end = partition.start, partition.end
+    totals = {key: dict(increments) for key, increments in partition.totals.items()}
+    pending = AnalyticsEvent.objects.filter(applied_at__isnull=True, date__gte=start, date__lte=end)
+    counted = [event for event in pending.iterator() if event.key in partition.keys]
+    late = AnalyticsEvent.objects.filter(applied_at__gte=partition.computed_at, date__gte=start, date__lte=end)
+    missed = [event for event in late.iterator() if event.key not in partition.keys]
+    for events, sign in ((counted, -1), (missed, 1)):
+        for key, increments in aggregate_events(events, tiers=DAILY_TIERS).items():
+            row = totals.setdefault(key, {})
+            for name, value in increments.items():
+                row[name] = row.get(name, 0) + sign * value
+
+    for model in DAILY_MODELS:
+        model.objects.filter(date__gte=start, date__lte=end).delete()
+    AnalyticsRollup.objects.filter(
+        granularity__in=DAILY_TIERS,
+        bucket_start__gte=day_start(start),
+        bucket_start__lt=day_start(end + timedelta(days=1)),
+    ).delete()
+    return apply_totals(totals) + worker.resum_coarse_tiers(start, end)
+
+
+def _metric_fields(model) -> List[str]:
+    return [
+        field.name
+        for field in model._meta.concrete_fields
+        if isinstance(field, (models.DecimalField, models.IntegerField))
+        and not field.primary_key
+        and field.name != "shard"
+    ]
+
+
+def rebuild_partitions(
+    bounds: Iterable[Tuple[date, date]],
+    mapper=map,
+) -> Iterator[Tuple[PartitionTotals, List[DiffRow]]]:
+    """Compute partitions with `mapper` (map or a process pool's map) and yield each with its diff, in order."""
+    for partition in mapper(compute_partition, list(bounds)):
+        yield partition, diff(current_totals(partition.start, partition.end), partition.totals)
@@ -0,0 +1,325 @@
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.db import models, transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from .cache import DashboardCache, QueryCache
+from .counters import upsert_increment
+from .models import (
+    AnalyticsCheckpoint,
+    AnalyticsEvent,
+    AnalyticsRollup,
+    CategoryDailyAnalytics,
+    MarketerDailyAnalytics,
+    PlatformDailyAnalytics,
+    ProductDailyAnalytics,
+    ShopDailyAnalytics,
+    SupplierDailyAnalytics,
+)
+
+logger = logging.getLogger(__name__)
+
+# Payload section -> (daily model, key field of the section's ids or None for platform rows, rollup scope)
+TARGETS = {
+    "shop": (ShopDailyAnalytics, "shop_id", AnalyticsRollup.Scope.SHOP),
+    "suppliers": (SupplierDailyAnalytics, "supplier_id", AnalyticsRollup.Scope.SUPPLIER),
+    "platform": (PlatformDailyAnalytics, None, AnalyticsRollup.Scope.PLATFORM),
+    "products": (ProductDailyAnalytics, "product_id", AnalyticsRollup.Scope.PRODUCT),
+    "categories": (CategoryDailyAnalytics, "category_id", AnalyticsRollup.Scope.CATEGORY),
+    "contracts": (MarketerDailyAnalytics, "contract_id", AnalyticsRollup.Scope.CONTRACT),
+}
+# Platform payloads use the PlatformDailyAnalytics names; rollups share the shop names.
+ROLLUP_FIELDS = {"total_gmv": "revenue", "total_platform_fee": "platform_fee", "total_orders": "orders_count"}
+ROLLUP_METRICS = (
+    "revenue",
+    "orders_count",
+    "units_sold",
+    "refund_amount",
+    "commission_paid",
+    "platform_fee",
+    "referred_orders",
+)
+
+Granularity = AnalyticsRollup.Granularity
+ALL_TIERS = (Granularity.HOUR, Granularity.DAY, Granularity.MONTH, Granularity.ALL)
+ALL_TIME = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def day_start(day: date) -> datetime:
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def month_start(day: date) -> datetime:
+    return day_start(day.replace(day=1))
+
+
+def next_month(day: date) -> date:
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def hour_start(value: datetime) -> datetime:
+    return timezone.localtime(value).replace(minute=0, second=0, microsecond=0)
+
+
+def bucket_starts(event: AnalyticsEvent, tiers: Sequence[str] = ALL_TIERS) -> List[Tuple[str, datetime]]:
+    """Buckets an event counts towards; days and months follow the event's date like the daily tables."""
+    starts = {
+        Granularity.HOUR: lambda: hour_start(event.occurred_at),
+        Granularity.DAY: lambda: day_start(event.date),
+        Granularity.MONTH: lambda: month_start(event.date),
+        Granularity.ALL: lambda: ALL_TIME,
+    }
+    return [(tier, starts[tier]()) for tier in tiers]
+
+
+def covering_buckets(start: datetime, end: datetime) -> List[Tuple[str, datetime, datetime]]:
+    """
+    Split [start, end) into (granularity, from, to) runs of whole buckets, coarsest in the middle.
+
+    start is rounded down and end up to the hour. A range of any length
+    needs at most five runs: hours, days, months, days, hours.
+    """
+    start = hour_start(start)
+    end_hour = hour_start(end)
+    end = end_hour if end_hour == timezone.localtime(end) else end_hour + timedelta(hours=1)
+    if start >= end:
+        return []
+
+    first_day = timezone.localtime(start).date()
+    if start != day_start(first_day):
+        first_day += timedelta(days=1)
+    last_day = timezone.localtime(end).date()
+    if day_start(first_day) >= day_start(last_day):
+        return [(Granularity.HOUR, start, end)]
+
+    runs = [(Granularity.HOUR, start, day_start(first_day))]
+    first_month = first_day if first_day.day == 1 else next_month(first_day)
+    last_month = last_day.replace(day=1)
+    if first_month < last_month:
+        runs += [
+            (Granularity.DAY, day_start(first_day), day_start(first_month)),
+            (Granularity.MONTH, day_start(first_month), day_start(last_month)),
+            (Granularity.DAY, day_start(last_month), day_start(last_day)),
+        ]
+    else:
+        runs.append((Granularity.DAY, day_start(first_day), day_start(last_day)))
+    runs.append((Granularity.HOUR, day_start(last_day), end))
+    return [(granularity, run_start, run_end) for granularity, run_start, run_end in runs if run_start < run_end]
+
+
+def resolve_buckets(
+    scope: str,
+    start: datetime,
+    end: datetime,
+    subject_ids: Optional[Sequence[str]] = None,
+) -> List[Tuple[str, datetime, datetime]]:
+    """
+    covering_buckets, with the hours of a day read from its whole-day bucket when the hour tier lacks them.
+
+    Migration 0005 backfilled days, months and all time but no hours, so the
+    hours of earlier days sum to less than their day bucket. Such a day is
+    read whole, counting the hours outside the range rather than dropping
+    the ones inside it.
+    """
+    runs = covering_buckets(start, end)
+    pieces = []
+    for granularity, run_start, run_end in runs:
+        if granularity != Granularity.HOUR:
+            continue
+        while run_start < run_end:
+            day = timezone.localtime(run_start).date()
+            piece_end = min(run_end, day_start(day + timedelta(days=1)))
+            pieces.append((day, run_start, piece_end))
+            run_start = piece_end
+    if not pieces:
+        return runs
+
+    days = sorted({day for day, _, _ in pieces})
+    rows = AnalyticsRollup.objects.filter(scope=scope)
+    if subject_ids is not None:
+        rows = rows.filter(subject_id__in=subject_ids)
+    sums = {}
+    for index, day in enumerate(days):
+        hours = Q(granularity=Granularity.HOUR, bucket_start__gte=day_start(day))
+        hours &= Q(bucket_start__lt=day_start(day + timedelta(days=1)))
+        whole_day = Q(granularity=Granularity.DAY, bucket_start=day_start(day))
+        for name in ROLLUP_METRICS:
+            sums[f"{name}_{index}_hour"] = Sum(name, filter=hours)
+            sums[f"{name}_{index}_day"] = Sum(name, filter=whole_day)
+    totals = {key: Decimal(str(value or 0)).quantize(Decimal("0.01")) for key, value in rows.aggregate(**sums).items()}
+    partial = {
+        day
+        for index, day in enumerate(days)
+        if any(totals[f"{name}_{index}_hour"] != totals[f"{name}_{index}_day"] for name in ROLLUP_METRICS)
+    }
+    if not partial:
+        return runs
+
+    resolved = [run for run in runs if run[0] != Granularity.HOUR]
+    for day, piece_start, piece_end in pieces:
+        run = (Granularity.DAY, day_start(day), day_start(day + timedelta(days=1)))
+        if day not in partial:
+            resolved.append((Granularity.HOUR, piece_start, piece_end))
+        elif run not in resolved:
+            resolved.append(run)
+    return resolved
+
+
+@dataclass
+class RollupResult:
+    events: int = 0
+    rows: int = 0
+    batches: int = 0
+    last_event_id: int = 0
+
+
+def _coerce(model, name: str, value: Any):
+    field = model._meta.get_field(name)
+    return Decimal(str(value)) if isinstance(field, models.DecimalField) else int(value)
+
+
+def aggregate_events(
+    events: Iterable[AnalyticsEvent],
+    tiers: Sequence[str] = ALL_TIERS,
+) -> Dict[Tuple, Dict[str, Any]]:
+    """
+    Sum event payloads into {(model, keys): increments}.
+
+    Keys are tuples of the target row's unique fields, so many events for the
+    same shop and day become one write. Every daily row increment is repeated
+    for the rollup buckets of `tiers`.
+    """
+    totals: Dict[Tuple, Dict[str, Any]] = {}
+
+    def add(model, keys: Tuple, increments: Dict[str, Any]) -> None:
+        row = totals.setdefault((model, keys), {})
+        for name, value in increments.items():
+            row[name] = row.get(name, 0) + _coerce(model, name, value)
+
+    for event in events:
+        payload = event.payload or {}
+        buckets = bucket_starts(event, tiers)
+        for section, (model, key_field, scope) in TARGETS.items():
+            data = payload.get(section)
+            if not data:
+                continue
+            if key_field is None:
+                subjects = {"": data}
+            elif section == "shop":
+                subjects = {str(event.shop_id): data} if event.shop_id else {}
+            else:
+                subjects = data
+            for subject_id, increments in subjects.items():
+                subject_key = ("shard", 0) if key_field is None else (key_field, subject_id)
+                add(model, (("date", event.date), subject_key), increments)
+                rollup_increments = {ROLLUP_FIELDS.get(name, name): value for name, value in increments.items()}
+                for granularity, bucket_start in buckets:
+                    add(
+                        AnalyticsRollup,
+                        (
+                            ("scope", scope),
+                            ("subject_id", subject_id),
+                            ("granularity", granularity),
+                            ("bucket_start", bucket_start),
+                        ),
+                        rollup_increments,
+                    )
+    return totals
+
+
+def apply_totals(totals: Dict[Tuple, Dict[str, Any]]) -> int:
+    # A stable order keeps concurrent writers (a rebuild and the worker) from deadlocking.
+    ordered = sorted(totals.items(), key=lambda entry: (entry[0][0]._meta.label, str(entry[0][1])))
+    for (model, keys), increments in ordered:
+        upsert_increment(model, dict(keys), increments)
+    return len(totals)
+
+
+class AnalyticsRollupWorker:
+    """
+    Folds AnalyticsEvent rows into the daily tables in id order.
+
+    Each batch runs in one transaction that locks the checkpoint row, applies
+    the summed increments and stamps the events' applied_at, so a crash
+    either applies a batch and its stamps together or neither, and two
+    workers never apply the same events. Events are picked by applied_at
+    rather than by id, so an event whose transaction commits after events
+    with higher ids were applied is still rolled up by a later batch. Only
+    events older than settle_seconds are read, which lets most of the
+    events of one burst land in the same batch.
+    """
+
+    def __init__(self, name: str = "daily", batch_size: int = 1000, settle_seconds: float = 5.0) -> None:
+        if batch_size <= 0:
+            raise ValueError("batch_size must be greater than 0")
+        self.name = name
+        self.batch_size = batch_size
+        self.settle_seconds = settle_seconds
+
+    def run(self, max_batches: Optional[int] = None) -> RollupResult:
+        result = RollupResult()
+        while max_batches is None or result.batches < max_batches:
+            applied = self.run_batch()
+            if applied is None:
+                break
+            events, rows, last_event_id = applied
+            result.events += events
+            result.rows += rows
+            result.batches += 1
+            result.last_event_id = last_event_id
+        if result.events:
+            logger.info("Analytics rollup %s applied events=%s rows=%s", self.name, result.events, result.rows)
+        return result
+
+    @transaction.atomic
+    def run_batch(self) -> Optional[Tuple[int, int, int]]:
+        checkpoint = self.lock_checkpoint()
+        cutoff = timezone.now() - timedelta(seconds=self.settle_seconds)
+        due = AnalyticsEvent.objects.filter(applied_at__isnull=True, created_at__lte=cutoff)
+        events = list(due.order_by("id")[: self.batch_size])
+        if not events:
+            return None
+        totals = aggregate_events(events)
+        rows = apply_totals(totals)
+        AnalyticsEvent.objects.filter(id__in=[event.id for event in events]).update(applied_at=timezone.now())
+        DashboardCache.invalidate((keys[0][1], keys[1][1]) for model, keys in totals if model is AnalyticsRollup)
+        QueryCache.invalidate()
+        checkpoint.last_event_id = max(checkpoint.last_event_id, events[-1].id)
+        checkpoint.save(update_fields=["last_event_id", "updated_at"])
+        return len(events), rows, checkpoint.last_event_id
+
+    def resum_coarse_tiers(self, start: date, end: date) -> int:
+        """Re-sum the month buckets touching [start, end] from days, then all time from months."""
+        rows = 0
+        month = start.replace(day=1)
+        while month <= end:
+            bucket, bucket_end = month_start(month), month_start(next_month(month))
+            rows += self._resum(Granularity.MONTH, bucket, Granularity.DAY, bucket, bucket_end)
+            month = next_month(month)
+        rows += self._resum(Granularity.ALL, ALL_TIME, Granularity.MONTH)
+        DashboardCache.invalidate_all()
+        QueryCache.invalidate()
+        return rows
+
+    @staticmethod
+    def _resum(granularity: str, bucket: datetime, source: str, source_start=None, source_end=None) -> int:
+        """Replace the `granularity` buckets at `bucket` with the sums of the `source` buckets in range."""
+        AnalyticsRollup.objects.filter(granularity=granularity, bucket_start=bucket).delete()
+        rows = AnalyticsRollup.objects.filter(granularity=source)
+        if source_start is not None:
+            rows = rows.filter(bucket_start__gte=source_start, bucket_start__lt=source_end)
+        sums = rows.values("scope", "subject_id").annotate(**{name: Sum(name) for name in ROLLUP_METRICS}).order_by()
+        created = AnalyticsRollup.objects.bulk_create(
+            [AnalyticsRollup(granularity=granularity, bucket_start=bucket, **row) for row in sums],
+            batch_size=1000,
+        )
+        return len(created)
+
+    def lock_checkpoint(self) -> AnalyticsCheckpoint:
+        AnalyticsCheckpoint.objects.get_or_create(name=self.name)
+        return AnalyticsCheckpoint.objects.select_for_update().get(name=self.name)
@@ -1,102 +1,268 @@
-from datetime import timedelta
+from datetime import datetime, timedelta
 from decimal import Decimal
+from typing import Any, Dict, List, Optional
 
-from django.db.models import Sum
+from django.db import connection
+from django.db.models import CharField, OuterRef, Q, QuerySet, Sum, Value
+from django.db.models.functions import Cast, Concat, Substr
 from django.utils import timezone
 
-from payment.models import Earning
+from payment.services.balances import BalanceService
 from shop.models import Shop
 
-from .models import (
-    PlatformDailyAnalytics,
-    ShopDailyAnalytics,
-    SupplierDailyAnalytics,
-)
+from .models import AnalyticsRollup, ProductDailyAnalytics
+from .rollup import ALL_TIME, ROLLUP_METRICS, day_start, month_start, resolve_buckets
+
+Granularity = AnalyticsRollup.Granularity
 
 
 def _decimal(value) -> Decimal:
     return Decimal(str(value or "0"))
 
 
-def _last_days_series(qs, date_field: str, value_field: str, key_name: str, days: int = 7):
-    today = timezone.localdate()
-    start = today - timedelta(days=days - 1)
-    rows = qs.filter(**{f"{date_field}__gte": start}).values(date_field).annotate(
-        total=Sum(value_field)
+def _covering(
+    scope: str,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    subject_ids: Optional[List[str]] = None,
+) -> Q:
+    """Filter for the whole buckets covering [start, end); matches nothing for an empty range."""
+    condition = Q(pk__in=[])
+    for granularity, run_start, run_end in resolve_buckets(
+        scope, start or ALL_TIME, end or timezone.now(), subject_ids
+    ):
+        condition |= Q(granularity=granularity, bucket_start__gte=run_start, bucket_start__lt=run_end)
+    return condition
+
+
+def rollup_totals(
+    scope: str,
+    subject_id,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> Dict[str, Decimal]:
+    """
+    Metric totals of one subject over [start, end), or all time when no range is given.
+
+    The range is read from at most five runs of whole buckets (hours, days,
+    months, days, hours), so the rows summed stay bounded however old the
+    subject is.
+    """
+    rows = AnalyticsRollup.objects.filter(scope=scope, subject_id=str(subject_id or ""))
+    if start is None and end is None:
+        rows = rows.filter(granularity=Granularity.ALL, bucket_start=ALL_TIME)
+    else:
+        rows = rows.filter(_covering(scope, start, end, [str(subject_id or "")]))
+    totals = rows.aggregate(**{name: Sum(name) for name in ROLLUP_METRICS})
+    return {name: _decimal(value) for name, value in totals.items()}
+
+
+def rollup_subject_id(expression):
+    """A UUID column as the text str(uuid) writes into AnalyticsRollup.subject_id."""
+    if connection.features.has_native_uuid_field:
+        return Cast(expression, CharField())
+    # Stored as 32 hex digits, so the dashes are put back.
+    parts = [Substr(expression, start, length) for start, length in ((1, 8), (9, 4), (13, 4), (17, 4), (21, 12))]
+    pieces = [parts[0]]
+    for part in parts[1:]:
+        pieces += [Value("-"), part]
+    return Concat(*pieces, output_field=CharField())
+
+
+def all_time_subquery(scope: str, metric: str, subject: str = "pk") -> QuerySet:
+    """
+    The all-time `metric` of the subject given by the outer `subject` column, for Subquery().
+
+    Reads one row by the bucket's unique key instead of summing daily rows.
+    """
+    return AnalyticsRollup.objects.filter(
+        scope=scope,
+        subject_id=rollup_subject_id(OuterRef(subject)),
+        granularity=Granularity.ALL,
+        bucket_start=ALL_TIME,
+    ).values(metric)[:1]
+
+
+def top_subjects(
+    scope: str,
+    metric: str = "units_sold",
+    limit: int = 10,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> List[Dict[str, Any]]:
+    """
+    The `limit` subjects with the highest `metric`, as [{"subject_id", metric}].
+
+    All time reads the first rows of the all-time bucket down the top-N
+    index; a range sums the covering buckets of each subject first.
+    """
+    if metric not in ROLLUP_METRICS:
+        raise ValueError(f"Unknown metric: {metric}")
+    rows = AnalyticsRollup.objects.filter(scope=scope)
+    if start is None and end is None:
+        ranked = rows.filter(granularity=Granularity.ALL, bucket_start=ALL_TIME).values("subject_id", metric)
+    else:
+        ranked = rows.filter(_covering(scope, start, end)).values("subject_id").annotate(**{metric: Sum(metric)})
+    return list(ranked.order_by(f"-{metric}", "subject_id")[:limit])
+
+
+def top_products(metric: str = "units_sold", limit: int = 10, days: Optional[int] = None) -> List[Dict[str, Any]]:
+    start = day_start(timezone.localdate() - timedelta(days=days - 1)) if days else None
+    return top_subjects(AnalyticsRollup.Scope.PRODUCT, metric, limit, start=start)
+
+
+def top_categories(metric: str = "units_sold", limit: int = 10, days: Optional[int] = None) -> List[Dict[str, Any]]:
+    start = day_start(timezone.localdate() - timedelta(days=days - 1)) if days else None
+    return top_subjects(AnalyticsRollup.Scope.CATEGORY, metric, limit, start=start)
+
+
+def top_supplier_products(user, limit: int = 5, days: int = 30) -> List[Dict[str, Any]]:
+    """A supplier's best selling products over the last `days` days."""
+    rows = (
+        ProductDailyAnalytics.objects.filter(
+            product__supplier=user,
+            date__gte=timezone.localdate() - timedelta(days=days - 1),
+        )
+        .values("product_id", "product__name")
+        .annotate(units_sold=Sum("units_sold"), revenue=Sum("revenue"))
+        .order_by("-units_sold", "product_id")[:limit]
     )
-    by_date = {row[date_field]: _decimal(row["total"]) for row in rows}
-    result = []
-    for offset in range(days):
-        day = start + timedelta(days=offset)
-        result.append({"date": str(day), key_name: str(by_date.get(day, Decimal("0.00")))})
-    return result
+    return [
+        {
+            "product_id": str(row["product_id"]),
+            "name": row["product__name"],
+            "units_sold": int(row["units_sold"]),
+            "revenue": _money(_decimal(row["revenue"])),
+        }
+        for row in rows
+    ]
 
 
-def get_shop_dashboard(shop: Shop) -> dict:
+def _dashboard_buckets(scope: str, subject_id, days: int = 7) -> dict:
+    """All-time, current month and last `days` day buckets of one subject, read with one query."""
     today = timezone.localdate()
-    month_start = today.replace(day=1)
-    qs = ShopDailyAnalytics.objects.filter(shop=shop)
-    totals = qs.aggregate(
-        total_revenue=Sum("revenue"),
-        orders_count=Sum("orders_count"),
-        units_sold=Sum("units_sold"),
-        refund_amount=Sum("refund_amount"),
-        commission_paid=Sum("commission_paid"),
-        platform_fee=Sum("platform_fee"),
+    first_day = today - timedelta(days=days - 1)
+    rows = AnalyticsRollup.objects.filter(scope=scope, subject_id=str(subject_id or "")).filter(
+        Q(granularity=Granularity.ALL, bucket_start=ALL_TIME)
+        | Q(granularity=Granularity.MONTH, bucket_start=month_start(today))
+        | Q(granularity=Granularity.DAY, bucket_start__gte=day_start(first_day))
+    )
+    empty = {name: Decimal("0") for name in ROLLUP_METRICS}
+    buckets = {"all": empty, "month": empty, "days": {}}
+    for row in rows.values("granularity", "bucket_start", *ROLLUP_METRICS):
+        metrics = {name: _decimal(row[name]) for name in ROLLUP_METRICS}
+        if row["granularity"] == Granularity.DAY:
+            buckets["days"][timezone.localtime(row["bucket_start"]).date()] = metrics
+        else:
+            buckets[row["granularity"]] = metrics
+    buckets["today"] = buckets["days"].get(today, empty)
+    buckets["series"] = [
+        (first_day + timedelta(days=offset), buckets["days"].get(first_day + timedelta(days=offset), empty))
+        for offset in range(days)
+    ]
+    return buckets
+
+
+def contract_totals(contract_ids, shop_id=None) -> Dict[str, Dict[str, Decimal]]:
+    """
+    All-time and current month metrics summed over marketer contracts, read with one query.
+
+    An order referred by two contracts counts once in each, so the all-time
+    referred_orders of a shop's contracts is read from the shop's own bucket
+    (given by shop_id). A marketer holds one contract per shop and an order
+    belongs to one shop, so without shop_id the contract order counts are
+    already distinct.
+    """
+    contracts = Q(
+        scope=AnalyticsRollup.Scope.CONTRACT,
+        subject_id__in=[str(contract_id) for contract_id in contract_ids],
+    ) & (
+        Q(granularity=Granularity.ALL, bucket_start=ALL_TIME)
+        | Q(granularity=Granularity.MONTH, bucket_start=month_start(timezone.localdate()))
     )
-    this_month = qs.filter(date__gte=month_start).aggregate(total=Sum("revenue"))["total"]
-    today_orders = qs.filter(date=today).aggregate(total=Sum("orders_count"))["total"]
+    if shop_id is not None:
+        contracts |= Q(
+            scope=AnalyticsRollup.Scope.SHOP,
+            subject_id=str(shop_id),
+            granularity=Granularity.ALL,
+            bucket_start=ALL_TIME,
+        )
+    empty = {name: Decimal("0.00") for name in ROLLUP_METRICS}
+    totals = {Granularity.ALL: dict(empty), Granularity.MONTH: dict(empty)}
+    referred_orders = None
+    rows = AnalyticsRollup.objects.filter(contracts).values("scope", "granularity")
+    for row in rows.annotate(**{name: Sum(name) for name in ROLLUP_METRICS}).order_by():
+        if row["scope"] == AnalyticsRollup.Scope.SHOP:
+            referred_orders = _decimal(row["referred_orders"])
+        else:
+            totals[row["granularity"]] = {name: _decimal(row[name]) for name in ROLLUP_METRICS}
+    all_time = totals[Granularity.ALL]
+    if shop_id is None:
+        all_time["referred_orders"] = all_time["orders_count"]
+    else:
+        all_time["referred_orders"] = referred_orders or Decimal("0")
+    return {"all": all_time, "month": totals[Granularity.MONTH]}
+
+
+def _money(value: Decimal) -> str:
+    return f"{value:.2f}"
+
+
+def _series(buckets: dict, key_name: str) -> list:
+    return [{"date": str(day), key_name: _money(metrics["revenue"])} for day, metrics in buckets["series"]]
+
+
+def get_shop_dashboard(shop: Shop) -> dict:
+    buckets = _dashboard_buckets(AnalyticsRollup.Scope.SHOP, shop.id)
+    totals = buckets["all"]
     return {
-        "total_revenue": str(_decimal(totals["total_revenue"])),
-        "this_month_revenue": str(_decimal(this_month)),
-        "orders_count": int(totals["orders_count"] or 0),
-        "units_sold": int(totals["units_sold"] or 0),
-        "refund_amount": str(_decimal(totals["refund_amount"])),
-        "commission_paid": str(_decimal(totals["commission_paid"])),
-        "platform_fee": str(_decimal(totals["platform_fee"])),
-        "today_orders": int(today_orders or 0),
-        "last_7_days": _last_days_series(qs, "date", "revenue", "revenue", days=7),
+        "total_revenue": _money(totals["revenue"]),
+        "this_month_revenue": _money(buckets["month"]["revenue"]),
+        "orders_count": int(totals["orders_count"]),
+        "units_sold": int(totals["units_sold"]),
+        "refund_amount": _money(totals["refund_amount"]),
+        "commission_paid": _money(totals["commission_paid"]),
+        "platform_fee": _money(totals["platform_fee"]),
+        "today_orders": int(buckets["today"]["orders_count"]),
+        "last_7_days": _series(buckets, "revenue"),
     }
 
 
-def get_supplier_dashboard(user) -> dict:
-    today = timezone.localdate()
-    month_start = today.replace(day=1)
-    qs = SupplierDailyAnalytics.objects.filter(supplier=user)
-    totals = qs.aggregate(
-        total_revenue=Sum("revenue"),
-        units_sold=Sum("units_sold"),
-        orders_count=Sum("orders_count"),
-    )
-    this_month = qs.filter(date__gte=month_start).aggregate(total=Sum("revenue"))["total"]
-    pending_payout = (
-        Earning.objects.filter(user=user, status=Earning.Status.AVAILABLE)
-        .aggregate(total=Sum("amount"))["total"]
-    )
+def get_supplier_analytics(user) -> dict:
+    """The rollup part of the supplier dashboard; pending_payout is read live by get_supplier_dashboard."""
+    buckets = _dashboard_buckets(AnalyticsRollup.Scope.SUPPLIER, user.id)
+    totals = buckets["all"]
     return {
-        "total_revenue": str(_decimal(totals["total_revenue"])),
-        "this_month_revenue": str(_decimal(this_month)),
-        "units_sold": int(totals["units_sold"] or 0),
-        "orders_count": int(totals["orders_count"] or 0),
-        "pending_payout": str(_decimal(pending_payout)),
-        "last_7_days": _last_days_series(qs, "date", "revenue", "revenue", days=7),
+        "total_revenue": _money(totals["revenue"]),
+        "this_month_revenue": _money(buckets["month"]["revenue"]),
+        "units_sold": int(totals["units_sold"]),
+        "orders_count": int(totals["orders_count"]),
+        "last_7_days": _series(buckets, "revenue"),
     }
 
 
+def get_supplier_product_analytics(user) -> dict:
+    """get_supplier_analytics plus the supplier's best sellers, for the supplier analytics endpoint."""
+    return {**get_supplier_analytics(user), "top_products": top_supplier_products(user)}
+
+
+def get_supplier_pending_payout(user) -> str:
+    return str(_decimal(BalanceService.available_for(user)))
+
+
+def get_supplier_dashboard(user, analytics: Optional[dict] = None) -> dict:
+    if analytics is None:
+        analytics = get_supplier_analytics(user)
+    return {**analytics, "pending_payout": get_supplier_pending_payout(user)}
+
+
 def get_admin_dashboard() -> dict:
-    today = timezone.localdate()
-    month_start = today.replace(day=1)
-    qs = PlatformDailyAnalytics.objects.all()
-    totals = qs.aggregate(
-        total_gmv=Sum("total_gmv"),
-        total_platform_fee=Sum("total_platform_fee"),
-        total_orders=Sum("total_orders"),
-    )
-    this_month = qs.filter(date__gte=month_start).aggregate(total=Sum("total_gmv"))["total"]
+    buckets = _dashboard_buckets(AnalyticsRollup.Scope.PLATFORM, "")
+    totals = buckets["all"]
     return {
-        "total_gmv": str(_decimal(totals["total_gmv"])),
-        "this_month_gmv": str(_decimal(this_month)),
-        "total_platform_fee": str(_decimal(totals["total_platform_fee"])),
-        "total_orders": int(totals["total_orders"] or 0),
-        "last_7_days": _last_days_series(qs, "date", "total_gmv", "gmv", days=7),
+        "total_gmv": _money(totals["revenue"]),
+        "this_month_gmv": _money(buckets["month"]["revenue"]),
+        "total_platform_fee": _money(totals["platform_fee"]),
+        "total_orders": int(totals["orders_count"]),
+        "last_7_days": _series(buckets, "gmv"),
     }
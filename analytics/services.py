@@ -1,17 +1,13 @@
 from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
 
 from django.db import transaction
-from django.db.models import F
 from django.utils import timezone
 
 from order.models import Order
 from payment.models import Refund
 
-from .models import (
-    PlatformDailyAnalytics,
-    ShopDailyAnalytics,
-    SupplierDailyAnalytics,
-)
+from .models import AnalyticsEvent
 
 
 PLATFORM_FEE_RATE = Decimal("0.10")
@@ -21,137 +17,218 @@ def _decimal(value) -> Decimal:
     return Decimal(str(value or "0"))
 
 
-def _get_locked_row(model, **lookup):
-    row = model.objects.select_for_update().filter(**lookup).first()
-    if row:
-        return row
-    return model.objects.create(**lookup)
+def _supplier_lines(items) -> Dict[str, Tuple[Decimal, int]]:
+    """(supplier amount, units) per supplier id, priced at the supplier price when set."""
+    lines: Dict[str, Tuple[Decimal, int]] = {}
+    for item in items:
+        product = item.product if item.product else (item.variant.product if item.variant else None)
+        supplier_id = getattr(product, "supplier_id", None) if product else None
+        if not supplier_id:
+            continue
+        supplier_price = product.supplier_price if product.supplier_price is not None else item.price
+        amount, units = lines.get(str(supplier_id), (Decimal("0.00"), 0))
+        lines[str(supplier_id)] = (
+            amount + _decimal(supplier_price) * _decimal(item.quantity),
+            units + int(item.quantity),
+        )
+    return lines
+
+
+def _product_lines(items) -> Dict[str, Dict[str, Tuple[Decimal, int]]]:
+    """(amount, units) per product id and per category id, at the price the customer paid."""
+    lines: Dict[str, Dict[str, Tuple[Decimal, int]]] = {"products": {}, "categories": {}}
+    for item in items:
+        product = item.product if item.product else (item.variant.product if item.variant else None)
+        if not product:
+            continue
+        for section, subject_id in (("products", product.id), ("categories", product.category_id)):
+            if not subject_id:
+                continue
+            amount, units = lines[section].get(str(subject_id), (Decimal("0.00"), 0))
+            lines[section][str(subject_id)] = (amount + _decimal(item.total), units + int(item.quantity))
+    return lines
+
+
+def _contract_lines(items) -> Dict[str, Tuple[Decimal, int]]:
+    """(amount, units) per marketer contract id of the items a marketer referred."""
+    lines: Dict[str, Tuple[Decimal, int]] = {}
+    for item in items:
+        if not item.marketer_contract_id:
+            continue
+        amount, units = lines.get(str(item.marketer_contract_id), (Decimal("0.00"), 0))
+        lines[str(item.marketer_contract_id)] = (amount + _decimal(item.total), units + int(item.quantity))
+    return lines
+
+
+def _refund_increments(amount: Decimal) -> Dict[str, str]:
+    return {"revenue": str(-amount), "refund_amount": str(amount)}
+
+
+def _order_items(order: Order) -> List:
+    return list(order.items.select_related("product", "variant__product").all())
 
 
 class AnalyticsService:
+    """
+    Records analytics events; the daily tables and rollups are filled by rollup_analytics.
+
+    Each handler computes the increments of its event once and appends a
+    single AnalyticsEvent row, so the webhook transaction no longer touches
+    the shared daily rows. The payload holds the increments per target
+    ("shop", "platform", "suppliers", "products", "categories", "contracts")
+    in the units of the rollup tables.
+    """
+
     @staticmethod
     @transaction.atomic
     def handle_payment_success(order: Order) -> None:
         if order.status != Order.Status.PAID:
             return
-
-        today = timezone.localdate()
-        items = list(
-            order.items.select_related(
-                "product__supplier",
-                "variant__product__supplier",
-                "product",
-            ).all()
-        )
-
-        order_total = _decimal(order.total_amount)
-        units_sold = sum(int(item.quantity) for item in items)
-        platform_fee = (order_total * PLATFORM_FEE_RATE).quantize(Decimal("0.01"))
-
-        shop_row = _get_locked_row(ShopDailyAnalytics, shop=order.shop, date=today)
-        ShopDailyAnalytics.objects.filter(pk=shop_row.pk).update(
-            revenue=F("revenue") + order_total,
-            orders_count=F("orders_count") + 1,
-            units_sold=F("units_sold") + units_sold,
-            platform_fee=F("platform_fee") + platform_fee,
-            updated_at=timezone.now(),
-        )
-
-        platform_row = _get_locked_row(PlatformDailyAnalytics, date=today)
-        PlatformDailyAnalytics.objects.filter(pk=platform_row.pk).update(
-            total_gmv=F("total_gmv") + order_total,
-            total_platform_fee=F("total_platform_fee") + platform_fee,
-            total_orders=F("total_orders") + 1,
-            updated_at=timezone.now(),
-        )
-
-        supplier_rollup = {}
-        for item in items:
-            product = item.product if item.product else (item.variant.product if item.variant else None)
-            supplier = getattr(product, "supplier", None) if product else None
-            if not supplier:
-                continue
-            supplier_price = product.supplier_price if product.supplier_price is not None else item.price
-            line_amount = _decimal(supplier_price) * _decimal(item.quantity)
-            payload = supplier_rollup.setdefault(
-                supplier.id,
-                {"supplier": supplier, "revenue": Decimal("0.00"), "units": 0},
-            )
-            payload["revenue"] += line_amount
-            payload["units"] += int(item.quantity)
-
-        for payload in supplier_rollup.values():
-            row = _get_locked_row(
-                SupplierDailyAnalytics,
-                supplier=payload["supplier"],
-                date=today,
-            )
-            SupplierDailyAnalytics.objects.filter(pk=row.pk).update(
-                revenue=F("revenue") + payload["revenue"],
-                units_sold=F("units_sold") + payload["units"],
-                orders_count=F("orders_count") + 1,
-                updated_at=timezone.now(),
-            )
+        AnalyticsService._record([AnalyticsService.payment_success_event(order, _order_items(order), timezone.now())])
 
     @staticmethod
     @transaction.atomic
     def handle_refund_approved(refund: Refund) -> None:
         if refund.status != Refund.Status.APPROVED:
             return
-
         order = refund.payment.order
-        items = list(
-            order.items.select_related(
-                "product__supplier",
-                "variant__product__supplier",
-                "product",
-            ).all()
+        event = AnalyticsService.refund_approved_event(
+            refund,
+            order,
+            _order_items(order),
+            refund.updated_at or timezone.now(),
+        )
+        if event is not None:
+            AnalyticsService._record([event])
+
+    @staticmethod
+    @transaction.atomic
+    def handle_commission_approved(commissions: Iterable) -> None:
+        """Record approved marketer commissions as paid by the order's shop and earned on the contract."""
+        now = timezone.now()
+        events = [
+            AnalyticsService.commission_approved_event(commission, commission.approved_at or now)
+            for commission in commissions
+        ]
+        if events:
+            AnalyticsService._record(events)
+
+    # Event builders, shared with analytics.rebuild which derives the same
+    # events from orders, refunds and commissions.
+
+    @staticmethod
+    def payment_success_event(order: Order, items: List, occurred_at) -> AnalyticsEvent:
+        order_total = _decimal(order.total_amount)
+        platform_fee = (order_total * PLATFORM_FEE_RATE).quantize(Decimal("0.01"))
+        contracts = _contract_lines(items)
+        return AnalyticsService._event(
+            AnalyticsEvent.Type.ORDER_PAID,
+            key=f"order_paid:{order.id}",
+            occurred_at=occurred_at,
+            shop_id=order.shop_id,
+            payload={
+                "order_id": str(order.id),
+                "shop": {
+                    "revenue": str(order_total),
+                    "orders_count": 1,
+                    "units_sold": sum(int(item.quantity) for item in items),
+                    "platform_fee": str(platform_fee),
+                    "referred_orders": 1 if contracts else 0,
+                },
+                "platform": {
+                    "total_gmv": str(order_total),
+                    "total_platform_fee": str(platform_fee),
+                    "total_orders": 1,
+                },
+                "suppliers": {
+                    supplier_id: {"revenue": str(amount), "units_sold": units, "orders_count": 1}
+                    for supplier_id, (amount, units) in _supplier_lines(items).items()
+                },
+                **{
+                    section: {
+                        subject_id: {"revenue": str(amount), "units_sold": units, "orders_count": 1}
+                        for subject_id, (amount, units) in subjects.items()
+                    }
+                    for section, subjects in _product_lines(items).items()
+                },
+                "contracts": {
+                    contract_id: {"revenue": str(amount), "units_sold": units, "orders_count": 1}
+                    for contract_id, (amount, units) in contracts.items()
+                },
+            },
         )
+
+    @staticmethod
+    def refund_approved_event(refund: Refund, order: Order, items: List, occurred_at) -> Optional[AnalyticsEvent]:
         item_total = sum((_decimal(item.total) for item in items), Decimal("0.00"))
         if item_total <= Decimal("0.00"):
-            return
+            return None
 
         refund_amount = _decimal(refund.amount)
         refund_ratio = min(Decimal("1.00"), refund_amount / item_total)
-        today = timezone.localdate(refund.updated_at or timezone.now())
-
-        shop_row = _get_locked_row(ShopDailyAnalytics, shop=order.shop, date=today)
         platform_fee = (refund_amount * PLATFORM_FEE_RATE).quantize(Decimal("0.01"))
-        ShopDailyAnalytics.objects.filter(pk=shop_row.pk).update(
-            revenue=F("revenue") - refund_amount,
-            refund_amount=F("refund_amount") + refund_amount,
-            platform_fee=F("platform_fee") - platform_fee,
-            updated_at=timezone.now(),
+        return AnalyticsService._event(
+            AnalyticsEvent.Type.REFUND_APPROVED,
+            key=f"refund_approved:{refund.id}",
+            occurred_at=occurred_at,
+            shop_id=order.shop_id,
+            payload={
+                "order_id": str(order.id),
+                "refund_id": str(refund.id),
+                "shop": {
+                    "revenue": str(-refund_amount),
+                    "refund_amount": str(refund_amount),
+                    "platform_fee": str(-platform_fee),
+                },
+                "platform": {
+                    "total_gmv": str(-refund_amount),
+                    "total_platform_fee": str(-platform_fee),
+                },
+                "suppliers": {
+                    supplier_id: {"revenue": str(-(amount * refund_ratio).quantize(Decimal("0.01")))}
+                    for supplier_id, (amount, _) in _supplier_lines(items).items()
+                },
+                **{
+                    section: {
+                        subject_id: _refund_increments((amount * refund_ratio).quantize(Decimal("0.01")))
+                        for subject_id, (amount, _) in subjects.items()
+                    }
+                    for section, subjects in _product_lines(items).items()
+                },
+                "contracts": {
+                    contract_id: {"revenue": str(-(amount * refund_ratio).quantize(Decimal("0.01")))}
+                    for contract_id, (amount, _) in _contract_lines(items).items()
+                },
+            },
+        )
+
+    @staticmethod
+    def commission_approved_event(commission, occurred_at) -> AnalyticsEvent:
+        return AnalyticsService._event(
+            AnalyticsEvent.Type.COMMISSION_APPROVED,
+            key=f"commission_approved:{commission.id}",
+            occurred_at=occurred_at,
+            shop_id=commission.order.shop_id,
+            payload={
+                "order_id": str(commission.order_id),
+                "commission_id": str(commission.id),
+                "shop": {"commission_paid": str(_decimal(commission.amount))},
+                "contracts": {str(commission.contract_id): {"commission_paid": str(_decimal(commission.amount))}},
+            },
         )
 
-        platform_row = _get_locked_row(PlatformDailyAnalytics, date=today)
-        PlatformDailyAnalytics.objects.filter(pk=platform_row.pk).update(
-            total_gmv=F("total_gmv") - refund_amount,
-            total_platform_fee=F("total_platform_fee") - platform_fee,
-            updated_at=timezone.now(),
+    @staticmethod
+    def _event(event_type: str, *, key: str, occurred_at, shop_id, payload: dict) -> AnalyticsEvent:
+        return AnalyticsEvent(
+            type=event_type,
+            key=key,
+            occurred_at=occurred_at,
+            date=timezone.localdate(occurred_at),
+            shop_id=shop_id,
+            payload=payload,
         )
 
-        supplier_rollup = {}
-        for item in items:
-            product = item.product if item.product else (item.variant.product if item.variant else None)
-            supplier = getattr(product, "supplier", None) if product else None
-            if not supplier:
-                continue
-            supplier_price = product.supplier_price if product.supplier_price is not None else item.price
-            line_amount = _decimal(supplier_price) * _decimal(item.quantity)
-            payload = supplier_rollup.setdefault(
-                supplier.id,
-                {"supplier": supplier, "refund": Decimal("0.00")},
-            )
-            payload["refund"] += (line_amount * refund_ratio)
-
-        for payload in supplier_rollup.values():
-            row = _get_locked_row(
-                SupplierDailyAnalytics,
-                supplier=payload["supplier"],
-                date=today,
-            )
-            SupplierDailyAnalytics.objects.filter(pk=row.pk).update(
-                revenue=F("revenue") - payload["refund"],
-                updated_at=timezone.now(),
-            )
+    @staticmethod
+    def _record(events: List[AnalyticsEvent]) -> None:
+        # ignore_conflicts on the unique key makes a redelivered webhook a no-op.
+        AnalyticsEvent.objects.bulk_create(events, ignore_conflicts=True)
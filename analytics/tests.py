@@ -0,0 +1,623 @@
+import csv
+import gzip
+import tempfile
+import uuid
+from datetime import timedelta
+from importlib import import_module
+from io import StringIO
+from pathlib import Path
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.apps import apps
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from account.models import User
+from catalog.models import Category, Product
+from core.metrics import metrics
+from marketer.models import MarketerCommission, MarketerContract
+from order.models import Order, OrderItem
+from payment.models import Payment, Refund
+from payment.services.service import PaymentService
+from shop.models import Shop
+
+from .cache import DashboardCache
+from .checks import check_dashboard_cache
+from .counters import upsert_increment
+from .exports import AnalyticsExporter
+from .models import (
+    AnalyticsCheckpoint,
+    AnalyticsEvent,
+    AnalyticsRebuild,
+    AnalyticsRollup,
+    CategoryDailyAnalytics,
+    MarketerDailyAnalytics,
+    PlatformDailyAnalytics,
+    ProductDailyAnalytics,
+    ShopDailyAnalytics,
+    SupplierDailyAnalytics,
+)
+from .rebuild import compute_partition, swap_partition
+from .rollup import ROLLUP_METRICS, AnalyticsRollupWorker, covering_buckets, day_start
+from .selectors import (
+    get_admin_dashboard,
+    get_shop_dashboard,
+    rollup_totals,
+    top_categories,
+    top_products,
+    top_subjects,
+    top_supplier_products,
+)
+from .services import AnalyticsService
+
+
+class AnalyticsCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.shop_owner = User.objects.create_user(email="owner@analytics.com", password="Pass123!", role="SHOP_OWNER")
+        self.supplier = User.objects.create_user(email="supplier@analytics.com", password="Pass123!", role="SUPPLIER")
+        self.customer = User.objects.create_user(email="customer@analytics.com", password="Pass123!", role="CUSTOMER")
+        self.shop = Shop.objects.create(name="Analytics Shop", owner=self.shop_owner)
+        self.product = Product.objects.create(
+            name="Analytics Product",
+            shop=self.shop,
+            supplier=self.supplier,
+            price=Decimal("100.00"),
+            supplier_price=Decimal("60.00"),
+            minimum_wholesale_quantity=1,
+        )
+
+    def _paid_order(self, number, quantity=2):
+        order = Order.objects.create(
+            order_number=number,
+            user=self.customer,
+            shop=self.shop,
+            status=Order.Status.PAID,
+            subtotal=Decimal("100.00") * quantity,
+            total_amount=Decimal("100.00") * quantity,
+            payment_method="santimpay",
+            delivery_address="addr",
+        )
+        OrderItem.objects.create(
+            order=order,
+            product=self.product,
+            product_name=self.product.name,
+            sku=self.product.sku,
+            price=Decimal("100.00"),
+            quantity=quantity,
+            total=Decimal("100.00") * quantity,
+        )
+        return order
+
+    def _rollup(self):
+        return AnalyticsRollupWorker(settle_seconds=0).run()
+
+    def test_payment_success_rolls_up_daily_rows(self):
+        AnalyticsService.handle_payment_success(self._paid_order("ORD-AN-1"))
+        AnalyticsService.handle_payment_success(self._paid_order("ORD-AN-2", quantity=1))
+        self.assertFalse(ShopDailyAnalytics.objects.exists())
+
+        result = self._rollup()
+
+        self.assertEqual((result.events, result.batches), (2, 1))
+
+        shop_row = ShopDailyAnalytics.objects.get(shop=self.shop)
+        self.assertEqual(
+            (shop_row.revenue, shop_row.orders_count, shop_row.units_sold, shop_row.platform_fee),
+            (Decimal("300.00"), 2, 3, Decimal("30.00")),
+        )
+        supplier_row = SupplierDailyAnalytics.objects.get(supplier=self.supplier)
+        self.assertEqual((supplier_row.revenue, supplier_row.units_sold), (Decimal("180.00"), 3))
+        self.assertEqual(PlatformDailyAnalytics.objects.count(), 1)
+        dashboard = get_admin_dashboard()
+        self.assertEqual((Decimal(dashboard["total_gmv"]), dashboard["total_orders"]), (Decimal("300.00"), 2))
+
+    def test_refund_decrements_daily_rows(self):
+        order = self._paid_order("ORD-AN-3")
+        AnalyticsService.handle_payment_success(order)
+        payment = Payment.objects.create(
+            order=order,
+            user=self.customer,
+            amount=order.total_amount,
+            provider="SANTIMPAY",
+        )
+        refund = Refund.objects.create(payment=payment, amount=Decimal("100.00"), status=Refund.Status.APPROVED)
+
+        AnalyticsService.handle_refund_approved(refund)
+        self._rollup()
+
+        shop_row = ShopDailyAnalytics.objects.get(shop=self.shop)
+        self.assertEqual((shop_row.revenue, shop_row.refund_amount), (Decimal("100.00"), Decimal("100.00")))
+        self.assertEqual(SupplierDailyAnalytics.objects.get(supplier=self.supplier).revenue, Decimal("60.00"))
+        self.assertEqual(Decimal(get_admin_dashboard()["total_gmv"]), Decimal("100.00"))
+
+    def test_upsert_increment_creates_then_adds_to_the_row(self):
+        today = timezone.localdate()
+        for _ in range(2):
+            upsert_increment(
+                PlatformDailyAnalytics,
+                {"date": today, "shard": 0},
+                {"total_gmv": Decimal("10.00"), "total_orders": 1},
+            )
+        upsert_increment(PlatformDailyAnalytics, {"date": today, "shard": 0}, {"total_platform_fee": Decimal("1.50")})
+
+        row = PlatformDailyAnalytics.objects.get(date=today)
+        self.assertEqual(
+            (row.total_gmv, row.total_platform_fee, row.total_orders),
+            (Decimal("20.00"), Decimal("1.50"), 2),
+        )
+
+    def test_rollup_is_idempotent_and_rebuildable(self):
+        order = self._paid_order("ORD-AN-4")
+        AnalyticsService.handle_payment_success(order)
+        AnalyticsService.handle_payment_success(order)
+        self.assertEqual(AnalyticsEvent.objects.count(), 1)
+
+        worker = AnalyticsRollupWorker(settle_seconds=0, batch_size=1)
+        worker.run()
+        self.assertEqual(worker.run().events, 0)
+        self.assertEqual(AnalyticsRollupWorker(settle_seconds=60).run().events, 0)
+
+        ShopDailyAnalytics.objects.update(revenue=Decimal("0.00"))
+        AnalyticsService.handle_payment_success(self._paid_order("ORD-AN-5", quantity=1))
+        # Paid before the event stream existed, so only the order itself records it.
+        earlier = timezone.localdate() - timedelta(days=3)
+        Order.objects.filter(pk=self._paid_order("ORD-AN-0").pk).update(created_at=timezone.now() - timedelta(days=3))
+        upsert_increment(ShopDailyAnalytics, {"shop_id": self.shop.id, "date": earlier}, {"revenue": Decimal("200.00")})
+        today = timezone.localdate()
+        call_command("rollup_analytics", "--rebuild-from", str(earlier), "--rebuild-to", str(today), stdout=StringIO())
+
+        shop_row = ShopDailyAnalytics.objects.get(shop=self.shop, date=today)
+        self.assertEqual((shop_row.revenue, shop_row.orders_count), (Decimal("200.00"), 1))
+        self.assertEqual(ShopDailyAnalytics.objects.get(shop=self.shop, date=earlier).revenue, Decimal("200.00"))
+        worker.run()
+        shop_row.refresh_from_db()
+        self.assertEqual((shop_row.revenue, shop_row.orders_count), (Decimal("300.00"), 2))
+        self.assertEqual(AnalyticsCheckpoint.objects.get(name="daily").last_event_id, AnalyticsEvent.objects.latest("id").id)
+
+    def test_rollup_applies_event_committed_after_higher_ids(self):
+        AnalyticsService.handle_payment_success(self._paid_order("ORD-AN-L1"))
+        AnalyticsService.handle_payment_success(self._paid_order("ORD-AN-L2", quantity=1))
+        late, applied = AnalyticsEvent.objects.order_by("id")
+        # The lower id is not visible yet, as if its transaction were still open.
+        AnalyticsEvent.objects.filter(id=late.id).update(created_at=timezone.now() + timedelta(hours=1))
+        self.assertEqual(self._rollup().events, 1)
+        self.assertEqual(AnalyticsCheckpoint.objects.get(name="daily").last_event_id, applied.id)
+
+        AnalyticsEvent.objects.filter(id=late.id).update(created_at=timezone.now())
+        self.assertEqual(self._rollup().events, 1)
+        self.assertEqual(self._rollup().events, 0)
+        shop_row = ShopDailyAnalytics.objects.get(shop=self.shop)
+        self.assertEqual((shop_row.revenue, shop_row.orders_count), (Decimal("300.00"), 2))
+        self.assertFalse(AnalyticsEvent.objects.filter(applied_at__isnull=True).exists())
+
+    def test_applied_at_migration_queues_a_rebuild_that_restores_skipped_events(self):
+        AnalyticsService.handle_payment_success(self._paid_order("ORD-AN-L3"))
+        AnalyticsService.handle_payment_success(self._paid_order("ORD-AN-L4", quantity=1))
+        skipped, applied = AnalyticsEvent.objects.order_by("id")
+        # The id-ordered worker moved past the lower id before its transaction committed.
+        AnalyticsEvent.objects.filter(id=skipped.id).update(created_at=timezone.now() + timedelta(hours=1))
+        self._rollup()
+        AnalyticsEvent.objects.update(applied_at=None, created_at=timezone.now())
+
+        import_module("analytics.migrations.0011_event_applied_at").mark_applied_events(apps, None)
+
+        self.assertFalse(AnalyticsEvent.objects.filter(applied_at__isnull=True).exists())
+        run = AnalyticsRebuild.objects.get(name="event-applied-at")
+        self.assertEqual((run.status, run.start_date), (AnalyticsRebuild.Status.QUEUED, timezone.localdate()))
+
+        out = StringIO()
+        call_command("rollup_analytics", stdout=out)
+
+        self.assertIn("Running queued rebuild event-applied-at", out.getvalue())
+        run.refresh_from_db()
+        self.assertEqual(run.status, AnalyticsRebuild.Status.COMPLETED)
+        shop_row = ShopDailyAnalytics.objects.get(shop=self.shop)
+        self.assertEqual((shop_row.revenue, shop_row.orders_count), (Decimal("300.00"), 2))
+        self.assertEqual(self._rollup().events, 0)
+
+    def test_commission_approved_adds_commission_paid(self):
+        order = self._paid_order("ORD-AN-6")
+        marketer = User.objects.create_user(email="marketer@analytics.com", password="Pass123!", role="MARKETER")
+        contract = MarketerContract.objects.create(shop=self.shop, marketer=marketer)
+        commission = SimpleNamespace(
+            id=uuid.uuid4(),
+            order=order,
+            order_id=order.id,
+            contract_id=contract.id,
+            amount=Decimal("12.50"),
+            approved_at=timezone.now(),
+        )
+
+        AnalyticsService.handle_commission_approved([commission, commission])
+        self._rollup()
+
+        self.assertEqual(ShopDailyAnalytics.objects.get(shop=self.shop).commission_paid, Decimal("12.50"))
+        self.assertEqual(MarketerDailyAnalytics.objects.get(contract=contract).commission_paid, Decimal("12.50"))
+
+    def test_rollup_tiers_answer_dashboards_and_ranges(self):
+        AnalyticsService.handle_payment_success(self._paid_order("ORD-AN-7"))
+        AnalyticsService.handle_payment_success(self._paid_order("ORD-AN-8", quantity=1))
+        self._rollup()
+
+        shop_rows = AnalyticsRollup.objects.filter(scope="shop", subject_id=str(self.shop.id))
+        self.assertEqual(sorted(shop_rows.values_list("granularity", flat=True)), ["all", "day", "hour", "month"])
+        with self.assertNumQueries(1):
+            dashboard = get_shop_dashboard(self.shop)
+        self.assertEqual(
+            (dashboard["total_revenue"], dashboard["this_month_revenue"], dashboard["today_orders"]),
+            ("300.00", "300.00", 2),
+        )
+        self.assertEqual(dashboard["last_7_days"][-1]["revenue"], "300.00")
+
+        now = timezone.now()
+        last_hour = rollup_totals("shop", self.shop.id, now - timedelta(hours=1), now)
+        earlier = rollup_totals("shop", self.shop.id, now - timedelta(days=90), now - timedelta(days=1))
+        self.assertEqual((last_hour["revenue"], last_hour["units_sold"]), (Decimal("300.00"), 3))
+        self.assertEqual(earlier["revenue"], Decimal("0"))
+
+    def test_covering_buckets_use_coarsest_runs(self):
+        start = timezone.make_aware(timezone.datetime(2024, 1, 30, 22, 15))
+        end = timezone.make_aware(timezone.datetime(2024, 4, 2, 3, 0))
+
+        runs = covering_buckets(start, end)
+
+        self.assertEqual(
+            [(granularity, run_start, run_end) for granularity, run_start, run_end in runs],
+            [
+                ("hour", start.replace(minute=0), day_start(timezone.datetime(2024, 1, 31).date())),
+                ("day", day_start(timezone.datetime(2024, 1, 31).date()), day_start(timezone.datetime(2024, 2, 1).date())),
+                ("month", day_start(timezone.datetime(2024, 2, 1).date()), day_start(timezone.datetime(2024, 4, 1).date())),
+                ("day", day_start(timezone.datetime(2024, 4, 1).date()), day_start(timezone.datetime(2024, 4, 2).date())),
+                ("hour", day_start(timezone.datetime(2024, 4, 2).date()), end),
+            ],
+        )
+        self.assertEqual([run[0] for run in covering_buckets(start, start + timedelta(minutes=30))], ["hour"])
+
+    def test_range_reads_whole_days_the_hour_tier_lacks(self):
+        # Rows the 0005 backfill wrote: a day bucket and no hours.
+        day = timezone.localdate() - timedelta(days=10)
+        AnalyticsRollup.objects.create(
+            scope=AnalyticsRollup.Scope.SHOP,
+            subject_id=str(self.shop.id),
+            granularity=AnalyticsRollup.Granularity.DAY,
+            bucket_start=day_start(day),
+            revenue=Decimal("120.00"),
+            orders_count=2,
+        )
+        start = day_start(day) + timedelta(hours=12)
+
+        totals = rollup_totals("shop", self.shop.id, start, start + timedelta(days=2))
+
+        self.assertEqual((totals["revenue"], totals["orders_count"]), (Decimal("120.00"), 2))
+        self.assertEqual(
+            top_subjects(AnalyticsRollup.Scope.SHOP, "revenue", start=start, end=start + timedelta(hours=3)),
+            [{"subject_id": str(self.shop.id), "revenue": Decimal("120.00")}],
+        )
+
+    def test_dashboard_cache_hits_until_rollup_invalidates(self):
+        builds = []
+
+        def build():
+            builds.append(1)
+            return get_shop_dashboard(self.shop)
+
+        first, etag = DashboardCache.get("shop", self.shop.id, build)
+        again, same_etag = DashboardCache.get("shop", self.shop.id, build)
+        self.assertEqual((len(builds), first, etag), (1, again, same_etag))
+
+        AnalyticsService.handle_payment_success(self._paid_order("ORD-AN-C1"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self._rollup()
+
+        with override_settings(ANALYTICS_DASHBOARD_BACKGROUND_REFRESH=False):
+            updated, new_etag = DashboardCache.get("shop", self.shop.id, build)
+        self.assertEqual(len(builds), 2)
+        self.assertEqual(updated["total_revenue"], "200.00")
+        self.assertNotEqual(new_etag, etag)
+        self.assertEqual(
+            DashboardCache.hit_ratio(),
+            {"hit": 1, "stale": 0, "miss": 2, "hit_ratio": 1 / 3},
+        )
+
+    def test_dashboard_generation_bumped_by_another_cache_client_retires_entries(self):
+        builds = []
+
+        def build():
+            builds.append(1)
+            return get_shop_dashboard(self.shop)
+
+        DashboardCache.get("shop", self.shop.id, build)
+        # The rollup worker runs in its own process with its own client of the shared cache.
+        worker_cache = caches.create_connection("default")
+        with patch("analytics.cache.cache", worker_cache), self.captureOnCommitCallbacks(execute=True):
+            DashboardCache.invalidate([("shop", self.shop.id)])
+
+        with override_settings(ANALYTICS_DASHBOARD_BACKGROUND_REFRESH=False):
+            DashboardCache.get("shop", self.shop.id, build)
+        self.assertEqual(len(builds), 2)
+
+    def test_per_process_cache_is_reported_by_system_check(self):
+        self.assertEqual([warning.id for warning in check_dashboard_cache(None)], ["analytics.W001"])
+        with override_settings(
+            CACHES={"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": "redis://cache"}}
+        ):
+            self.assertEqual(check_dashboard_cache(None), [])
+
+    def test_dashboard_cache_serves_stale_while_refreshing(self):
+        DashboardCache.get("platform", "", get_admin_dashboard)
+        with self.captureOnCommitCallbacks(execute=True):
+            DashboardCache.invalidate_all()
+
+        submitted = []
+        with patch("analytics.cache._refresh_executor") as executor:
+            executor.return_value.submit.side_effect = lambda fn, *args: submitted.append(args)
+            stale, _ = DashboardCache.get("platform", "", lambda: {"total_gmv": "1.00"})
+            DashboardCache.get("platform", "", lambda: {"total_gmv": "1.00"})
+
+        self.assertEqual(stale["total_gmv"], "0.00")
+        self.assertEqual(len(submitted), 1)
+        self.assertEqual(metrics.get("analytics.dashboard.stale"), 2)
+
+        DashboardCache._refresh(*submitted[0])
+        refreshed, _ = DashboardCache.get("platform", "", get_admin_dashboard)
+        self.assertEqual(refreshed, {"total_gmv": "1.00"})
+        self.assertEqual(metrics.get("analytics.dashboard.hit"), 1)
+
+    def test_dashboard_view_answers_not_modified_for_matching_etag(self):
+        client = APIClient()
+        client.force_authenticate(self.shop_owner)
+
+        response = client.get(reverse("analytics-shop-dashboard"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Cache-Control"], "private, no-cache")
+
+        cached = client.get(reverse("analytics-shop-dashboard"), HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached["ETag"], response["ETag"])
+
+    def test_query_api_pages_and_streams_rollups(self):
+        AnalyticsService.handle_payment_success(self._paid_order("ORD-AN-Q1"))
+        AnalyticsService.handle_payment_success(self._paid_order("ORD-AN-Q2", quantity=1))
+        self._rollup()
+        admin = User.objects.create_superuser(email="admin@analytics.com", password="Pass123!")
+        client = APIClient()
+        client.force_authenticate(admin)
+        today = timezone.localdate().isoformat()
+        url = reverse("analytics-query")
+
+        response = client.get(url, {"start": today, "end": today, "group_by": "shop", "metrics": "revenue,units_sold"})
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data["count"], 1)
+        row = response.data["results"][0]
+        self.assertEqual(
+            (row["subject_id"], row["revenue"], row["units_sold"]),
+            (str(self.shop.id), "300.00", 3),
+        )
+        self.assertNotIn("platform_fee", row)
+
+        client.get(url, {"start": today, "end": today, "group_by": "shop", "metrics": "revenue,units_sold"})
+        self.assertEqual(metrics.get("analytics.query.hit"), 1)
+
+        total = client.get(
+            url,
+            {"start": "2020-01-01", "granularity": "total", "group_by": "supplier", "ordering": "-revenue"},
+        )
+        self.assertEqual(total.data["results"][0]["revenue"], "180.00")
+
+        export = client.get(url, {"start": today, "end": today, "group_by": "platform", "file_format": "csv"})
+        lines = b"".join(export.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(","), ["subject_id", "bucket_start", *ROLLUP_METRICS])
+        self.assertEqual(len(lines), 2)
+
+        too_wide = client.get(url, {"start": "2020-01-01", "granularity": "hour"})
+        self.assertEqual(too_wide.status_code, 400)
+
+    def test_product_and_category_rollups_rank_best_sellers(self):
+        category = Category.objects.create(name="Analytics Category")
+        Product.objects.filter(pk=self.product.pk).update(category=category)
+        other = Product.objects.create(name="Slow Product", shop=self.shop, price=Decimal("100.00"))
+        order = self._paid_order("ORD-AN-P1", quantity=3)
+        OrderItem.objects.create(
+            order=order,
+            product=other,
+            product_name=other.name,
+            sku=other.sku,
+            price=Decimal("100.00"),
+            quantity=1,
+            total=Decimal("100.00"),
+        )
+        AnalyticsService.handle_payment_success(order)
+        payment = Payment.objects.create(
+            order=order,
+            user=self.customer,
+            amount=order.total_amount,
+            provider="SANTIMPAY",
+        )
+        refund = Refund.objects.create(payment=payment, amount=Decimal("200.00"), status=Refund.Status.APPROVED)
+        AnalyticsService.handle_refund_approved(refund)
+        self._rollup()
+
+        product_row = ProductDailyAnalytics.objects.get(product=self.product)
+        self.assertEqual(
+            (product_row.revenue, product_row.refund_amount, product_row.units_sold, product_row.orders_count),
+            (Decimal("150.00"), Decimal("150.00"), 3, 1),
+        )
+        category_row = CategoryDailyAnalytics.objects.get(category=category)
+        self.assertEqual((category_row.revenue, category_row.units_sold), (Decimal("150.00"), 3))
+
+        self.assertEqual(
+            [row["subject_id"] for row in top_products()],
+            [str(self.product.id), str(other.id)],
+        )
+        self.assertEqual(top_products(metric="revenue", limit=1, days=7)[0]["revenue"], Decimal("150.00"))
+        self.assertEqual(top_categories()[0]["subject_id"], str(category.id))
+        self.assertEqual(
+            top_supplier_products(self.supplier),
+            [{"product_id": str(self.product.id), "name": self.product.name, "units_sold": 3, "revenue": "150.00"}],
+        )
+
+        client = APIClient()
+        client.force_authenticate(self.supplier)
+        cards = client.get("/supliers/dashboard/")
+        analytics = client.get("/analytics/supplier/dashboard/")
+        self.assertEqual((cards.status_code, analytics.status_code), (200, 200))
+        self.assertEqual(analytics.data["top_products"][0]["product_id"], str(self.product.id))
+        self.assertEqual(analytics.data["units_sold"], cards.data["total_units_sold"])
+
+    def test_migration_backfills_product_rollups_from_earlier_orders(self):
+        AnalyticsService.handle_payment_success(self._paid_order("ORD-AN-B1"))
+        self._rollup()
+        # Paid and refunded before product rows existed, so no event carries them.
+        order = self._paid_order("ORD-AN-B2")
+        payment = Payment.objects.create(order=order, user=self.customer, amount=order.total_amount, provider="SANTIMPAY")
+        Refund.objects.create(payment=payment, amount=Decimal("100.00"), status=Refund.Status.COMPLETED)
+
+        import_module("analytics.migrations.0007_product_category_analytics").backfill_product_sales(apps, None)
+
+        product_row = ProductDailyAnalytics.objects.get(product=self.product)
+        self.assertEqual(
+            (product_row.revenue, product_row.refund_amount, product_row.units_sold, product_row.orders_count),
+            (Decimal("300.00"), Decimal("100.00"), 4, 2),
+        )
+        self.assertEqual(rollup_totals(AnalyticsRollup.Scope.PRODUCT, self.product.id)["units_sold"], 4)
+        self.assertEqual(top_products()[0]["units_sold"], 4)
+
+    def test_migrations_backfill_contract_rollups_and_referred_orders(self):
+        marketer = User.objects.create_user(email="backfill-marketer@analytics.com", password="Pass123!", role="MARKETER")
+        contract = MarketerContract.objects.create(shop=self.shop, marketer=marketer)
+        order = self._paid_order("ORD-AN-B3")
+        item = order.items.get()
+        OrderItem.objects.filter(pk=item.pk).update(marketer_contract=contract)
+        # Recorded before contract sections and referred_orders were part of the event.
+        event = AnalyticsService.payment_success_event(order, list(order.items.all()), timezone.now())
+        del event.payload["contracts"], event.payload["shop"]["referred_orders"]
+        event.save()
+        self._rollup()
+        MarketerCommission.objects.create(
+            contract=contract,
+            order=order,
+            order_item=item,
+            product=self.product,
+            rate=Decimal("10.00"),
+            amount=Decimal("20.00"),
+            status=MarketerCommission.Status.APPROVED,
+            approved_at=timezone.now(),
+        )
+
+        import_module("analytics.migrations.0010_marketer_daily_analytics").backfill_contract_sales(apps, None)
+        import_module("analytics.migrations.0012_referred_orders").backfill_referred_orders(apps, None)
+
+        contract_row = MarketerDailyAnalytics.objects.get(contract=contract)
+        self.assertEqual(
+            (contract_row.revenue, contract_row.units_sold, contract_row.orders_count, contract_row.commission_paid),
+            (Decimal("200.00"), 2, 1, Decimal("20.00")),
+        )
+        self.assertEqual(ShopDailyAnalytics.objects.get(shop=self.shop).referred_orders, 1)
+        self.assertEqual(rollup_totals(AnalyticsRollup.Scope.SHOP, self.shop.id)["referred_orders"], 1)
+
+        client = APIClient()
+        client.force_authenticate(marketer)
+        dashboard = client.get("/marketer/dashboard/")
+        self.assertEqual(dashboard.status_code, 200)
+        self.assertEqual(
+            (Decimal(dashboard.data["total_earnings"]), dashboard.data["total_orders_influenced"]),
+            (Decimal("20.00"), 1),
+        )
+        client.force_authenticate(self.shop_owner)
+        self.assertEqual(client.get("/marketer/dashboard/").data["total_orders_influenced"], 1)
+
+    def test_rebuild_command_recomputes_drifted_days_from_orders(self):
+        AnalyticsService.handle_payment_success(self._paid_order("ORD-AN-R1"))
+        self._rollup()
+        # A paid order whose analytics call failed, and a paid order not rolled up yet.
+        self._paid_order("ORD-AN-R2", quantity=1)
+        AnalyticsService.handle_payment_success(self._paid_order("ORD-AN-R3", quantity=3))
+        today = timezone.localdate().isoformat()
+
+        out = StringIO()
+        call_command("rebuild_analytics", "--from", today, stdout=out)
+
+        self.assertIn("ShopDailyAnalytics", out.getvalue())
+        self.assertIn("revenue: 200.00 -> 600.00", out.getvalue())
+        run = AnalyticsRebuild.objects.get(name=f"rebuild-{today}-{today}")
+        self.assertEqual((run.status, run.completed_through), (AnalyticsRebuild.Status.COMPLETED, timezone.localdate()))
+
+        # The pending event is left to the worker, so it is counted once.
+        self._rollup()
+        shop_row = ShopDailyAnalytics.objects.get(shop=self.shop)
+        self.assertEqual((shop_row.revenue, shop_row.units_sold), (Decimal("600.00"), 6))
+        self.assertEqual(ProductDailyAnalytics.objects.get(product=self.product).units_sold, 6)
+        self.assertEqual(get_shop_dashboard(self.shop)["total_revenue"], "600.00")
+
+        out = StringIO()
+        call_command("rebuild_analytics", "--from", today, stdout=out)
+        self.assertIn("already complete", out.getvalue())
+        call_command("rebuild_analytics", "--from", today, "--restart", "--dry-run", stdout=out)
+        self.assertIn("Would change 0 daily row fields", out.getvalue())
+
+    def test_export_writes_gzip_chunks_and_only_deltas_after_watermark(self):
+        self._paid_order("ORD-AN-E1")
+        self._paid_order("ORD-AN-E2")
+        self._paid_order("ORD-AN-E3")
+        with tempfile.TemporaryDirectory() as directory:
+            exporter = AnalyticsExporter(directory, chunk_rows=2, settle_seconds=0)
+
+            first = {result.dataset: result for result in exporter.run(["orders", "order_items"])}
+
+            self.assertEqual((first["orders"].rows, len(first["orders"].files)), (3, 2))
+            with gzip.open(first["orders"].files[0], "rt", encoding="utf-8", newline="") as handle:
+                rows = list(csv.DictReader(handle))
+            self.assertEqual([row["order_number"] for row in rows], ["ORD-AN-E1", "ORD-AN-E2"])
+            self.assertEqual(rows[0]["total_amount"], "200.00")
+            self.assertEqual(first["order_items"].rows, 3)
+            self.assertFalse(list(Path(directory).rglob("*.tmp")))
+
+            order = Order.objects.get(order_number="ORD-AN-E2")
+            order.status = Order.Status.SHIPPED
+            order.save()
+            second = {result.dataset: result for result in exporter.run(["orders", "order_items"])}
+
+            self.assertEqual((second["orders"].rows, second["order_items"].rows), (1, 1))
+            with gzip.open(second["orders"].files[0], "rt", encoding="utf-8", newline="") as handle:
+                rows = list(csv.DictReader(handle))
+            self.assertEqual([(row["order_number"], row["status"]) for row in rows], [("ORD-AN-E2", "shipped")])
+            self.assertEqual(exporter.run(["orders"])[0].rows, 0)
+
+    def test_completed_refund_is_exported_with_its_payment(self):
+        order = self._paid_order("ORD-AN-E4")
+        payment = Payment.objects.create(order=order, user=self.customer, amount=order.total_amount, provider="SANTIMPAY")
+        refund = Refund.objects.create(payment=payment, amount=Decimal("50.00"), status=Refund.Status.PROCESSING)
+        with tempfile.TemporaryDirectory() as directory:
+            exporter = AnalyticsExporter(directory, settle_seconds=0)
+            self.assertEqual(exporter.run(["payments"])[0].rows, 1)
+
+            PaymentService(merchant_id="TEST-MERCHANT-ID").apply_refund_status(refund, {"status": "SUCCESS"})
+            result = exporter.run(["payments"])[0]
+
+            self.assertEqual(result.rows, 1)
+            with gzip.open(result.files[0], "rt", encoding="utf-8", newline="") as handle:
+                self.assertEqual(next(csv.DictReader(handle))["refunded_total"], "50.00")
+
+    def test_swap_keeps_events_applied_after_the_partition_was_computed(self):
+        AnalyticsService.handle_payment_success(self._paid_order("ORD-AN-S1"))
+        self._rollup()
+        today = timezone.localdate()
+        partition = compute_partition((today, today))
+
+        # Paid and rolled up while the partition waited to be swapped.
+        AnalyticsService.handle_payment_success(self._paid_order("ORD-AN-S2", quantity=1))
+        self._rollup()
+        swap_partition(partition)
+
+        shop_row = ShopDailyAnalytics.objects.get(shop=self.shop)
+        self.assertEqual((shop_row.revenue, shop_row.orders_count), (Decimal("300.00"), 2))
+        self.assertEqual(get_shop_dashboard(self.shop)["total_revenue"], "300.00")
+        self.assertEqual(self._rollup().events, 0)
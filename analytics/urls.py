@@ -2,6 +2,8 @@ from django.urls import path
 
 from .api import (
     AdminAnalyticsDashboardView,
+    AdminDashboardCacheStatsView,
+    AnalyticsQueryView,
     ShopAnalyticsDashboardView,
     SupplierAnalyticsDashboardView,
 )
@@ -11,4 +13,6 @@ urlpatterns = [
     path("shop/dashboard/", ShopAnalyticsDashboardView.as_view(), name="analytics-shop-dashboard"),
     path("supplier/dashboard/", SupplierAnalyticsDashboardView.as_view(), name="analytics-supplier-dashboard"),
     path("admin/dashboard/", AdminAnalyticsDashboardView.as_view(), name="analytics-admin-dashboard"),
+    path("admin/query/", AnalyticsQueryView.as_view(), name="analytics-query"),
+    path("admin/dashboard-cache/", AdminDashboardCacheStatsView.as_view(), name="analytics-dashboard-cache"),
 ]
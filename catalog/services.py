@@ -16,14 +16,14 @@ from django.db.models import (
     Q,
     QuerySet,
     Subquery,
-    Sum,
     Value,
     When,
 )
 from django.db.models.functions import Coalesce, Random
 from django.utils import timezone
 
-from order.models import OrderItem
+from analytics.models import AnalyticsRollup
+from analytics.selectors import all_time_subquery
 
 from .models import Product, ProductReview
 
@@ -70,13 +70,9 @@ def get_ranked_products_queryset(
     # Aggregate once for dynamic price bands used by price_penalty.
     average_price = queryset.aggregate(avg_price=Avg("price"))["avg_price"] or Decimal("0.00")
 
-    # Subqueries avoid join multiplication between reviews and order items.
-    sales_subquery = (
-        OrderItem.objects.filter(product_id=OuterRef("pk"))
-        .values("product_id")
-        .annotate(total_sales=Sum("quantity"))
-        .values("total_sales")[:1]
-    )
+    # Subqueries avoid join multiplication between reviews and sales; sales
+    # are the one all-time product rollup row rather than every order item.
+    sales_subquery = all_time_subquery(AnalyticsRollup.Scope.PRODUCT, "units_sold")
     rating_subquery = (
         ProductReview.objects.filter(product_id=OuterRef("pk"))
         .values("product_id")
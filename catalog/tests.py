@@ -3,8 +3,11 @@ from rest_framework.test import APIClient
 from rest_framework.test import APIRequestFactory
 
 from account.models import User
+from analytics.rollup import AnalyticsRollupWorker
+from analytics.services import AnalyticsService
 from catalog.models import Category, Product, ProductReview, ProductVariant
 from catalog.serializers import ProductSerializer
+from catalog.services import get_ranked_products_queryset
 from order.models import Order, OrderItem
 from shop.models import Shop
 
@@ -230,9 +233,15 @@ class RankedProductListEndpointTests(TestCase):
             quantity=1,
             total="100.00",
         )
+        AnalyticsService.handle_payment_success(order)
+        AnalyticsRollupWorker(settle_seconds=0).run()
 
         response = self.client.get("/catalog/products/all/")
         self.assertEqual(response.status_code, 200, response.data)
         self.assertGreaterEqual(len(response.data), 2)
         self.assertEqual(response.data[0]["id"], str(high_sales.id))
+        self.assertEqual(
+            dict(get_ranked_products_queryset().values_list("name", "total_sales")),
+            {high_sales.name: 20, low_sales.name: 1},
+        )
 
@@ -0,0 +1,13 @@
+from django.conf import settings
+
+# Backends whose entries live inside one process: a delete or a generation
+# bump made by a worker process is never seen by the web processes.
+PROCESS_LOCAL_BACKENDS = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+
+def is_shared_cache(alias: str = "default") -> bool:
+    """Whether every process sees the same entries of cache `alias` (set CACHE_URL for Redis)."""
+    return settings.CACHES.get(alias, {}).get("BACKEND", "") not in PROCESS_LOCAL_BACKENDS
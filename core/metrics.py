@@ -0,0 +1,49 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+
+class MetricsRegistry:
+    """
+    Process-local counters for background workers.
+
+    Counters are plain floats keyed by dotted names ("email.sent"). Timers add
+    the elapsed seconds to "<name>.seconds" and bump "<name>.count", so rates
+    can be derived from a snapshot. Thread-safe; values reset on restart.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._values: Dict[str, float] = defaultdict(float)
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._values[name] += value
+
+    def get(self, name: str) -> float:
+        with self._lock:
+            return self._values.get(name, 0.0)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self._values[f"{name}.seconds"] += elapsed
+                self._values[f"{name}.count"] += 1
+
+    def snapshot(self, prefix: str = "") -> Dict[str, float]:
+        with self._lock:
+            return {name: value for name, value in self._values.items() if name.startswith(prefix)}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+metrics = MetricsRegistry()
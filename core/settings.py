@@ -3,6 +3,7 @@ from pathlib import Path
 from datetime import timedelta
 import os
 import glob
+import json
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
@@ -78,6 +79,24 @@ DATABASES = {
     }
 }
 
+# Shared cache for inbox summaries, device tokens and dashboards; without CACHE_URL each process keeps
+# its own copy, and caches that workers must invalidate are bypassed or only expire by TTL.
+CACHE_URL = os.getenv("CACHE_URL", "")
+if CACHE_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "shikela",
+        }
+    }
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -187,6 +206,18 @@ PLATFORM_USER_ID = os.getenv("PLATFORM_USER_ID", "")
 PLATFORM_USER_EMAIL = os.getenv("PLATFORM_USER_EMAIL", "")
 PLATFORM_MERCHANT_ID = os.getenv("PLATFORM_MERCHANT_ID", "")
 
+# Scheduled payout runs (manage.py run_payouts)
+PAYOUT_BATCH_MAX_WORKERS = int(os.getenv("PAYOUT_BATCH_MAX_WORKERS", "4"))
+PAYOUT_BATCH_RATE_PER_SECOND = float(os.getenv("PAYOUT_BATCH_RATE_PER_SECOND", "5"))
+# Batch payouts PROCESSING longer than this are looked up at the gateway and completed, released or re-sent.
+PAYOUT_STALE_PROCESSING_SECONDS = int(os.getenv("PAYOUT_STALE_PROCESSING_SECONDS", "1800"))
+
+# Refund queue (manage.py process_refund_queue); gateway concurrency follows PAYOUT_BATCH_*
+REFUND_MAX_ATTEMPTS = int(os.getenv("REFUND_MAX_ATTEMPTS", "5"))
+REFUND_RETRY_BASE_SECONDS = int(os.getenv("REFUND_RETRY_BASE_SECONDS", "60"))
+# Refunds claimed but not recorded as sent within this many seconds are sent again (same gateway tx_id).
+REFUND_LEASE_SECONDS = int(os.getenv("REFUND_LEASE_SECONDS", "300"))
+
 # Firebase Cloud Messaging
 FCM_PROJECT_ID = os.getenv("FCM_PROJECT_ID", "")
 # Auto-discover service account from notifications/fcm if env var is not set.
@@ -197,3 +228,61 @@ if _fcm_candidates:
 
 FCM_SERVICE_ACCOUNT_FILE = os.getenv("FCM_SERVICE_ACCOUNT_FILE", _default_fcm_service_account)
 FCM_SERVICE_ACCOUNT_JSON = os.getenv("FCM_SERVICE_ACCOUNT_JSON", "")
+# Push delivery backend; notifications.push.LocmemPushBackend keeps messages in memory.
+PUSH_BACKEND = os.getenv("PUSH_BACKEND", "notifications.push.FirebasePushBackend")
+
+# Notification outbox (manage.py process_notification_outbox)
+NOTIFICATION_OUTBOX_WORKERS = int(os.getenv("NOTIFICATION_OUTBOX_WORKERS", "4"))
+NOTIFICATION_OUTBOX_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_OUTBOX_MAX_ATTEMPTS", "5"))
+NOTIFICATION_OUTBOX_RETRY_BASE_SECONDS = int(os.getenv("NOTIFICATION_OUTBOX_RETRY_BASE_SECONDS", "30"))
+# Claimed deliveries still PROCESSING after this many seconds are claimed again by the next run.
+NOTIFICATION_OUTBOX_LEASE_SECONDS = int(os.getenv("NOTIFICATION_OUTBOX_LEASE_SECONDS", "300"))
+NOTIFICATION_PUSH_RATE_PER_SECOND = float(os.getenv("NOTIFICATION_PUSH_RATE_PER_SECOND", "20"))
+NOTIFICATION_EMAIL_RATE_PER_SECOND = float(os.getenv("NOTIFICATION_EMAIL_RATE_PER_SECOND", "5"))
+# Emails to one recipient within this many seconds are sent as a single digest.
+NOTIFICATION_EMAIL_DIGEST_WINDOW_SECONDS = int(os.getenv("NOTIFICATION_EMAIL_DIGEST_WINDOW_SECONDS", "60"))
+NOTIFICATION_EMAIL_BATCH_SIZE = int(os.getenv("NOTIFICATION_EMAIL_BATCH_SIZE", "50"))
+EMAIL_POOL_MAX_IDLE = int(os.getenv("EMAIL_POOL_MAX_IDLE", "4"))
+NOTIFICATION_SUMMARY_CACHE_SECONDS = int(os.getenv("NOTIFICATION_SUMMARY_CACHE_SECONDS", "300"))
+
+# Realtime notification streams (served under ASGI, core.asgi.application).
+# Use notifications.realtime.RedisBroker when running more than one process.
+NOTIFICATION_BROKER = os.getenv("NOTIFICATION_BROKER", "notifications.realtime.InProcessBroker")
+NOTIFICATION_BROKER_URL = os.getenv("NOTIFICATION_BROKER_URL", CACHE_URL)
+NOTIFICATION_STREAM_HEARTBEAT_SECONDS = float(os.getenv("NOTIFICATION_STREAM_HEARTBEAT_SECONDS", "15"))
+NOTIFICATION_STREAM_MAX_SECONDS = float(os.getenv("NOTIFICATION_STREAM_MAX_SECONDS", "300"))
+NOTIFICATION_STREAM_BACKLOG_LIMIT = int(os.getenv("NOTIFICATION_STREAM_BACKLOG_LIMIT", "100"))
+NOTIFICATION_POLL_TIMEOUT_SECONDS = float(os.getenv("NOTIFICATION_POLL_TIMEOUT_SECONDS", "25"))
+
+# Notification retention (manage.py purge_notifications): days to keep per type, "default" for the rest.
+NOTIFICATION_RETENTION_DAYS = json.loads(
+    os.getenv("NOTIFICATION_RETENTION_DAYS", '{"default": 180, "low_stock_alert": 30, "order_shipped": 90}')
+)
+NOTIFICATION_RETENTION_CHUNK_SIZE = int(os.getenv("NOTIFICATION_RETENTION_CHUNK_SIZE", "1000"))
+NOTIFICATION_ARCHIVE_DIR = os.getenv("NOTIFICATION_ARCHIVE_DIR", str(BASE_DIR / "archive" / "notifications"))
+
+# Device token registry (manage.py prune_device_tokens); tokens are cached only with CACHE_URL
+DEVICE_TOKEN_CACHE_SECONDS = int(os.getenv("DEVICE_TOKEN_CACHE_SECONDS", "600"))
+DEVICE_TOKEN_STALE_DAYS = int(os.getenv("DEVICE_TOKEN_STALE_DAYS", "60"))
+DEVICE_TOKEN_PURGE_INACTIVE_DAYS = int(os.getenv("DEVICE_TOKEN_PURGE_INACTIVE_DAYS", "180"))
+
+# Per-user notification channel preferences
+NOTIFICATION_PREFERENCE_CACHE_SECONDS = int(os.getenv("NOTIFICATION_PREFERENCE_CACHE_SECONDS", "600"))
+
+# Analytics event rollup (manage.py rollup_analytics)
+ANALYTICS_ROLLUP_BATCH_SIZE = int(os.getenv("ANALYTICS_ROLLUP_BATCH_SIZE", "1000"))
+ANALYTICS_ROLLUP_SETTLE_SECONDS = float(os.getenv("ANALYTICS_ROLLUP_SETTLE_SECONDS", "5"))
+
+# Analytics dashboard cache: seconds an entry is fresh, then served stale while it is rebuilt
+ANALYTICS_DASHBOARD_FRESH_SECONDS = int(os.getenv("ANALYTICS_DASHBOARD_FRESH_SECONDS", "60"))
+ANALYTICS_DASHBOARD_STALE_SECONDS = int(os.getenv("ANALYTICS_DASHBOARD_STALE_SECONDS", "600"))
+ANALYTICS_DASHBOARD_BACKGROUND_REFRESH = os.getenv("ANALYTICS_DASHBOARD_BACKGROUND_REFRESH", "true").lower() in {"1", "true", "yes", "on"}
+
+# Analytics query API (analytics/admin/query/): widest window in buckets, seconds pages stay cached
+ANALYTICS_QUERY_MAX_BUCKETS = int(os.getenv("ANALYTICS_QUERY_MAX_BUCKETS", "1000"))
+ANALYTICS_QUERY_CACHE_SECONDS = int(os.getenv("ANALYTICS_QUERY_CACHE_SECONDS", "300"))
+
+# Analytics exports (manage.py export_analytics): gzip chunk files, rows per file, seconds left for late commits
+ANALYTICS_EXPORT_DIR = os.getenv("ANALYTICS_EXPORT_DIR", str(BASE_DIR / "exports" / "analytics"))
+ANALYTICS_EXPORT_CHUNK_ROWS = int(os.getenv("ANALYTICS_EXPORT_CHUNK_ROWS", "100000"))
+ANALYTICS_EXPORT_SETTLE_SECONDS = float(os.getenv("ANALYTICS_EXPORT_SETTLE_SECONDS", "60"))
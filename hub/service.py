@@ -8,8 +8,9 @@ from django.db.models import Case, Count, F, IntegerField, Max, Q, Sum, Value, W
 from django.db.models.functions import Coalesce
 from django.utils import timezone
 
+from analytics.models import ProductDailyAnalytics
 from catalog.models import Product
-from order.models import Order, OrderItem
+from order.models import Order
 
 from .models import Comment, Post, Profile, TypeChoices
 
@@ -318,14 +319,6 @@ class SellerFeedService:
     TRENDING_WINDOW_DAYS = 30
     SELLER_ROLES = {"SHOP_OWNER", "SUPPLIER"}
 
-    SALE_STATUSES = (
-        Order.Status.PAID,
-        Order.Status.CONFIRMED,
-        Order.Status.PROCESSING,
-        Order.Status.SHIPPED,
-        Order.Status.DELIVERED,
-    )
-
     BUCKET_KEYS = (
         "trending_products",
         "new_products",
@@ -448,24 +441,20 @@ class SellerFeedService:
         if limit <= 0:
             return []
 
-        since = timezone.now() - timedelta(days=cls.TRENDING_WINDOW_DAYS)
+        # Daily product rollups: one row per product and day instead of every order item.
+        since = timezone.localdate() - timedelta(days=cls.TRENDING_WINDOW_DAYS - 1)
         trending_rows = (
-            OrderItem.objects.filter(
-                order__status__in=cls.SALE_STATUSES,
-                order__created_at__gte=since,
-            )
-            .annotate(feed_product_id=Coalesce("product_id", "variant__product_id"))
-            .exclude(feed_product_id__isnull=True)
-            .exclude(feed_product_id__in=exclude_ids)
-            .values("feed_product_id")
+            ProductDailyAnalytics.objects.filter(date__gte=since)
+            .exclude(product_id__in=exclude_ids)
+            .values("product_id")
             .annotate(
-                units_sold=Coalesce(Sum("quantity"), Value(0)),
-                last_ordered_at=Max("order__created_at"),
+                total_units=Coalesce(Sum("units_sold"), Value(0)),
+                last_sold_on=Max("date"),
             )
-            .order_by("-units_sold", "-last_ordered_at")
+            .order_by("-total_units", "-last_sold_on")
         )
 
-        ordered_ids = list(trending_rows.values_list("feed_product_id", flat=True)[:limit])
+        ordered_ids = list(trending_rows.values_list("product_id", flat=True)[:limit])
         if not ordered_ids:
             return []
 
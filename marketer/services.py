@@ -30,7 +30,7 @@ class MarketerCommissionService:
     @staticmethod
     def create_pending_for_order(order: Order):
         items = (
-            order.items.select_related("product", "variant__product", "marketer_contract")
+            order.items.select_related("product", "variant__product", "marketer_contract__marketer")
             .all()
         )
         created_commissions = []
@@ -71,7 +71,7 @@ class MarketerCommissionService:
     def approve_for_order(order: Order):
         now = timezone.now()
         commissions = list(
-            MarketerCommission.objects.filter(
+            MarketerCommission.objects.select_related("contract__marketer").filter(
                 order=order,
                 status=MarketerCommission.Status.PENDING,
             )
@@ -85,4 +85,5 @@ class MarketerCommissionService:
         for commission in commissions:
             commission.status = MarketerCommission.Status.APPROVED
             commission.approved_at = now
+            commission.order = order
         return commissions
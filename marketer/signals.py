@@ -1,9 +1,13 @@
+import logging
+
 from django.db.models.signals import post_save, pre_save
 from django.dispatch import receiver
 
 from order.models import Order
 from .services import MarketerCommissionService
-from notifications.services import NotificationService, NotificationTemplates
+from notifications.services import NotificationRequest, NotificationService, NotificationTemplates
+
+logger = logging.getLogger(__name__)
 
 
 @receiver(pre_save, sender=Order)
@@ -28,17 +32,18 @@ def _approve_commissions_on_delivery(sender, instance: Order, **kwargs):
 
                 AnalyticsService.handle_commission_approved(commissions)
             except Exception:
-                pass
-        for commission in commissions:
+                # rebuild_analytics recovers the commissions from MarketerCommission.
+                logger.exception("Recording commission analytics failed for order %s", instance.pk)
+        if commissions:
             try:
-                title, message, payload = NotificationTemplates.commission_approved(instance, commission)
-                NotificationService.notify(
-                    user=commission.contract.marketer,
-                    notification_type="commission_approved",
-                    title=title,
-                    message=message,
-                    payload=payload,
-                )
+                with NotificationTemplates.session():
+                    NotificationService.notify_many(
+                        NotificationRequest.from_template(
+                            commission.contract.marketer,
+                            NotificationTemplates.commission_approved(instance, commission),
+                        )
+                        for commission in commissions
+                    )
             except Exception:
                 # Never break order status updates because of notifications.
                 pass
@@ -4,6 +4,8 @@ from django.utils import timezone
 from rest_framework.test import APIClient
 
 from account.models import User
+from analytics.rollup import AnalyticsRollupWorker
+from analytics.services import AnalyticsService
 from catalog.models import Category, Product, ProductVariant
 from order.models import Order, OrderItem
 from shop.models import Shop
@@ -120,3 +122,101 @@ class MarketerFlowTests(TestCase):
         commission.refresh_from_db()
         self.assertEqual(commission.status, MarketerCommission.Status.APPROVED)
         self.assertIsNotNone(commission.approved_at)
+
+    def test_dashboard_reads_contract_rollups(self):
+        contract = self._create_contract()
+        contract.status = MarketerContract.Status.ACTIVE
+        contract.save(update_fields=["status", "updated_at"])
+        orders = []
+        for number in ("ORD-MKT-D1", "ORD-MKT-D2"):
+            order = Order.objects.create(
+                order_number=number,
+                user=self.customer,
+                shop=self.shop,
+                status=Order.Status.PAID,
+                subtotal=Decimal("200.00"),
+                total_amount=Decimal("200.00"),
+                payment_method="santimpay",
+                delivery_address="addr",
+            )
+            OrderItem.objects.create(
+                order=order,
+                product=self.product,
+                variant=self.variant,
+                marketer_contract=contract,
+                product_name=self.product.name,
+                sku=self.product.sku,
+                price=Decimal("100.00"),
+                quantity=2,
+                total=Decimal("200.00"),
+            )
+            AnalyticsService.handle_payment_success(order)
+            MarketerCommissionService.create_pending_for_order(order)
+            orders.append(order)
+        orders[0].status = Order.Status.DELIVERED
+        orders[0].save(update_fields=["status"])
+        AnalyticsRollupWorker(settle_seconds=0).run()
+
+        for user in (self.marketer, self.owner):
+            self.client.force_authenticate(user)
+            # Contracts, their rollup buckets and the pending commissions.
+            with self.assertNumQueries(3):
+                resp = self.client.get("/marketer/dashboard/")
+            self.assertEqual(resp.status_code, 200, resp.data)
+            self.assertEqual(
+                (
+                    resp.data["total_earnings"],
+                    resp.data["this_month_revenue"],
+                    resp.data["pending_commissions"],
+                    resp.data["total_orders_influenced"],
+                    resp.data["total_units_sold"],
+                    resp.data["active_contracts"],
+                ),
+                ("20.00", "20.00", "20.00", 2, 4, 1),
+            )
+
+    def test_order_referred_by_two_contracts_is_influenced_once_for_the_shop(self):
+        contract = self._create_contract()
+        other_marketer = User.objects.create_user(
+            email="marketer2@shop.com",
+            password="Pass123!",
+            role="MARKETER",
+            marketer_type="CREATOR",
+        )
+        other = MarketerContract.objects.create(
+            shop=self.shop,
+            marketer=other_marketer,
+            commission_rate=Decimal("5.00"),
+            status=MarketerContract.Status.ACTIVE,
+        )
+        order = Order.objects.create(
+            order_number="ORD-MKT-TWO",
+            user=self.customer,
+            shop=self.shop,
+            status=Order.Status.PAID,
+            subtotal=Decimal("200.00"),
+            total_amount=Decimal("200.00"),
+            payment_method="santimpay",
+            delivery_address="addr",
+        )
+        for referrer in (contract, other):
+            OrderItem.objects.create(
+                order=order,
+                product=self.product,
+                variant=self.variant,
+                marketer_contract=referrer,
+                product_name=self.product.name,
+                sku=self.product.sku,
+                price=Decimal("100.00"),
+                quantity=1,
+                total=Decimal("100.00"),
+            )
+        AnalyticsService.handle_payment_success(order)
+        AnalyticsRollupWorker(settle_seconds=0).run()
+
+        for user in (self.owner, self.marketer, other_marketer):
+            self.client.force_authenticate(user)
+            resp = self.client.get("/marketer/dashboard/")
+            self.assertEqual(resp.status_code, 200, resp.data)
+            self.assertEqual(resp.data["total_orders_influenced"], 1)
+        self.assertEqual(resp.data["total_units_sold"], 1)
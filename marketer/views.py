@@ -1,7 +1,6 @@
 from decimal import Decimal
 
 from django.db.models import Sum, Count
-from django.utils import timezone
 from rest_framework import permissions, status
 from rest_framework.generics import ListCreateAPIView, RetrieveUpdateAPIView
 from rest_framework.response import Response
@@ -9,7 +8,8 @@ from rest_framework.views import APIView
 from rest_framework.exceptions import PermissionDenied
 
 from account.models import User
-from order.models import OrderItem, Order
+from analytics.selectors import contract_totals
+from order.models import Order
 from shop.models import Shop
 
 from .models import MarketerContract, MarketerCommission, MarketerContractProduct
@@ -35,15 +35,11 @@ class MarketerDashboardView(APIView):
 
     def get(self, request):
         user = request.user
-        now = timezone.now()
-        month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
 
+        shop = None
         if user.role == "MARKETER":
+            contracts = MarketerContract.objects.filter(marketer=user)
             commissions = MarketerCommission.objects.filter(contract__marketer=user)
-            active_contracts = MarketerContract.objects.filter(
-                marketer=user, status=MarketerContract.Status.ACTIVE
-            ).count()
-            order_items = OrderItem.objects.filter(marketer_contract__marketer=user)
         else:
             shop = getattr(user, "owned_shop", None)
             if not shop:
@@ -58,27 +54,23 @@ class MarketerDashboardView(APIView):
                 }
                 return Response(MarketerDashboardSerializer(payload).data)
 
+            contracts = MarketerContract.objects.filter(shop=shop)
             commissions = MarketerCommission.objects.filter(contract__shop=shop)
-            active_contracts = MarketerContract.objects.filter(
-                shop=shop, status=MarketerContract.Status.ACTIVE
-            ).count()
-            order_items = OrderItem.objects.filter(marketer_contract__shop=shop)
 
-        total_earnings = commissions.filter(status=MarketerCommission.Status.APPROVED).aggregate(
-            total=Sum("amount")
-        )["total"] or Decimal("0.00")
+        contract_statuses = list(contracts.values_list("id", "status"))
+        active_contracts = sum(
+            1 for _, contract_status in contract_statuses if contract_status == MarketerContract.Status.ACTIVE
+        )
+        # Approved commissions and referred sales come from the contract rollups;
+        # pending commissions are still moving, so they are summed live.
+        totals = contract_totals((contract_id for contract_id, _ in contract_statuses), shop_id=shop.id if shop else None)
+        total_earnings = totals["all"]["commission_paid"]
+        this_month_revenue = totals["month"]["commission_paid"]
+        total_orders_influenced = int(totals["all"]["referred_orders"])
+        total_units_sold = int(totals["all"]["units_sold"])
         pending_commissions = commissions.filter(status=MarketerCommission.Status.PENDING).aggregate(
             total=Sum("amount")
         )["total"] or Decimal("0.00")
-        this_month_revenue = commissions.filter(
-            status=MarketerCommission.Status.APPROVED,
-            created_at__gte=month_start,
-        ).aggregate(total=Sum("amount"))["total"] or Decimal("0.00")
-
-        total_orders_influenced = (
-            order_items.values("order_id").distinct().count()
-        )
-        total_units_sold = order_items.aggregate(total=Sum("quantity"))["total"] or 0
 
         payload = {
             "total_earnings": total_earnings,
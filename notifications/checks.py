@@ -0,0 +1,21 @@
+from django.core.checks import Warning, register
+
+from core.cache import is_shared_cache
+
+
+@register()
+def check_summary_cache(app_configs, **kwargs):
+    """Inbox summaries are invalidated by whichever process changed the counters."""
+    if is_shared_cache():
+        return []
+    return [
+        Warning(
+            "The default cache is per process, so a web worker or process_notification_outbox cannot "
+            "invalidate the inbox summaries cached by other processes.",
+            hint=(
+                "Set CACHE_URL to a shared Redis cache. Without it summaries refresh only after "
+                "NOTIFICATION_SUMMARY_CACHE_SECONDS."
+            ),
+            id="notifications.W001",
+        )
+    ]
@@ -0,0 +1,256 @@
+import json
+import logging
+import smtplib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+# (payload key, line format, appends currency, skipped when falsy rather than only when None)
+_EMAIL_DETAIL_LINES = (
+    ("order_number", "Order number: {}", False, True),
+    ("total_amount", "Amount: {} {}", True, False),
+    ("refund_amount", "Refund amount: {} {}", True, False),
+    ("reason", "Reason: {}", False, True),
+    ("next_steps", "Next steps: {}", False, True),
+)
+
+
+def render_email_body(*, message: str, payload: Dict[str, Any]) -> str:
+    lines = [message, "", f"Notification type: {payload.get('type', 'general')}"]
+    for key, line, with_currency, skip_falsy in _EMAIL_DETAIL_LINES:
+        value = payload.get(key)
+        if value is None or (skip_falsy and not value):
+            continue
+        lines.append(line.format(value, payload.get("currency", "ETB")) if with_currency else line.format(value))
+    lines.extend(["", f"Details: {json.dumps(payload, ensure_ascii=True, default=str)}"])
+    return "\n".join(lines)
+
+
+@dataclass
+class EmailItem:
+    """One notification email to send; `key` identifies it in the report (e.g. a delivery id)."""
+
+    key: Any
+    recipient: str
+    title: str
+    message: str
+    payload: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class EmailBatch:
+    messages: List[EmailMessage]
+    items: List[EmailItem]
+    digests: int = 0
+
+
+@dataclass
+class EmailDeliveryReport:
+    sent: int = 0
+    failed: int = 0
+    messages: int = 0
+    digests: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+    errors: Dict[Any, Exception] = field(default_factory=dict)
+
+    @property
+    def throughput(self) -> float:
+        """Messages handed to the mail server per second."""
+        return self.messages / self.seconds if self.seconds else float(self.messages)
+
+
+class EmailConnectionPool:
+    """
+    Keeps mail backend connections open between sends.
+
+    Each send checks out an idle connection (or opens one) and returns it
+    afterwards, so worker threads reuse an established SMTP session instead of
+    connecting, negotiating TLS and authenticating for every message.
+    Connections older than max_age_seconds are closed rather than reused, and
+    a connection that raises is discarded.
+    """
+
+    def __init__(self, max_idle: int = 4, max_age_seconds: float = 300.0, clock: Callable[[], float] = time.monotonic) -> None:
+        self.max_idle = max(0, max_idle)
+        self.max_age_seconds = max_age_seconds
+        self._clock = clock
+        self._idle: List[Tuple[str, Any, float]] = []
+        self._lock = threading.Lock()
+
+    def send_messages(self, messages: Sequence[EmailMessage]) -> int:
+        messages = list(messages)
+        if not messages:
+            return 0
+        backend, connection, opened_at, reused = self._checkout()
+        try:
+            sent = connection.send_messages(messages) or 0
+        except smtplib.SMTPServerDisconnected:
+            self._discard(connection)
+            if not reused:
+                raise
+            # The server dropped the idle session; that fails on the first command, so retry once.
+            backend, connection, opened_at, _ = self._checkout(reuse=False)
+            try:
+                sent = connection.send_messages(messages) or 0
+            except Exception:
+                self._discard(connection)
+                raise
+        except Exception:
+            self._discard(connection)
+            raise
+        self._checkin(backend, connection, opened_at)
+        return sent
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for _, connection, _ in idle:
+            self._discard(connection)
+
+    def _checkout(self, reuse: bool = True) -> Tuple[str, Any, float, bool]:
+        backend = settings.EMAIL_BACKEND
+        now = self._clock()
+        stale = []
+        found = None
+        with self._lock:
+            while reuse and self._idle:
+                entry = self._idle.pop()
+                if entry[0] == backend and now - entry[2] < self.max_age_seconds:
+                    found = entry
+                    break
+                stale.append(entry[1])
+        for connection in stale:
+            self._discard(connection)
+        if found:
+            return found[0], found[1], found[2], True
+
+        connection = get_connection(backend, fail_silently=False)
+        connection.open()
+        metrics.incr("email.connections_opened")
+        return backend, connection, now, False
+
+    def _checkin(self, backend: str, connection: Any, opened_at: float) -> None:
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append((backend, connection, opened_at))
+                return
+        self._discard(connection)
+
+    @staticmethod
+    def _discard(connection: Any) -> None:
+        try:
+            connection.close()
+        except Exception:
+            logger.debug("Closing mail connection failed", exc_info=True)
+
+
+email_pool = EmailConnectionPool(max_idle=getattr(settings, "EMAIL_POOL_MAX_IDLE", 4))
+
+
+def send_pooled(messages: Sequence[EmailMessage]) -> int:
+    """Send with a pooled connection; used for one-off emails outside the outbox."""
+    return email_pool.send_messages(messages)
+
+
+class EmailDeliveryEngine:
+    """
+    Sends notification emails in batches over pooled connections.
+
+    Items for the same recipient are coalesced into one digest message (up to
+    max_digest_items each), and messages are handed to the backend's
+    send_messages in batches of batch_size, so one SMTP session carries many
+    messages. Throughput and failures are recorded in core.metrics.
+    """
+
+    def __init__(
+        self,
+        pool: Optional[EmailConnectionPool] = None,
+        batch_size: int = 50,
+        max_digest_items: int = 20,
+        limiter=None,
+    ) -> None:
+        self.pool = pool or email_pool
+        self.batch_size = max(1, batch_size)
+        self.max_digest_items = max(1, max_digest_items)
+        self.limiter = limiter
+
+    def deliver(self, items: Iterable[EmailItem]) -> EmailDeliveryReport:
+        report = EmailDeliveryReport()
+        started = time.monotonic()
+        for batch in self.batches(items):
+            try:
+                self.send_batch(batch)
+            except Exception as exc:
+                logger.warning("Email batch failed size=%s: %s", len(batch.messages), exc)
+                report.failed += len(batch.items)
+                report.errors.update((item.key, exc) for item in batch.items)
+            else:
+                report.sent += len(batch.items)
+                report.messages += len(batch.messages)
+                report.digests += batch.digests
+            report.batches += 1
+        report.seconds = time.monotonic() - started
+        return report
+
+    def batches(self, items: Iterable[EmailItem]) -> List[EmailBatch]:
+        by_recipient: Dict[str, List[EmailItem]] = OrderedDict()
+        for item in items:
+            by_recipient.setdefault(item.recipient.strip().lower(), []).append(item)
+
+        batches: List[EmailBatch] = []
+        current = EmailBatch(messages=[], items=[])
+        for group in by_recipient.values():
+            for start in range(0, len(group), self.max_digest_items):
+                chunk = group[start:start + self.max_digest_items]
+                current.messages.append(self.build_message(chunk))
+                current.items.extend(chunk)
+                if len(chunk) > 1:
+                    current.digests += 1
+                if len(current.messages) >= self.batch_size:
+                    batches.append(current)
+                    current = EmailBatch(messages=[], items=[])
+        if current.messages:
+            batches.append(current)
+        return batches
+
+    def send_batch(self, batch: EmailBatch) -> None:
+        if self.limiter is not None:
+            self.limiter.acquire()
+        try:
+            with metrics.timer("email.batch"):
+                self.pool.send_messages(batch.messages)
+        except Exception:
+            metrics.incr("email.failed", len(batch.messages))
+            raise
+        metrics.incr("email.sent", len(batch.messages))
+        metrics.incr("email.digests", batch.digests)
+
+    @staticmethod
+    def build_message(items: Sequence[EmailItem]) -> EmailMessage:
+        from_email = getattr(settings, "DEFAULT_FROM_EMAIL", "")
+        recipient = items[0].recipient
+        if len(items) == 1:
+            item = items[0]
+            body = render_email_body(message=item.message, payload=item.payload)
+            return EmailMessage(subject=item.title, body=body, from_email=from_email, to=[recipient])
+
+        sections = [f"You have {len(items)} new notifications.", ""]
+        for item in items:
+            sections.extend([item.title, item.message, ""])
+        return EmailMessage(
+            subject=f"You have {len(items)} new notifications",
+            body="\n".join(sections).rstrip() + "\n",
+            from_email=from_email,
+            to=[recipient],
+        )
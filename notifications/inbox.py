@@ -0,0 +1,174 @@
+import hashlib
+import json
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, DateTimeField, F, Max, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Notification, NotificationCounter
+
+
+class NotificationInbox:
+    """
+    Per-user inbox summary backed by NotificationCounter rows.
+
+    Counters are adjusted with F() updates when notifications are created or
+    read. The summary built from them is cached per user with an ETag and the
+    generation it was built from; every change bumps the user's generation
+    after commit. The generation is read before the counters, so a summary
+    computed while a change commits is stored under the old generation and
+    never served afterwards.
+    """
+
+    CACHE_KEY = "notifications:summary:{user_id}"
+    GENERATION_KEY = "notifications:summary:gen:{user_id}"
+
+    @classmethod
+    def record_created(cls, notifications: Iterable[Notification]) -> None:
+        grouped: Dict[Tuple[str, str], list] = {}
+        for notification in notifications:
+            key = (str(notification.user_id), notification.type)
+            entry = grouped.setdefault(key, [0, notification.created_at])
+            entry[0] += 1
+            entry[1] = max(entry[1], notification.created_at)
+        if not grouped:
+            return
+
+        NotificationCounter.objects.bulk_create(
+            [NotificationCounter(user_id=user_id, type=notification_type) for user_id, notification_type in grouped],
+            ignore_conflicts=True,
+        )
+        for (user_id, notification_type), (count, latest) in grouped.items():
+            latest_value = Value(latest, output_field=DateTimeField())
+            NotificationCounter.objects.filter(user_id=user_id, type=notification_type).update(
+                unread=F("unread") + count,
+                latest_at=Coalesce(Greatest("latest_at", latest_value), latest_value),
+            )
+        cls._invalidate({user_id for user_id, _ in grouped})
+
+    @classmethod
+    def record_read(cls, user_id: Any, notification_type: str, count: int = 1) -> None:
+        NotificationCounter.objects.filter(user_id=user_id, type=notification_type).update(
+            unread=Greatest(F("unread") - count, Value(0)),
+        )
+        cls._invalidate([user_id])
+
+    @classmethod
+    def record_all_read(cls, user_id: Any) -> None:
+        NotificationCounter.objects.filter(user_id=user_id).update(unread=0)
+        cls._invalidate([user_id])
+
+    @classmethod
+    def record_deleted(cls, notifications: Iterable[Notification]) -> None:
+        """
+        Take deleted notifications out of their counters; call in the deleting transaction.
+
+        Unread ones are subtracted, and a counter whose latest notification
+        was deleted moves back to the newest one left. Counters are only
+        adjusted, never recreated, so notifications created meanwhile stay
+        counted.
+        """
+        grouped: Dict[Tuple[str, str], list] = {}
+        for notification in notifications:
+            entry = grouped.setdefault((str(notification.user_id), notification.type), [0, notification.created_at])
+            entry[0] += 0 if notification.is_read else 1
+            entry[1] = max(entry[1], notification.created_at)
+        newest = Notification.objects.filter(user_id=OuterRef("user_id"), type=OuterRef("type")).order_by("-created_at")
+        for (user_id, notification_type), (unread, deleted_latest) in sorted(grouped.items()):
+            NotificationCounter.objects.filter(user_id=user_id, type=notification_type).update(
+                unread=Greatest(F("unread") - unread, Value(0)),
+                latest_at=Case(
+                    When(latest_at__lte=deleted_latest, then=Subquery(newest.values("created_at")[:1])),
+                    default=F("latest_at"),
+                ),
+            )
+        cls._invalidate({user_id for user_id, _ in grouped})
+
+    @classmethod
+    @transaction.atomic
+    def rebuild(cls, user_ids: Optional[Iterable[Any]] = None) -> int:
+        """Recompute counters from Notification rows (all users when user_ids is None)."""
+        notifications = Notification.objects.all()
+        counters = NotificationCounter.objects.all()
+        if user_ids is not None:
+            user_ids = [str(user_id) for user_id in user_ids]
+            notifications = notifications.filter(user_id__in=user_ids)
+            counters = counters.filter(user_id__in=user_ids)
+        rows = (
+            notifications.values("user_id", "type")
+            .annotate(unread=Count("id", filter=Q(is_read=False)), latest_at=Max("created_at"))
+            .order_by()
+        )
+        affected = set(counters.values_list("user_id", flat=True).distinct())
+        counters.delete()
+        created = NotificationCounter.objects.bulk_create(
+            [
+                NotificationCounter(
+                    user_id=row["user_id"],
+                    type=row["type"],
+                    unread=row["unread"],
+                    latest_at=row["latest_at"],
+                )
+                for row in rows.iterator()
+            ],
+            batch_size=1000,
+        )
+        affected.update(counter.user_id for counter in created)
+        cls._invalidate(affected)
+        return len(created)
+
+    @classmethod
+    def summary(cls, user) -> Tuple[Dict[str, Any], str]:
+        """Return the user's summary and its ETag, from cache when possible."""
+        key = cls.CACHE_KEY.format(user_id=user.id)
+        generation_key = cls.GENERATION_KEY.format(user_id=user.id)
+        values = cache.get_many([key, generation_key])
+        generation = values.get(generation_key, 0)
+        cached = values.get(key)
+        if cached is not None and cached["generation"] == generation:
+            return cached["summary"], cached["etag"]
+
+        by_type = {}
+        unread_total = 0
+        latest_at = None
+        for notification_type, unread, latest in (
+            NotificationCounter.objects.filter(user=user).order_by("type").values_list("type", "unread", "latest_at")
+        ):
+            by_type[notification_type] = {
+                "unread": unread,
+                "latest_at": latest.isoformat() if latest else None,
+            }
+            unread_total += unread
+            if latest and (latest_at is None or latest > latest_at):
+                latest_at = latest
+        summary = {
+            "unread_total": unread_total,
+            "latest_at": latest_at.isoformat() if latest_at else None,
+            "by_type": by_type,
+        }
+        etag = hashlib.sha1(json.dumps(summary, sort_keys=True).encode()).hexdigest()
+        cache.set(
+            key,
+            {"summary": summary, "etag": etag, "generation": generation},
+            getattr(settings, "NOTIFICATION_SUMMARY_CACHE_SECONDS", 300),
+        )
+        return summary, etag
+
+    @classmethod
+    def _invalidate(cls, user_ids: Iterable[Any]) -> None:
+        keys = sorted({cls.GENERATION_KEY.format(user_id=user_id) for user_id in user_ids})
+        if keys:
+            transaction.on_commit(lambda: _bump(keys))
+
+
+def _bump(keys: Iterable[str]) -> None:
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Missing (never set or evicted); any value differs from what entries recorded.
+            cache.set(key, int(time.time() * 1000), None)
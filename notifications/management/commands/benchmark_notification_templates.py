@@ -0,0 +1,77 @@
+import time
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from catalog.models import Product
+from notifications.services import NotificationTemplates
+from order.models import Order
+
+# Renders of one payment event: customer, shop owner (two), and one per sold product.
+RENDERS_PER_EVENT = 5
+
+
+class Command(BaseCommand):
+    help = "Time rendering notification templates for a batch of payment events, with and without a render session."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=10000, help="Notifications to render per run.")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per mode; the best time is reported.")
+
+    def handle(self, *args, **options):
+        count, repeat = options["count"], options["repeat"]
+        if count <= 0 or repeat <= 0:
+            raise CommandError("--count and --repeat must be greater than 0.")
+
+        events = self._events(max(1, count // RENDERS_PER_EVENT))
+        for label, use_session in (("plain", False), ("session", True)):
+            best = None
+            with CaptureQueriesContext(connection) as queries:
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    rendered = self._render(events, use_session)
+                    elapsed = time.perf_counter() - started
+                    best = elapsed if best is None else min(best, elapsed)
+            self.stdout.write(
+                f"{label:<8} rendered={rendered} best={best * 1000:.1f}ms "
+                f"per_notification={best / rendered * 1e6:.2f}us queries={len(queries)}"
+            )
+
+    @staticmethod
+    def _events(count):
+        now = timezone.now()
+        events = []
+        for index in range(count):
+            order = Order(
+                id=uuid.uuid4(),
+                order_number=f"ORD-{index:08d}",
+                total_amount=Decimal("149.90"),
+                updated_at=now,
+            )
+            products = [Product(id=uuid.uuid4(), name=f"Product {index}-{slot}") for slot in range(2)]
+            events.append((order, products))
+        return events
+
+    @staticmethod
+    def _render(events, use_session):
+        rendered = 0
+        for order, products in events:
+            if use_session:
+                with NotificationTemplates.session():
+                    rendered += _render_event(order, products)
+            else:
+                rendered += _render_event(order, products)
+        return rendered
+
+
+def _render_event(order, products):
+    NotificationTemplates.payment_success(order, items_count=len(products))
+    NotificationTemplates.new_order(order)
+    NotificationTemplates.payment_confirmed(order)
+    for product in products:
+        NotificationTemplates.product_sold(order, product)
+    return 3 + len(products)
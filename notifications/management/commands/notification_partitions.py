@@ -0,0 +1,43 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from notifications.models import Notification
+from notifications.retention import NotificationPartitionManager
+
+
+class Command(BaseCommand):
+    help = "Manage optional monthly partitions of the notifications table on PostgreSQL."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--print-conversion",
+            action="store_true",
+            help="Print the one-off DDL that converts the table to a partitioned one (not executed).",
+        )
+        parser.add_argument("--since", help="First month for the conversion (YYYY-MM-DD); defaults to the oldest row.")
+        parser.add_argument("--months-ahead", type=int, default=3, help="Future monthly partitions to create.")
+
+    def handle(self, *args, **options):
+        manager = NotificationPartitionManager()
+        if options["print_conversion"]:
+            since = parse_date(options["since"]) if options["since"] else None
+            if options["since"] and since is None:
+                raise CommandError(f"Invalid date: {options['since']}")
+            if since is None:
+                oldest = Notification.objects.order_by("created_at").values_list("created_at", flat=True).first()
+                first_month = oldest or timezone.now()
+            else:
+                first_month = timezone.make_aware(datetime.combine(since, time.min))
+            for statement in manager.conversion_sql(first_month, options["months_ahead"]):
+                self.stdout.write(f"{statement};")
+            return
+
+        if not manager.is_partitioned():
+            raise CommandError(
+                "notifications_notification is not partitioned; review --print-conversion output and apply it first."
+            )
+        for name in manager.ensure_partitions(options["months_ahead"]):
+            self.stdout.write(f"Partition ready: {name}")
@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from notifications.outbox import NotificationOutboxWorker
+
+
+class Command(BaseCommand):
+    help = "Send pending push and email notification deliveries from the outbox."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Keep draining until interrupted.")
+        parser.add_argument("--interval", type=float, default=2.0, help="Seconds to sleep when the outbox is empty.")
+        parser.add_argument("--batch-size", type=int, default=200, help="Deliveries claimed per run.")
+        parser.add_argument("--workers", type=int, default=None, help="Concurrent email sends.")
+
+    def handle(self, *args, **options):
+        worker = NotificationOutboxWorker(
+            batch_size=options["batch_size"],
+            max_workers=options["workers"] or getattr(settings, "NOTIFICATION_OUTBOX_WORKERS", 4),
+            max_attempts=getattr(settings, "NOTIFICATION_OUTBOX_MAX_ATTEMPTS", 5),
+            retry_base_seconds=getattr(settings, "NOTIFICATION_OUTBOX_RETRY_BASE_SECONDS", 30),
+            push_rate_per_second=getattr(settings, "NOTIFICATION_PUSH_RATE_PER_SECOND", 20.0),
+            email_rate_per_second=getattr(settings, "NOTIFICATION_EMAIL_RATE_PER_SECOND", 5.0),
+            email_batch_size=getattr(settings, "NOTIFICATION_EMAIL_BATCH_SIZE", 50),
+            digest_window_seconds=getattr(settings, "NOTIFICATION_EMAIL_DIGEST_WINDOW_SECONDS", 0),
+            lease_seconds=getattr(settings, "NOTIFICATION_OUTBOX_LEASE_SECONDS", 300),
+        )
+
+        while True:
+            result = worker.run_once()
+            if result.claimed:
+                self.stdout.write(
+                    f"Deliveries claimed={result.claimed} sent={result.sent} "
+                    f"retrying={result.retried} failed={result.failed} "
+                    f"emails={result.email_messages} digests={result.digests}"
+                )
+            if not options["loop"]:
+                break
+            if not result.claimed:
+                time.sleep(options["interval"])
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from notifications.tokens import DeviceTokenRegistry
+
+
+class Command(BaseCommand):
+    help = "Deactivate device tokens with no successful push in N days and delete long-inactive tokens."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stale-days", type=int, default=None, help="Days without a successful send.")
+        parser.add_argument(
+            "--purge-inactive-days",
+            type=int,
+            default=None,
+            help="Delete tokens inactive for this many days (0 keeps them).",
+        )
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Tokens deactivated per UPDATE.")
+
+    def handle(self, *args, **options):
+        stale_days = options["stale_days"] or getattr(settings, "DEVICE_TOKEN_STALE_DAYS", 60)
+        purge_days = options["purge_inactive_days"]
+        if purge_days is None:
+            purge_days = getattr(settings, "DEVICE_TOKEN_PURGE_INACTIVE_DAYS", 180)
+        if stale_days <= 0 or options["chunk_size"] <= 0:
+            raise CommandError("--stale-days and --chunk-size must be greater than 0.")
+
+        pruned = DeviceTokenRegistry.prune_stale(stale_days, chunk_size=options["chunk_size"])
+        purged = DeviceTokenRegistry.purge_inactive(purge_days) if purge_days > 0 else 0
+        self.stdout.write(
+            self.style.SUCCESS(f"Deactivated {pruned} stale device tokens; deleted {purged} inactive tokens.")
+        )
@@ -0,0 +1,62 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from notifications.retention import NotificationPartitionManager, NotificationRetentionJob, RetentionPolicy
+
+
+class Command(BaseCommand):
+    help = "Archive and delete notifications older than their per-type retention (NOTIFICATION_RETENTION_DAYS)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report how many notifications would be purged.")
+        parser.add_argument("--chunk-size", type=int, default=None, help="Notifications archived and deleted per transaction.")
+        parser.add_argument("--archive-dir", default=None, help="Directory for gzip NDJSON archives.")
+        parser.add_argument("--no-archive", action="store_true", help="Delete without writing an archive.")
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between chunks.")
+        parser.add_argument(
+            "--drop-partitions",
+            action="store_true",
+            help="On a partitioned PostgreSQL table, also drop monthly partitions past the longest retention.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            policy = RetentionPolicy()
+            job = NotificationRetentionJob(
+                policy=policy,
+                chunk_size=options["chunk_size"] or getattr(settings, "NOTIFICATION_RETENTION_CHUNK_SIZE", 1000),
+                archive_dir=None
+                if options["no_archive"]
+                else options["archive_dir"] or getattr(settings, "NOTIFICATION_ARCHIVE_DIR", "") or None,
+                dry_run=options["dry_run"],
+                pause_seconds=options["pause"],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc)) from exc
+
+        result = job.run()
+        for label, count in sorted(result.by_type.items()):
+            self.stdout.write(f"{label}: {count}")
+        if options["dry_run"]:
+            self.stdout.write(self.style.WARNING(f"Dry run: {sum(result.by_type.values())} notifications would be purged."))
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Deleted {result.deleted} notifications in {result.chunks} chunks; archived {result.archived}."
+            )
+        )
+        for path in result.files:
+            self.stdout.write(f"Archive: {path}")
+
+        if options["drop_partitions"]:
+            manager = NotificationPartitionManager()
+            if not manager.is_partitioned():
+                raise CommandError("notifications_notification is not a partitioned PostgreSQL table.")
+            if not policy.max_days():
+                raise CommandError("Some notification types are kept forever; no partition can be dropped.")
+            for name in manager.drop_partitions_before(timezone.now() - timedelta(days=policy.max_days())):
+                self.stdout.write(f"Dropped partition {name}")
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:59
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+
+
+def build_counters(apps, schema_editor):
+    Notification = apps.get_model("notifications", "Notification")
+    NotificationCounter = apps.get_model("notifications", "NotificationCounter")
+    rows = (
+        Notification.objects.values("user_id", "type")
+        .annotate(unread=Count("id", filter=Q(is_read=False)), latest_at=Max("created_at"))
+        .order_by()
+    )
+    NotificationCounter.objects.bulk_create(
+        [
+            NotificationCounter(
+                user_id=row["user_id"],
+                type=row["type"],
+                unread=row["unread"],
+                latest_at=row["latest_at"],
+            )
+            for row in rows.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0003_notification_outbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationCounter',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('type', models.CharField(choices=[('payment_success', 'Payment Success'), ('order_shipped', 'Order Shipped'), ('order_delivered', 'Order Delivered'), ('order_cancelled', 'Order Cancelled'), ('refund_completed', 'Refund Completed'), ('low_stock_alert', 'Low Stock Alert'), ('new_order', 'New Order'), ('payment_confirmed', 'Payment Confirmed'), ('product_sold', 'Product Sold'), ('commission_created', 'Commission Created'), ('commission_approved', 'Commission Approved')], max_length=50)),
+                ('unread', models.PositiveIntegerField(default=0)),
+                ('latest_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notification_counters', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'type'), name='uniq_notification_counter_user_type')],
+            },
+        ),
+        migrations.RunPython(build_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0008_delivery_lease'),
+    ]
+
+    operations = [
+        # Rows written before the mask existed stored every channel, so they keep overriding all of them.
+        migrations.AddField(
+            model_name='notificationpreference',
+            name='overridden',
+            field=models.PositiveSmallIntegerField(default=15),
+            preserve_default=False,
+        ),
+    ]
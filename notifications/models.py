@@ -13,6 +13,7 @@ class DeviceToken(models.Model):
     token = models.TextField(unique=True)
     device_type = models.CharField(max_length=20, choices=DeviceType.choices)
     is_active = models.BooleanField(default=True)
+    last_success_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -20,6 +21,7 @@ class DeviceToken(models.Model):
         indexes = [
             models.Index(fields=["user", "is_active"]),
             models.Index(fields=["device_type"]),
+            models.Index(fields=["is_active", "last_success_at"], name="devicetoken_active_success_idx"),
         ]
 
 
@@ -50,8 +52,101 @@ class Notification(models.Model):
         ordering = ["-created_at"]
         indexes = [
             models.Index(fields=["user", "is_read"]),
-            models.Index(fields=["type"]),
+            models.Index(fields=["user", "-created_at"], name="notif_user_created_idx"),
+            models.Index(fields=["type", "created_at"], name="notif_type_created_idx"),
             models.Index(fields=["created_at"]),
         ]
 
-# Create your models here.
+
+class NotificationDelivery(models.Model):
+    """
+    Outbox row for one channel of a notification.
+
+    Written in the same transaction as the Notification and drained by
+    process_notification_outbox, so no network call runs in the request.
+    A claimed row is PROCESSING until locked_until; after that the worker
+    that claimed it is presumed dead and the row is claimed again.
+    """
+
+    class Channel(models.TextChoices):
+        PUSH = "push", "Push"
+        EMAIL = "email", "Email"
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        PROCESSING = "processing", "Processing"
+        SENT = "sent", "Sent"
+        FAILED = "failed", "Failed"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name="deliveries")
+    channel = models.CharField(max_length=10, choices=Channel.choices)
+    recipient = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+            models.Index(fields=["status", "locked_until"]),
+        ]
+
+
+class NotificationCounter(models.Model):
+    """
+    Unread count and latest timestamp per (user, type).
+
+    Maintained by NotificationInbox whenever notifications are created or
+    read, so inbox badges never have to count Notification rows.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="notification_counters")
+    type = models.CharField(max_length=50, choices=Notification.Type.choices)
+    unread = models.PositiveIntegerField(default=0)
+    latest_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "type"], name="uniq_notification_counter_user_type"),
+        ]
+
+
+class NotificationPreference(models.Model):
+    """
+    A user's channel choice for one notification type, as a bitmask of Channel flags.
+
+    Only types the user changed have a row, and only the channels flagged in
+    `overridden` take their value from `channels`; every other channel
+    follows the global default for the notification being sent. Read
+    through notifications.preferences.NotificationPreferences.
+    """
+
+    class Channel(models.IntegerChoices):
+        PUSH = 1, "Push"
+        EMAIL = 2, "Email"
+        IN_APP = 4, "In-app"
+        DIGEST = 8, "Digest"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="notification_preferences",
+    )
+    type = models.CharField(max_length=50, choices=Notification.Type.choices)
+    channels = models.PositiveSmallIntegerField()
+    overridden = models.PositiveSmallIntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "type"], name="uniq_notification_preference_user_type"),
+        ]
@@ -0,0 +1,222 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import List
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from core.ratelimit import RateLimiter
+
+from .email import EmailDeliveryEngine, EmailItem
+from .models import NotificationDelivery
+from .push import PushDeliveryEngine, PushMessage
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class OutboxRunResult:
+    claimed: int = 0
+    sent: int = 0
+    retried: int = 0
+    failed: int = 0
+    email_messages: int = 0
+    digests: int = 0
+
+
+class NotificationOutboxWorker:
+    """
+    Drains NotificationDelivery rows outside the request cycle.
+
+    Each run claims due PENDING rows (skipping rows locked by other workers)
+    for lease_seconds, sends every push delivery through one PushDeliveryEngine pass and emails
+    in batches from a thread pool, each channel behind its own rate limiter.
+    Held emails for the same recipients that fall inside the digest window
+    are claimed along with them and coalesced into one digest message.
+    Failed deliveries are retried with exponential backoff until max_attempts.
+    PROCESSING rows whose lease expired belong to a worker that died before
+    recording the outcome; they are claimed again, or marked failed once
+    they have used up max_attempts.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 200,
+        max_workers: int = 4,
+        max_attempts: int = 5,
+        retry_base_seconds: int = 30,
+        push_rate_per_second: float = 20.0,
+        email_rate_per_second: float = 5.0,
+        email_batch_size: int = 50,
+        digest_window_seconds: int = 0,
+        lease_seconds: int = 300,
+    ) -> None:
+        self.batch_size = max(1, batch_size)
+        self.max_workers = max(1, max_workers)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base_seconds = retry_base_seconds
+        self.push_limiter = RateLimiter(push_rate_per_second)
+        self.email_engine = EmailDeliveryEngine(
+            batch_size=email_batch_size,
+            limiter=RateLimiter(email_rate_per_second),
+        )
+        self.digest_window = timedelta(seconds=max(0, digest_window_seconds))
+        self.lease = timedelta(seconds=max(1, lease_seconds))
+
+    def run_once(self) -> OutboxRunResult:
+        result = OutboxRunResult()
+        deliveries = self._claim_due()
+        result.claimed = len(deliveries)
+        if not deliveries:
+            return result
+
+        push = [d for d in deliveries if d.channel == NotificationDelivery.Channel.PUSH]
+        email = [d for d in deliveries if d.channel == NotificationDelivery.Channel.EMAIL]
+        sent: List[NotificationDelivery] = []
+        failures = []
+
+        email_batches = self.email_engine.batches(
+            EmailItem(
+                key=delivery,
+                recipient=delivery.recipient,
+                title=delivery.notification.title,
+                message=delivery.notification.message,
+                payload=delivery.notification.payload,
+            )
+            for delivery in email
+        )
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            email_futures = {pool.submit(self.email_engine.send_batch, batch): batch for batch in email_batches}
+            # Push is already batched per FCM call, so it runs alongside the email workers.
+            if push:
+                try:
+                    report = PushDeliveryEngine(limiter=self.push_limiter).deliver(
+                        PushMessage(
+                            user_id=delivery.notification.user_id,
+                            title=delivery.notification.title,
+                            message=delivery.notification.message,
+                            payload=delivery.notification.payload,
+                        )
+                        for delivery in push
+                    )
+                except Exception as exc:
+                    logger.exception("Push outbox batch failed")
+                    failures.extend((delivery, exc) for delivery in push)
+                else:
+                    for delivery in push:
+                        if str(delivery.notification.user_id) in report.failed_user_ids:
+                            failures.append((delivery, RuntimeError("FCM batch call failed")))
+                        else:
+                            sent.append(delivery)
+            for future in as_completed(email_futures):
+                batch = email_futures[future]
+                try:
+                    future.result()
+                except Exception as exc:
+                    failures.extend((item.key, exc) for item in batch.items)
+                else:
+                    sent.extend(item.key for item in batch.items)
+                    result.email_messages += len(batch.messages)
+                    result.digests += batch.digests
+
+        now = timezone.now()
+        NotificationDelivery.objects.filter(id__in=[delivery.id for delivery in sent]).update(
+            status=NotificationDelivery.Status.SENT,
+            sent_at=now,
+            next_attempt_at=None,
+            locked_until=None,
+            last_error="",
+            updated_at=now,
+        )
+        result.sent = len(sent)
+        for delivery, exc in failures:
+            if self._reschedule(delivery, exc):
+                result.retried += 1
+            else:
+                result.failed += 1
+        return result
+
+    def retry_delay(self, attempts: int) -> timedelta:
+        return timedelta(seconds=self.retry_base_seconds * (2 ** max(0, attempts - 1)))
+
+    @transaction.atomic
+    def _claim_due(self) -> List[NotificationDelivery]:
+        now = timezone.now()
+        self._fail_exhausted_leases(now)
+        due = list(
+            NotificationDelivery.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=NotificationDelivery.Status.PENDING, next_attempt_at__lte=now)
+                | Q(status=NotificationDelivery.Status.PROCESSING, locked_until__lte=now)
+            )
+            .order_by("next_attempt_at")
+            .values_list("id", "channel", "recipient")[: self.batch_size]
+        )
+        if not due:
+            return []
+        due_ids = [delivery_id for delivery_id, _, _ in due]
+        recipients = {recipient for _, channel, recipient in due if channel == NotificationDelivery.Channel.EMAIL}
+        if recipients and self.digest_window:
+            # Emails still held for the same recipients join this run's digests.
+            due_ids.extend(
+                NotificationDelivery.objects.select_for_update(skip_locked=True)
+                .filter(
+                    status=NotificationDelivery.Status.PENDING,
+                    channel=NotificationDelivery.Channel.EMAIL,
+                    recipient__in=recipients,
+                    next_attempt_at__gt=now,
+                    next_attempt_at__lte=now + self.digest_window,
+                )
+                .values_list("id", flat=True)
+            )
+        NotificationDelivery.objects.filter(id__in=due_ids).update(
+            status=NotificationDelivery.Status.PROCESSING,
+            attempts=F("attempts") + 1,
+            locked_until=now + self.lease,
+            updated_at=now,
+        )
+        return list(
+            NotificationDelivery.objects.select_related("notification")
+            .filter(id__in=due_ids)
+            .order_by("notification__created_at")
+        )
+
+    def _fail_exhausted_leases(self, now) -> None:
+        expired = NotificationDelivery.objects.filter(
+            status=NotificationDelivery.Status.PROCESSING,
+            locked_until__lte=now,
+            attempts__gte=self.max_attempts,
+        )
+        failed = expired.update(
+            status=NotificationDelivery.Status.FAILED,
+            next_attempt_at=None,
+            locked_until=None,
+            last_error="Lease expired before the delivery outcome was recorded",
+            updated_at=now,
+        )
+        if failed:
+            logger.warning("Marked %s notification deliveries failed after their lease expired", failed)
+
+    def _reschedule(self, delivery: NotificationDelivery, error: Exception) -> bool:
+        delivery.last_error = str(error)
+        if delivery.attempts >= self.max_attempts:
+            logger.warning(
+                "Notification delivery %s (%s) failed after %s attempts: %s",
+                delivery.id,
+                delivery.channel,
+                delivery.attempts,
+                error,
+            )
+            delivery.status = NotificationDelivery.Status.FAILED
+            delivery.next_attempt_at = None
+            retried = False
+        else:
+            delivery.status = NotificationDelivery.Status.PENDING
+            delivery.next_attempt_at = timezone.now() + self.retry_delay(delivery.attempts)
+            retried = True
+        delivery.locked_until = None
+        delivery.save(update_fields=["status", "next_attempt_at", "locked_until", "last_error", "updated_at"])
+        return retried
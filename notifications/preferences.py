@@ -0,0 +1,153 @@
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core.cache import is_shared_cache
+from core.metrics import metrics
+
+from .models import Notification, NotificationPreference
+
+Channel = NotificationPreference.Channel
+
+ALL_CHANNELS = Channel.PUSH | Channel.EMAIL | Channel.IN_APP | Channel.DIGEST
+CHANNEL_NAMES = {"push": Channel.PUSH, "email": Channel.EMAIL, "in_app": Channel.IN_APP, "digest": Channel.DIGEST}
+
+
+class NotificationPreferences:
+    """
+    Cached per-user channel overrides, resolved in bulk for fan-out.
+
+    Each user's overrides are cached as one {type: (channels, overridden)}
+    dict, so resolving a batch of notifications costs one cache get_many
+    plus at most one query for every uncached user together. Channels not
+    flagged in `overridden` come from the default policy supplied by the
+    caller, evaluated against the notification's payload at send time.
+    Preferences are changed in web processes and read by every process that
+    notifies, so the cache is only used when it is shared between processes
+    (CACHE_URL); with a per-process cache they are read from the database
+    on every resolve.
+    """
+
+    CACHE_KEY = "notifications:preferences:v2:{user_id}"
+
+    @classmethod
+    def overrides_for_users(cls, user_ids: Iterable[Any]) -> Dict[str, Dict[str, Tuple[int, int]]]:
+        user_ids = {str(user_id) for user_id in user_ids}
+        if not user_ids:
+            return {}
+        if not is_shared_cache():
+            return cls._load(user_ids)
+        keys = {cls.CACHE_KEY.format(user_id=user_id): user_id for user_id in user_ids}
+        cached = cache.get_many(list(keys))
+        overrides = {keys[key]: value for key, value in cached.items()}
+        misses = user_ids - set(overrides)
+        metrics.incr("notifications.preferences.cache_hit", len(overrides))
+        metrics.incr("notifications.preferences.cache_miss", len(misses))
+        if misses:
+            loaded = cls._load(misses)
+            cache.set_many(
+                {cls.CACHE_KEY.format(user_id=user_id): value for user_id, value in loaded.items()},
+                getattr(settings, "NOTIFICATION_PREFERENCE_CACHE_SECONDS", 600),
+            )
+            overrides.update(loaded)
+        return overrides
+
+    @staticmethod
+    def _load(user_ids: Iterable[str]) -> Dict[str, Dict[str, Tuple[int, int]]]:
+        loaded: Dict[str, Dict[str, Tuple[int, int]]] = {user_id: {} for user_id in user_ids}
+        for user_id, notification_type, channels, overridden in NotificationPreference.objects.filter(
+            user_id__in=list(loaded)
+        ).values_list("user_id", "type", "channels", "overridden"):
+            loaded[str(user_id)][notification_type] = (channels, overridden)
+        return loaded
+
+    @classmethod
+    def resolve(
+        cls,
+        notifications: List[Notification],
+        default_channels: Callable[[str, Mapping[str, Any]], int],
+    ) -> List[int]:
+        """Channel mask for each notification, in order."""
+        overrides = cls.overrides_for_users(notification.user_id for notification in notifications)
+        masks = []
+        for notification in notifications:
+            channels, overridden = overrides[str(notification.user_id)].get(notification.type, (0, 0))
+            if overridden != ALL_CHANNELS:
+                default = default_channels(notification.type, notification.payload or {})
+                channels = merge_channels(default, channels, overridden)
+            masks.append(channels)
+        return masks
+
+    @classmethod
+    @transaction.atomic
+    def update(
+        cls,
+        user,
+        channels_by_type: Mapping[str, int],
+        overridden_by_type: Optional[Mapping[str, int]] = None,
+    ) -> None:
+        """
+        Store overrides for several types of one user with a single upsert.
+
+        `overridden_by_type` names the channels each type overrides; types
+        missing from it override every channel.
+        """
+        if not channels_by_type:
+            return
+        overridden_by_type = overridden_by_type or {}
+        NotificationPreference.objects.bulk_create(
+            [
+                NotificationPreference(
+                    user=user,
+                    type=notification_type,
+                    channels=channels & ALL_CHANNELS,
+                    overridden=overridden_by_type.get(notification_type, ALL_CHANNELS) & ALL_CHANNELS,
+                )
+                for notification_type, channels in channels_by_type.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["user", "type"],
+            update_fields=["channels", "overridden", "updated_at"],
+        )
+        cls.invalidate([user.id])
+
+    @classmethod
+    @transaction.atomic
+    def reset(cls, user) -> int:
+        deleted, _ = NotificationPreference.objects.filter(user=user).delete()
+        if deleted:
+            cls.invalidate([user.id])
+        return deleted
+
+    @classmethod
+    def invalidate(cls, user_ids: Iterable[Any]) -> None:
+        keys = [cls.CACHE_KEY.format(user_id=user_id) for user_id in set(map(str, user_ids))]
+        if keys:
+            transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def channels_to_dict(channels: int) -> Dict[str, bool]:
+    return {name: bool(channels & flag) for name, flag in CHANNEL_NAMES.items()}
+
+
+def channels_from_dict(values: Mapping[str, bool], base: int = 0) -> int:
+    """Apply {"email": False, ...} on top of `base`; keys not given keep their bit."""
+    channels = base
+    for name, enabled in values.items():
+        flag = CHANNEL_NAMES[name]
+        channels = channels | flag if enabled else channels & ~flag
+    return channels
+
+
+def channel_mask(names: Iterable[str]) -> int:
+    mask = 0
+    for name in names:
+        mask |= CHANNEL_NAMES[name]
+    return mask
+
+
+def merge_channels(default: int, channels: int, overridden: int) -> int:
+    """Bits flagged in `overridden` from `channels`, the rest from `default`."""
+    return (default & ~overridden) | (channels & overridden)
@@ -0,0 +1,263 @@
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .tokens import DeviceTokenRegistry
+
+logger = logging.getLogger(__name__)
+
+# FCM accepts at most 500 messages per send_each / send_each_for_multicast call.
+FCM_MAX_BATCH_SIZE = 500
+
+INVALID_TOKEN_ERROR_MARKERS = (
+    "registration-token-not-registered",
+    "invalid-registration-token",
+    "unregistered",
+)
+
+
+def is_invalid_token_error(error_code: str) -> bool:
+    normalized_error = (error_code or "").lower()
+    return any(marker in normalized_error for marker in INVALID_TOKEN_ERROR_MARKERS)
+
+
+@dataclass
+class PushMessage:
+    user_id: Any
+    title: str
+    message: str
+    payload: Dict[str, Any] = field(default_factory=dict)
+
+    def data(self) -> Dict[str, str]:
+        return {k: str(v) for k, v in self.payload.items()}
+
+    def content_key(self) -> Tuple[str, str, str]:
+        return (self.title, self.message, json.dumps(self.data(), sort_keys=True))
+
+
+@dataclass
+class PushSendResult:
+    token: str
+    success: bool
+    error_code: str = ""
+
+
+@dataclass
+class PushDeliveryReport:
+    sent: int = 0
+    failed: int = 0
+    deactivated: int = 0
+    calls: int = 0
+    # Users whose batch call raised (network, quota); their sends can be retried.
+    failed_user_ids: set = field(default_factory=set)
+
+
+class FirebasePushBackend:
+    """Sends through firebase_admin.messaging using the batch APIs."""
+
+    _initialized = False
+
+    @classmethod
+    def is_available(cls) -> bool:
+        if cls._initialized:
+            return True
+        try:
+            import firebase_admin
+            from firebase_admin import credentials
+
+            if firebase_admin._apps:
+                cls._initialized = True
+                return True
+
+            service_account_path = getattr(settings, "FCM_SERVICE_ACCOUNT_FILE", "")
+            service_account_json = getattr(settings, "FCM_SERVICE_ACCOUNT_JSON", "")
+            project_id = getattr(settings, "FCM_PROJECT_ID", "")
+
+            if service_account_json:
+                cred = credentials.Certificate(json.loads(service_account_json))
+                firebase_admin.initialize_app(cred, {"projectId": project_id} if project_id else None)
+            elif service_account_path:
+                cred = credentials.Certificate(service_account_path)
+                firebase_admin.initialize_app(cred, {"projectId": project_id} if project_id else None)
+            else:
+                logger.info("FCM credentials are not configured. Push sending is disabled.")
+                return False
+
+            cls._initialized = True
+            return True
+        except Exception:
+            logger.exception("Failed to initialize Firebase app")
+            return False
+
+    def send_multicast(self, tokens: Sequence[str], title: str, body: str, data: Dict[str, str]) -> List[PushSendResult]:
+        from firebase_admin import messaging
+
+        message = messaging.MulticastMessage(
+            notification=messaging.Notification(title=title, body=body),
+            data=data,
+            tokens=list(tokens),
+        )
+        response = messaging.send_each_for_multicast(message)
+        return self._results(tokens, response)
+
+    def send_each(self, messages: Sequence[Tuple[str, str, str, Dict[str, str]]]) -> List[PushSendResult]:
+        from firebase_admin import messaging
+
+        response = messaging.send_each(
+            [
+                messaging.Message(
+                    notification=messaging.Notification(title=title, body=body),
+                    data=data,
+                    token=token,
+                )
+                for token, title, body, data in messages
+            ]
+        )
+        return self._results([token for token, _, _, _ in messages], response)
+
+    @staticmethod
+    def _results(tokens: Sequence[str], response) -> List[PushSendResult]:
+        from firebase_admin import messaging
+
+        results = []
+        for token, item in zip(tokens, response.responses):
+            if item.success:
+                results.append(PushSendResult(token=token, success=True))
+                continue
+            exc = item.exception
+            if isinstance(exc, messaging.UnregisteredError):
+                error_code = "unregistered"
+            else:
+                error_code = getattr(exc, "code", "") or str(exc)
+            results.append(PushSendResult(token=token, success=False, error_code=error_code))
+        return results
+
+
+class LocmemPushBackend:
+    """
+    In-memory backend for tests and local development.
+
+    Sent messages are appended to `outbox`; tokens listed in `invalid_tokens`
+    fail with an unregistered error. Every batch call is recorded in `calls`.
+    """
+
+    outbox: List[Dict[str, Any]] = []
+    calls: List[Tuple[str, int]] = []
+    invalid_tokens: set = set()
+
+    @classmethod
+    def reset(cls) -> None:
+        cls.outbox = []
+        cls.calls = []
+        cls.invalid_tokens = set()
+
+    def is_available(self) -> bool:
+        return True
+
+    def send_multicast(self, tokens: Sequence[str], title: str, body: str, data: Dict[str, str]) -> List[PushSendResult]:
+        self.calls.append(("send_each_for_multicast", len(tokens)))
+        return [self._deliver(token, title, body, data) for token in tokens]
+
+    def send_each(self, messages: Sequence[Tuple[str, str, str, Dict[str, str]]]) -> List[PushSendResult]:
+        self.calls.append(("send_each", len(messages)))
+        return [self._deliver(*message) for message in messages]
+
+    def _deliver(self, token: str, title: str, body: str, data: Dict[str, str]) -> PushSendResult:
+        if token in self.invalid_tokens:
+            return PushSendResult(token=token, success=False, error_code="messaging/registration-token-not-registered")
+        self.outbox.append({"token": token, "title": title, "body": body, "data": data})
+        return PushSendResult(token=token, success=True)
+
+
+def get_push_backend():
+    backend_path = getattr(settings, "PUSH_BACKEND", "notifications.push.FirebasePushBackend")
+    return import_string(backend_path)()
+
+
+class PushDeliveryEngine:
+    """
+    Delivers push notifications for many users with as few FCM calls as possible.
+
+    Active tokens come from DeviceTokenRegistry, which serves cached users
+    and loads the rest in one query. Messages with identical content are sent
+    with send_each_for_multicast; the remaining single-token messages from
+    different users are pooled into send_each calls. Both are chunked to FCM's 500 message limit. Tokens FCM reports
+    as invalid are deactivated, and delivered tokens stamped with
+    last_success_at, with a single UPDATE each.
+    """
+
+    def __init__(self, backend=None, batch_size: int = FCM_MAX_BATCH_SIZE, limiter=None) -> None:
+        self.backend = backend or get_push_backend()
+        self.batch_size = max(1, min(batch_size, FCM_MAX_BATCH_SIZE))
+        self.limiter = limiter
+
+    def send_to_user(self, *, user_id, title: str, message: str, payload: Optional[Dict[str, Any]] = None) -> PushDeliveryReport:
+        return self.deliver([PushMessage(user_id=user_id, title=title, message=message, payload=payload or {})])
+
+    def deliver(self, messages: Iterable[PushMessage]) -> PushDeliveryReport:
+        report = PushDeliveryReport()
+        messages = list(messages)
+        if not messages or not self.backend.is_available():
+            return report
+
+        tokens_by_user = DeviceTokenRegistry.tokens_for_users(message.user_id for message in messages)
+        token_owners: Dict[str, str] = {
+            token: user_id for user_id, tokens in tokens_by_user.items() for token in tokens
+        }
+
+        groups: Dict[Tuple[str, str, str], Tuple[PushMessage, List[str]]] = {}
+        for message in messages:
+            tokens = tokens_by_user.get(str(message.user_id), [])
+            if not tokens:
+                continue
+            _, group_tokens = groups.setdefault(message.content_key(), (message, []))
+            group_tokens.extend(tokens)
+
+        results: List[PushSendResult] = []
+        singles: List[Tuple[str, str, str, Dict[str, str]]] = []
+        for message, tokens in groups.values():
+            tokens = list(dict.fromkeys(tokens))
+            if len(tokens) == 1:
+                singles.append((tokens[0], message.title, message.message, message.data()))
+                continue
+            for chunk in self._chunks(tokens):
+                results.extend(
+                    self._call(report, token_owners, chunk, self.backend.send_multicast, chunk, message.title, message.message, message.data())
+                )
+        for chunk in self._chunks(singles):
+            results.extend(self._call(report, token_owners, [item[0] for item in chunk], self.backend.send_each, chunk))
+
+        invalid_tokens = []
+        delivered_tokens = []
+        for result in results:
+            if result.success:
+                report.sent += 1
+                delivered_tokens.append(result.token)
+                continue
+            report.failed += 1
+            logger.warning("FCM send failed token=%s code=%s", result.token[:12], result.error_code)
+            if is_invalid_token_error(result.error_code):
+                invalid_tokens.append(result.token)
+        DeviceTokenRegistry.mark_success(delivered_tokens)
+        report.deactivated = DeviceTokenRegistry.deactivate_invalid(invalid_tokens)
+        return report
+
+    def _chunks(self, items: Sequence[Any]):
+        for start in range(0, len(items), self.batch_size):
+            yield items[start:start + self.batch_size]
+
+    def _call(self, report: PushDeliveryReport, token_owners: Dict[str, str], tokens: List[str], send, *args) -> List[PushSendResult]:
+        if self.limiter is not None:
+            self.limiter.acquire()
+        report.calls += 1
+        try:
+            return send(*args)
+        except Exception:
+            logger.exception("FCM batch send failed size=%s", len(tokens))
+            report.failed += len(tokens)
+            report.failed_user_ids.update(token_owners[token] for token in tokens)
+            return []
@@ -0,0 +1,163 @@
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Iterable, Optional
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def notification_event(notification: Notification) -> Dict[str, Any]:
+    return {
+        "id": str(notification.id),
+        "type": notification.type,
+        "title": notification.title,
+        "message": notification.message,
+        "payload": notification.payload,
+        "is_read": notification.is_read,
+        "created_at": notification.created_at.isoformat() if notification.created_at else None,
+    }
+
+
+class InProcessBroker:
+    """
+    Fans notification events out to the streams open in this process.
+
+    Each subscriber gets a bounded asyncio.Queue. publish() may be called from
+    any thread; events are handed to the subscriber's event loop with
+    call_soon_threadsafe. A full queue drops the event, and the client
+    recovers it on reconnect through Last-Event-ID.
+    """
+
+    def __init__(self) -> None:
+        self._subscribers: Dict[str, set] = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, user_id: Any, event: Dict[str, Any]) -> None:
+        self._dispatch(str(user_id), event)
+
+    @asynccontextmanager
+    async def subscribe(self, user_id: Any) -> AsyncIterator[asyncio.Queue]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        entry = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers[str(user_id)].add(entry)
+        try:
+            yield queue
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(str(user_id))
+                if subscribers is not None:
+                    subscribers.discard(entry)
+                    if not subscribers:
+                        del self._subscribers[str(user_id)]
+
+    def subscriber_count(self, user_id: Any) -> int:
+        with self._lock:
+            return len(self._subscribers.get(str(user_id), ()))
+
+    def _dispatch(self, user_id: str, event: Dict[str, Any]) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._put, queue, event)
+            except RuntimeError:
+                # The subscriber's loop has already shut down.
+                continue
+
+    @staticmethod
+    def _put(queue: asyncio.Queue, event: Dict[str, Any]) -> None:
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.warning("Notification stream queue full; dropping event id=%s", event.get("id"))
+
+
+class RedisBroker(InProcessBroker):
+    """
+    Publishes events over Redis pub/sub so streams in every ASGI process see them.
+
+    Each process keeps a single pattern subscription and dispatches incoming
+    events to its local subscribers, so the number of Redis connections does
+    not grow with the number of open streams.
+    """
+
+    CHANNEL_PREFIX = "notifications:user:"
+
+    def __init__(self, url: Optional[str] = None) -> None:
+        super().__init__()
+        self.url = url or getattr(settings, "NOTIFICATION_BROKER_URL", "") or "redis://localhost:6379/0"
+        self._client = None
+        self._listener: Optional[asyncio.Task] = None
+
+    def publish(self, user_id: Any, event: Dict[str, Any]) -> None:
+        if self._client is None:
+            import redis
+
+            self._client = redis.Redis.from_url(self.url)
+        self._client.publish(f"{self.CHANNEL_PREFIX}{user_id}", json.dumps(event, default=str))
+
+    @asynccontextmanager
+    async def subscribe(self, user_id: Any) -> AsyncIterator[asyncio.Queue]:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+        async with super().subscribe(user_id) as queue:
+            yield queue
+
+    async def _listen(self) -> None:
+        import redis.asyncio as aioredis
+
+        client = aioredis.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        try:
+            await pubsub.psubscribe(f"{self.CHANNEL_PREFIX}*")
+            async for message in pubsub.listen():
+                if message.get("type") != "pmessage":
+                    continue
+                channel = message["channel"].decode() if isinstance(message["channel"], bytes) else message["channel"]
+                try:
+                    event = json.loads(message["data"])
+                except (TypeError, ValueError):
+                    continue
+                self._dispatch(channel[len(self.CHANNEL_PREFIX):], event)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Notification Redis listener stopped")
+        finally:
+            await pubsub.aclose()
+            await client.aclose()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker() -> InProcessBroker:
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                backend_path = getattr(settings, "NOTIFICATION_BROKER", "notifications.realtime.InProcessBroker")
+                _broker = import_string(backend_path)()
+    return _broker
+
+
+def publish_notifications(notifications: Iterable[Notification]) -> None:
+    """Publish newly committed notifications; failures never reach the caller."""
+    try:
+        broker = get_broker()
+        for notification in notifications:
+            broker.publish(notification.user_id, notification_event(notification))
+    except Exception:
+        logger.exception("Failed to publish realtime notifications")
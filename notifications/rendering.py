@@ -0,0 +1,310 @@
+import string
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date, datetime
+from decimal import Decimal
+from operator import attrgetter
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+Rendered = Tuple[str, str, Dict[str, Any]]
+
+_SCALARS = (str, int, float, bool, Decimal, type(None))
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, (uuid.UUID, Decimal)):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+class RenderSession:
+    """
+    Per-event render cache.
+
+    Attribute values are resolved once per (object, path) and whole renders
+    are reused when the same template is rendered again with the same
+    context, e.g. the order fields shared by the customer, shop owner and
+    supplier notifications of one payment.
+    """
+
+    def __init__(self) -> None:
+        self.values: Dict[Tuple[int, str], Any] = {}
+        self.rendered: Dict[Tuple, Rendered] = {}
+        # Keeps context objects alive so their id() stays unique for the session.
+        self.refs: List[Any] = []
+        self.hits = 0
+        self.misses = 0
+
+
+_session: ContextVar[Optional[RenderSession]] = ContextVar("notification_render_session", default=None)
+
+
+class NotificationTemplate:
+    """
+    Title, precompiled message format and payload layout of one notification type.
+
+    `fields` maps payload keys to attribute paths on context objects
+    ("order.order_number") or to plain context values ("items_count"), and
+    `message_fields` does the same for values used only in the message.
+    Paths are compiled to attrgetters and the message format is parsed when
+    the template is built, so an unknown placeholder fails at import time.
+    Templates only read attributes of objects the caller already loaded.
+    """
+
+    def __init__(
+        self,
+        notification_type: str,
+        title: str,
+        message: str,
+        entity: str,
+        fields: Dict[str, str],
+        constants: Optional[Dict[str, Any]] = None,
+        message_fields: Optional[Dict[str, str]] = None,
+        defaults: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.type = notification_type
+        self.title = title
+        self.message = message
+        self.entity = entity
+        self.constants = dict(constants or {})
+        self.defaults = dict(defaults or {})
+
+        paths = {"entity_id": f"{entity}.id", **fields, **(message_fields or {})}
+        self._payload_keys = ["entity_id", *fields]
+        self._getters: List[Tuple[str, str, str, Optional[Callable[[Any], Any]]]] = []
+        for key, path in paths.items():
+            root, _, rest = path.partition(".")
+            self._getters.append((key, root, rest, attrgetter(rest) if rest else None))
+        self.arguments = frozenset(root for _, root, _, _ in self._getters)
+
+        placeholders = {name for _, name, _, _ in string.Formatter().parse(message) if name}
+        unknown = placeholders - set(paths)
+        if unknown:
+            raise ValueError(f"Template {notification_type} message uses undeclared fields: {', '.join(sorted(unknown))}")
+
+    def render(self, **context: Any) -> Rendered:
+        missing = self.arguments - set(context) - set(self.defaults)
+        if missing:
+            raise TypeError(f"Template {self.type} requires: {', '.join(sorted(missing))}")
+
+        session = _session.get()
+        if session is not None:
+            cache_key = (self.type, *sorted((name, self._identity(value)) for name, value in context.items()))
+            cached = session.rendered.get(cache_key)
+            if cached is not None:
+                session.hits += 1
+                title, message, payload = cached
+                return title, message, dict(payload)
+            session.misses += 1
+
+        values = {}
+        for key, root, rest, getter in self._getters:
+            if root not in context:
+                values[key] = self.defaults[key]
+                continue
+            value = self._resolve(session, context[root], rest, getter)
+            values[key] = self.defaults.get(key, value) if value is None else value
+
+        payload = {"type": self.type, "entity_id": values["entity_id"], "entity_type": self.entity}
+        for key in self._payload_keys[1:]:
+            payload[key] = values[key]
+        payload.update(self.constants)
+        rendered = (self.title, self.message.format_map(values), payload)
+
+        if session is not None:
+            session.rendered[cache_key] = rendered
+            session.refs.append(context)
+            return rendered[0], rendered[1], dict(payload)
+        return rendered
+
+    @staticmethod
+    def _identity(value: Any) -> Any:
+        return value if isinstance(value, _SCALARS) else ("object", id(value))
+
+    @staticmethod
+    def _resolve(session: Optional[RenderSession], obj: Any, rest: str, getter) -> Any:
+        if getter is None:
+            return _normalize(obj)
+        if session is None:
+            return _normalize(getter(obj))
+        cache_key = (id(obj), rest)
+        if cache_key not in session.values:
+            session.values[cache_key] = _normalize(getter(obj))
+        return session.values[cache_key]
+
+
+class TemplateRegistry:
+    def __init__(self) -> None:
+        self._templates: Dict[str, NotificationTemplate] = {}
+
+    def register(self, template: NotificationTemplate) -> NotificationTemplate:
+        if template.type in self._templates:
+            raise ValueError(f"Template already registered: {template.type}")
+        self._templates[template.type] = template
+        return template
+
+    def get(self, notification_type: str) -> NotificationTemplate:
+        try:
+            return self._templates[notification_type]
+        except KeyError:
+            raise KeyError(f"No notification template for type: {notification_type}") from None
+
+    def render(self, notification_type: str, **context: Any) -> Rendered:
+        return self.get(notification_type).render(**context)
+
+    def types(self) -> List[str]:
+        return sorted(self._templates)
+
+    @staticmethod
+    @contextmanager
+    def session() -> Iterator[RenderSession]:
+        """Cache renders for the duration of one event (a webhook, a signal)."""
+        if _session.get() is not None:
+            yield _session.get()
+            return
+        session = RenderSession()
+        token = _session.set(session)
+        try:
+            yield session
+        finally:
+            _session.reset(token)
+
+
+registry = TemplateRegistry()
+
+_ORDER_FIELDS = {"order_id": "order.id", "order_number": "order.order_number"}
+_ORDER_AMOUNT_FIELDS = {**_ORDER_FIELDS, "total_amount": "order.total_amount"}
+
+registry.register(
+    NotificationTemplate(
+        "payment_success",
+        "Payment Successful",
+        "Your order #{order_number} has been confirmed.",
+        entity="order",
+        fields={**_ORDER_AMOUNT_FIELDS, "items_count": "items_count", "paid_at": "order.updated_at"},
+        constants={"currency": "ETB"},
+        defaults={"items_count": 0, "paid_at": ""},
+    )
+)
+registry.register(
+    NotificationTemplate(
+        "order_shipped",
+        "Order Shipped",
+        "Your order #{order_number} is on the way.",
+        entity="order",
+        fields={"order_id": "order.id"},
+        message_fields={"order_number": "order.order_number"},
+    )
+)
+registry.register(
+    NotificationTemplate(
+        "order_delivered",
+        "Order Delivered",
+        "Your order #{order_number} has been delivered.",
+        entity="order",
+        fields={"order_id": "order.id"},
+        message_fields={"order_number": "order.order_number"},
+    )
+)
+registry.register(
+    NotificationTemplate(
+        "order_cancelled",
+        "Order Cancelled",
+        "Your order #{order_number} was cancelled.",
+        entity="order",
+        fields={**_ORDER_AMOUNT_FIELDS, "reason": "reason"},
+        constants={
+            "currency": "ETB",
+            "next_steps": "Please retry payment or contact support if you were charged.",
+        },
+        defaults={"reason": "Payment failed or was cancelled"},
+    )
+)
+registry.register(
+    NotificationTemplate(
+        "refund_completed",
+        "Refund Completed",
+        "Refund processed for order #{order_number}.",
+        entity="refund",
+        fields={
+            "refund_id": "refund.id",
+            **_ORDER_FIELDS,
+            "refund_amount": "refund.amount",
+            "reason": "refund.reason",
+        },
+        constants={
+            "currency": "ETB",
+            "next_steps": "Funds usually reflect based on your payment provider timeline.",
+        },
+        defaults={"reason": ""},
+    )
+)
+registry.register(
+    NotificationTemplate(
+        "low_stock_alert",
+        "Low Stock Alert",
+        "Product {product_name} is low on stock ({current_stock} left).",
+        entity="product",
+        fields={
+            "product_id": "product.id",
+            "threshold": "threshold",
+            "current_stock": "current_stock",
+            "urgent": "urgent",
+        },
+        message_fields={"product_name": "product.name"},
+        defaults={"urgent": False},
+    )
+)
+registry.register(
+    NotificationTemplate(
+        "new_order",
+        "New Order",
+        "You received a new order #{order_number}.",
+        entity="order",
+        fields=_ORDER_AMOUNT_FIELDS,
+        constants={"currency": "ETB"},
+    )
+)
+registry.register(
+    NotificationTemplate(
+        "payment_confirmed",
+        "Payment Confirmed",
+        "Payment received for order #{order_number}.",
+        entity="order",
+        fields=_ORDER_AMOUNT_FIELDS,
+        constants={"currency": "ETB"},
+    )
+)
+registry.register(
+    NotificationTemplate(
+        "product_sold",
+        "Product Sold",
+        "Your product {product_name} was sold.",
+        entity="order",
+        fields={"order_id": "order.id", "product_id": "product.id"},
+        message_fields={"product_name": "product.name"},
+    )
+)
+registry.register(
+    NotificationTemplate(
+        "commission_created",
+        "Commission Created",
+        "You earned commission for order #{order_number}.",
+        entity="commission",
+        fields={"commission_id": "commission.id", "order_id": "order.id"},
+        message_fields={"order_number": "order.order_number"},
+    )
+)
+registry.register(
+    NotificationTemplate(
+        "commission_approved",
+        "Commission Approved",
+        "Your commission for order #{order_number} is approved.",
+        entity="commission",
+        fields={"commission_id": "commission.id", "order_id": "order.id"},
+        message_fields={"order_number": "order.order_number"},
+    )
+)
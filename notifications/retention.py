@@ -0,0 +1,306 @@
+import gzip
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from .inbox import NotificationInbox
+from .models import Notification, NotificationDelivery
+from .realtime import notification_event
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RetentionResult:
+    archived: int = 0
+    deleted: int = 0
+    chunks: int = 0
+    files: List[str] = field(default_factory=list)
+    by_type: Dict[str, int] = field(default_factory=dict)
+
+
+class RetentionPolicy:
+    """
+    Per-type time to live for notifications, in days.
+
+    Built from NOTIFICATION_RETENTION_DAYS, e.g. {"default": 180,
+    "low_stock_alert": 30}. Types without an entry use "default"; a TTL of 0
+    or less keeps that type forever.
+    """
+
+    def __init__(self, days: Optional[Dict[str, int]] = None) -> None:
+        days = dict(days if days is not None else getattr(settings, "NOTIFICATION_RETENTION_DAYS", {}))
+        unknown = set(days) - {"default"} - set(Notification.Type.values)
+        if unknown:
+            raise ValueError(f"Unknown notification type in retention policy: {', '.join(sorted(unknown))}")
+        self.default_days = int(days.pop("default", 0) or 0)
+        self.days = {notification_type: int(value) for notification_type, value in days.items()}
+
+    def cutoffs(self, now: datetime) -> List[Tuple[str, QuerySet]]:
+        """(label, queryset of expired notifications) for every rule with a TTL."""
+        rules = []
+        for notification_type, days in sorted(self.days.items()):
+            if days > 0:
+                rules.append(
+                    (
+                        notification_type,
+                        Notification.objects.filter(type=notification_type, created_at__lt=now - timedelta(days=days)),
+                    )
+                )
+        if self.default_days > 0:
+            rules.append(
+                (
+                    "default",
+                    Notification.objects.exclude(type__in=list(self.days)).filter(
+                        created_at__lt=now - timedelta(days=self.default_days)
+                    ),
+                )
+            )
+        return rules
+
+    def max_days(self) -> int:
+        """Longest TTL; every partition older than this is fully expired. 0 if any type is kept forever."""
+        values = [self.default_days, *self.days.values()]
+        if any(value <= 0 for value in values):
+            return 0
+        return max(values)
+
+
+class NotificationArchiveWriter:
+    """Appends notifications to one gzip-compressed NDJSON file per run."""
+
+    def __init__(self, directory: str, now: datetime) -> None:
+        self.directory = Path(directory)
+        self.path = self.directory / f"notifications-{now:%Y%m%dT%H%M%S}.ndjson.gz"
+        self._handle = None
+
+    def write(self, notifications: List[Notification]) -> None:
+        if self._handle is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._handle = gzip.open(self.path, "at", encoding="utf-8")
+        for notification in notifications:
+            record = notification_event(notification)
+            record["user_id"] = str(notification.user_id)
+            self._handle.write(json.dumps(record, default=str) + "\n")
+        # Flush each chunk so a crash after a delete never loses archived rows.
+        self._handle.flush()
+
+    def close(self) -> None:
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+
+class NotificationRetentionJob:
+    """
+    Archives and deletes expired notifications in bounded chunks.
+
+    Each chunk selects up to chunk_size expired ids in created_at order,
+    writes them to the archive, then deletes their outbox rows and the
+    notifications in a short transaction, so locks are held only for one
+    chunk at a time. The same transaction subtracts the chunk's unread
+    notifications from the inbox counters, with the rows locked so a
+    concurrent read is not subtracted twice. With dry_run nothing is
+    written or deleted.
+    """
+
+    def __init__(
+        self,
+        policy: Optional[RetentionPolicy] = None,
+        chunk_size: int = 1000,
+        archive_dir: Optional[str] = None,
+        dry_run: bool = False,
+        pause_seconds: float = 0.0,
+    ) -> None:
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be greater than 0")
+        self.policy = policy or RetentionPolicy()
+        self.chunk_size = chunk_size
+        self.archive_dir = archive_dir
+        self.dry_run = dry_run
+        self.pause_seconds = pause_seconds
+
+    def run(self, now: Optional[datetime] = None) -> RetentionResult:
+        now = now or timezone.now()
+        result = RetentionResult()
+        writer = NotificationArchiveWriter(self.archive_dir, now) if self.archive_dir and not self.dry_run else None
+        try:
+            for label, expired in self.policy.cutoffs(now):
+                if self.dry_run:
+                    result.by_type[label] = expired.count()
+                    continue
+                for chunk in self._chunks(expired):
+                    if writer is not None:
+                        writer.write(chunk)
+                        result.archived += len(chunk)
+                    deleted = self._delete(chunk)
+                    result.deleted += deleted
+                    result.by_type[label] = result.by_type.get(label, 0) + deleted
+                    result.chunks += 1
+                    if self.pause_seconds:
+                        time.sleep(self.pause_seconds)
+        finally:
+            if writer is not None:
+                writer.close()
+                if result.archived:
+                    result.files.append(str(writer.path))
+
+        if result.deleted:
+            logger.info("Notification retention deleted=%s archived=%s", result.deleted, result.archived)
+        return result
+
+    def _chunks(self, expired: QuerySet) -> Iterator[List[Notification]]:
+        while True:
+            chunk = list(expired.order_by("created_at", "id")[: self.chunk_size])
+            if not chunk:
+                return
+            yield chunk
+
+    @staticmethod
+    @transaction.atomic
+    def _delete(chunk: List[Notification]) -> int:
+        ids = [notification.id for notification in chunk]
+        # Locked and re-read, so is_read is the value at delete time.
+        locked = list(
+            Notification.objects.select_for_update()
+            .filter(id__in=ids)
+            .only("id", "user_id", "type", "is_read", "created_at")
+        )
+        NotificationDelivery.objects.filter(notification_id__in=ids).delete()
+        _, deleted = Notification.objects.filter(id__in=ids).delete()
+        NotificationInbox.record_deleted(locked)
+        return deleted.get(Notification._meta.label, 0)
+
+
+class NotificationPartitionManager:
+    """
+    Optional monthly range partitioning of notifications_notification on PostgreSQL.
+
+    conversion_sql() returns the one-off DDL that rebuilds the table as a
+    partitioned table keyed on created_at; it is printed for review and run
+    during a maintenance window, not applied by migrations. The primary key
+    becomes (id, created_at) and the outbox foreign key is dropped, since
+    PostgreSQL cannot reference a partitioned table by id alone. Once
+    converted, ensure_partitions() creates upcoming months and
+    drop_partitions_before() drops whole expired months instead of deleting
+    rows.
+    """
+
+    TABLE = Notification._meta.db_table
+
+    def __init__(self, using=None) -> None:
+        self.connection = using or connection
+
+    def is_supported(self) -> bool:
+        return self.connection.vendor == "postgresql"
+
+    def is_partitioned(self) -> bool:
+        if not self.is_supported():
+            return False
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s",
+                [self.TABLE],
+            )
+            return cursor.fetchone() is not None
+
+    @staticmethod
+    def _month_start(value: datetime) -> datetime:
+        return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+    @classmethod
+    def _next_month(cls, value: datetime) -> datetime:
+        return cls._month_start(value.replace(day=28) + timedelta(days=4))
+
+    def partition_name(self, month: datetime) -> str:
+        return f"{self.TABLE}_y{month:%Y}m{month:%m}"
+
+    def partition_sql(self, month: datetime) -> str:
+        month = self._month_start(month)
+        return (
+            f'CREATE TABLE IF NOT EXISTS "{self.partition_name(month)}" PARTITION OF "{self.TABLE}" '
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{self._next_month(month).isoformat()}')"
+        )
+
+    def conversion_sql(self, first_month: datetime, months_ahead: int = 3) -> List[str]:
+        legacy = f"{self.TABLE}_legacy"
+        user_table = Notification._meta.get_field("user").related_model._meta.db_table
+        statements = [
+            # Drop foreign keys pointing at the table (the outbox's notification_id).
+            "DO $$ DECLARE r record; BEGIN "
+            "FOR r IN SELECT conname, conrelid::regclass AS tbl FROM pg_constraint "
+            f"WHERE contype = 'f' AND confrelid = '\"{self.TABLE}\"'::regclass LOOP "
+            "EXECUTE format('ALTER TABLE %s DROP CONSTRAINT %I', r.tbl, r.conname); "
+            "END LOOP; END $$",
+            f'ALTER TABLE "{self.TABLE}" RENAME TO "{legacy}"',
+            f'CREATE TABLE "{self.TABLE}" (LIKE "{legacy}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+            f"PARTITION BY RANGE (created_at)",
+            f'ALTER TABLE "{self.TABLE}" ADD PRIMARY KEY (id, created_at)',
+            f'ALTER TABLE "{self.TABLE}" ADD FOREIGN KEY (user_id) REFERENCES "{user_table}" (id) '
+            f"DEFERRABLE INITIALLY DEFERRED",
+            f'CREATE INDEX ON "{self.TABLE}" (user_id, is_read)',
+            f'CREATE INDEX ON "{self.TABLE}" (user_id, created_at DESC)',
+            f'CREATE INDEX ON "{self.TABLE}" (type, created_at)',
+            f'CREATE INDEX ON "{self.TABLE}" (created_at)',
+            f'CREATE TABLE "{self.TABLE}_default" PARTITION OF "{self.TABLE}" DEFAULT',
+        ]
+        month = self._month_start(first_month)
+        last = self._month_start(timezone.now())
+        for _ in range(months_ahead):
+            last = self._next_month(last)
+        while month <= last:
+            statements.append(self.partition_sql(month))
+            month = self._next_month(month)
+        statements.extend(
+            [
+                f'INSERT INTO "{self.TABLE}" SELECT * FROM "{legacy}"',
+                f'DROP TABLE "{legacy}"',
+            ]
+        )
+        return statements
+
+    def ensure_partitions(self, months_ahead: int = 3, now: Optional[datetime] = None) -> List[str]:
+        month = self._month_start(now or timezone.now())
+        created = []
+        with self.connection.cursor() as cursor:
+            for _ in range(months_ahead + 1):
+                cursor.execute(self.partition_sql(month))
+                created.append(self.partition_name(month))
+                month = self._next_month(month)
+        return created
+
+    def drop_partitions_before(self, cutoff: datetime) -> List[str]:
+        """Drop monthly partitions whose whole range is older than cutoff."""
+        dropped = []
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+                "WHERE p.relname = %s ORDER BY c.relname",
+                [self.TABLE],
+            )
+            names = [row[0] for row in cursor.fetchall()]
+            prefix = f"{self.TABLE}_y"
+            for name in names:
+                if not name.startswith(prefix):
+                    continue
+                try:
+                    month = datetime.strptime(name[len(prefix):], "%Ym%m").replace(tzinfo=cutoff.tzinfo)
+                except ValueError:
+                    continue
+                if self._next_month(month) <= cutoff:
+                    cursor.execute(f'ALTER TABLE "{self.TABLE}" DETACH PARTITION "{name}"')
+                    cursor.execute(f'DROP TABLE "{name}"')
+                    dropped.append(name)
+        return dropped
+
@@ -1,6 +1,8 @@
 from rest_framework import serializers
 
 from .models import DeviceToken, Notification
+from .preferences import CHANNEL_NAMES
+from .tokens import DeviceTokenRegistry
 
 
 class DeviceTokenSerializer(serializers.Serializer):
@@ -12,18 +14,23 @@ class DeviceTokenSerializer(serializers.Serializer):
         device_type = self.validated_data["device_type"]
         if not token:
             raise serializers.ValidationError({"token": "token is required"})
-        device_token, _ = DeviceToken.objects.update_or_create(
-            token=token,
-            defaults={
-                "user": user,
-                "device_type": device_type,
-                "is_active": True,
-            },
-        )
-        return device_token
+        return DeviceTokenRegistry.register(user, token, device_type)
 
 
 class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
         fields = ["id", "type", "title", "message", "payload", "is_read", "created_at"]
+
+
+class NotificationPreferenceSerializer(serializers.Serializer):
+    type = serializers.ChoiceField(choices=Notification.Type.choices)
+    push = serializers.BooleanField(required=False)
+    email = serializers.BooleanField(required=False)
+    in_app = serializers.BooleanField(required=False)
+    digest = serializers.BooleanField(required=False)
+
+    def validate(self, attrs):
+        if not set(attrs) & set(CHANNEL_NAMES):
+            raise serializers.ValidationError("Provide at least one of: " + ", ".join(CHANNEL_NAMES))
+        return attrs
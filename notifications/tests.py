@@ -1,11 +1,34 @@
+import asyncio
+import gzip
+import json
+import smtplib
+import tempfile
+import uuid
+from datetime import timedelta
+from decimal import Decimal
 from unittest.mock import patch
 
+from django.core import mail
+from django.core.cache import cache
 from django.test import TestCase, override_settings
+from django.utils import timezone
 from rest_framework.test import APIClient
 
 from account.models import User
-from .models import DeviceToken, Notification
-from .services import NotificationService
+from catalog.models import Product
+from core.metrics import metrics
+from order.models import Order
+from .email import EmailConnectionPool, EmailDeliveryEngine, EmailItem
+from .inbox import NotificationInbox
+from .models import DeviceToken, Notification, NotificationCounter, NotificationDelivery, NotificationPreference
+from .outbox import NotificationOutboxWorker
+from .preferences import NotificationPreferences
+from .push import LocmemPushBackend, PushDeliveryEngine, PushMessage, is_invalid_token_error
+from .realtime import get_broker, notification_event
+from .rendering import NotificationTemplate, registry
+from .tokens import DeviceTokenRegistry
+from .retention import NotificationPartitionManager, NotificationRetentionJob, RetentionPolicy
+from .services import NotificationRequest, NotificationService, NotificationTemplates
 
 
 class NotificationsApiTests(TestCase):
@@ -86,6 +109,76 @@ class NotificationsApiTests(TestCase):
         note2.refresh_from_db()
         self.assertTrue(note2.is_read)
 
+    def _notify(self, notification_type, entity_id):
+        return NotificationService.notify(
+            user=self.user,
+            notification_type=notification_type,
+            title="Title",
+            message="Message",
+            payload={"type": notification_type, "entity_id": entity_id},
+        )
+
+    def test_summary_tracks_unread_counts_and_supports_etag(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self._notify("payment_success", "1")
+            self._notify("payment_success", "2")
+            self._notify("order_shipped", "1")
+
+        resp = self.client.get("/api/notifications/summary/")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data["unread_total"], 3)
+        self.assertEqual(resp.data["by_type"]["payment_success"]["unread"], 2)
+        etag = resp["ETag"]
+
+        with self.assertNumQueries(0):
+            cached = self.client.get("/api/notifications/summary/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f"/api/notifications/{first.id}/read/", {}, format="json")
+            self.client.patch(f"/api/notifications/{first.id}/read/", {}, format="json")
+        resp = self.client.get("/api/notifications/summary/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data["by_type"]["payment_success"]["unread"], 1)
+        self.assertNotEqual(resp["ETag"], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/api/notifications/mark-all-read/", {}, format="json")
+        resp = self.client.get("/api/notifications/summary/")
+        self.assertEqual(resp.data["unread_total"], 0)
+        self.assertIsNotNone(resp.data["latest_at"])
+
+    def test_inbox_rebuild_matches_notifications(self):
+        self._notify("payment_success", "1")
+        self._notify("order_shipped", "1")
+        Notification.objects.filter(type="order_shipped").update(is_read=True)
+        NotificationCounter.objects.update(unread=99)
+
+        NotificationInbox.rebuild([self.user.id])
+
+        self.assertEqual(
+            dict(NotificationCounter.objects.filter(user=self.user).values_list("type", "unread")),
+            {"payment_success": 1, "order_shipped": 0},
+        )
+
+
+    def test_summary_computed_before_a_change_commits_is_not_served(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._notify("payment_success", "1")
+        # A reader reads the generation and counters, then a change commits before it writes the cache.
+        generation = cache.get(NotificationInbox.GENERATION_KEY.format(user_id=self.user.id), 0)
+        stale, stale_etag = NotificationInbox.summary(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self._notify("payment_success", "2")
+        cache.set(
+            NotificationInbox.CACHE_KEY.format(user_id=self.user.id),
+            {"summary": stale, "etag": stale_etag, "generation": generation},
+        )
+
+        summary, etag = NotificationInbox.summary(self.user)
+        self.assertEqual(summary["unread_total"], 2)
+        self.assertNotEqual(etag, stale_etag)
+
 
 class NotificationServiceTests(TestCase):
     def setUp(self):
@@ -95,10 +188,13 @@ class NotificationServiceTests(TestCase):
             role="CUSTOMER",
         )
 
-    @patch("notifications.services.NotificationService._send_push_to_user")
-    def test_notify_schedules_push_on_commit(self, mock_send_push):
+    def _channels(self, notification):
+        return sorted(notification.deliveries.values_list("channel", flat=True))
+
+    @patch("notifications.push.PushDeliveryEngine.deliver")
+    def test_notify_writes_outbox_rows_instead_of_sending(self, mock_deliver):
         payload = {"type": "payment_success", "order_id": "1"}
-        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
             notification = NotificationService.notify(
                 user=self.user,
                 notification_type="payment_success",
@@ -107,103 +203,676 @@ class NotificationServiceTests(TestCase):
                 payload=payload,
             )
 
-        self.assertTrue(Notification.objects.filter(id=notification.id).exists())
-        self.assertEqual(len(callbacks), 1)
-        mock_send_push.assert_not_called()
+        # On-commit work is limited to dropping the cached summary and the realtime publish.
+        self.assertEqual(len(callbacks), 2)
+        mock_deliver.assert_not_called()
+        delivery = NotificationDelivery.objects.get(notification=notification)
+        self.assertEqual(delivery.channel, NotificationDelivery.Channel.PUSH)
+        self.assertEqual(delivery.status, NotificationDelivery.Status.PENDING)
+
+    def test_should_deactivate_token_only_for_invalid_token_errors(self):
+        self.assertTrue(is_invalid_token_error("messaging/registration-token-not-registered"))
+        self.assertTrue(is_invalid_token_error("UNREGISTERED"))
+        self.assertFalse(is_invalid_token_error("invalid-argument"))
 
-        callbacks[0]()
-        mock_send_push.assert_called_once_with(
-            user_id=self.user.id,
+    @override_settings(EMAIL_NOTIFICATIONS_ENABLED=True)
+    def test_notify_queues_email_delivery_when_enabled(self):
+        notification = NotificationService.notify(
+            user=self.user,
+            notification_type="payment_success",
             title="Payment Successful",
             message="Order paid",
-            payload=payload,
+            payload={"type": "payment_success", "order_id": "1"},
         )
 
-    def test_should_deactivate_token_only_for_invalid_token_errors(self):
-        self.assertTrue(
-            NotificationService._should_deactivate_token("messaging/registration-token-not-registered")
-        )
-        self.assertTrue(NotificationService._should_deactivate_token("UNREGISTERED"))
-        self.assertFalse(NotificationService._should_deactivate_token("invalid-argument"))
-
-    @override_settings(EMAIL_NOTIFICATIONS_ENABLED=True)
-    def test_notify_schedules_email_on_commit_when_enabled(self):
-        payload = {"type": "payment_success", "order_id": "1"}
-        with patch("notifications.services.NotificationService._send_push_to_user") as mock_send_push:
-            with patch("notifications.services.NotificationService._send_email_to_recipient") as mock_send_email:
-                with self.captureOnCommitCallbacks(execute=False) as callbacks:
-                    NotificationService.notify(
-                        user=self.user,
-                        notification_type="payment_success",
-                        title="Payment Successful",
-                        message="Order paid",
-                        payload=payload,
-                    )
-
-                self.assertEqual(len(callbacks), 2)
-                for callback in callbacks:
-                    callback()
-
-                mock_send_push.assert_called_once()
-                mock_send_email.assert_called_once_with(
-                    recipient_email=self.user.email,
-                    title="Payment Successful",
-                    message="Order paid",
-                    payload=payload,
-                )
+        self.assertEqual(self._channels(notification), ["email", "push"])
+        email = notification.deliveries.get(channel=NotificationDelivery.Channel.EMAIL)
+        self.assertEqual(email.recipient, self.user.email)
 
     @override_settings(
         EMAIL_NOTIFICATIONS_ENABLED=True,
         EMAIL_SEND_ORDER_DELIVERED=False,
     )
     def test_order_delivered_email_is_optional_and_disabled_by_default(self):
-        payload = {"type": "order_delivered", "order_id": "1"}
-        with patch("notifications.services.NotificationService._send_push_to_user") as mock_send_push:
-            with patch("notifications.services.NotificationService._send_email_to_recipient") as mock_send_email:
-                with self.captureOnCommitCallbacks(execute=False) as callbacks:
-                    NotificationService.notify(
-                        user=self.user,
-                        notification_type="order_delivered",
-                        title="Order Delivered",
-                        message="Delivered",
-                        payload=payload,
-                    )
-
-                self.assertEqual(len(callbacks), 1)
-                callbacks[0]()
-                mock_send_push.assert_called_once()
-                mock_send_email.assert_not_called()
+        notification = NotificationService.notify(
+            user=self.user,
+            notification_type="order_delivered",
+            title="Order Delivered",
+            message="Delivered",
+            payload={"type": "order_delivered", "order_id": "1"},
+        )
+
+        self.assertEqual(self._channels(notification), ["push"])
 
     @override_settings(
         EMAIL_NOTIFICATIONS_ENABLED=True,
         EMAIL_SEND_URGENT_LOW_STOCK=True,
     )
     def test_low_stock_email_sent_only_when_urgent(self):
-        with patch("notifications.services.NotificationService._send_push_to_user"):
-            with patch("notifications.services.NotificationService._send_email_to_recipient") as mock_send_email:
-                with self.captureOnCommitCallbacks(execute=False) as callbacks:
-                    NotificationService.notify(
-                        user=self.user,
-                        notification_type="low_stock_alert",
-                        title="Low Stock Alert",
-                        message="Urgent restock needed",
-                        payload={"type": "low_stock_alert", "urgent": True, "product_id": "p1"},
-                    )
-                self.assertEqual(len(callbacks), 2)
-                for callback in callbacks:
-                    callback()
-                mock_send_email.assert_called_once()
-
-                mock_send_email.reset_mock()
-                with self.captureOnCommitCallbacks(execute=False) as callbacks:
-                    NotificationService.notify(
-                        user=self.user,
-                        notification_type="low_stock_alert",
-                        title="Low Stock Alert",
-                        message="Stock below threshold",
-                        payload={"type": "low_stock_alert", "urgent": False, "product_id": "p2"},
-                    )
-                self.assertEqual(len(callbacks), 1)
-                callbacks[0]()
-                mock_send_email.assert_not_called()
+        urgent = NotificationService.notify(
+            user=self.user,
+            notification_type="low_stock_alert",
+            title="Low Stock Alert",
+            message="Urgent restock needed",
+            payload={"type": "low_stock_alert", "urgent": True, "product_id": "p1"},
+        )
+        routine = NotificationService.notify(
+            user=self.user,
+            notification_type="low_stock_alert",
+            title="Low Stock Alert",
+            message="Stock below threshold",
+            payload={"type": "low_stock_alert", "urgent": False, "product_id": "p2"},
+        )
+
+        self.assertEqual(self._channels(urgent), ["email", "push"])
+        self.assertEqual(self._channels(routine), ["push"])
+
+    def test_notify_many_dedupes_and_bulk_inserts(self):
+        other = User.objects.create_user(
+            email="service-other@shikela.com",
+            password="Pass123!",
+            role="CUSTOMER",
+        )
+        sold = {"type": "product_sold", "entity_id": "order-1"}
+        requests = [
+            NotificationRequest(self.user, "product_sold", "Product Sold", "First item", sold),
+            NotificationRequest(self.user, "product_sold", "Product Sold", "Second item", sold),
+            NotificationRequest(other, "product_sold", "Product Sold", "First item", sold),
+            NotificationRequest.from_template(
+                other,
+                ("Commission", "Earned", {"type": "commission_created", "entity_id": "c1"}),
+            ),
+        ]
+
+        # One preference lookup for both recipients; notifications, outbox rows and
+        # counter rows are each one INSERT; counters then get one UPDATE per (user, type).
+        with self.assertNumQueries(9):
+            created = NotificationService.notify_many(requests)
+
+        self.assertEqual(len(created), 3)
+        self.assertEqual(Notification.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(Notification.objects.get(user=self.user).message, "First item")
+        self.assertEqual(
+            sorted(Notification.objects.filter(user=other).values_list("type", flat=True)),
+            ["commission_created", "product_sold"],
+        )
+        self.assertEqual(NotificationDelivery.objects.count(), 3)
+
+
+@override_settings(EMAIL_NOTIFICATIONS_ENABLED=True, NOTIFICATION_EMAIL_DIGEST_WINDOW_SECONDS=60)
+class NotificationPreferenceTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(email="prefs@shikela.com", password="Pass123!", role="CUSTOMER")
+        self.other = User.objects.create_user(email="prefs-other@shikela.com", password="Pass123!", role="CUSTOMER")
+        self.client.force_authenticate(self.user)
+
+    def _notify(self, user, notification_type="payment_success"):
+        return NotificationService.notify(
+            user=user,
+            notification_type=notification_type,
+            title="Title",
+            message="Message",
+            payload={"type": notification_type, "entity_id": "1"},
+        )
+
+    def test_overrides_route_channels_per_user(self):
+        NotificationPreferences.update(
+            self.user,
+            {
+                "payment_success": NotificationPreference.Channel.EMAIL,
+                "order_delivered": NotificationPreference.Channel.EMAIL | NotificationPreference.Channel.IN_APP,
+            },
+        )
+
+        muted = self._notify(self.user)
+        delivered = self._notify(self.user, "order_delivered")
+        default = self._notify(self.other)
+
+        self.assertTrue(muted.is_read)
+        self.assertEqual(list(muted.deliveries.values_list("channel", flat=True)), ["email"])
+        email = delivered.deliveries.get()
+        self.assertEqual(email.channel, "email")
+        self.assertLessEqual(email.next_attempt_at, timezone.now())
+        self.assertFalse(delivered.is_read)
+        self.assertEqual(sorted(default.deliveries.values_list("channel", flat=True)), ["email", "push"])
+        self.assertEqual(
+            dict(NotificationCounter.objects.filter(user=self.user).values_list("type", "unread")),
+            {"order_delivered": 1},
+        )
+
+    def _resolve_batch(self):
+        return [
+            Notification(user=user, type=notification_type, payload={})
+            for user in (self.user, self.other)
+            for notification_type in ("new_order", "order_shipped")
+        ]
+
+    @patch("notifications.preferences.is_shared_cache", return_value=True)
+    def test_resolve_loads_uncached_users_with_one_query(self, _shared):
+        NotificationPreferences.update(self.other, {"new_order": NotificationPreference.Channel.PUSH})
+        notifications = self._resolve_batch()
+
+        with self.assertNumQueries(1):
+            first = NotificationPreferences.resolve(notifications, NotificationService.default_channels)
+        with self.assertNumQueries(0):
+            second = NotificationPreferences.resolve(notifications, NotificationService.default_channels)
+
+        self.assertEqual(first, second)
+        self.assertEqual(first[2], NotificationPreference.Channel.PUSH)
+        self.assertTrue(first[0] & NotificationPreference.Channel.EMAIL)
+
+    def test_preferences_are_read_from_the_database_without_a_shared_cache(self):
+        NotificationPreferences.resolve(self._resolve_batch(), NotificationService.default_channels)
+        # Changed by another process, whose invalidation this process's cache would never see.
+        NotificationPreference.objects.create(
+            user=self.other,
+            type="new_order",
+            channels=NotificationPreference.Channel.PUSH,
+            overridden=NotificationPreference.Channel.PUSH | NotificationPreference.Channel.EMAIL,
+        )
+
+        with self.assertNumQueries(1):
+            masks = NotificationPreferences.resolve(self._resolve_batch(), NotificationService.default_channels)
+
+        self.assertEqual(masks[2] & NotificationPreference.Channel.EMAIL, 0)
+
+    def test_preferences_api_updates_and_resets(self):
+        response = self.client.patch(
+            "/api/notifications/preferences/",
+            [{"type": "order_shipped", "push": False}, {"type": "order_shipped", "email": True}],
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200, response.data)
+        shipped = next(item for item in response.data if item["type"] == "order_shipped")
+        self.assertEqual(
+            shipped,
+            {"type": "order_shipped", "push": False, "email": True, "in_app": True, "digest": True, "customized": True},
+        )
+        preference = NotificationPreference.objects.get(user=self.user)
+        self.assertEqual((preference.channels, preference.overridden), (2, 3))
+
+        invalid = self.client.patch("/api/notifications/preferences/", [{"type": "order_shipped"}], format="json")
+        self.assertEqual(invalid.status_code, 400)
+
+        reset = self.client.delete("/api/notifications/preferences/")
+        self.assertFalse(any(item["customized"] for item in reset.data))
+        self.assertFalse(NotificationPreference.objects.filter(user=self.user).exists())
+
+    def test_channels_left_out_of_a_patch_follow_the_payload_defaults(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                "/api/notifications/preferences/",
+                [{"type": "low_stock_alert", "push": False}],
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+
+        urgent = NotificationService.notify(
+            user=self.user,
+            notification_type="low_stock_alert",
+            title="Low stock",
+            message="Almost out",
+            payload={"type": "low_stock_alert", "urgent": True},
+        )
+        routine = NotificationService.notify(
+            user=self.user,
+            notification_type="low_stock_alert",
+            title="Low stock",
+            message="Running low",
+            payload={"type": "low_stock_alert", "urgent": False},
+        )
+
+        self.assertEqual(list(urgent.deliveries.values_list("channel", flat=True)), ["email"])
+        self.assertFalse(routine.deliveries.exists())
+
+
+@override_settings(
+    PUSH_BACKEND="notifications.push.LocmemPushBackend",
+    EMAIL_NOTIFICATIONS_ENABLED=True,
+    NOTIFICATION_EMAIL_DIGEST_WINDOW_SECONDS=0,
+)
+class NotificationOutboxWorkerTests(TestCase):
+    def setUp(self):
+        LocmemPushBackend.reset()
+        self.user = User.objects.create_user(email="outbox@shikela.com", password="Pass123!", role="CUSTOMER")
+        DeviceToken.objects.create(user=self.user, token="outbox-token", device_type="web")
+        self.notification = NotificationService.notify(
+            user=self.user,
+            notification_type="payment_success",
+            title="Payment Successful",
+            message="Order paid",
+            payload={"type": "payment_success", "order_id": "1"},
+        )
+        self.worker = NotificationOutboxWorker(push_rate_per_second=0, email_rate_per_second=0, max_attempts=2)
+
+    def test_worker_sends_push_and_email(self):
+        result = self.worker.run_once()
+
+        self.assertEqual((result.claimed, result.sent, result.email_messages), (2, 2, 1))
+        self.assertEqual(LocmemPushBackend.outbox[0]["token"], "outbox-token")
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, "Payment Successful")
+        self.assertEqual(mail.outbox[0].to, [self.user.email])
+        self.assertIn("Order paid", mail.outbox[0].body)
+        self.assertFalse(self.notification.deliveries.exclude(status=NotificationDelivery.Status.SENT).exists())
+        self.assertEqual(self.worker.run_once().claimed, 0)
+
+    @patch("django.core.mail.backends.locmem.EmailBackend.send_messages")
+    def test_failed_email_is_retried_with_backoff_then_marked_failed(self, mock_send_messages):
+        mock_send_messages.side_effect = TimeoutError("smtp timeout")
+
+        result = self.worker.run_once()
+
+        self.assertEqual((result.sent, result.retried), (1, 1))
+        email = self.notification.deliveries.get(channel=NotificationDelivery.Channel.EMAIL)
+        self.assertEqual(email.status, NotificationDelivery.Status.PENDING)
+        self.assertEqual(email.last_error, "smtp timeout")
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        self.assertEqual(self.worker.run_once().claimed, 0)
+
+        NotificationDelivery.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+        result = self.worker.run_once()
+        email.refresh_from_db()
+        self.assertEqual(result.failed, 1)
+        self.assertEqual(email.status, NotificationDelivery.Status.FAILED)
+
+    def test_deliveries_of_a_dead_worker_are_reclaimed_after_the_lease(self):
+        claimed = self.worker._claim_due()
+        self.assertEqual(len(claimed), 2)
+        # The worker dies here: nothing records the outcome of the claimed rows.
+        self.assertEqual(self.worker.run_once().claimed, 0)
+
+        NotificationDelivery.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        result = self.worker.run_once()
+
+        self.assertEqual((result.claimed, result.sent), (2, 2))
+        self.assertFalse(self.notification.deliveries.exclude(status=NotificationDelivery.Status.SENT).exists())
+        self.assertFalse(NotificationDelivery.objects.filter(locked_until__isnull=False).exists())
+
+    def test_expired_lease_with_no_attempts_left_is_marked_failed(self):
+        self.worker._claim_due()
+        NotificationDelivery.objects.update(attempts=2, locked_until=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(self.worker.run_once().claimed, 0)
+        self.assertFalse(self.notification.deliveries.exclude(status=NotificationDelivery.Status.FAILED).exists())
+        self.assertEqual(len(mail.outbox), 0)
+
+    @override_settings(NOTIFICATION_EMAIL_DIGEST_WINDOW_SECONDS=60)
+    def test_emails_within_digest_window_are_coalesced(self):
+        for index in range(2):
+            NotificationService.notify(
+                user=self.user,
+                notification_type="payment_success",
+                title=f"Payment {index}",
+                message=f"Order {index} paid",
+                payload={"type": "payment_success", "order_id": str(index)},
+            )
+        worker = NotificationOutboxWorker(push_rate_per_second=0, email_rate_per_second=0, digest_window_seconds=60)
+
+        result = worker.run_once()
+
+        self.assertEqual((result.sent, result.email_messages, result.digests), (6, 1, 1))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, "You have 3 new notifications")
+        self.assertIn("Order 1 paid", mail.outbox[0].body)
+        self.assertFalse(NotificationDelivery.objects.exclude(status=NotificationDelivery.Status.SENT).exists())
+
+
+class EmailDeliveryEngineTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.pool = EmailConnectionPool()
+        self.engine = EmailDeliveryEngine(pool=self.pool, batch_size=2)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def _item(self, key, recipient):
+        return EmailItem(key=key, recipient=recipient, title=f"Title {key}", message=f"Body {key}")
+
+    def test_batches_reuse_one_pooled_connection(self):
+        items = [self._item(index, f"user{index}@shikela.com") for index in range(5)]
+        items.append(self._item(5, "USER0@shikela.com"))
+
+        report = self.engine.deliver(items)
+
+        self.assertEqual((report.sent, report.messages, report.digests, report.batches), (6, 5, 1, 3))
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(mail.outbox[0].subject, "You have 2 new notifications")
+        self.assertEqual(metrics.get("email.connections_opened"), 1)
+        self.assertEqual(metrics.get("email.sent"), 5)
+        self.assertEqual(metrics.get("email.batch.count"), 3)
+
+    def test_failed_batch_reports_errors_per_item(self):
+        with patch("django.core.mail.backends.locmem.EmailBackend.send_messages", side_effect=OSError("refused")):
+            report = self.engine.deliver([self._item("a", "a@shikela.com"), self._item("b", "b@shikela.com")])
+
+        self.assertEqual((report.sent, report.failed), (0, 2))
+        self.assertEqual(set(report.errors), {"a", "b"})
+        self.assertEqual(metrics.get("email.failed"), 2)
+
+    def test_pool_reconnects_when_idle_session_was_dropped(self):
+        self.pool.send_messages([EmailDeliveryEngine.build_message([self._item(1, "a@shikela.com")])])
+        with patch(
+            "django.core.mail.backends.locmem.EmailBackend.send_messages",
+            side_effect=[smtplib.SMTPServerDisconnected("closed"), 1],
+        ):
+            sent = self.pool.send_messages([EmailDeliveryEngine.build_message([self._item(2, "b@shikela.com")])])
+
+        self.assertEqual(sent, 1)
+        self.assertEqual(metrics.get("email.connections_opened"), 2)
+
+
+@override_settings(PUSH_BACKEND="notifications.push.LocmemPushBackend")
+class PushDeliveryEngineTests(TestCase):
+    def setUp(self):
+        LocmemPushBackend.reset()
+        self.seller = User.objects.create_user(email="seller@shikela.com", password="Pass123!", role="SHOP_OWNER")
+        self.buyer = User.objects.create_user(email="buyer@shikela.com", password="Pass123!", role="CUSTOMER")
+        for index in range(5):
+            DeviceToken.objects.create(user=self.seller, token=f"seller-{index}", device_type="android")
+        DeviceToken.objects.create(user=self.buyer, token="buyer-0", device_type="web")
+        DeviceToken.objects.create(user=self.buyer, token="buyer-old", device_type="web", is_active=False)
+
+    def test_user_devices_share_one_multicast_call(self):
+        report = PushDeliveryEngine().send_to_user(
+            user_id=self.seller.id,
+            title="New Order",
+            message="Order received",
+            payload={"type": "new_order", "items_count": 2},
+        )
+
+        self.assertEqual(report.sent, 5)
+        self.assertEqual(LocmemPushBackend.calls, [("send_each_for_multicast", 5)])
+        self.assertEqual(LocmemPushBackend.outbox[0]["data"], {"type": "new_order", "items_count": "2"})
+
+    def test_single_token_messages_are_pooled_across_users(self):
+        other = User.objects.create_user(email="other-buyer@shikela.com", password="Pass123!", role="CUSTOMER")
+        DeviceToken.objects.create(user=other, token="other-0", device_type="web")
+
+        report = PushDeliveryEngine().deliver(
+            [
+                PushMessage(user_id=self.buyer.id, title="Shipped", message="Order 1 shipped"),
+                PushMessage(user_id=other.id, title="Shipped", message="Order 2 shipped"),
+            ]
+        )
+
+        self.assertEqual(report.sent, 2)
+        self.assertEqual(LocmemPushBackend.calls, [("send_each", 2)])
+        self.assertNotIn("buyer-old", [sent["token"] for sent in LocmemPushBackend.outbox])
+
+    def test_batches_are_chunked_and_invalid_tokens_deactivated(self):
+        LocmemPushBackend.invalid_tokens = {"seller-1", "seller-3"}
+
+        # Token load, last_success_at stamp, and the invalid-token deactivation
+        # (owner lookup + UPDATE inside a savepoint), independent of token count.
+        with self.assertNumQueries(6):
+            report = PushDeliveryEngine(batch_size=2).send_to_user(
+                user_id=self.seller.id, title="New Order", message="Order received"
+            )
+
+        self.assertEqual([size for _, size in LocmemPushBackend.calls], [2, 2, 1])
+        self.assertEqual((report.sent, report.failed, report.deactivated), (3, 2, 2))
+        self.assertEqual(
+            set(DeviceToken.objects.filter(is_active=False, user=self.seller).values_list("token", flat=True)),
+            {"seller-1", "seller-3"},
+        )
+
+    def test_tokens_are_read_from_the_database_without_a_shared_cache(self):
+        metrics.reset()
+        engine = PushDeliveryEngine()
+        engine.send_to_user(user_id=self.buyer.id, title="Shipped", message="On the way")
+        DeviceToken.objects.create(user=self.buyer, token="buyer-other-process", device_type="web")
+        LocmemPushBackend.reset()
+
+        # Token load and the last_success_at stamp, on every send.
+        with self.assertNumQueries(2):
+            report = engine.send_to_user(user_id=self.buyer.id, title="Shipped", message="On the way")
+
+        self.assertEqual(report.sent, 2)
+        self.assertEqual(metrics.get("push.token_cache.hit"), 0)
+
+    @patch("notifications.tokens.is_shared_cache", return_value=True)
+    def test_active_tokens_are_cached_until_registration_changes(self, _shared):
+        client = APIClient()
+        client.force_authenticate(self.buyer)
+        engine = PushDeliveryEngine()
+        engine.send_to_user(user_id=self.buyer.id, title="Shipped", message="On the way")
+
+        # Cached tokens: only the last_success_at stamp hits the database.
+        with self.assertNumQueries(1):
+            engine.send_to_user(user_id=self.buyer.id, title="Shipped", message="On the way")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post("/api/notifications/device-token/", {"token": "buyer-new", "device_type": "web"}, format="json")
+        LocmemPushBackend.reset()
+        report = engine.send_to_user(user_id=self.buyer.id, title="Shipped", message="On the way")
+
+        self.assertEqual(report.sent, 2)
+        self.assertEqual({sent["token"] for sent in LocmemPushBackend.outbox}, {"buyer-0", "buyer-new"})
+        self.assertIsNotNone(DeviceToken.objects.get(token="buyer-0").last_success_at)
+
+    def test_prune_deactivates_tokens_without_recent_success(self):
+        now = timezone.now()
+        DeviceToken.objects.filter(token="seller-0").update(last_success_at=now - timedelta(days=90))
+        DeviceToken.objects.filter(token="seller-1").update(last_success_at=now - timedelta(days=1))
+        DeviceToken.objects.exclude(token__in=["seller-0", "seller-1"]).update(created_at=now - timedelta(days=1))
+        DeviceToken.objects.filter(token="buyer-old").update(updated_at=now - timedelta(days=400))
+
+        metrics.reset()
+        pruned = DeviceTokenRegistry.prune_stale(60, chunk_size=1)
+        purged = DeviceTokenRegistry.purge_inactive(180)
+
+        self.assertEqual((pruned, purged), (1, 1))
+        self.assertFalse(DeviceToken.objects.get(token="seller-0").is_active)
+        self.assertFalse(DeviceToken.objects.filter(token="buyer-old").exists())
+        self.assertEqual(metrics.get("push.tokens.pruned"), 1)
+
+
+@override_settings(
+    NOTIFICATION_STREAM_HEARTBEAT_SECONDS=0.05,
+    NOTIFICATION_STREAM_MAX_SECONDS=0.2,
+)
+class NotificationRealtimeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="stream@shikela.com", password="Pass123!", role="CUSTOMER")
+        self.notifications = [
+            Notification.objects.create(
+                user=self.user,
+                type="order_shipped",
+                title=f"Shipped {index}",
+                message="On the way",
+                payload={"type": "order_shipped"},
+            )
+            for index in range(3)
+        ]
+
+    async def _content(self, response):
+        return "".join([chunk.decode() async for chunk in response.streaming_content])
+
+    async def test_stream_requires_authentication(self):
+        response = await self.async_client.get("/api/notifications/stream/")
+        self.assertEqual(response.status_code, 401)
+
+    async def test_stream_resumes_after_last_event_id_and_sends_heartbeats(self):
+        await self.async_client.aforce_login(self.user)
+        first, second, third = self.notifications
+
+        response = await self.async_client.get(
+            "/api/notifications/stream/",
+            headers={"Last-Event-ID": str(first.id)},
+        )
+        content = await self._content(response)
+
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertNotIn(f"id: {first.id}", content)
+        self.assertLess(content.index(f"id: {second.id}"), content.index(f"id: {third.id}"))
+        self.assertIn(": heartbeat", content)
+
+    async def test_backlog_breaks_timestamp_ties_by_id_and_skips_read_notifications(self):
+        await self.async_client.aforce_login(self.user)
+        read = await Notification.objects.acreate(
+            user=self.user,
+            type="order_shipped",
+            title="Muted",
+            message="On the way",
+            payload={"type": "order_shipped"},
+            is_read=True,
+        )
+        # One fan-out stamps every notification with the same created_at.
+        await Notification.objects.filter(user=self.user).aupdate(created_at=timezone.now())
+        first, *rest = sorted([notification.id for notification in self.notifications])
+
+        response = await self.async_client.get(f"/api/notifications/poll/?last_event_id={first}")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([event["id"] for event in response.json()["events"]], [str(pk) for pk in rest])
+        self.assertNotIn(str(read.id), response.content.decode())
+
+    async def test_long_poll_receives_published_event(self):
+        await self.async_client.aforce_login(self.user)
+        broker = get_broker()
+        request = asyncio.create_task(self.async_client.get("/api/notifications/poll/?timeout=2"))
+        while not broker.subscriber_count(self.user.id):
+            await asyncio.sleep(0.01)
+
+        broker.publish(self.user.id, notification_event(self.notifications[0]))
+        response = await request
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["events"][0]["id"], str(self.notifications[0].id))
+        self.assertEqual(broker.subscriber_count(self.user.id), 0)
+
+    def test_notify_publishes_after_commit(self):
+        with patch("notifications.services.publish_notifications") as mock_publish:
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                notification = NotificationService.notify(
+                    user=self.user,
+                    notification_type="order_shipped",
+                    title="Shipped",
+                    message="On the way",
+                    payload={"type": "order_shipped"},
+                )
+                mock_publish.assert_not_called()
+            for callback in callbacks:
+                callback()
+
+        mock_publish.assert_called_once_with([notification])
+
+
+class NotificationRetentionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="retention@shikela.com", password="Pass123!", role="CUSTOMER")
+        self.now = timezone.now()
+        self.policy = RetentionPolicy({"default": 90, "low_stock_alert": 7})
+
+    def _notify(self, notification_type, age_days):
+        notification = NotificationService.notify(
+            user=self.user,
+            notification_type=notification_type,
+            title=notification_type,
+            message="Message",
+            payload={"type": notification_type},
+        )
+        Notification.objects.filter(pk=notification.pk).update(created_at=self.now - timedelta(days=age_days))
+        return notification
+
+    def test_purge_archives_and_deletes_expired_notifications_in_chunks(self):
+        expired = [self._notify("low_stock_alert", 10), self._notify("low_stock_alert", 8), self._notify("order_shipped", 100)]
+        read = self._notify("order_shipped", 120)
+        Notification.objects.filter(pk=read.pk).update(is_read=True)
+        NotificationInbox.record_read(self.user.id, "order_shipped")
+        expired.append(read)
+        kept = [self._notify("low_stock_alert", 1), self._notify("order_shipped", 30)]
+
+        with tempfile.TemporaryDirectory() as archive_dir:
+            result = NotificationRetentionJob(policy=self.policy, chunk_size=2, archive_dir=archive_dir).run(now=self.now)
+            with gzip.open(result.files[0], "rt", encoding="utf-8") as handle:
+                archived_ids = {json.loads(line)["id"] for line in handle}
+
+        self.assertEqual((result.deleted, result.archived, result.chunks), (4, 4, 2))
+        self.assertEqual(result.by_type, {"low_stock_alert": 2, "default": 2})
+        self.assertEqual(archived_ids, {str(notification.id) for notification in expired})
+        self.assertEqual(set(Notification.objects.values_list("id", flat=True)), {notification.id for notification in kept})
+        self.assertFalse(NotificationDelivery.objects.filter(notification_id__in=[n.id for n in expired]).exists())
+        self.assertEqual(
+            dict(NotificationCounter.objects.filter(user=self.user).values_list("type", "unread")),
+            {"low_stock_alert": 1, "order_shipped": 1},
+        )
+
+    def test_dry_run_only_counts(self):
+        self._notify("low_stock_alert", 10)
+
+        result = NotificationRetentionJob(policy=self.policy, dry_run=True).run(now=self.now)
+
+        self.assertEqual(result.by_type, {"low_stock_alert": 1, "default": 0})
+        self.assertEqual(Notification.objects.count(), 1)
+
+    def test_policy_rejects_unknown_types(self):
+        with self.assertRaises(ValueError):
+            RetentionPolicy({"default": 30, "not_a_type": 1})
+        self.assertEqual(self.policy.max_days(), 90)
+        self.assertEqual(RetentionPolicy({"low_stock_alert": 7}).max_days(), 0)
+
+    def test_partition_conversion_sql_covers_months_through_horizon(self):
+        manager = NotificationPartitionManager()
+        first = self.now.replace(day=15) - timedelta(days=62)
+
+        statements = manager.conversion_sql(first, months_ahead=1)
+
+        partitions = [statement for statement in statements if "PARTITION OF" in statement and "DEFAULT" not in statement]
+        self.assertEqual(len(partitions), 4)
+        self.assertIn("PARTITION BY RANGE (created_at)", statements[2])
+        self.assertFalse(manager.is_partitioned())
+
+
+class NotificationTemplateTests(TestCase):
+    def setUp(self):
+        self.order = Order(
+            id=uuid.uuid4(),
+            order_number="ORD-00000042",
+            total_amount=Decimal("120.50"),
+            updated_at=timezone.now(),
+        )
+        self.product = Product(id=uuid.uuid4(), name="Coffee Beans")
+
+    def test_payment_success_renders_from_loaded_objects(self):
+        with self.assertNumQueries(0):
+            title, message, payload = NotificationTemplates.payment_success(self.order, items_count=3)
+
+        self.assertEqual(title, "Payment Successful")
+        self.assertEqual(message, "Your order #ORD-00000042 has been confirmed.")
+        self.assertEqual(
+            payload,
+            {
+                "type": "payment_success",
+                "entity_id": str(self.order.id),
+                "entity_type": "order",
+                "order_id": str(self.order.id),
+                "order_number": "ORD-00000042",
+                "total_amount": "120.50",
+                "items_count": 3,
+                "paid_at": self.order.updated_at.isoformat(),
+                "currency": "ETB",
+            },
+        )
+
+    def test_session_reuses_renders_within_one_event(self):
+        with NotificationTemplates.session() as session:
+            first = NotificationTemplates.product_sold(self.order, self.product)
+            second = NotificationTemplates.product_sold(self.order, self.product)
+            NotificationTemplates.new_order(self.order)
+            second[2]["order_id"] = "changed"
+
+        self.assertEqual((session.hits, session.misses), (1, 2))
+        self.assertEqual(first[2]["order_id"], str(self.order.id))
+        self.assertEqual(NotificationTemplates.product_sold(self.order, self.product)[1], "Your product Coffee Beans was sold.")
 
+    def test_templates_validate_placeholders_and_arguments(self):
+        with self.assertRaises(ValueError):
+            NotificationTemplate("order_shipped", "Shipped", "Order #{order_number}", entity="order", fields={})
+        with self.assertRaises(TypeError):
+            registry.render("refund_completed", order=self.order)
+        self.assertEqual(len(registry.types()), len(Notification.Type.values))
@@ -0,0 +1,156 @@
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.cache import is_shared_cache
+from core.metrics import metrics
+
+from .models import DeviceToken
+
+
+class DeviceTokenRegistry:
+    """
+    Cached set of active device tokens per user.
+
+    Push delivery reads tokens through tokens_for_users(), which serves users
+    from the cache and loads all misses with one query. Every change to a
+    user's tokens (registration, reassignment, deactivation, pruning) drops
+    that user's entry after commit. Registrations happen in web processes
+    and pushes are sent by process_notification_outbox, so the cache is only
+    used when it is shared between processes (CACHE_URL); with a per-process
+    cache tokens are read from the database on every send. Churn is counted
+    in core.metrics under "push.tokens.*".
+    """
+
+    CACHE_KEY = "notifications:device_tokens:{user_id}"
+
+    @classmethod
+    def tokens_for_users(cls, user_ids: Iterable[Any]) -> Dict[str, List[str]]:
+        user_ids = {str(user_id) for user_id in user_ids}
+        if not user_ids:
+            return {}
+        if not is_shared_cache():
+            return cls._load(user_ids)
+        keys = {cls.CACHE_KEY.format(user_id=user_id): user_id for user_id in user_ids}
+        cached = cache.get_many(list(keys))
+        tokens = {keys[key]: value for key, value in cached.items()}
+        misses = user_ids - set(tokens)
+        metrics.incr("push.token_cache.hit", len(tokens))
+        metrics.incr("push.token_cache.miss", len(misses))
+        if misses:
+            loaded = cls._load(misses)
+            cache.set_many(
+                {cls.CACHE_KEY.format(user_id=user_id): value for user_id, value in loaded.items()},
+                getattr(settings, "DEVICE_TOKEN_CACHE_SECONDS", 600),
+            )
+            tokens.update(loaded)
+        return tokens
+
+    @staticmethod
+    def _load(user_ids: Iterable[str]) -> Dict[str, List[str]]:
+        loaded: Dict[str, List[str]] = {user_id: [] for user_id in user_ids}
+        for user_id, token in (
+            DeviceToken.objects.filter(user_id__in=list(loaded), is_active=True)
+            .order_by("created_at")
+            .values_list("user_id", "token")
+        ):
+            loaded[str(user_id)].append(token)
+        return loaded
+
+    @classmethod
+    @transaction.atomic
+    def register(cls, user, token: str, device_type: str) -> DeviceToken:
+        previous_owner = DeviceToken.objects.filter(token=token).values_list("user_id", flat=True).first()
+        device_token, created = DeviceToken.objects.update_or_create(
+            token=token,
+            defaults={
+                "user": user,
+                "device_type": device_type,
+                "is_active": True,
+            },
+        )
+        metrics.incr("push.tokens.registered" if created else "push.tokens.refreshed")
+        if previous_owner is not None and str(previous_owner) != str(user.id):
+            metrics.incr("push.tokens.reassigned")
+        cls.invalidate([user.id, previous_owner] if previous_owner is not None else [user.id])
+        return device_token
+
+    @classmethod
+    @transaction.atomic
+    def deactivate(cls, user, token: Optional[str] = None) -> int:
+        qs = DeviceToken.objects.filter(user=user, is_active=True)
+        if token:
+            qs = qs.filter(token=token)
+        updated = qs.update(is_active=False, updated_at=timezone.now())
+        if updated:
+            metrics.incr("push.tokens.unregistered", updated)
+            cls.invalidate([user.id])
+        return updated
+
+    @classmethod
+    def deactivate_invalid(cls, tokens: Iterable[str]) -> int:
+        """Deactivate tokens FCM rejected, with one UPDATE."""
+        tokens = list(tokens)
+        if not tokens:
+            return 0
+        with transaction.atomic():
+            qs = DeviceToken.objects.filter(token__in=tokens, is_active=True)
+            owners = set(qs.values_list("user_id", flat=True))
+            updated = qs.update(is_active=False, updated_at=timezone.now())
+            cls.invalidate(owners)
+        metrics.incr("push.tokens.invalid", updated)
+        return updated
+
+    @staticmethod
+    def mark_success(tokens: Iterable[str]) -> int:
+        tokens = list(tokens)
+        if not tokens:
+            return 0
+        return DeviceToken.objects.filter(token__in=tokens).update(last_success_at=timezone.now())
+
+    @classmethod
+    def prune_stale(cls, days: int, chunk_size: int = 1000, now=None) -> int:
+        """
+        Deactivate active tokens with no successful send in `days` days.
+
+        Tokens that never had a successful send are judged by their
+        registration time. Works in chunks so each UPDATE stays short.
+        """
+        cutoff = (now or timezone.now()) - timedelta(days=days)
+        stale = (
+            DeviceToken.objects.filter(is_active=True)
+            .annotate(last_seen=Coalesce("last_success_at", "created_at"))
+            .filter(last_seen__lt=cutoff)
+        )
+        pruned = 0
+        while True:
+            chunk = list(stale.values_list("id", "user_id")[:chunk_size])
+            if not chunk:
+                break
+            with transaction.atomic():
+                pruned += DeviceToken.objects.filter(id__in=[token_id for token_id, _ in chunk]).update(
+                    is_active=False,
+                    updated_at=timezone.now(),
+                )
+                cls.invalidate({user_id for _, user_id in chunk})
+        metrics.incr("push.tokens.pruned", pruned)
+        return pruned
+
+    @staticmethod
+    def purge_inactive(days: int, now=None) -> int:
+        """Delete tokens that have been inactive for `days` days."""
+        cutoff = (now or timezone.now()) - timedelta(days=days)
+        deleted, _ = DeviceToken.objects.filter(is_active=False, updated_at__lt=cutoff).delete()
+        metrics.incr("push.tokens.purged", deleted)
+        return deleted
+
+    @classmethod
+    def invalidate(cls, user_ids: Iterable[Any]) -> None:
+        keys = [cls.CACHE_KEY.format(user_id=user_id) for user_id in set(map(str, user_ids))]
+        if keys:
+            transaction.on_commit(lambda: cache.delete_many(keys))
@@ -4,12 +4,20 @@ from .views import (
     DeviceTokenView,
     NotificationListView,
     NotificationMarkAllReadView,
+    NotificationPreferenceView,
     NotificationReadView,
+    NotificationSummaryView,
+    notification_poll,
+    notification_stream,
 )
 
 
 urlpatterns = [
     path("", NotificationListView.as_view(), name="notifications-list"),
+    path("summary/", NotificationSummaryView.as_view(), name="notifications-summary"),
+    path("stream/", notification_stream, name="notifications-stream"),
+    path("poll/", notification_poll, name="notifications-poll"),
+    path("preferences/", NotificationPreferenceView.as_view(), name="notifications-preferences"),
     path("device-token/", DeviceTokenView.as_view(), name="notifications-device-token"),
     path("<uuid:pk>/read/", NotificationReadView.as_view(), name="notifications-read-one"),
     path("mark-all-read/", NotificationMarkAllReadView.as_view(), name="notifications-read-all"),
@@ -1,11 +1,35 @@
-from rest_framework import permissions, status
+import asyncio
+import json
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import exceptions, permissions, status
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.generics import ListAPIView
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .models import DeviceToken, Notification
-from .serializers import DeviceTokenSerializer, NotificationSerializer
+from .inbox import NotificationInbox
+from .models import Notification
+from .preferences import (
+    CHANNEL_NAMES,
+    NotificationPreferences,
+    channel_mask,
+    channels_from_dict,
+    channels_to_dict,
+    merge_channels,
+)
+from .realtime import get_broker, notification_event
+from .serializers import DeviceTokenSerializer, NotificationPreferenceSerializer, NotificationSerializer
+from .services import NotificationService
+from .tokens import DeviceTokenRegistry
 
 
 class NotificationPagination(PageNumberPagination):
@@ -33,10 +57,7 @@ class DeviceTokenView(APIView):
 
     def delete(self, request):
         token = (request.data.get("token") or "").strip()
-        qs = DeviceToken.objects.filter(user=request.user, is_active=True)
-        if token:
-            qs = qs.filter(token=token)
-        updated = qs.update(is_active=False)
+        updated = DeviceTokenRegistry.deactivate(request.user, token or None)
         return Response({"deactivated": updated}, status=status.HTTP_200_OK)
 
 
@@ -56,10 +77,11 @@ class NotificationReadView(APIView):
         notification = Notification.objects.filter(id=pk, user=request.user).first()
         if not notification:
             return Response({"detail": "Notification not found"}, status=status.HTTP_404_NOT_FOUND)
-        if not notification.is_read:
-            notification.is_read = True
-            notification.save(update_fields=["is_read"])
-        return Response({"id": str(notification.id), "is_read": notification.is_read})
+        with transaction.atomic():
+            # Conditional update so concurrent reads decrement the counter once.
+            if Notification.objects.filter(id=notification.id, is_read=False).update(is_read=True):
+                NotificationInbox.record_read(request.user.id, notification.type)
+        return Response({"id": str(notification.id), "is_read": True})
 
     def post(self, request, pk):
         return self.patch(request, pk)
@@ -69,7 +91,211 @@ class NotificationMarkAllReadView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
-        updated = Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+        with transaction.atomic():
+            updated = Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+            NotificationInbox.record_all_read(request.user.id)
         return Response({"updated": updated}, status=status.HTTP_200_OK)
 
-# Create your views here.
+
+class NotificationSummaryView(APIView):
+    """Unread counts by type for badge polling; answers 304 when the ETag matches."""
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        summary, etag = NotificationInbox.summary(request.user)
+        etag = quote_etag(etag)
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(summary)
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
+
+class NotificationPreferenceView(APIView):
+    """
+    Per-type channel preferences of the current user.
+
+    PATCH takes a list of {"type": ..., "push"/"email"/"in_app"/"digest": bool};
+    only the channels given are overridden, the others keep following the
+    defaults. DELETE restores the defaults. GET shows the defaults for a
+    notification without payload, so payload-dependent channels such as the
+    email for urgent stock alerts may still be sent where it shows False.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        return Response(self._preferences(self._overrides(request.user)))
+
+    def patch(self, request):
+        serializer = NotificationPreferenceSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        overrides = dict(self._overrides(request.user))
+        for item in serializer.validated_data:
+            notification_type = item["type"]
+            values = {name: item[name] for name in CHANNEL_NAMES if name in item}
+            channels, overridden = overrides.get(notification_type, (0, 0))
+            overrides[notification_type] = (channels_from_dict(values, channels), overridden | channel_mask(values))
+        updates = {item["type"]: overrides[item["type"]] for item in serializer.validated_data}
+        NotificationPreferences.update(
+            request.user,
+            {notification_type: channels for notification_type, (channels, _) in updates.items()},
+            {notification_type: overridden for notification_type, (_, overridden) in updates.items()},
+        )
+        return Response(self._preferences(overrides))
+
+    def delete(self, request):
+        NotificationPreferences.reset(request.user)
+        return Response(self._preferences({}))
+
+    @staticmethod
+    def _overrides(user):
+        return NotificationPreferences.overrides_for_users([user.id])[str(user.id)]
+
+    @staticmethod
+    def _preferences(overrides):
+        preferences = []
+        for notification_type in Notification.Type.values:
+            channels, overridden = overrides.get(notification_type, (0, 0))
+            customized = bool(overridden)
+            channels = merge_channels(NotificationService.default_channels(notification_type, {}), channels, overridden)
+            preferences.append({"type": notification_type, **channels_to_dict(channels), "customized": customized})
+        return preferences
+
+
+# -----------------------------
+# Realtime (ASGI)
+# -----------------------------
+def _jwt_user(request):
+    try:
+        result = JWTAuthentication().authenticate(Request(request))
+    except exceptions.AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+async def _stream_user(request):
+    user = await sync_to_async(_jwt_user)(request)
+    if user is None:
+        user = await request.auser()
+    return user if user.is_authenticated else None
+
+
+def _events_after(user, last_event_id, limit):
+    """
+    Unread notifications after `last_event_id` in (created_at, id) order, for resuming a stream.
+
+    Read notifications, including those muted in-app, were never published
+    live, so the backlog leaves them out too. The id breaks ties between
+    notifications created in the same fan-out, which share a timestamp.
+    """
+    try:
+        last_event_id = uuid.UUID(str(last_event_id))
+    except (TypeError, ValueError):
+        return []
+    anchor = Notification.objects.filter(id=last_event_id, user=user).values_list("created_at", flat=True).first()
+    if anchor is None:
+        return []
+    notifications = (
+        Notification.objects.filter(user=user, is_read=False)
+        .filter(Q(created_at__gt=anchor) | Q(created_at=anchor, id__gt=last_event_id))
+        .order_by("created_at", "id")[:limit]
+    )
+    return [notification_event(notification) for notification in notifications]
+
+
+def _last_event_id(request):
+    return request.headers.get("Last-Event-ID") or request.GET.get("last_event_id")
+
+
+def _sse(event):
+    return f"id: {event['id']}\nevent: notification\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+async def notification_stream(request):
+    """
+    Server-sent events stream of new notifications for the current user.
+
+    Events are fanned out by the configured broker, so open streams do not
+    query the database. A reconnecting client sends Last-Event-ID and first
+    receives the notifications it missed. Comment heartbeats keep proxies from
+    closing idle streams, and each stream ends after
+    NOTIFICATION_STREAM_MAX_SECONDS; EventSource reconnects automatically.
+    """
+    user = await _stream_user(request)
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+
+    heartbeat = getattr(settings, "NOTIFICATION_STREAM_HEARTBEAT_SECONDS", 15)
+    max_seconds = getattr(settings, "NOTIFICATION_STREAM_MAX_SECONDS", 300)
+    backlog_limit = getattr(settings, "NOTIFICATION_STREAM_BACKLOG_LIMIT", 100)
+    last_event_id = _last_event_id(request)
+
+    async def events():
+        yield "retry: 3000\n\n"
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max_seconds
+        # Subscribe before reading the backlog so nothing committed in between is lost.
+        async with get_broker().subscribe(user.id) as queue:
+            seen = set()
+            if last_event_id:
+                for event in await sync_to_async(_events_after)(user, last_event_id, backlog_limit):
+                    seen.add(event["id"])
+                    yield _sse(event)
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=min(heartbeat, remaining))
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                if event["id"] in seen:
+                    continue
+                yield _sse(event)
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+async def notification_poll(request):
+    """
+    Long-poll fallback for clients without EventSource.
+
+    Returns missed notifications after `last_event_id` immediately, otherwise
+    waits up to `timeout` seconds for the next one.
+    """
+    user = await _stream_user(request)
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+
+    max_timeout = getattr(settings, "NOTIFICATION_POLL_TIMEOUT_SECONDS", 25)
+    try:
+        timeout = min(float(request.GET.get("timeout", max_timeout)), max_timeout)
+    except ValueError:
+        return JsonResponse({"detail": "timeout must be a number."}, status=400)
+    last_event_id = _last_event_id(request)
+
+    async with get_broker().subscribe(user.id) as queue:
+        events = []
+        if last_event_id:
+            events = await sync_to_async(_events_after)(
+                user, last_event_id, getattr(settings, "NOTIFICATION_STREAM_BACKLOG_LIMIT", 100)
+            )
+        if not events and timeout > 0:
+            try:
+                events.append(await asyncio.wait_for(queue.get(), timeout=timeout))
+            except asyncio.TimeoutError:
+                pass
+        while not queue.empty():
+            event = queue.get_nowait()
+            if all(event["id"] != existing["id"] for existing in events):
+                events.append(event)
+
+    return JsonResponse({"events": events, "last_event_id": events[-1]["id"] if events else last_event_id})
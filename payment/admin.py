@@ -2,7 +2,8 @@ from django.contrib import admin, messages
 from django.utils.translation import gettext_lazy as _
 
 from .models import Payment, Refund, LedgerEntry, WebhookLog, PayoutRequest, Earning
-from .services.service import PaymentService, PaymentServiceError
+from .services.refunds import RefundQueue
+from .services.service import PaymentService
 
 
 def _refund_service(refund):
@@ -36,45 +37,19 @@ class RefundAdmin(admin.ModelAdmin):
 	reject_refunds.short_description = "Reject selected refunds"
 
 	def execute_refunds(self, request, queryset):
-		"""Trigger payout for APPROVED refunds via the payment service."""
-		succeeded = 0
-		failed = 0
-		for refund in queryset.select_related("payment__order__shop__owner", "requested_by").all():
+		"""Queue APPROVED refunds; process_refund_queue sends them to the gateway."""
+		queued = 0
+		skipped = 0
+		for refund in queryset.all():
 			if refund.status != Refund.Status.APPROVED:
-				failed += 1
+				skipped += 1
 				continue
-			try:
-				service = _refund_service(refund)
-				target_user = refund.requested_by or refund.payment.user
-				payout_info = service._resolve_payout_target(target_user)
-				phone = payout_info.get("account")
-				method = payout_info.get("method")
-				tx_id = f"REF-{refund.payment.id}-{refund.id.hex[:8].upper()}"
-				response = service.payout_to_customer(
-					amount=refund.amount,
-					payment_reason=refund.reason or f"Refund for order {refund.payment.order.order_number}",
-					phone_number=phone,
-					payment_method=method,
-					tx_id=tx_id,
-				)
-				refund.provider_reference = response.get("id")
-				refund.status = Refund.Status.PROCESSING
-				metadata = dict(refund.metadata or {})
-				metadata.setdefault("provider_response", {})
-				metadata["provider_response"].update(response)
-				refund.metadata = metadata
-				refund.save(update_fields=["provider_reference", "status", "metadata", "updated_at"])
-				succeeded += 1
-			except PaymentServiceError as exc:
-				failed += 1
-				self.message_user(request, _("Failed to execute refund %(id)s: %(err)s") % {"id": refund.id, "err": str(exc)}, messages.ERROR)
-			except Exception as exc:
-				failed += 1
-				self.message_user(request, _("Unexpected error executing refund %(id)s: %(err)s") % {"id": refund.id, "err": str(exc)}, messages.ERROR)
+			RefundQueue.enqueue(refund)
+			queued += 1
 
-		self.message_user(request, _("Refunds executed: %(ok)d, failed: %(bad)d") % {"ok": succeeded, "bad": failed}, messages.INFO)
+		self.message_user(request, _("Refunds queued: %(ok)d, skipped: %(bad)d") % {"ok": queued, "bad": skipped}, messages.INFO)
 
-	execute_refunds.short_description = "Execute selected approved refunds (payout)"
+	execute_refunds.short_description = "Queue selected approved refunds for payout"
 
 	def sync_refunds(self, request, queryset):
 		synced = 0
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from payment.services.balances import BalanceService
+
+
+class Command(BaseCommand):
+    help = "Recompute user balances from the balance journal and report drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", action="append", dest="users", help="Limit the check to these user ids.")
+        parser.add_argument("--fix", action="store_true", help="Rewrite drifted balances from the journal.")
+
+    def handle(self, *args, **options):
+        unbalanced = BalanceService.unbalanced_transactions()
+        for transaction_id in unbalanced:
+            self.stderr.write(f"Journal transaction {transaction_id} does not sum to zero")
+
+        drift = BalanceService.find_drift(options["users"])
+        for row in drift:
+            self.stderr.write(
+                f"User {row.user_id} {row.field}: balance {row.actual}, journal {row.expected}"
+            )
+
+        if drift and options["fix"]:
+            fixed = BalanceService.rebuild({row.user_id for row in drift})
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {fixed} balances from the journal."))
+        elif not drift and not unbalanced:
+            self.stdout.write(self.style.SUCCESS("Balances match the journal."))
+        else:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"{len(drift)} drifted balance fields, {len(unbalanced)} unbalanced transactions."
+                )
+            )
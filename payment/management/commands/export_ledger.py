@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from payment.services.exports import LedgerExporter
+
+
+class Command(BaseCommand):
+    help = "Stream ledger entries as CSV or NDJSON, optionally filtered by date range and entry type."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", dest="file_format", choices=sorted(LedgerExporter.FORMATS), default="csv")
+        parser.add_argument("--start", help="Inclusive start date or datetime (ISO 8601).")
+        parser.add_argument("--end", help="End date (inclusive) or datetime (exclusive), ISO 8601.")
+        parser.add_argument("--entry-type", action="append", dest="entry_types", help="Repeat to export several types.")
+        parser.add_argument("--output", help="File to write to (defaults to stdout).")
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Rows fetched per database round trip.")
+
+    def handle(self, *args, **options):
+        try:
+            exporter = LedgerExporter(
+                start=LedgerExporter.parse_bound(options["start"]),
+                end=LedgerExporter.parse_bound(options["end"], end=True),
+                entry_types=options["entry_types"],
+                chunk_size=options["chunk_size"],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc)) from exc
+
+        if options["output"]:
+            rows = 0
+            with open(options["output"], "w", newline="", encoding="utf-8") as handle:
+                for line in exporter.stream(options["file_format"]):
+                    handle.write(line)
+                    rows += 1
+            if options["file_format"] == "csv":
+                rows -= 1
+            self.stderr.write(f"Exported {rows} ledger entries to {options['output']}.")
+        else:
+            for line in exporter.stream(options["file_format"]):
+                self.stdout.write(line, ending="")
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from payment.services.refunds import RefundQueue
+
+
+class Command(BaseCommand):
+    help = "Send due queued refunds to the gateway and sync the status of refunds in flight."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=100, help="Maximum refunds sent per run.")
+        parser.add_argument("--sync-limit", type=int, default=500, help="Maximum in-flight refunds polled per run.")
+        parser.add_argument("--skip-send", action="store_true", help="Only poll refunds already sent.")
+        parser.add_argument("--skip-sync", action="store_true", help="Only send queued refunds.")
+        parser.add_argument("--workers", type=int, default=None, help="Concurrent gateway calls.")
+        parser.add_argument("--rate", type=float, default=None, help="Maximum gateway calls per second.")
+
+    def handle(self, *args, **options):
+        queue = RefundQueue(
+            max_workers=options["workers"] or getattr(settings, "PAYOUT_BATCH_MAX_WORKERS", 4),
+            rate_per_second=options["rate"] or getattr(settings, "PAYOUT_BATCH_RATE_PER_SECOND", 5.0),
+            max_attempts=getattr(settings, "REFUND_MAX_ATTEMPTS", 5),
+            retry_base_seconds=getattr(settings, "REFUND_RETRY_BASE_SECONDS", 60),
+            lease_seconds=getattr(settings, "REFUND_LEASE_SECONDS", 300),
+        )
+
+        if not options["skip_send"]:
+            sent = queue.process_due(limit=options["limit"])
+            self.stdout.write(
+                self.style.SUCCESS(f"Refunds sent={sent.sent} retrying={sent.retried} failed={sent.failed}")
+            )
+        if not options["skip_sync"]:
+            synced = queue.sync_outstanding(limit=options["sync_limit"])
+            self.stdout.write(
+                self.style.SUCCESS(f"Refunds completed={len(synced.completed)} poll_errors={synced.failed}")
+            )
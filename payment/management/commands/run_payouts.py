@@ -0,0 +1,57 @@
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from payment.services.payouts import PayoutBatchService
+
+
+class Command(BaseCommand):
+    help = "Schedule a payout run for all available earnings and dispatch it to the gateway."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--schedule-only", action="store_true", help="Reserve earnings without calling the gateway.")
+        parser.add_argument("--dispatch", metavar="BATCH_ID", help="Dispatch an already scheduled batch.")
+        parser.add_argument(
+            "--recover-only",
+            action="store_true",
+            help="Only resolve payouts left PROCESSING by an interrupted dispatch.",
+        )
+        parser.add_argument("--workers", type=int, default=None, help="Concurrent gateway calls.")
+        parser.add_argument("--rate", type=float, default=None, help="Maximum gateway calls per second.")
+
+    def handle(self, *args, **options):
+        service = PayoutBatchService(
+            max_workers=options["workers"] or getattr(settings, "PAYOUT_BATCH_MAX_WORKERS", 4),
+            rate_per_second=options["rate"] or getattr(settings, "PAYOUT_BATCH_RATE_PER_SECOND", 5.0),
+        )
+
+        stale_after = timedelta(seconds=getattr(settings, "PAYOUT_STALE_PROCESSING_SECONDS", 1800))
+        if not options["schedule_only"] and not options["dispatch"]:
+            recovered = service.recover_stale(stale_after)
+            if recovered.completed or recovered.failed:
+                self.stdout.write(
+                    f"Recovered stale payouts: completed={recovered.completed} failed={recovered.failed} "
+                    f"amount={recovered.total_amount}"
+                )
+            if options["recover_only"]:
+                return
+
+        if options["dispatch"]:
+            try:
+                batch_id = uuid.UUID(options["dispatch"])
+            except ValueError as exc:
+                raise CommandError("BATCH_ID must be a UUID") from exc
+            result = service.dispatch_run(batch_id)
+        elif options["schedule_only"]:
+            result = service.schedule_run()
+        else:
+            result = service.run()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Batch {result.batch_id}: scheduled={result.scheduled} completed={result.completed} "
+                f"failed={result.failed} amount={result.total_amount}"
+            )
+        )
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from payment.services.settlement import SettlementEngine
+
+
+class Command(BaseCommand):
+    help = "Settle delivered payments in bulk: ledger entries, earnings and settlement metadata."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500, help="Payments settled per transaction.")
+        parser.add_argument("--limit", type=int, default=0, help="Maximum number of payments to settle (0 = all).")
+
+    def handle(self, *args, **options):
+        engine = SettlementEngine(chunk_size=options["chunk_size"])
+        payments = engine.eligible_payments().only("id")
+        if options["limit"]:
+            payments = payments[: options["limit"]]
+
+        result = engine.settle(payments)
+
+        for payment_id, reason in result.skipped.items():
+            self.stderr.write(f"Skipped payment {payment_id}: {reason}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Settled {len(result.settled)} payments "
+                f"({result.ledger_entries_created} ledger entries, {result.earnings_created} earnings), "
+                f"skipped {len(result.skipped)}."
+            )
+        )
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_user_balances(apps, schema_editor):
+    Earning = apps.get_model("payment", "Earning")
+    UserBalance = apps.get_model("payment", "UserBalance")
+
+    balances = {}
+    rows = Earning.objects.values("user_id", "status").annotate(total=Sum("amount")).order_by()
+    for row in rows:
+        balance = balances.setdefault(row["user_id"], UserBalance(user_id=row["user_id"]))
+        if row["status"] == "AVAILABLE":
+            balance.available = row["total"]
+        elif row["status"] == "PAID_OUT":
+            balance.paid_out = row["total"]
+    UserBalance.objects.bulk_create(balances.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0004_order_delivery_method'),
+        ('payment', '0004_rename_payment_earn_status_2f54a9_idx_payment_ear_status_14faf3_idx_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserBalance',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='balance', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('available', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('reserved', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('paid_out', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='payoutrequest',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='payoutrequest',
+            name='batch_id',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='payoutrequest',
+            name='scheduled_for',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='earning',
+            name='status',
+            field=models.CharField(choices=[('AVAILABLE', 'Available'), ('RESERVED', 'Reserved'), ('PAID_OUT', 'Paid Out')], default='AVAILABLE', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='payoutrequest',
+            name='status',
+            field=models.CharField(choices=[('REQUESTED', 'Requested'), ('SCHEDULED', 'Scheduled'), ('PROCESSING', 'Processing'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed'), ('REJECTED', 'Rejected')], default='REQUESTED', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='payoutrequest',
+            index=models.Index(fields=['batch_id', 'status'], name='payment_pay_batch_i_09b5b1_idx'),
+        ),
+        migrations.RunPython(backfill_user_balances, migrations.RunPython.noop),
+    ]
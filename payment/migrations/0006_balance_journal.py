@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:37
+
+import uuid
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def open_journal_from_balances(apps, schema_editor):
+    BalanceJournalEntry = apps.get_model("payment", "BalanceJournalEntry")
+    UserBalance = apps.get_model("payment", "UserBalance")
+
+    transaction_id = uuid.uuid4()
+    entries = []
+    for balance in UserBalance.objects.all().iterator():
+        legs = {
+            "AVAILABLE": balance.available,
+            "RESERVED": balance.reserved,
+            "PAID_OUT": balance.paid_out,
+        }
+        total = sum(legs.values())
+        if not total:
+            continue
+        entries.append(
+            BalanceJournalEntry(
+                transaction_id=transaction_id,
+                user_id=balance.user_id,
+                account="SETTLEMENT",
+                amount=-total,
+                reason="OPENING",
+            )
+        )
+        for account, amount in legs.items():
+            if amount:
+                entries.append(
+                    BalanceJournalEntry(
+                        transaction_id=transaction_id,
+                        user_id=balance.user_id,
+                        account=account,
+                        amount=amount,
+                        reason="OPENING",
+                    )
+                )
+    BalanceJournalEntry.objects.bulk_create(entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payment', '0005_payout_batches_and_user_balance'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='earning',
+            name='status',
+            field=models.CharField(choices=[('AVAILABLE', 'Available'), ('RESERVED', 'Reserved'), ('PAID_OUT', 'Paid Out'), ('REVERSED', 'Reversed')], default='AVAILABLE', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='BalanceJournalEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_id', models.UUIDField(db_index=True)),
+                ('account', models.CharField(choices=[('SETTLEMENT', 'Settlement'), ('AVAILABLE', 'Available'), ('RESERVED', 'Reserved'), ('PAID_OUT', 'Paid Out')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('reason', models.CharField(choices=[('OPENING', 'Opening Balance'), ('EARNING_RECORDED', 'Earning Recorded'), ('PAYOUT_RESERVED', 'Payout Reserved'), ('PAYOUT_RELEASED', 'Payout Released'), ('PAID_OUT', 'Paid Out'), ('REVERSED', 'Reversed')], max_length=30)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_journal', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'account'], name='payment_bal_user_id_ef553e_idx')],
+            },
+        ),
+        migrations.RunPython(open_journal_from_balances, migrations.RunPython.noop),
+    ]
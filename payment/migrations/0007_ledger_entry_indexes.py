@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0004_order_delivery_method'),
+        ('payment', '0006_balance_journal'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ledgerentry',
+            index=models.Index(fields=['payment', 'entry_type'], name='payment_led_payment_227d62_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ledgerentry',
+            index=models.Index(fields=['entry_type', 'created_at'], name='payment_led_entry_t_5c4b47_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ledgerentry',
+            index=models.Index(fields=['created_at'], name='payment_led_created_ae0902_idx'),
+        ),
+    ]
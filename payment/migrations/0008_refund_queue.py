@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:41
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_refunded_totals(apps, schema_editor):
+    Payment = apps.get_model("payment", "Payment")
+    Refund = apps.get_model("payment", "Refund")
+
+    totals = (
+        Refund.objects.filter(status="COMPLETED")
+        .values("payment_id")
+        .annotate(total=Sum("amount"))
+        .order_by()
+    )
+    payments = []
+    for row in totals:
+        payments.append(Payment(id=row["payment_id"], refunded_total=row["total"]))
+    Payment.objects.bulk_update(payments, ["refunded_total"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payment', '0007_ledger_entry_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='refunded_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='refund',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='refund',
+            name='last_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='refund',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='refund',
+            name='status',
+            field=models.CharField(choices=[('REQUESTED', 'Requested'), ('APPROVED', 'Approved'), ('QUEUED', 'Queued'), ('PROCESSING', 'Processing'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed'), ('REJECTED', 'Rejected')], default='REQUESTED', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='refund',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='payment_ref_status_2f0e0c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='refund',
+            index=models.Index(fields=['provider_reference'], name='payment_ref_provide_a806c1_idx'),
+        ),
+        migrations.RunPython(backfill_refunded_totals, migrations.RunPython.noop),
+    ]
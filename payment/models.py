@@ -45,6 +45,7 @@ class Payment(models.Model):
     )
 
     is_verified = models.BooleanField(default=False)
+    refunded_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
     metadata = models.JSONField(default=dict, blank=True)
 
@@ -65,6 +66,7 @@ class Refund(models.Model):
     class Status(models.TextChoices):
         REQUESTED = "REQUESTED", "Requested"
         APPROVED = "APPROVED", "Approved"
+        QUEUED = "QUEUED", "Queued"
         PROCESSING = "PROCESSING", "Processing"
         COMPLETED = "COMPLETED", "Completed"
         FAILED = "FAILED", "Failed"
@@ -100,11 +102,24 @@ class Refund(models.Model):
         null=True
     )
 
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    # Set while a RefundQueue worker is sending the refund to the gateway.
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
     metadata = models.JSONField(default=dict, blank=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+            models.Index(fields=["status", "locked_until"]),
+            models.Index(fields=["provider_reference"]),
+        ]
+
     def __str__(self):
         return f"Refund {self.id} - {self.status}"
 
@@ -163,6 +178,13 @@ class LedgerEntry(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["payment", "entry_type"]),
+            models.Index(fields=["entry_type", "created_at"]),
+            models.Index(fields=["created_at"]),
+        ]
+
     def __str__(self):
         return f"{self.entry_type} - {self.amount}"
 
@@ -171,6 +193,7 @@ class PayoutRequest(models.Model):
 
     class Status(models.TextChoices):
         REQUESTED = "REQUESTED", "Requested"
+        SCHEDULED = "SCHEDULED", "Scheduled"
         PROCESSING = "PROCESSING", "Processing"
         COMPLETED = "COMPLETED", "Completed"
         FAILED = "FAILED", "Failed"
@@ -188,6 +211,11 @@ class PayoutRequest(models.Model):
     payout_account = models.CharField(max_length=150, blank=True)
     provider_reference = models.CharField(max_length=150, blank=True, null=True)
 
+    # Scheduled payout runs group one request per user under a shared batch id.
+    batch_id = models.UUIDField(null=True, blank=True)
+    scheduled_for = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+
     metadata = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -196,6 +224,7 @@ class PayoutRequest(models.Model):
         indexes = [
             models.Index(fields=["status"]),
             models.Index(fields=["provider_reference"]),
+            models.Index(fields=["batch_id", "status"]),
         ]
 
 
@@ -203,7 +232,9 @@ class Earning(models.Model):
 
     class Status(models.TextChoices):
         AVAILABLE = "AVAILABLE", "Available"
+        RESERVED = "RESERVED", "Reserved"
         PAID_OUT = "PAID_OUT", "Paid Out"
+        REVERSED = "REVERSED", "Reversed"
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="earnings")
@@ -232,3 +263,69 @@ class Earning(models.Model):
             models.Index(fields=["status"]),
             models.Index(fields=["merchant_id_snapshot"]),
         ]
+
+
+class UserBalance(models.Model):
+    """Materialized per-user balances; the running totals of BalanceJournalEntry."""
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="balance",
+    )
+    available = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    reserved = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    paid_out = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user_id} - {self.available}"
+
+
+class BalanceJournalEntry(models.Model):
+    """
+    Append-only double-entry journal behind UserBalance.
+
+    Every balance movement writes two legs sharing a transaction_id whose
+    amounts sum to zero. SETTLEMENT is the external side money enters from
+    (earnings recorded) and returns to (earnings reversed).
+    """
+
+    class Account(models.TextChoices):
+        SETTLEMENT = "SETTLEMENT", "Settlement"
+        AVAILABLE = "AVAILABLE", "Available"
+        RESERVED = "RESERVED", "Reserved"
+        PAID_OUT = "PAID_OUT", "Paid Out"
+
+    class Reason(models.TextChoices):
+        OPENING = "OPENING", "Opening Balance"
+        EARNING_RECORDED = "EARNING_RECORDED", "Earning Recorded"
+        PAYOUT_RESERVED = "PAYOUT_RESERVED", "Payout Reserved"
+        PAYOUT_RELEASED = "PAYOUT_RELEASED", "Payout Released"
+        PAID_OUT = "PAID_OUT", "Paid Out"
+        REVERSED = "REVERSED", "Reversed"
+
+    transaction_id = models.UUIDField(db_index=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="balance_journal",
+    )
+    account = models.CharField(max_length=20, choices=Account.choices)
+    amount = models.DecimalField(max_digits=14, decimal_places=2)
+    reason = models.CharField(max_length=30, choices=Reason.choices)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "account"]),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Balance journal entries are append-only")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.user_id} {self.account} {self.amount}"
@@ -15,8 +15,6 @@ class RefundRequestSerializer(serializers.Serializer):
     reason = serializers.CharField(allow_blank=True, required=False)
 
     def validate(self, attrs):
-        from django.db import models as dj_models
-
         payment_id = attrs.get("payment_id")
         amount = attrs.get("amount")
 
@@ -26,11 +24,7 @@ class RefundRequestSerializer(serializers.Serializer):
         if payment.status != Payment.Status.COMPLETED:
             raise serializers.ValidationError("Only completed payments can be refunded")
 
-        total_refunded = (
-            Refund.objects.filter(payment=payment, status=Refund.Status.COMPLETED)
-            .aggregate(total=dj_models.Sum("amount"))["total"] or 0
-        )
-        if total_refunded + amount > payment.amount:
+        if payment.refunded_total + amount > payment.amount:
             raise serializers.ValidationError("Refund amount exceeds remaining refundable amount")
 
         attrs["payment"] = payment
@@ -0,0 +1,191 @@
+# payments/services/balances.py
+from __future__ import annotations
+
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from payment.models import BalanceJournalEntry, UserBalance
+
+Account = BalanceJournalEntry.Account
+Reason = BalanceJournalEntry.Reason
+
+# Journal accounts that are materialized as UserBalance columns.
+BALANCE_FIELDS = {
+    Account.AVAILABLE: "available",
+    Account.RESERVED: "reserved",
+    Account.PAID_OUT: "paid_out",
+}
+
+
+@dataclass
+class BalanceDrift:
+    user_id: str
+    field: str
+    expected: Decimal
+    actual: Decimal
+
+
+class BalanceService:
+    """
+    Double-entry balances for earnings.
+
+    Each operation moves money between two accounts of one or more users,
+    appending a debit and a credit leg to BalanceJournalEntry and applying the
+    same change to the materialized UserBalance row in one transaction.
+    Callers pass {user_id: amount} maps so a whole payout run or settlement
+    chunk is applied in one call.
+    """
+
+    @classmethod
+    def record_earnings(cls, amounts: Dict[Any, Decimal]) -> None:
+        cls._move(amounts, Account.SETTLEMENT, Account.AVAILABLE, Reason.EARNING_RECORDED)
+
+    @classmethod
+    def reverse_earnings(cls, amounts: Dict[Any, Decimal]) -> None:
+        cls._move(amounts, Account.AVAILABLE, Account.SETTLEMENT, Reason.REVERSED)
+
+    @classmethod
+    def reserve(cls, amounts: Dict[Any, Decimal]) -> None:
+        cls._move(amounts, Account.AVAILABLE, Account.RESERVED, Reason.PAYOUT_RESERVED)
+
+    @classmethod
+    def release(cls, amounts: Dict[Any, Decimal]) -> None:
+        cls._move(amounts, Account.RESERVED, Account.AVAILABLE, Reason.PAYOUT_RELEASED)
+
+    @classmethod
+    def pay_reserved(cls, amounts: Dict[Any, Decimal]) -> None:
+        cls._move(amounts, Account.RESERVED, Account.PAID_OUT, Reason.PAID_OUT)
+
+    @classmethod
+    def pay_available(cls, amounts: Dict[Any, Decimal]) -> None:
+        cls._move(amounts, Account.AVAILABLE, Account.PAID_OUT, Reason.PAID_OUT)
+
+    @staticmethod
+    def balance_for(user) -> UserBalance:
+        return UserBalance.objects.filter(user=user).first() or UserBalance(user=user)
+
+    @staticmethod
+    def available_for(user) -> Decimal:
+        value = UserBalance.objects.filter(user=user).values_list("available", flat=True).first()
+        return Decimal(str(value or "0.00"))
+
+    @staticmethod
+    def total_available() -> Decimal:
+        value = UserBalance.objects.aggregate(total=Sum("available"))["total"]
+        return Decimal(str(value or "0.00"))
+
+    # -----------------------------
+    # Consistency
+    # -----------------------------
+    @staticmethod
+    def journal_totals(user_ids: Optional[Iterable[Any]] = None) -> Dict[str, Dict[str, Decimal]]:
+        entries = BalanceJournalEntry.objects.filter(account__in=list(BALANCE_FIELDS))
+        if user_ids is not None:
+            entries = entries.filter(user_id__in=list(user_ids))
+        totals: Dict[str, Dict[str, Decimal]] = defaultdict(
+            lambda: {field: Decimal("0.00") for field in BALANCE_FIELDS.values()}
+        )
+        for row in entries.values("user_id", "account").annotate(total=Sum("amount")).order_by():
+            totals[str(row["user_id"])][BALANCE_FIELDS[row["account"]]] = Decimal(str(row["total"]))
+        return totals
+
+    @classmethod
+    def find_drift(cls, user_ids: Optional[Iterable[Any]] = None) -> List[BalanceDrift]:
+        """Compare every UserBalance row with the totals recomputed from the journal."""
+        expected = cls.journal_totals(user_ids)
+        balances = UserBalance.objects.all()
+        if user_ids is not None:
+            balances = balances.filter(user_id__in=list(user_ids))
+        actual = {
+            str(row["user_id"]): row
+            for row in balances.values("user_id", *BALANCE_FIELDS.values())
+        }
+
+        drift = []
+        for user_id in sorted(set(expected) | set(actual)):
+            for field in BALANCE_FIELDS.values():
+                want = expected[user_id][field] if user_id in expected else Decimal("0.00")
+                have = Decimal(str(actual[user_id][field])) if user_id in actual else Decimal("0.00")
+                if want != have:
+                    drift.append(BalanceDrift(user_id=user_id, field=field, expected=want, actual=have))
+        return drift
+
+    @staticmethod
+    def unbalanced_transactions() -> List[uuid.UUID]:
+        """Journal transactions whose legs do not sum to zero."""
+        return list(
+            BalanceJournalEntry.objects.values("transaction_id")
+            .annotate(total=Sum("amount"))
+            .exclude(total=0)
+            .order_by()
+            .values_list("transaction_id", flat=True)
+        )
+
+    @classmethod
+    @transaction.atomic
+    def rebuild(cls, user_ids: Iterable[Any]) -> int:
+        """Overwrite the given users' UserBalance rows with their journal totals."""
+        user_ids = {str(user_id) for user_id in user_ids}
+        if not user_ids:
+            return 0
+        expected = cls.journal_totals(user_ids)
+        cls._ensure_rows(user_ids)
+        balances = list(UserBalance.objects.select_for_update().filter(user_id__in=user_ids))
+        for balance in balances:
+            for field, value in expected[str(balance.user_id)].items():
+                setattr(balance, field, value)
+            balance.updated_at = timezone.now()
+        UserBalance.objects.bulk_update(balances, [*BALANCE_FIELDS.values(), "updated_at"], batch_size=1000)
+        return len(balances)
+
+    # -----------------------------
+    # Internals
+    # -----------------------------
+    @classmethod
+    @transaction.atomic
+    def _move(cls, amounts: Dict[Any, Decimal], source: str, target: str, reason: str) -> None:
+        normalized: Dict[str, Decimal] = {}
+        for user_id, amount in amounts.items():
+            normalized[str(user_id)] = normalized.get(str(user_id), Decimal("0.00")) + amount
+        amounts = {user_id: amount for user_id, amount in normalized.items() if amount}
+        if not amounts:
+            return
+
+        transaction_id = uuid.uuid4()
+        legs = []
+        for user_id, amount in amounts.items():
+            legs.append(
+                BalanceJournalEntry(
+                    transaction_id=transaction_id, user_id=user_id, account=source, amount=-amount, reason=reason
+                )
+            )
+            legs.append(
+                BalanceJournalEntry(
+                    transaction_id=transaction_id, user_id=user_id, account=target, amount=amount, reason=reason
+                )
+            )
+        BalanceJournalEntry.objects.bulk_create(legs, batch_size=1000)
+
+        cls._ensure_rows(amounts.keys())
+        now = timezone.now()
+        for user_id, amount in amounts.items():
+            changes = {"updated_at": now}
+            if target in BALANCE_FIELDS:
+                changes[BALANCE_FIELDS[target]] = F(BALANCE_FIELDS[target]) + amount
+            if source in BALANCE_FIELDS:
+                changes[BALANCE_FIELDS[source]] = F(BALANCE_FIELDS[source]) - amount
+            UserBalance.objects.filter(user_id=user_id).update(**changes)
+
+    @staticmethod
+    def _ensure_rows(user_ids) -> None:
+        UserBalance.objects.bulk_create(
+            [UserBalance(user_id=user_id) for user_id in set(user_ids)],
+            ignore_conflicts=True,
+        )
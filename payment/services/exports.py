@@ -0,0 +1,142 @@
+# payments/services/exports.py
+from __future__ import annotations
+
+import csv
+import json
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from django.db.models import QuerySet
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from payment.models import LedgerEntry
+
+
+class _EchoBuffer:
+    """File-like object whose write() hands the formatted line straight back."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+class LedgerExporter:
+    """
+    Streams LedgerEntry rows as CSV or NDJSON.
+
+    Rows are read with QuerySet.iterator(), which uses a server-side cursor on
+    PostgreSQL, and formatted one at a time so memory use does not depend on
+    the number of rows exported.
+    """
+
+    FORMATS = {
+        "csv": "text/csv",
+        "ndjson": "application/x-ndjson",
+    }
+    FIELDS = [
+        "id",
+        "created_at",
+        "entry_type",
+        "amount",
+        "order_id",
+        "order__order_number",
+        "payment_id",
+        "description",
+    ]
+    HEADERS = [
+        "id",
+        "created_at",
+        "entry_type",
+        "amount",
+        "order_id",
+        "order_number",
+        "payment_id",
+        "description",
+    ]
+
+    def __init__(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        entry_types: Optional[Iterable[str]] = None,
+        chunk_size: int = 2000,
+    ) -> None:
+        entry_types = list(entry_types or [])
+        unknown = set(entry_types) - set(LedgerEntry.EntryType.values)
+        if unknown:
+            raise ValueError(f"Unknown entry type: {', '.join(sorted(unknown))}")
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be greater than 0")
+        self.start = start
+        self.end = end
+        self.entry_types = entry_types
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def content_type(cls, file_format: str) -> str:
+        try:
+            return cls.FORMATS[file_format]
+        except KeyError:
+            raise ValueError(f"Unsupported export format: {file_format}") from None
+
+    @staticmethod
+    def parse_bound(value: Optional[str], end: bool = False) -> Optional[datetime]:
+        """Parse an ISO datetime or date; a bare end date includes that whole day."""
+        if not value:
+            return None
+        try:
+            day = parse_date(value)
+            parsed = None if day else parse_datetime(value)
+        except ValueError:
+            day = parsed = None
+        if day:
+            parsed = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+        elif parsed is None:
+            raise ValueError(f"Invalid date: {value}")
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+    def queryset(self) -> QuerySet:
+        qs = LedgerEntry.objects.all()
+        if self.start:
+            qs = qs.filter(created_at__gte=self.start)
+        if self.end:
+            qs = qs.filter(created_at__lt=self.end)
+        if self.entry_types:
+            qs = qs.filter(entry_type__in=self.entry_types)
+        return qs.order_by("created_at", "id").values_list(*self.FIELDS)
+
+    def rows(self) -> Iterator[Dict[str, Any]]:
+        for values in self.queryset().iterator(chunk_size=self.chunk_size):
+            yield dict(zip(self.HEADERS, values))
+
+    def stream(self, file_format: str) -> Iterator[str]:
+        self.content_type(file_format)
+        if file_format == "csv":
+            return self._stream_csv()
+        return self._stream_ndjson()
+
+    def _stream_csv(self) -> Iterator[str]:
+        writer = csv.writer(_EchoBuffer())
+        yield writer.writerow(self.HEADERS)
+        for row in self.rows():
+            yield writer.writerow([self._format(row[field]) for field in self.HEADERS])
+
+    def _stream_ndjson(self) -> Iterator[str]:
+        for row in self.rows():
+            yield json.dumps({key: self._format(value) for key, value in row.items()}) + "\n"
+
+    @staticmethod
+    def _format(value: Any) -> Any:
+        if value is None:
+            return None
+        if isinstance(value, datetime):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return str(value)
+        if not isinstance(value, (str, int)):
+            return str(value)
+        return value
+
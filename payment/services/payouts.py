@@ -0,0 +1,270 @@
+# payments/services/payouts.py
+from __future__ import annotations
+
+import logging
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.ratelimit import RateLimiter
+from payment.models import Earning, PayoutRequest
+
+from .balances import BalanceService
+from .service import PaymentService, PaymentServiceError
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PayoutRunResult:
+    batch_id: Optional[uuid.UUID] = None
+    scheduled: int = 0
+    completed: int = 0
+    failed: int = 0
+    total_amount: Decimal = Decimal("0.00")
+
+
+class PayoutBatchService:
+    """
+    Scheduled payout runs.
+
+    schedule_run() reserves every user's AVAILABLE earnings under one
+    PayoutRequest per user sharing a batch id. dispatch_run() then sends the
+    gateway payouts for that batch from a thread pool behind a shared rate
+    limiter, and settles or releases the reserved earnings with the outcome.
+    Each request is sent under a tx_id derived from its id, so
+    recover_stale() can look up, or safely re-send, requests a dead
+    dispatch left PROCESSING.
+    """
+
+    def __init__(
+        self,
+        service: Optional[PaymentService] = None,
+        max_workers: int = 4,
+        rate_per_second: float = 5.0,
+        min_amount: Decimal = Decimal("0.01"),
+    ) -> None:
+        self.service = service or PaymentService()
+        self.max_workers = max(1, max_workers)
+        self.limiter = RateLimiter(rate_per_second)
+        self.min_amount = min_amount
+
+    @staticmethod
+    def tx_id(payout_request: PayoutRequest) -> str:
+        return f"BAT-{payout_request.id.hex[:20].upper()}"
+
+    def run(self) -> PayoutRunResult:
+        result = self.schedule_run()
+        if result.scheduled:
+            dispatched = self.dispatch_run(result.batch_id)
+            result.completed = dispatched.completed
+            result.failed = dispatched.failed
+        return result
+
+    @transaction.atomic
+    def schedule_run(self, scheduled_for: Optional[datetime] = None) -> PayoutRunResult:
+        batch_id = uuid.uuid4()
+        result = PayoutRunResult(batch_id=batch_id)
+
+        earnings_by_user: Dict[Any, List[Any]] = defaultdict(list)
+        totals: Dict[Any, Decimal] = defaultdict(lambda: Decimal("0.00"))
+        for earning_id, user_id, amount in (
+            Earning.objects.select_for_update()
+            .filter(status=Earning.Status.AVAILABLE)
+            .values_list("id", "user_id", "amount")
+        ):
+            earnings_by_user[user_id].append(earning_id)
+            totals[user_id] += amount
+
+        payout_requests = [
+            PayoutRequest(
+                user_id=user_id,
+                amount=PaymentService._money(total),
+                status=PayoutRequest.Status.SCHEDULED,
+                batch_id=batch_id,
+                scheduled_for=scheduled_for or timezone.now(),
+                metadata={"earning_count": len(earnings_by_user[user_id])},
+            )
+            for user_id, total in totals.items()
+            if total >= self.min_amount
+        ]
+        PayoutRequest.objects.bulk_create(payout_requests)
+
+        for payout_request in payout_requests:
+            Earning.objects.filter(id__in=earnings_by_user[payout_request.user_id]).update(
+                status=Earning.Status.RESERVED,
+                payout_request=payout_request,
+                updated_at=timezone.now(),
+            )
+        BalanceService.reserve({pr.user_id: pr.amount for pr in payout_requests})
+
+        result.scheduled = len(payout_requests)
+        result.total_amount = sum((pr.amount for pr in payout_requests), Decimal("0.00"))
+        return result
+
+    def dispatch_run(self, batch_id: uuid.UUID) -> PayoutRunResult:
+        result = PayoutRunResult(batch_id=batch_id)
+        payout_requests = list(
+            PayoutRequest.objects.select_related("user").filter(
+                batch_id=batch_id,
+                status=PayoutRequest.Status.SCHEDULED,
+            )
+        )
+        if not payout_requests:
+            return result
+
+        PayoutRequest.objects.filter(id__in=[pr.id for pr in payout_requests]).update(
+            status=PayoutRequest.Status.PROCESSING,
+            attempts=F("attempts") + 1,
+            updated_at=timezone.now(),
+        )
+        targets = self.service.resolve_payout_targets([pr.user for pr in payout_requests])
+
+        # Worker threads only talk to the gateway; all database writes happen here.
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {
+                pool.submit(self._send, payout_request, targets[str(payout_request.user_id)]): payout_request
+                for payout_request in payout_requests
+            }
+            for future in as_completed(futures):
+                payout_request = futures[future]
+                try:
+                    payout_result = future.result()
+                except Exception as exc:
+                    logger.warning("Batch payout failed payout_request=%s: %s", payout_request.id, exc)
+                    self._fail(payout_request, exc)
+                    result.failed += 1
+                else:
+                    self._complete(payout_request, payout_result)
+                    result.completed += 1
+                    result.total_amount += payout_request.amount
+        return result
+
+    def _send(self, payout_request: PayoutRequest, target: Any) -> Dict[str, Any]:
+        if isinstance(target, Exception):
+            raise target
+        self.limiter.acquire()
+        tx_id = self.tx_id(payout_request)
+        response = self.service.payout_to_customer(
+            amount=payout_request.amount,
+            payment_reason="Scheduled earnings payout",
+            phone_number=target["account"],
+            payment_method=target["method"],
+            tx_id=tx_id,
+        )
+        return {
+            "tx_id": tx_id,
+            "method": target["method"],
+            "account": target["account"],
+            "provider_response": response,
+        }
+
+    def recover_stale(self, older_than: timedelta) -> PayoutRunResult:
+        """
+        Resolve batch payouts a dispatch left PROCESSING for longer than older_than.
+
+        The gateway is asked for the status of each request's tx_id: paid
+        requests are completed, failed ones release their earnings, and
+        requests the gateway has no status for are scheduled again and
+        re-dispatched under the same tx_id. Requests still pending at the
+        gateway are left for a later run.
+        """
+        result = PayoutRunResult()
+        stale = self._claim_stale(timezone.now() - older_than)
+        if not stale:
+            return result
+
+        redispatch: Dict[uuid.UUID, List[uuid.UUID]] = defaultdict(list)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self._fetch_status, payout_request): payout_request for payout_request in stale}
+            for future in as_completed(futures):
+                payout_request = futures[future]
+                try:
+                    status_data = future.result()
+                except Exception as exc:
+                    logger.warning("Stale payout status poll failed payout_request=%s: %s", payout_request.id, exc)
+                    redispatch[payout_request.batch_id].append(payout_request.id)
+                    continue
+                gateway_status = self.service._extract_gateway_status(status_data)
+                if gateway_status in {"SUCCESS", "COMPLETED", "PAID"}:
+                    self._complete(
+                        payout_request,
+                        {"tx_id": self.tx_id(payout_request), "provider_response": status_data},
+                    )
+                    result.completed += 1
+                    result.total_amount += payout_request.amount
+                elif gateway_status in {"FAILED", "CANCELLED"}:
+                    self._fail(payout_request, PaymentServiceError(f"Gateway reported {gateway_status}"))
+                    result.failed += 1
+
+        for batch_id, payout_request_ids in redispatch.items():
+            PayoutRequest.objects.filter(id__in=payout_request_ids, status=PayoutRequest.Status.PROCESSING).update(
+                status=PayoutRequest.Status.SCHEDULED,
+                updated_at=timezone.now(),
+            )
+            dispatched = self.dispatch_run(batch_id)
+            result.completed += dispatched.completed
+            result.failed += dispatched.failed
+            result.total_amount += dispatched.total_amount
+        return result
+
+    @transaction.atomic
+    def _claim_stale(self, cutoff: datetime) -> List[PayoutRequest]:
+        stale_ids = list(
+            PayoutRequest.objects.select_for_update(skip_locked=True)
+            .filter(status=PayoutRequest.Status.PROCESSING, batch_id__isnull=False, updated_at__lte=cutoff)
+            .values_list("id", flat=True)
+        )
+        if not stale_ids:
+            return []
+        # Touching updated_at keeps a concurrent recovery run from picking the same requests.
+        PayoutRequest.objects.filter(id__in=stale_ids).update(updated_at=timezone.now())
+        return list(PayoutRequest.objects.select_related("user").filter(id__in=stale_ids))
+
+    def _fetch_status(self, payout_request: PayoutRequest) -> Dict[str, Any]:
+        self.limiter.acquire()
+        return self.service.get_transaction_status(self.tx_id(payout_request))
+
+    @transaction.atomic
+    def _complete(self, payout_request: PayoutRequest, payout_result: Dict[str, Any]) -> None:
+        payout_request.status = PayoutRequest.Status.COMPLETED
+        payout_request.payout_method = payout_result.get("method", "")
+        payout_request.payout_account = payout_result.get("account", "")
+        payout_request.provider_reference = (payout_result.get("provider_response") or {}).get("id")
+        payout_request.metadata = {**(payout_request.metadata or {}), "payout_result": payout_result}
+        payout_request.save(
+            update_fields=[
+                "status",
+                "payout_method",
+                "payout_account",
+                "provider_reference",
+                "metadata",
+                "updated_at",
+            ]
+        )
+        Earning.objects.filter(payout_request=payout_request, status=Earning.Status.RESERVED).update(
+            status=Earning.Status.PAID_OUT,
+            updated_at=timezone.now(),
+        )
+        BalanceService.pay_reserved({payout_request.user_id: payout_request.amount})
+
+    @transaction.atomic
+    def _fail(self, payout_request: PayoutRequest, error: Exception) -> None:
+        payout_request.status = PayoutRequest.Status.FAILED
+        payout_request.metadata = {**(payout_request.metadata or {}), "error": str(error)}
+        payout_request.save(update_fields=["status", "metadata", "updated_at"])
+        Earning.objects.filter(payout_request=payout_request, status=Earning.Status.RESERVED).update(
+            status=Earning.Status.AVAILABLE,
+            payout_request=None,
+            updated_at=timezone.now(),
+        )
+        BalanceService.release({payout_request.user_id: payout_request.amount})
+
@@ -0,0 +1,249 @@
+# payments/services/refunds.py
+from __future__ import annotations
+
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from core.ratelimit import RateLimiter
+from notifications.services import NotificationService, NotificationTemplates
+from payment.models import Refund
+
+from .service import PaymentService
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RefundRunResult:
+    sent: int = 0
+    retried: int = 0
+    failed: int = 0
+    completed: List[str] = field(default_factory=list)
+
+
+class RefundQueue:
+    """
+    Asynchronous refund execution.
+
+    Views and admin actions only enqueue refunds. process_due() sends due
+    QUEUED refunds to the gateway from a thread pool, rescheduling failures
+    with exponential backoff until max_attempts. sync_outstanding() polls
+    the status of refunds already sent and applies the results.
+
+    Claimed refunds hold a lease of lease_seconds. A PROCESSING refund with
+    no provider_reference whose lease expired was claimed by a worker that
+    died before recording the gateway response, so it is claimed and sent
+    again; the gateway tx_id is derived from the refund, so a resend of a
+    refund that did go through is recognised rather than paid twice.
+
+    A due refund larger than what is left of its payment can never succeed,
+    so it is marked FAILED with the reason before it is claimed instead of
+    being retried.
+    """
+
+    def __init__(
+        self,
+        service: Optional[PaymentService] = None,
+        max_workers: int = 4,
+        rate_per_second: float = 5.0,
+        max_attempts: int = 5,
+        retry_base_seconds: int = 60,
+        lease_seconds: int = 300,
+    ) -> None:
+        self.service = service or PaymentService()
+        self.max_workers = max(1, max_workers)
+        self.limiter = RateLimiter(rate_per_second)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base_seconds = retry_base_seconds
+        self.lease = timedelta(seconds=max(1, lease_seconds))
+
+    @staticmethod
+    def enqueue(refund: Refund) -> Refund:
+        refund.status = Refund.Status.QUEUED
+        refund.attempts = 0
+        refund.next_attempt_at = timezone.now()
+        refund.last_error = ""
+        refund.save(update_fields=["status", "attempts", "next_attempt_at", "last_error", "updated_at"])
+        return refund
+
+    def retry_delay(self, attempts: int) -> timedelta:
+        return timedelta(seconds=self.retry_base_seconds * (2 ** max(0, attempts - 1)))
+
+    # -----------------------------
+    # Execution
+    # -----------------------------
+    def process_due(self, limit: int = 100) -> RefundRunResult:
+        result = RefundRunResult()
+        result.failed += self._fail_exceeding(limit)
+        refunds = self._claim_due(limit)
+        if not refunds:
+            return result
+
+        targets = self.service.resolve_payout_targets(
+            [refund.requested_by or refund.payment.user for refund in refunds]
+        )
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {
+                pool.submit(self._send, refund, targets[str(refund.requested_by_id or refund.payment.user_id)]): refund
+                for refund in refunds
+            }
+            for future in as_completed(futures):
+                refund = futures[future]
+                try:
+                    response = future.result()
+                except Exception as exc:
+                    if self._reschedule(refund, exc):
+                        result.retried += 1
+                    else:
+                        result.failed += 1
+                else:
+                    self._mark_sent(refund, response)
+                    result.sent += 1
+        return result
+
+    @staticmethod
+    def _due(now) -> Q:
+        return Q(status=Refund.Status.QUEUED, next_attempt_at__lte=now) | Q(
+            status=Refund.Status.PROCESSING, locked_until__lte=now, provider_reference__isnull=True
+        )
+
+    @transaction.atomic
+    def _fail_exceeding(self, limit: int) -> int:
+        now = timezone.now()
+        error = "Refund exceeds original payment amount"
+        exceeding_ids = list(
+            Refund.objects.select_for_update(skip_locked=True)
+            .filter(self._due(now), amount__gt=F("payment__amount") - F("payment__refunded_total"))
+            .values_list("id", flat=True)[:limit]
+        )
+        for refund_id in exceeding_ids:
+            logger.warning("Refund %s failed: %s", refund_id, error)
+        return Refund.objects.filter(id__in=exceeding_ids).update(
+            status=Refund.Status.FAILED,
+            next_attempt_at=None,
+            locked_until=None,
+            last_error=error,
+            updated_at=now,
+        )
+
+    @transaction.atomic
+    def _claim_due(self, limit: int) -> List[Refund]:
+        now = timezone.now()
+        due_ids = list(
+            Refund.objects.select_for_update(skip_locked=True)
+            .filter(self._due(now))
+            .order_by("next_attempt_at")
+            .values_list("id", flat=True)[:limit]
+        )
+        if not due_ids:
+            return []
+        Refund.objects.filter(id__in=due_ids).update(
+            status=Refund.Status.PROCESSING,
+            attempts=F("attempts") + 1,
+            locked_until=now + self.lease,
+            updated_at=now,
+        )
+        return list(
+            Refund.objects.select_related("payment__order", "payment__user", "requested_by").filter(id__in=due_ids)
+        )
+
+    def _send(self, refund: Refund, target: Any) -> Dict[str, Any]:
+        if isinstance(target, Exception):
+            raise target
+        payment = refund.payment
+        if payment.refunded_total + refund.amount > payment.amount:
+            raise ValueError("Refund exceeds original payment amount")
+        self.limiter.acquire()
+        return self.service.payout_to_customer(
+            amount=refund.amount,
+            payment_reason=refund.reason or f"Refund for order {payment.order.order_number}",
+            phone_number=target["account"],
+            payment_method=(refund.metadata or {}).get("payment_method") or target["method"],
+            # Stable per refund so a retried send is recognisable at the gateway.
+            tx_id=f"REF-{payment.id}-{refund.id.hex[:8].upper()}",
+        )
+
+    def _mark_sent(self, refund: Refund, response: Dict[str, Any]) -> None:
+        metadata = dict(refund.metadata or {})
+        metadata.setdefault("provider_response", {})
+        metadata["provider_response"].update(response)
+        refund.provider_reference = response.get("id")
+        refund.metadata = metadata
+        refund.next_attempt_at = None
+        refund.locked_until = None
+        refund.last_error = ""
+        refund.save(
+            update_fields=["provider_reference", "metadata", "next_attempt_at", "locked_until", "last_error", "updated_at"]
+        )
+
+    def _reschedule(self, refund: Refund, error: Exception) -> bool:
+        attempts = refund.attempts
+        refund.last_error = str(error)
+        if attempts >= self.max_attempts:
+            logger.warning("Refund %s failed after %s attempts: %s", refund.id, attempts, error)
+            refund.status = Refund.Status.FAILED
+            refund.next_attempt_at = None
+            retried = False
+        else:
+            logger.info("Refund %s attempt %s failed, retrying: %s", refund.id, attempts, error)
+            refund.status = Refund.Status.QUEUED
+            refund.next_attempt_at = timezone.now() + self.retry_delay(attempts)
+            retried = True
+        refund.locked_until = None
+        refund.save(update_fields=["status", "next_attempt_at", "locked_until", "last_error", "updated_at"])
+        return retried
+
+    # -----------------------------
+    # Status sync
+    # -----------------------------
+    def sync_outstanding(self, limit: int = 500) -> RefundRunResult:
+        result = RefundRunResult()
+        refunds = list(
+            Refund.objects.select_related("payment__order", "payment__user", "requested_by")
+            .filter(status=Refund.Status.PROCESSING, provider_reference__isnull=False)
+            .exclude(provider_reference="")
+            .order_by("updated_at")[:limit]
+        )
+        if not refunds:
+            return result
+
+        # Worker threads only poll the gateway; statuses are applied here.
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self._fetch_status, refund): refund for refund in refunds}
+            for future in as_completed(futures):
+                refund = futures[future]
+                try:
+                    status_data = future.result()
+                except Exception as exc:
+                    logger.warning("Refund status poll failed refund=%s: %s", refund.id, exc)
+                    result.failed += 1
+                    continue
+                if self.service.apply_refund_status(refund, status_data):
+                    result.completed.append(str(refund.id))
+                    self._notify_completed(refund)
+        return result
+
+    def _fetch_status(self, refund: Refund) -> Dict[str, Any]:
+        self.limiter.acquire()
+        return self.service.get_transaction_status(refund.provider_reference)
+
+    @staticmethod
+    def _notify_completed(refund: Refund) -> None:
+        try:
+            title, message, payload = NotificationTemplates.refund_completed(refund.payment.order, refund)
+            NotificationService.notify(
+                user=refund.requested_by or refund.payment.user,
+                notification_type="refund_completed",
+                title=title,
+                message=message,
+                payload=payload,
+            )
+        except Exception:
+            logger.exception("Failed to send refund_completed notification refund=%s", refund.id)
@@ -6,16 +6,18 @@ import uuid
 import time
 from dataclasses import dataclass
 from decimal import Decimal, ROUND_HALF_UP
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import transaction, models
+from django.utils import timezone
 
 from catalog.models import ProductVariant
-from order.models import Order
+from order.models import Order, OrderItem
 from payment.models import Earning, LedgerEntry, Payment, Refund, PayoutRequest
 from account.models import PaymentMethod
+from .balances import BalanceService
 from .santimpay_sdk import SantimpaySDK
 User = get_user_model()
 
@@ -179,73 +181,82 @@ class PaymentService:
         payment: Payment,
         amount: Decimal,
         reason: str,
-        payment_method: str
+        payment_method: Optional[str] = None,
     ) -> Refund:
         """
         Initiate partial or full refund.
+
+        The refund is queued; process_refund_queue sends it to the gateway.
         """
+        payment = Payment.objects.select_for_update().get(pk=payment.pk)
         if payment.status != Payment.Status.COMPLETED:
             raise PaymentServiceError("Only completed payments can be refunded")
-
-        total_refunded = (
-            Refund.objects.filter(payment=payment, status=Refund.Status.COMPLETED)
-            .aggregate(total=models.Sum("amount"))["total"] or 0
-        )
-        if total_refunded + amount > payment.amount:
+        if payment.refunded_total + amount > payment.amount:
             raise PaymentServiceError("Refund exceeds original payment amount")
 
         refund = Refund.objects.create(
             payment=payment,
             amount=amount,
-            status=Refund.Status.PROCESSING,
+            status=Refund.Status.QUEUED,
             reason=reason,
-            requested_by=payment.user
-        )
-
-        # Call SantimPay payout
-        response = self.payout_to_customer(
-            amount=amount,
-            payment_reason=f"Refund for order {payment.order.order_number}",
-            phone_number=payment.user.phone,
-            payment_method=payment_method,
-            tx_id=f"REF-{payment.id}-{uuid.uuid4().hex[:8].upper()}"
+            requested_by=payment.user,
+            next_attempt_at=timezone.now(),
+            metadata={"payment_method": payment_method} if payment_method else {},
         )
-
-        refund.provider_reference = response.get("id")
-        refund.save(update_fields=["provider_reference"])
-
         return refund
 
-    @transaction.atomic
     def sync_refund_status(self, refund: Refund) -> Dict[str, Any]:
         if not refund.provider_reference:
             raise PaymentServiceError("Refund has no transaction reference")
 
         status_data = self.get_transaction_status(refund.provider_reference)
+        self.apply_refund_status(refund, status_data)
+        return status_data
+
+    @transaction.atomic
+    def apply_refund_status(self, refund: Refund, status_data: Dict[str, Any]) -> bool:
+        """
+        Apply a gateway status to a refund. Returns True when this call completed it.
+
+        Completed amounts are added to Payment.refunded_total with an F()
+        update under the refund's row lock, so concurrent syncs of the same
+        refund count it once.
+        """
+        previous_status = (
+            Refund.objects.select_for_update().filter(pk=refund.pk).values_list("status", flat=True).first()
+        )
         gateway_status = self._extract_gateway_status(status_data)
 
         if gateway_status in {"SUCCESS", "COMPLETED", "PAID"}:
             refund.status = Refund.Status.COMPLETED
         elif gateway_status in {"FAILED", "CANCELLED"}:
             refund.status = Refund.Status.FAILED
+        else:
+            refund.status = previous_status or refund.status
 
         refund.save(update_fields=["status", "updated_at"])
 
+        completed = previous_status != Refund.Status.COMPLETED and refund.status == Refund.Status.COMPLETED
+        if not completed:
+            return False
+
         # Update payment and order if fully refunded
-        payment = refund.payment
-        total_refunded = (
-            Refund.objects.filter(payment=payment, status=Refund.Status.COMPLETED)
-            .aggregate(total=models.Sum("amount"))["total"] or 0
+        Payment.objects.filter(pk=refund.payment_id).update(
+            refunded_total=models.F("refunded_total") + refund.amount,
+            updated_at=timezone.now(),
         )
-        if total_refunded >= payment.amount:
+        payment = Payment.objects.select_related("order").get(pk=refund.payment_id)
+        refund.payment = payment
+        if payment.refunded_total >= payment.amount:
             payment.status = Payment.Status.REFUNDED
             payment.save(update_fields=["status", "updated_at"])
 
             order = payment.order
             order.status = Order.Status.REFUNDED
             order.save(update_fields=["status", "updated_at"])
+            self.reverse_settlement_earnings(payment)
 
-        return status_data
+        return True
 
     # -----------------------------
     # Webhook / Sync
@@ -295,15 +306,47 @@ class PaymentService:
         if settlement.get("prepared") is True:
             return settlement
 
+        items = self._settlement_items(payment)
+        supplier_user = self._resolve_supplier_user(payment, settlement, items=items)
+        platform_user = self._resolve_platform_user()
+        settlement_result, ledger_entries = self.build_split_settlement(
+            payment,
+            items,
+            supplier_user_id=supplier_user.id if supplier_user else None,
+            platform_user_id=platform_user.id if platform_user else None,
+        )
+
+        for entry_type, amount, description in ledger_entries:
+            self._ensure_ledger_entry(
+                payment=payment,
+                entry_type=entry_type,
+                amount=amount,
+                description=description,
+            )
+
+        meta["settlement"] = settlement_result
+        payment.metadata = meta
+        payment.save(update_fields=["metadata", "updated_at"])
+        return settlement_result
+
+    def build_split_settlement(
+        self,
+        payment: Payment,
+        items: List[OrderItem],
+        supplier_user_id: Optional[Any],
+        platform_user_id: Optional[Any],
+    ) -> Tuple[Dict[str, Any], List[Tuple[str, Decimal, str]]]:
+        """
+        Compute the settlement split for a payment from already-loaded order items.
+        Returns the settlement metadata and the ledger entries it implies as
+        (entry_type, amount, description) tuples. Performs no queries.
+        """
         total_amount = self._to_decimal(payment.amount)
         commission_rate = Decimal("0.10")
         commission_amount = self._money(total_amount * commission_rate)
-        supplier_amount = self._calculate_supplier_amount(payment)
-        shop_owner_expected_amount = self._calculate_shop_owner_expected_amount(payment)
-
-        dropshipper_user = payment.order.shop.owner
-        supplier_user = self._resolve_supplier_user(payment, settlement)
-        platform_user = self._resolve_platform_user()
+        supplier_amount = self._calculate_supplier_amount(payment, items=items)
+        shop_owner_expected_amount = self._calculate_shop_owner_expected_amount(payment, items=items)
+        dropshipper_user_id = payment.order.shop.owner_id
 
         dropshipper_amount = self._money(
             total_amount - commission_amount - supplier_amount
@@ -315,10 +358,10 @@ class PaymentService:
 
         allocations: Dict[str, Dict[str, Any]] = {}
 
-        def add_allocation(user: Optional[User], amount: Decimal, role: str) -> None:
-            if not user or amount <= Decimal("0.00"):
+        def add_allocation(user_id: Optional[Any], amount: Decimal, role: str) -> None:
+            if not user_id or amount <= Decimal("0.00"):
                 return
-            key = str(user.id)
+            key = str(user_id)
             existing = allocations.get(key)
             if existing:
                 existing["amount"] = str(self._money(self._to_decimal(existing["amount"]) + amount))
@@ -331,40 +374,26 @@ class PaymentService:
                 "roles": [role],
             }
 
-        if supplier_amount > 0 and not supplier_user:
+        if supplier_amount > 0 and not supplier_user_id:
             raise PaymentServiceError("Supplier payout amount exists but supplier user is not configured")
 
-        add_allocation(supplier_user, supplier_amount, "SUPPLIER")
-        add_allocation(dropshipper_user, dropshipper_amount, "SHOP_OWNER")
-        if platform_user:
-            add_allocation(platform_user, commission_amount, "PLATFORM")
-
-        self._ensure_ledger_entry(
-            payment=payment,
-            entry_type=LedgerEntry.EntryType.PAYMENT,
-            amount=total_amount,
-            description="Customer payment settled",
-        )
-        self._ensure_ledger_entry(
-            payment=payment,
-            entry_type=LedgerEntry.EntryType.COMMISSION,
-            amount=commission_amount,
-            description=f"Platform commission ({commission_rate * Decimal('100')}%)",
-        )
+        add_allocation(supplier_user_id, supplier_amount, "SUPPLIER")
+        add_allocation(dropshipper_user_id, dropshipper_amount, "SHOP_OWNER")
+        if platform_user_id:
+            add_allocation(platform_user_id, commission_amount, "PLATFORM")
+
+        ledger_entries: List[Tuple[str, Decimal, str]] = [
+            (LedgerEntry.EntryType.PAYMENT, total_amount, "Customer payment settled"),
+            (
+                LedgerEntry.EntryType.COMMISSION,
+                commission_amount,
+                f"Platform commission ({commission_rate * Decimal('100')}%)",
+            ),
+        ]
         if supplier_amount > 0:
-            self._ensure_ledger_entry(
-                payment=payment,
-                entry_type=LedgerEntry.EntryType.VENDOR_PAYOUT,
-                amount=-supplier_amount,
-                description="Supplier payout",
-            )
+            ledger_entries.append((LedgerEntry.EntryType.VENDOR_PAYOUT, -supplier_amount, "Supplier payout"))
         if dropshipper_amount > 0:
-            self._ensure_ledger_entry(
-                payment=payment,
-                entry_type=LedgerEntry.EntryType.VENDOR_PAYOUT,
-                amount=-dropshipper_amount,
-                description="Dropshipper payout",
-            )
+            ledger_entries.append((LedgerEntry.EntryType.VENDOR_PAYOUT, -dropshipper_amount, "Dropshipper payout"))
 
         settlement_result: Dict[str, Any] = {
             "prepared": True,
@@ -373,18 +402,15 @@ class PaymentService:
             "commission_rate": str(commission_rate),
             "total_amount": str(total_amount),
             "commission_amount": str(commission_amount),
-            "platform_user_id": str(platform_user.id) if platform_user else None,
-            "supplier_user_id": str(supplier_user.id) if supplier_user else None,
+            "platform_user_id": str(platform_user_id) if platform_user_id else None,
+            "supplier_user_id": str(supplier_user_id) if supplier_user_id else None,
             "supplier_amount": str(supplier_amount),
-            "dropshipper_user_id": str(dropshipper_user.id),
+            "dropshipper_user_id": str(dropshipper_user_id),
             "shop_owner_expected_amount": str(shop_owner_expected_amount),
             "dropshipper_amount": str(dropshipper_amount),
             "allocations": allocations,
         }
-        meta["settlement"] = settlement_result
-        payment.metadata = meta
-        payment.save(update_fields=["metadata", "updated_at"])
-        return settlement_result
+        return settlement_result, ledger_entries
 
     @transaction.atomic
     def record_settlement_earnings(self, payment: Payment) -> Dict[str, Any]:
@@ -395,6 +421,13 @@ class PaymentService:
             return settlement
 
         allocations = settlement.get("allocations", {})
+        previous = {
+            str(user_id): (amount, status)
+            for user_id, amount, status in Earning.objects.filter(payment=payment).values_list(
+                "user_id", "amount", "status"
+            )
+        }
+        balance_changes: Dict[str, Decimal] = {}
         for alloc in allocations.values():
             user_id = alloc.get("user_id")
             if not user_id:
@@ -405,6 +438,11 @@ class PaymentService:
             amount = self._money(self._to_decimal(alloc.get("amount", "0")))
             if amount <= Decimal("0.00"):
                 continue
+            previous_amount, previous_status = previous.get(str(user.id), (Decimal("0.00"), None))
+            if previous_status not in (None, Earning.Status.AVAILABLE):
+                # Never put reserved or paid out earnings back into the available pool.
+                continue
+            balance_changes[str(user.id)] = amount - previous_amount
             roles = alloc.get("roles", [])
             role_value = "/".join(roles) if roles else ""
             Earning.objects.update_or_create(
@@ -420,6 +458,8 @@ class PaymentService:
                 },
             )
 
+        BalanceService.record_earnings(balance_changes)
+
         settlement["earnings_recorded"] = True
         meta = dict(payment.metadata or {})
         meta["settlement"] = settlement
@@ -427,6 +467,21 @@ class PaymentService:
         payment.save(update_fields=["metadata", "updated_at"])
         return settlement
 
+    @transaction.atomic
+    def reverse_settlement_earnings(self, payment: Payment) -> Decimal:
+        """Take a refunded payment's unpaid earnings back out of the available balances."""
+        earnings = list(
+            Earning.objects.select_for_update().filter(payment=payment, status=Earning.Status.AVAILABLE)
+        )
+        if not earnings:
+            return Decimal("0.00")
+        Earning.objects.filter(id__in=[e.id for e in earnings]).update(status=Earning.Status.REVERSED)
+        amounts: Dict[Any, Decimal] = {}
+        for earning in earnings:
+            amounts[earning.user_id] = amounts.get(earning.user_id, Decimal("0.00")) + earning.amount
+        BalanceService.reverse_earnings(amounts)
+        return self._money(sum(amounts.values(), Decimal("0.00")))
+
     @transaction.atomic
     def request_total_user_payout(self, user: User) -> PayoutRequest:
         earnings = list(
@@ -485,6 +540,7 @@ class PaymentService:
             status=Earning.Status.PAID_OUT,
             payout_request=payout_request,
         )
+        BalanceService.pay_available({user.id: total_amount})
         return payout_request
 
     @transaction.atomic
@@ -584,14 +640,15 @@ class PaymentService:
         if settlement.get("processed") is True:
             return settlement
 
+        items = self._settlement_items(payment)
         total_amount = self._to_decimal(payment.amount)
         commission_rate = Decimal("0.10")
         commission_amount = self._money(total_amount * commission_rate)
-        supplier_amount = self._calculate_supplier_amount(payment)
-        shop_owner_expected_amount = self._calculate_shop_owner_expected_amount(payment)
+        supplier_amount = self._calculate_supplier_amount(payment, items=items)
+        shop_owner_expected_amount = self._calculate_shop_owner_expected_amount(payment, items=items)
 
         dropshipper_user = payment.order.shop.owner
-        supplier_user = self._resolve_supplier_user(payment, settlement)
+        supplier_user = self._resolve_supplier_user(payment, settlement, items=items)
 
         dropshipper_amount = self._money(
             total_amount - commission_amount - supplier_amount
@@ -856,25 +913,51 @@ class PaymentService:
     def _money(value: Decimal) -> Decimal:
         return value.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
 
-    def _resolve_supplier_user(self, payment: Payment, settlement_meta: Dict[str, Any]) -> Optional[User]:
+    @staticmethod
+    def _settlement_items(payment: Payment) -> List[OrderItem]:
+        return list(payment.order.items.select_related("product", "variant__product").all())
+
+    @staticmethod
+    def _item_product(item: OrderItem):
+        return item.product if item.product else (item.variant.product if item.variant else None)
+
+    def resolve_supplier_user_id(
+        self,
+        payment: Payment,
+        settlement_meta: Dict[str, Any],
+        items: List[OrderItem],
+    ) -> Optional[str]:
         supplier_id = settlement_meta.get("supplier_user_id")
         if supplier_id:
-            return User.objects.filter(id=supplier_id).first()
+            return str(supplier_id)
 
         payment_supplier_id = (payment.metadata or {}).get("supplier_user_id")
         if payment_supplier_id:
-            return User.objects.filter(id=payment_supplier_id).first()
+            return str(payment_supplier_id)
 
         supplier_ids = set()
-        for item in payment.order.items.select_related("product", "variant__product").all():
-            product = item.product if item.product else (item.variant.product if item.variant else None)
+        for item in items:
+            product = self._item_product(item)
             if product and getattr(product, "supplier_id", None):
                 supplier_ids.add(str(product.supplier_id))
         if len(supplier_ids) == 1:
-            return User.objects.filter(id=supplier_ids.pop()).first()
+            return supplier_ids.pop()
         return None
 
-    def _calculate_supplier_amount(self, payment: Payment) -> Decimal:
+    def _resolve_supplier_user(
+        self,
+        payment: Payment,
+        settlement_meta: Dict[str, Any],
+        items: Optional[List[OrderItem]] = None,
+    ) -> Optional[User]:
+        if items is None:
+            items = self._settlement_items(payment)
+        supplier_id = self.resolve_supplier_user_id(payment, settlement_meta, items)
+        if not supplier_id:
+            return None
+        return User.objects.filter(id=supplier_id).first()
+
+    def _calculate_supplier_amount(self, payment: Payment, items: Optional[List[OrderItem]] = None) -> Decimal:
         settlement = (payment.metadata or {}).get("settlement", {})
         explicit_supplier_amount = settlement.get("supplier_amount") or (payment.metadata or {}).get("supplier_amount")
         if explicit_supplier_amount is not None:
@@ -883,9 +966,11 @@ class PaymentService:
                 raise PaymentServiceError("supplier_amount cannot be negative")
             return amount
 
+        if items is None:
+            items = self._settlement_items(payment)
         total = Decimal("0.00")
-        for item in payment.order.items.select_related("product", "variant").all():
-            product = item.product if item.product else (item.variant.product if item.variant else None)
+        for item in items:
+            product = self._item_product(item)
             if not product:
                 continue
             supplier_price = product.supplier_price if product.supplier_price is not None else item.price
@@ -894,10 +979,16 @@ class PaymentService:
             total += self._to_decimal(supplier_price) * Decimal(str(item.quantity))
         return self._money(total)
 
-    def _calculate_shop_owner_expected_amount(self, payment: Payment) -> Decimal:
+    def _calculate_shop_owner_expected_amount(
+        self,
+        payment: Payment,
+        items: Optional[List[OrderItem]] = None,
+    ) -> Decimal:
+        if items is None:
+            items = self._settlement_items(payment)
         total = Decimal("0.00")
-        for item in payment.order.items.select_related("product", "variant").all():
-            product = item.product if item.product else (item.variant.product if item.variant else None)
+        for item in items:
+            product = self._item_product(item)
             if not product:
                 continue
             owner_price = product.shop_owner_price if product.shop_owner_price is not None else item.price
@@ -926,6 +1017,27 @@ class PaymentService:
         preferred = list(
             PaymentMethod.objects.filter(shop_owner=user).order_by("created_at")
         )
+        return self.payout_target_from_methods(user, preferred)
+
+    def resolve_payout_targets(self, users: List[User]) -> Dict[str, Any]:
+        """
+        Resolve payout destinations for many users with a single PaymentMethod query.
+        Values are target dicts, or the PaymentServiceError raised for that user.
+        """
+        methods_by_user: Dict[str, List[PaymentMethod]] = {}
+        for payment_method in PaymentMethod.objects.filter(shop_owner__in=users).order_by("created_at"):
+            methods_by_user.setdefault(str(payment_method.shop_owner_id), []).append(payment_method)
+
+        targets: Dict[str, Any] = {}
+        for user in users:
+            try:
+                targets[str(user.id)] = self.payout_target_from_methods(user, methods_by_user.get(str(user.id), []))
+            except PaymentServiceError as exc:
+                targets[str(user.id)] = exc
+        return targets
+
+    @staticmethod
+    def payout_target_from_methods(user: User, preferred: List[PaymentMethod]) -> Dict[str, str]:
         for payment_method in preferred:
             if payment_method.payment_type == "BANK" and payment_method.account_number:
                 return {"method": "BANK", "account": payment_method.account_number}
@@ -0,0 +1,210 @@
+# payments/services/settlement.py
+from __future__ import annotations
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from order.models import Order, OrderItem
+from payment.models import Earning, LedgerEntry, Payment
+
+from .balances import BalanceService
+from .service import PaymentService, PaymentServiceError
+
+User = get_user_model()
+
+
+@dataclass
+class BatchSettlementResult:
+    settled: List[str] = field(default_factory=list)
+    skipped: Dict[str, str] = field(default_factory=dict)
+    ledger_entries_created: int = 0
+    earnings_created: int = 0
+
+
+class SettlementEngine:
+    """
+    Settles many delivered payments in one pass.
+
+    Produces the same ledger entries, earnings and settlement metadata as
+    PaymentService.record_settlement_earnings, but loads order items, suppliers
+    and existing rows per chunk instead of per payment and writes with bulk_create.
+    """
+
+    def __init__(self, service: Optional[PaymentService] = None, chunk_size: int = 500) -> None:
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be greater than 0")
+        self.service = service or PaymentService()
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def eligible_payments() -> QuerySet:
+        return (
+            Payment.objects.filter(
+                status=Payment.Status.COMPLETED,
+                order__status=Order.Status.DELIVERED,
+            )
+            .exclude(metadata__settlement__earnings_recorded=True)
+            .order_by("created_at")
+        )
+
+    def settle(self, payments: Iterable[Payment]) -> BatchSettlementResult:
+        result = BatchSettlementResult()
+        payment_ids = [payment.pk for payment in payments]
+        for start in range(0, len(payment_ids), self.chunk_size):
+            self._settle_chunk(payment_ids[start:start + self.chunk_size], result)
+        return result
+
+    @transaction.atomic
+    def _settle_chunk(self, payment_ids: List[Any], result: BatchSettlementResult) -> None:
+        payments = list(
+            Payment.objects.select_for_update(of=("self",))
+            .select_related("order__shop")
+            .filter(id__in=payment_ids)
+            .order_by("created_at")
+        )
+        if not payments:
+            return
+
+        items_by_order: Dict[Any, List[OrderItem]] = defaultdict(list)
+        for item in OrderItem.objects.select_related("product", "variant__product").filter(
+            order_id__in={payment.order_id for payment in payments}
+        ):
+            items_by_order[item.order_id].append(item)
+
+        supplier_ids: Dict[Any, Optional[str]] = {}
+        for payment in payments:
+            settlement = (payment.metadata or {}).get("settlement", {})
+            supplier_ids[payment.pk] = self.service.resolve_supplier_user_id(
+                payment, settlement, items_by_order[payment.order_id]
+            )
+        existing_user_ids = self._existing_user_ids(supplier_ids.values())
+
+        platform_user = self.service._resolve_platform_user()
+        platform_user_id = platform_user.id if platform_user else None
+
+        existing_ledger: Set[Tuple[Any, str, str]] = set(
+            LedgerEntry.objects.filter(payment_id__in=payment_ids).values_list(
+                "payment_id", "entry_type", "description"
+            )
+        )
+        existing_earnings: Set[Tuple[Any, str]] = {
+            (payment_id, str(user_id))
+            for payment_id, user_id in Earning.objects.filter(payment_id__in=payment_ids).values_list(
+                "payment_id", "user_id"
+            )
+        }
+
+        now = timezone.now()
+        new_ledger: List[LedgerEntry] = []
+        new_earnings: List[Earning] = []
+        updated_payments: List[Payment] = []
+
+        for payment in payments:
+            if payment.status != Payment.Status.COMPLETED or payment.order.status != Order.Status.DELIVERED:
+                result.skipped[str(payment.pk)] = "Payment is not completed or order is not delivered"
+                continue
+
+            meta = dict(payment.metadata or {})
+            settlement = meta.get("settlement", {})
+            if settlement.get("earnings_recorded") is True:
+                result.skipped[str(payment.pk)] = "Earnings already recorded"
+                continue
+
+            if settlement.get("prepared") is not True:
+                supplier_id = supplier_ids[payment.pk]
+                if supplier_id not in existing_user_ids:
+                    supplier_id = None
+                try:
+                    settlement, ledger_entries = self.service.build_split_settlement(
+                        payment,
+                        items_by_order[payment.order_id],
+                        supplier_user_id=supplier_id,
+                        platform_user_id=platform_user_id,
+                    )
+                except PaymentServiceError as exc:
+                    result.skipped[str(payment.pk)] = str(exc)
+                    continue
+                for entry_type, amount, description in ledger_entries:
+                    key = (payment.pk, entry_type, description)
+                    if key in existing_ledger:
+                        continue
+                    existing_ledger.add(key)
+                    new_ledger.append(
+                        LedgerEntry(
+                            order_id=payment.order_id,
+                            payment=payment,
+                            entry_type=entry_type,
+                            amount=amount,
+                            description=description,
+                        )
+                    )
+
+            new_earnings.extend(self._build_earnings(payment, settlement, existing_earnings))
+
+            settlement["earnings_recorded"] = True
+            meta["settlement"] = settlement
+            payment.metadata = meta
+            payment.updated_at = now
+            updated_payments.append(payment)
+            result.settled.append(str(payment.pk))
+
+        self._drop_unknown_users(new_earnings)
+        LedgerEntry.objects.bulk_create(new_ledger, batch_size=self.chunk_size)
+        Earning.objects.bulk_create(new_earnings, batch_size=self.chunk_size)
+        earned: Dict[Any, Decimal] = defaultdict(lambda: Decimal("0.00"))
+        for earning in new_earnings:
+            earned[earning.user_id] += earning.amount
+        BalanceService.record_earnings(earned)
+        Payment.objects.bulk_update(updated_payments, ["metadata", "updated_at"], batch_size=self.chunk_size)
+        result.ledger_entries_created += len(new_ledger)
+        result.earnings_created += len(new_earnings)
+
+    def _build_earnings(
+        self,
+        payment: Payment,
+        settlement: Dict[str, Any],
+        existing_earnings: Set[Tuple[Any, str]],
+    ) -> List[Earning]:
+        earnings = []
+        for alloc in settlement.get("allocations", {}).values():
+            user_id = alloc.get("user_id")
+            if not user_id or (payment.pk, str(user_id)) in existing_earnings:
+                continue
+            amount = self.service._money(self.service._to_decimal(alloc.get("amount", "0")))
+            if amount <= Decimal("0.00"):
+                continue
+            roles = alloc.get("roles", [])
+            existing_earnings.add((payment.pk, str(user_id)))
+            earnings.append(
+                Earning(
+                    user_id=user_id,
+                    payment=payment,
+                    order_id=payment.order_id,
+                    amount=amount,
+                    role="/".join(roles) if roles else "",
+                    merchant_id_snapshot="",
+                    status=Earning.Status.AVAILABLE,
+                    metadata={"allocation": alloc},
+                )
+            )
+        return earnings
+
+    @staticmethod
+    def _existing_user_ids(user_ids: Iterable[Optional[str]]) -> Set[str]:
+        candidates = {user_id for user_id in user_ids if user_id}
+        if not candidates:
+            return set()
+        return {str(pk) for pk in User.objects.filter(id__in=candidates).values_list("id", flat=True)}
+
+    def _drop_unknown_users(self, earnings: List[Earning]) -> None:
+        # Allocations may reference users deleted since the settlement was prepared;
+        # the per-payment path skips those, so the batch path does too.
+        known = self._existing_user_ids(str(earning.user_id) for earning in earnings)
+        earnings[:] = [earning for earning in earnings if str(earning.user_id) in known]
@@ -1,14 +1,26 @@
+import csv
+import json
+from datetime import timedelta
 from decimal import Decimal
+from io import StringIO
 from unittest.mock import Mock, patch
 
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework.test import APIClient
 
 from account.models import User
 from catalog.models import Category, Product, ProductVariant
 from order.models import Order, OrderItem
-from payment.models import Earning, Payment, Refund
-from payment.services.service import PaymentService, PaymentServiceError
+from payment.models import Earning, LedgerEntry, Payment, PayoutRequest, Refund, UserBalance
+from payment.services.balances import BalanceService
+from payment.services.payouts import PayoutBatchService
+from payment.services.refunds import RefundQueue
+from payment.services.service import PaymentGatewayError, PaymentService, PaymentServiceError
+from payment.services.settlement import SettlementEngine
 from payment.services.santimpay_sdk import SantimpaySDK
 from shop.models import Shop
 
@@ -313,6 +325,146 @@ class PaymentLifecycleLogicTests(TestCase):
             any(call.kwargs.get("notification_type") == "refund_completed" for call in mock_notify.call_args_list)
         )
 
+    @patch("payment.services.service.PaymentService.payout_to_customer")
+    def test_refund_execute_queues_without_calling_gateway(self, mock_payout):
+        Payment.objects.filter(pk=self.payment.pk).update(status=Payment.Status.COMPLETED)
+        admin = User.objects.create_user(email="admin@shop.com", password="Pass123!", role="CUSTOMER", is_staff=True)
+        refund = Refund.objects.create(
+            payment=self.payment,
+            amount=Decimal("40.00"),
+            status=Refund.Status.APPROVED,
+            requested_by=self.customer,
+        )
+        self.client.force_authenticate(admin)
+
+        response = self.client.post(f"/payment/refunds/{refund.id}/execute/")
+
+        self.assertEqual(response.status_code, 202, response.data)
+        self.assertEqual(response.data["status"], Refund.Status.QUEUED)
+        mock_payout.assert_not_called()
+
+    @patch("payment.services.service.PaymentService.payout_to_customer")
+    def test_refund_queue_sends_due_refunds_and_retries_failures(self, mock_payout):
+        Payment.objects.filter(pk=self.payment.pk).update(status=Payment.Status.COMPLETED)
+        mock_payout.return_value = {"id": "REFUND-REF-1"}
+        service = PaymentService(merchant_id="TEST-MERCHANT-ID")
+        queue = RefundQueue(service=service, rate_per_second=0, max_attempts=2, retry_base_seconds=30)
+        refund = service.initiate_refund(self.payment, Decimal("40.00"), "Damaged item")
+
+        # The customer has no payout destination yet, so the first attempt is rescheduled.
+        result = queue.process_due()
+        refund.refresh_from_db()
+        self.assertEqual(result.retried, 1)
+        self.assertEqual(refund.status, Refund.Status.QUEUED)
+        self.assertEqual(refund.attempts, 1)
+        self.assertIn("No payout destination", refund.last_error)
+        self.assertGreater(refund.next_attempt_at, timezone.now() + timedelta(seconds=25))
+        self.assertEqual(queue.process_due().sent, 0)
+
+        User.objects.filter(pk=self.customer.pk).update(phone_number="0911999999")
+        Refund.objects.filter(pk=refund.pk).update(next_attempt_at=timezone.now())
+        result = queue.process_due()
+        refund.refresh_from_db()
+        self.assertEqual(result.sent, 1)
+        self.assertEqual(refund.status, Refund.Status.PROCESSING)
+        self.assertEqual(refund.provider_reference, "REFUND-REF-1")
+        self.assertEqual(mock_payout.call_args.kwargs["phone_number"], "0911999999")
+
+    @patch("payment.services.service.PaymentService.payout_to_customer")
+    def test_refund_claimed_by_a_dead_worker_is_sent_again_after_the_lease(self, mock_payout):
+        Payment.objects.filter(pk=self.payment.pk).update(status=Payment.Status.COMPLETED)
+        User.objects.filter(pk=self.customer.pk).update(phone_number="0911999999")
+        mock_payout.return_value = {"id": "REFUND-REF-2"}
+        service = PaymentService(merchant_id="TEST-MERCHANT-ID")
+        queue = RefundQueue(service=service, rate_per_second=0)
+        refund = service.initiate_refund(self.payment, Decimal("40.00"), "Damaged item")
+
+        # The worker dies after claiming, before the gateway response is recorded.
+        self.assertEqual(len(queue._claim_due(limit=10)), 1)
+        self.assertEqual(queue.process_due().sent, 0)
+
+        Refund.objects.filter(pk=refund.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        result = queue.process_due()
+
+        refund.refresh_from_db()
+        self.assertEqual(result.sent, 1)
+        self.assertEqual(refund.status, Refund.Status.PROCESSING)
+        self.assertEqual(refund.provider_reference, "REFUND-REF-2")
+        self.assertIsNone(refund.locked_until)
+        self.assertEqual(refund.attempts, 2)
+        self.assertEqual(mock_payout.call_args.kwargs["tx_id"], f"REF-{self.payment.id}-{refund.id.hex[:8].upper()}")
+        # Sent refunds are left to sync_outstanding, not claimed again.
+        Refund.objects.filter(pk=refund.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(queue.process_due().sent, 0)
+
+    @patch("payment.services.service.PaymentService.payout_to_customer")
+    def test_refund_queue_fails_after_max_attempts(self, mock_payout):
+        Payment.objects.filter(pk=self.payment.pk).update(status=Payment.Status.COMPLETED)
+        mock_payout.side_effect = PaymentGatewayError("gateway down")
+        User.objects.filter(pk=self.customer.pk).update(phone_number="0911999999")
+        service = PaymentService(merchant_id="TEST-MERCHANT-ID")
+        queue = RefundQueue(service=service, rate_per_second=0, max_attempts=1)
+        refund = service.initiate_refund(self.payment, Decimal("40.00"), "Damaged item")
+
+        result = queue.process_due()
+
+        refund.refresh_from_db()
+        self.assertEqual(result.failed, 1)
+        self.assertEqual(refund.status, Refund.Status.FAILED)
+        self.assertEqual(refund.last_error, "gateway down")
+
+    @patch("payment.services.service.PaymentService.payout_to_customer")
+    def test_refund_exceeding_the_payment_fails_without_retrying(self, mock_payout):
+        Payment.objects.filter(pk=self.payment.pk).update(status=Payment.Status.COMPLETED)
+        User.objects.filter(pk=self.customer.pk).update(phone_number="0911999999")
+        service = PaymentService(merchant_id="TEST-MERCHANT-ID")
+        queue = RefundQueue(service=service, rate_per_second=0, max_attempts=5)
+        refund = service.initiate_refund(self.payment, Decimal("40.00"), "Damaged item")
+        # Another refund completed after this one was queued.
+        Payment.objects.filter(pk=self.payment.pk).update(refunded_total=self.payment.amount - Decimal("10.00"))
+
+        result = queue.process_due()
+
+        refund.refresh_from_db()
+        self.assertEqual((result.failed, result.retried, result.sent), (1, 0, 0))
+        self.assertEqual(refund.status, Refund.Status.FAILED)
+        self.assertEqual(refund.last_error, "Refund exceeds original payment amount")
+        self.assertEqual(refund.attempts, 0)
+        self.assertIsNone(refund.next_attempt_at)
+        mock_payout.assert_not_called()
+
+    @patch("payment.services.refunds.NotificationService.notify")
+    @patch("payment.services.service.PaymentService.get_transaction_status")
+    def test_sync_outstanding_refunds_maintains_refunded_total(self, mock_status, mock_notify):
+        Payment.objects.filter(pk=self.payment.pk).update(status=Payment.Status.COMPLETED)
+        first = Refund.objects.create(
+            payment=self.payment,
+            amount=Decimal("40.00"),
+            status=Refund.Status.PROCESSING,
+            provider_reference="TXN-REFUND-A",
+        )
+        Refund.objects.create(
+            payment=self.payment,
+            amount=Decimal("200.00"),
+            status=Refund.Status.PROCESSING,
+            provider_reference="TXN-REFUND-B",
+        )
+        mock_status.return_value = {"status": "SUCCESS"}
+        queue = RefundQueue(service=PaymentService(merchant_id="TEST-MERCHANT-ID"), rate_per_second=0)
+
+        result = queue.sync_outstanding()
+
+        self.assertEqual(len(result.completed), 2)
+        self.assertEqual(mock_notify.call_count, 2)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.refunded_total, Decimal("240.00"))
+        self.assertEqual(self.payment.status, Payment.Status.REFUNDED)
+
+        # Re-applying a completed status does not count the refund twice.
+        PaymentService(merchant_id="TEST-MERCHANT-ID").apply_refund_status(first, {"status": "SUCCESS"})
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.refunded_total, Decimal("240.00"))
+
     def test_prepare_and_settle_split_payout_blocked_before_delivery(self):
         self.payment.status = Payment.Status.COMPLETED
         self.payment.save(update_fields=["status", "updated_at"])
@@ -366,3 +518,386 @@ class SantimPaySdkSignerTests(TestCase):
             "Payment for a coffee",
         )
 
+
+@override_settings(
+    SANTIMPAY_PRIVATE_KEY="dummy-private-key",
+    SANTIMPAY_MERCHANT_ID="TEST-MERCHANT-ID",
+    SANTIMPAY_TEST_BED=True,
+    SANTIMPAY_NOTIFY_URL="http://localhost:8000/payment/webhook/santimpay/",
+)
+class SettlementEngineTests(TestCase):
+    def setUp(self):
+        self.shop_owner = User.objects.create_user(
+            email="owner_batch@shop.com",
+            password="Pass123!",
+            role="SHOP_OWNER",
+        )
+        self.supplier = User.objects.create_user(
+            email="supplier_batch@shop.com",
+            password="Pass123!",
+            role="SUPPLIER",
+        )
+        self.customer = User.objects.create_user(
+            email="customer_batch@shop.com",
+            password="Pass123!",
+            role="CUSTOMER",
+        )
+        self.shop = Shop.objects.create(name="Batch Shop", owner=self.shop_owner)
+        self.product = Product.objects.create(
+            name="Batch Product",
+            shop=self.shop,
+            supplier=self.supplier,
+            price=Decimal("120.00"),
+            supplier_price=Decimal("80.00"),
+            minimum_wholesale_quantity=1,
+        )
+        self.service = PaymentService(merchant_id="TEST-MERCHANT-ID")
+
+    def _create_delivered_payment(self, index: int) -> Payment:
+        order = Order.objects.create(
+            order_number=f"ORD-BATCH-{index:03d}",
+            user=self.customer,
+            shop=self.shop,
+            status=Order.Status.DELIVERED,
+            subtotal=Decimal("240.00"),
+            total_amount=Decimal("240.00"),
+            payment_method="santimpay",
+            delivery_address="addr",
+        )
+        OrderItem.objects.create(
+            order=order,
+            product=self.product,
+            variant=None,
+            product_name=self.product.name,
+            sku=self.product.sku,
+            price=Decimal("120.00"),
+            quantity=2,
+            total=Decimal("240.00"),
+        )
+        return Payment.objects.create(
+            order=order,
+            user=self.customer,
+            amount=Decimal("240.00"),
+            status=Payment.Status.COMPLETED,
+            provider="SANTIMPAY",
+            provider_reference=f"TXN-BATCH-{index}",
+        )
+
+    def test_batch_settlement_matches_single_payment_settlement(self):
+        single = self._create_delivered_payment(0)
+        batched = self._create_delivered_payment(1)
+        self.service.record_settlement_earnings(single)
+
+        result = SettlementEngine(service=self.service).settle([batched])
+
+        self.assertEqual(result.settled, [str(batched.id)])
+        single.refresh_from_db()
+        batched.refresh_from_db()
+        self.assertEqual(batched.metadata["settlement"], single.metadata["settlement"])
+        self.assertEqual(
+            sorted(LedgerEntry.objects.filter(payment=batched).values_list("entry_type", "amount", "description")),
+            sorted(LedgerEntry.objects.filter(payment=single).values_list("entry_type", "amount", "description")),
+        )
+        self.assertEqual(
+            sorted(Earning.objects.filter(payment=batched).values_list("user_id", "amount", "role")),
+            sorted(Earning.objects.filter(payment=single).values_list("user_id", "amount", "role")),
+        )
+
+    def test_batch_settlement_is_idempotent(self):
+        payments = [self._create_delivered_payment(i) for i in range(3)]
+        engine = SettlementEngine(service=self.service, chunk_size=2)
+
+        first = engine.settle(payments)
+        second = engine.settle(payments)
+
+        self.assertEqual(len(first.settled), 3)
+        self.assertEqual(first.earnings_created, 6)
+        self.assertEqual(second.settled, [])
+        self.assertEqual(len(second.skipped), 3)
+        self.assertEqual(Earning.objects.count(), 6)
+        self.assertEqual(LedgerEntry.objects.count(), 12)
+        self.assertFalse(engine.eligible_payments().exists())
+
+    def test_batch_settlement_query_count_does_not_grow_with_batch_size(self):
+        engine = SettlementEngine(service=self.service)
+        small = [self._create_delivered_payment(i) for i in range(2)]
+        large = [self._create_delivered_payment(i) for i in range(10, 16)]
+
+        with CaptureQueriesContext(connection) as small_queries:
+            engine.settle(small)
+        with CaptureQueriesContext(connection) as large_queries:
+            engine.settle(large)
+
+        self.assertEqual(len(small_queries), len(large_queries))
+        self.assertEqual(Earning.objects.filter(payment__in=large).count(), 12)
+
+    def test_batch_settlement_skips_undelivered_payments(self):
+        payment = self._create_delivered_payment(0)
+        Order.objects.filter(pk=payment.order_id).update(status=Order.Status.SHIPPED)
+
+        result = SettlementEngine(service=self.service).settle([payment])
+
+        self.assertIn(str(payment.id), result.skipped)
+        self.assertFalse(Earning.objects.filter(payment=payment).exists())
+
+
+@override_settings(
+    SANTIMPAY_PRIVATE_KEY="dummy-private-key",
+    SANTIMPAY_MERCHANT_ID="TEST-MERCHANT-ID",
+    SANTIMPAY_TEST_BED=True,
+    SANTIMPAY_NOTIFY_URL="http://localhost:8000/payment/webhook/santimpay/",
+)
+class PayoutBatchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.shop_owner = User.objects.create_user(
+            email="owner_run@shop.com",
+            password="Pass123!",
+            role="SHOP_OWNER",
+            phone_number="0911000001",
+        )
+        self.supplier = User.objects.create_user(
+            email="supplier_run@shop.com",
+            password="Pass123!",
+            role="SUPPLIER",
+            phone_number="0911000002",
+        )
+        self.customer = User.objects.create_user(
+            email="customer_run@shop.com",
+            password="Pass123!",
+            role="CUSTOMER",
+        )
+        self.shop = Shop.objects.create(name="Run Shop", owner=self.shop_owner)
+        self.product = Product.objects.create(
+            name="Run Product",
+            shop=self.shop,
+            supplier=self.supplier,
+            price=Decimal("120.00"),
+            supplier_price=Decimal("80.00"),
+            minimum_wholesale_quantity=1,
+        )
+        self.service = PaymentService(merchant_id="TEST-MERCHANT-ID")
+        for index in range(2):
+            order = Order.objects.create(
+                order_number=f"ORD-RUN-{index:03d}",
+                user=self.customer,
+                shop=self.shop,
+                status=Order.Status.DELIVERED,
+                subtotal=Decimal("240.00"),
+                total_amount=Decimal("240.00"),
+                payment_method="santimpay",
+                delivery_address="addr",
+            )
+            OrderItem.objects.create(
+                order=order,
+                product=self.product,
+                variant=None,
+                product_name=self.product.name,
+                sku=self.product.sku,
+                price=Decimal("120.00"),
+                quantity=2,
+                total=Decimal("240.00"),
+            )
+            payment = Payment.objects.create(
+                order=order,
+                user=self.customer,
+                amount=Decimal("240.00"),
+                status=Payment.Status.COMPLETED,
+                provider="SANTIMPAY",
+                provider_reference=f"TXN-RUN-{index}",
+            )
+            self.service.record_settlement_earnings(payment)
+
+    def test_settlement_maintains_available_balance(self):
+        self.assertEqual(UserBalance.objects.get(user=self.supplier).available, Decimal("320.00"))
+        self.assertEqual(UserBalance.objects.get(user=self.shop_owner).available, Decimal("112.00"))
+
+    def test_schedule_run_groups_earnings_per_user(self):
+        result = PayoutBatchService(service=self.service).schedule_run()
+
+        self.assertEqual(result.scheduled, 2)
+        payout = PayoutRequest.objects.get(batch_id=result.batch_id, user=self.supplier)
+        self.assertEqual(payout.status, PayoutRequest.Status.SCHEDULED)
+        self.assertEqual(payout.amount, Decimal("320.00"))
+        self.assertEqual(payout.earning_items.filter(status=Earning.Status.RESERVED).count(), 2)
+        balance = UserBalance.objects.get(user=self.supplier)
+        self.assertEqual(balance.available, Decimal("0.00"))
+        self.assertEqual(balance.reserved, Decimal("320.00"))
+
+    @patch("payment.services.service.PaymentService.payout_to_customer")
+    def test_dispatch_run_pays_each_user_once(self, mock_payout):
+        mock_payout.return_value = {"id": "BATCH-REF"}
+
+        result = PayoutBatchService(service=self.service, max_workers=2, rate_per_second=0).run()
+
+        self.assertEqual(result.completed, 2)
+        self.assertEqual(mock_payout.call_count, 2)
+        self.assertEqual(
+            PayoutRequest.objects.filter(batch_id=result.batch_id, status=PayoutRequest.Status.COMPLETED).count(),
+            2,
+        )
+        self.assertFalse(Earning.objects.exclude(status=Earning.Status.PAID_OUT).exists())
+        balance = UserBalance.objects.get(user=self.supplier)
+        self.assertEqual(balance.reserved, Decimal("0.00"))
+        self.assertEqual(balance.paid_out, Decimal("320.00"))
+
+    @patch("payment.services.service.PaymentService.payout_to_customer")
+    def test_failed_dispatch_releases_reserved_earnings(self, mock_payout):
+        mock_payout.side_effect = PaymentGatewayError("gateway down")
+
+        result = PayoutBatchService(service=self.service, rate_per_second=0).run()
+
+        self.assertEqual(result.failed, 2)
+        self.assertEqual(Earning.objects.filter(status=Earning.Status.AVAILABLE, payout_request=None).count(), 4)
+        balance = UserBalance.objects.get(user=self.supplier)
+        self.assertEqual(balance.available, Decimal("320.00"))
+        self.assertEqual(balance.reserved, Decimal("0.00"))
+
+    @patch("payment.services.service.PaymentService.payout_to_customer")
+    @patch("payment.services.service.PaymentService.get_transaction_status")
+    def test_stale_processing_payouts_are_completed_or_resent(self, mock_status, mock_payout):
+        batch = PayoutBatchService(service=self.service, rate_per_second=0)
+        batch_id = batch.schedule_run().batch_id
+        # A dispatch claimed the batch and died before recording any outcome.
+        PayoutRequest.objects.filter(batch_id=batch_id).update(
+            status=PayoutRequest.Status.PROCESSING,
+            attempts=1,
+            updated_at=timezone.now() - timedelta(hours=1),
+        )
+        paid = PayoutRequest.objects.get(batch_id=batch_id, user=self.supplier)
+        unknown = PayoutRequest.objects.get(batch_id=batch_id, user=self.shop_owner)
+
+        def status(tx_id):
+            if tx_id == PayoutBatchService.tx_id(paid):
+                return {"status": "SUCCESS", "id": "BATCH-PAID"}
+            raise PaymentGatewayError("transaction not found")
+
+        mock_status.side_effect = status
+        mock_payout.return_value = {"id": "BATCH-RESENT"}
+
+        self.assertEqual(batch.recover_stale(timedelta(hours=2)).completed, 0)
+        result = batch.recover_stale(timedelta(minutes=30))
+
+        self.assertEqual((result.completed, result.failed), (2, 0))
+        self.assertEqual(mock_payout.call_count, 1)
+        self.assertEqual(mock_payout.call_args.kwargs["tx_id"], PayoutBatchService.tx_id(unknown))
+        self.assertEqual(
+            dict(PayoutRequest.objects.filter(batch_id=batch_id).values_list("user_id", "provider_reference")),
+            {self.supplier.id: "BATCH-PAID", self.shop_owner.id: "BATCH-RESENT"},
+        )
+        self.assertFalse(Earning.objects.exclude(status=Earning.Status.PAID_OUT).exists())
+        self.assertEqual(UserBalance.objects.get(user=self.supplier).paid_out, Decimal("320.00"))
+        self.assertEqual(BalanceService.find_drift(), [])
+
+    def test_payout_history_reads_maintained_balance(self):
+        self.client.force_authenticate(self.supplier)
+        response = self.client.get("/payment/payouts/history/")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data["available_earnings"], "320.00")
+
+    def test_balance_journal_legs_sum_to_zero_and_match_balances(self):
+        PayoutBatchService(service=self.service, rate_per_second=0).schedule_run()
+
+        self.assertEqual(BalanceService.unbalanced_transactions(), [])
+        self.assertEqual(BalanceService.find_drift(), [])
+        totals = BalanceService.journal_totals([self.supplier.id])[str(self.supplier.id)]
+        self.assertEqual(totals["reserved"], Decimal("320.00"))
+
+    def test_check_balances_reports_and_fixes_drift(self):
+        UserBalance.objects.filter(user=self.supplier).update(available=Decimal("1.00"))
+
+        drift = BalanceService.find_drift()
+        self.assertEqual(len(drift), 1)
+        self.assertEqual(drift[0].expected, Decimal("320.00"))
+
+        call_command("check_balances", "--fix", stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(BalanceService.available_for(self.supplier), Decimal("320.00"))
+        self.assertEqual(BalanceService.find_drift(), [])
+
+    def test_reversing_refunded_payment_removes_available_earnings(self):
+        payment = Payment.objects.get(provider_reference="TXN-RUN-0")
+
+        reversed_total = self.service.reverse_settlement_earnings(payment)
+
+        self.assertEqual(reversed_total, Decimal("216.00"))
+        self.assertEqual(payment.earnings.filter(status=Earning.Status.REVERSED).count(), 2)
+        self.assertEqual(BalanceService.available_for(self.supplier), Decimal("160.00"))
+        self.assertEqual(BalanceService.find_drift(), [])
+
+
+class LedgerExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user(
+            email="finance@shop.com",
+            password="Pass123!",
+            role="CUSTOMER",
+            is_staff=True,
+        )
+        owner = User.objects.create_user(email="owner_ledger@shop.com", password="Pass123!", role="SHOP_OWNER")
+        shop = Shop.objects.create(name="Ledger Shop", owner=owner)
+        self.order = Order.objects.create(
+            order_number="ORD-LEDGER-001",
+            user=self.admin,
+            shop=shop,
+            status=Order.Status.DELIVERED,
+            subtotal=Decimal("100.00"),
+            total_amount=Decimal("100.00"),
+            payment_method="santimpay",
+            delivery_address="addr",
+        )
+        LedgerEntry.objects.create(
+            order=self.order,
+            entry_type=LedgerEntry.EntryType.PAYMENT,
+            amount=Decimal("100.00"),
+            description="Customer payment",
+        )
+        LedgerEntry.objects.create(
+            order=self.order,
+            entry_type=LedgerEntry.EntryType.COMMISSION,
+            amount=Decimal("5.00"),
+            description='Platform fee, "standard"',
+        )
+
+    def test_csv_export_streams_all_entries(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get("/payment/ledger/export/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.DictReader(StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1]["order_number"], "ORD-LEDGER-001")
+        self.assertEqual(rows[1]["description"], 'Platform fee, "standard"')
+
+    def test_ndjson_export_filters_by_entry_type_and_date(self):
+        self.client.force_authenticate(self.admin)
+        today = timezone.localdate().isoformat()
+        response = self.client.get(
+            f"/payment/ledger/export/?file_format=ndjson&entry_type=COMMISSION&start={today}&end={today}"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0])["amount"], "5.00")
+
+        tomorrow = (timezone.localdate() + timedelta(days=1)).isoformat()
+        response = self.client.get(f"/payment/ledger/export/?file_format=ndjson&start={tomorrow}")
+        self.assertEqual(b"".join(response.streaming_content), b"")
+
+    def test_export_rejects_unknown_filters_and_non_staff(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get("/payment/ledger/export/?entry_type=BOGUS")
+        self.assertEqual(response.status_code, 400)
+
+        self.client.force_authenticate(self.order.shop.owner)
+        response = self.client.get("/payment/ledger/export/")
+        self.assertEqual(response.status_code, 403)
+
+    def test_export_ledger_command_writes_csv(self):
+        out = StringIO()
+        call_command("export_ledger", "--entry-type", "PAYMENT", stdout=out)
+        rows = list(csv.DictReader(StringIO(out.getvalue())))
+        self.assertEqual([row["entry_type"] for row in rows], ["PAYMENT"])
@@ -7,6 +7,7 @@ urlpatterns = [
     path("webhook/santimpay/", SantimPayWebhookView.as_view(), name="santimpay-webhook"),
     path("payouts/request/", PayoutRequestView.as_view(), name="payout-request"),
     path("payouts/history/", PayoutHistoryView.as_view(), name="payout-history"),
+    path("ledger/export/", LedgerExportView.as_view(), name="ledger-export"),
     # Refunds
     path("refunds/", RefundListCreateView.as_view(), name="refund-list-create"),
     path("refunds/request/", RefundListCreateView.as_view(), name="refund-request"),
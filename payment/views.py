@@ -1,10 +1,9 @@
 # payments/views/webhook.py
 import json
 import logging
-from decimal import Decimal
 from django.conf import settings
 from django.db import transaction
-from django.http import HttpRequest, JsonResponse
+from django.http import HttpRequest, JsonResponse, StreamingHttpResponse
 from django.utils.decorators import method_decorator
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
@@ -23,7 +22,10 @@ from django.shortcuts import get_object_or_404
 
 from courier.services import create_shipment_for_order, LogisticsError
 from order.models import Order
-from payment.models import Earning, Payment, PayoutRequest, Refund, WebhookLog
+from payment.models import Payment, PayoutRequest, Refund, WebhookLog
+from payment.services.balances import BalanceService
+from payment.services.exports import LedgerExporter
+from payment.services.refunds import RefundQueue
 from payment.services.service import (
     PaymentConfigurationError,
     PaymentGatewayError,
@@ -31,7 +33,7 @@ from payment.services.service import (
     PaymentServiceError,
 )
 from marketer.services import MarketerCommissionService
-from notifications.services import NotificationService, NotificationTemplates
+from notifications.services import NotificationRequest, NotificationService, NotificationTemplates
 from analytics.services import AnalyticsService
 
 
@@ -197,33 +199,8 @@ class RefundExecuteView(APIView):
         if refund.status != Refund.Status.APPROVED:
             return Response({"detail": "Only approved refunds can be executed"}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            merchant_id = _get_platform_merchant_id()
-            service = PaymentService(merchant_id=merchant_id)
-            target_user = refund.requested_by or refund.payment.user
-            payout_info = service._resolve_payout_target(target_user)
-            phone = payout_info.get("account")
-            method = payout_info.get("method")
-            tx_id = f"REF-{refund.payment.id}-{refund.id.hex[:8].upper()}"
-            response = service.payout_to_customer(
-                amount=refund.amount,
-                payment_reason=refund.reason or f"Refund for order {refund.payment.order.order_number}",
-                phone_number=phone,
-                payment_method=method,
-                tx_id=tx_id,
-            )
-            refund.provider_reference = response.get("id")
-            refund.status = Refund.Status.PROCESSING
-            metadata = dict(refund.metadata or {})
-            metadata.setdefault("provider_response", {})
-            metadata["provider_response"].update(response)
-            refund.metadata = metadata
-            refund.save(update_fields=["provider_reference", "status", "metadata", "updated_at"])
-            return Response(RefundSerializer(refund).data)
-        except PaymentServiceError as exc:
-            return Response({"detail": str(exc)}, status=status.HTTP_502_BAD_GATEWAY)
-        except Exception as exc:
-            return Response({"detail": str(exc)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        RefundQueue.enqueue(refund)
+        return Response(RefundSerializer(refund).data, status=status.HTTP_202_ACCEPTED)
 
 
 class PayoutRequestView(APIView):
@@ -232,8 +209,7 @@ class PayoutRequestView(APIView):
     def post(self, request):
         serializer = PayoutCreateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        has_available = Earning.objects.filter(user=request.user, status=Earning.Status.AVAILABLE).exists()
-        if not has_available:
+        if BalanceService.available_for(request.user) <= 0:
             return Response({"detail": "No available earnings to payout"}, status=status.HTTP_400_BAD_REQUEST)
         try:
             merchant_id = _get_platform_merchant_id()
@@ -258,8 +234,10 @@ class PayoutHistoryView(APIView):
         else:
             queryset = PayoutRequest.objects.select_related("payment", "order").filter(user=request.user).order_by("-created_at")
         data = PayoutRequestSerializer(queryset, many=True).data
-        summary_qs = Earning.objects.filter(user=request.user, status=Earning.Status.AVAILABLE) if not request.user.is_staff else Earning.objects.filter(status=Earning.Status.AVAILABLE)
-        available_total = sum((e.amount for e in summary_qs), Decimal("0.00"))
+        if request.user.is_staff:
+            available_total = BalanceService.total_available()
+        else:
+            available_total = BalanceService.available_for(request.user)
         return Response(
             {
                 "available_earnings": str(available_total),
@@ -269,9 +247,57 @@ class PayoutHistoryView(APIView):
 
 
 
+class LedgerExportView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        file_format = request.query_params.get("file_format", "csv")
+        try:
+            exporter = LedgerExporter(
+                start=LedgerExporter.parse_bound(request.query_params.get("start")),
+                end=LedgerExporter.parse_bound(request.query_params.get("end"), end=True),
+                entry_types=request.query_params.getlist("entry_type"),
+            )
+            content_type = exporter.content_type(file_format)
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(exporter.stream(file_format), content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="ledger.{file_format}"'
+        return response
+
 
 logger = logging.getLogger(__name__)
 
+
+def _payment_success_notifications(order, commissions):
+    """Customer, shop owner, supplier and marketer notifications for a newly paid order."""
+    items = list(order.items.select_related("product__supplier", "variant__product__supplier"))
+    requests = [
+        NotificationRequest.from_template(
+            order.user,
+            NotificationTemplates.payment_success(order, items_count=len(items)),
+        ),
+        NotificationRequest.from_template(order.shop.owner, NotificationTemplates.payment_confirmed(order)),
+    ]
+    suppliers = {}
+    for item in items:
+        product = item.product if item.product else (item.variant.product if item.variant else None)
+        supplier = getattr(product, "supplier", None) if product else None
+        if supplier and supplier.id not in suppliers:
+            suppliers[supplier.id] = (supplier, product)
+    for supplier, product in suppliers.values():
+        requests.append(NotificationRequest.from_template(supplier, NotificationTemplates.product_sold(order, product)))
+    for commission in commissions:
+        requests.append(
+            NotificationRequest.from_template(
+                commission.contract.marketer,
+                NotificationTemplates.commission_created(order, commission),
+            )
+        )
+    return requests
+
+
 @method_decorator(csrf_exempt, name="dispatch")
 class SantimPayWebhookView(View):
     """
@@ -347,55 +373,12 @@ class SantimPayWebhookView(View):
                         except Exception:
                             logger.exception("Failed to update analytics for order=%s", order.id)
                         try:
-                            title, message, payload = NotificationTemplates.payment_success(order)
-                            NotificationService.notify(
-                                user=order.user,
-                                notification_type="payment_success",
-                                title=title,
-                                message=message,
-                                payload=payload,
-                            )
-                        except Exception:
-                            logger.exception("Failed to send payment_success notification order=%s", order.id)
-                        try:
-                            title, message, payload = NotificationTemplates.payment_confirmed(order)
-                            NotificationService.notify(
-                                user=order.shop.owner,
-                                notification_type="payment_confirmed",
-                                title=title,
-                                message=message,
-                                payload=payload,
-                            )
-                        except Exception:
-                            logger.exception("Failed to send payment_confirmed notification order=%s", order.id)
-                        try:
-                            for item in order.items.select_related("product__supplier", "variant__product__supplier").all():
-                                product = item.product if item.product else (item.variant.product if item.variant else None)
-                                supplier = getattr(product, "supplier", None) if product else None
-                                if not supplier:
-                                    continue
-                                title, message, payload = NotificationTemplates.product_sold(order, product)
-                                NotificationService.notify(
-                                    user=supplier,
-                                    notification_type="product_sold",
-                                    title=title,
-                                    message=message,
-                                    payload=payload,
-                                )
-                        except Exception:
-                            logger.exception("Failed to send supplier product_sold notifications order=%s", order.id)
-                        try:
-                            for commission in created_commissions:
-                                title, message, payload = NotificationTemplates.commission_created(order, commission)
-                                NotificationService.notify(
-                                    user=commission.contract.marketer,
-                                    notification_type="commission_created",
-                                    title=title,
-                                    message=message,
-                                    payload=payload,
+                            with NotificationTemplates.session():
+                                NotificationService.notify_many(
+                                    _payment_success_notifications(order, created_commissions)
                                 )
                         except Exception:
-                            logger.exception("Failed to send commission_created notifications order=%s", order.id)
+                            logger.exception("Failed to send payment notifications order=%s", order.id)
                         if order.delivery_method == Order.DeliveryMethod.COURIER:
                             try:
                                 create_shipment_for_order(order)
@@ -0,0 +1,177 @@
+import time
+import tracemalloc
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from account.models import User
+from analytics.models import AnalyticsRollup
+from analytics.rollup import ALL_TIME, day_start, month_start
+from catalog.models import Product
+from order.models import Order, OrderItem
+from payment.services.balances import BalanceService
+from shop.models import Shop
+from supliers.views import SupplierDashboardView
+
+PRICE = Decimal("100.00")
+SUPPLIER_PRICE = Decimal("60.00")
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the supplier dashboard read from rollups with a scan of the supplier's order items "
+        "at several sales volumes. Each size is seeded inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1000,100000,1000000", help="Comma separated order item counts.")
+        parser.add_argument("--items-per-order", type=int, default=10)
+        parser.add_argument("--days", type=int, default=365, help="Days the seeded sales are spread over.")
+        parser.add_argument("--skip-scan", action="store_true", help="Only time the rollup-backed view.")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options["sizes"].split(",") if size.strip()]
+        except ValueError:
+            raise CommandError("--sizes must be comma separated integers.")
+        if not sizes or min(sizes) <= 0 or options["items_per_order"] <= 0 or options["days"] <= 0:
+            raise CommandError("--sizes, --items-per-order and --days must be greater than 0.")
+
+        for size in sizes:
+            try:
+                with transaction.atomic():
+                    self._run(size, options)
+                    raise _Rollback
+            except _Rollback:
+                pass
+
+    def _run(self, size, options):
+        seed_started = time.perf_counter()
+        supplier = _seed(size, options["items_per_order"], options["days"])
+        seeded = time.perf_counter() - seed_started
+
+        view = SupplierDashboardView.as_view()
+        request = APIRequestFactory().get("/supliers/dashboard/")
+        force_authenticate(request, user=supplier)
+        # Cold: the dashboard cache is empty, so the rollup buckets are read.
+        cold = _measure(lambda: view(request))
+        warm = _measure(lambda: view(request))
+        self.stdout.write(f"items={size} seeded_in={seeded:.1f}s")
+        self.stdout.write(f"  rollup-cold {cold}")
+        self.stdout.write(f"  rollup-warm {warm}")
+        if not options["skip_scan"]:
+            self.stdout.write(f"  item-scan   {_measure(lambda: _scan(supplier))}")
+
+
+def _measure(fn):
+    tracemalloc.start()
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return f"seconds={elapsed:.4f} queries={len(queries)} peak_kib={peak / 1024:.0f}"
+
+
+def _scan(supplier):
+    """The previous dashboard: every supplier order item loaded and summed in Python."""
+    items = list(
+        OrderItem.objects.select_related("order", "product", "variant__product").filter(
+            Q(product__supplier=supplier) | Q(variant__product__supplier=supplier)
+        )
+    )
+    total = Decimal("0.00")
+    for item in items:
+        total += (item.product.supplier_price or item.price) * item.quantity
+    return total
+
+
+def _seed(size, items_per_order, days):
+    stamp = int(time.time())
+    supplier = User.objects.create_user(email=f"bench-supplier-{stamp}-{size}@example.com", role="SUPPLIER")
+    customer = User.objects.create_user(email=f"bench-customer-{stamp}-{size}@example.com", role="CUSTOMER")
+    owner = User.objects.create_user(email=f"bench-owner-{stamp}-{size}@example.com", role="SHOP_OWNER")
+    shop = Shop.objects.create(name=f"Bench Shop {stamp}-{size}", owner=owner)
+    product = Product.objects.create(
+        name="Bench Product",
+        shop=shop,
+        supplier=supplier,
+        price=PRICE,
+        supplier_price=SUPPLIER_PRICE,
+        minimum_wholesale_quantity=1,
+    )
+
+    today = timezone.localdate()
+    per_day = {}
+    order_count = -(-size // items_per_order)
+    for start in range(0, order_count, 5000):
+        orders = Order.objects.bulk_create(
+            [
+                Order(
+                    order_number=f"B{size}-{index}",
+                    user=customer,
+                    shop=shop,
+                    status=Order.Status.PAID,
+                    subtotal=PRICE * items_per_order,
+                    total_amount=PRICE * items_per_order,
+                    payment_method="santimpay",
+                    delivery_address="bench",
+                )
+                for index in range(start, min(start + 5000, order_count))
+            ]
+        )
+        items = []
+        for offset, order in enumerate(orders):
+            lines = min(items_per_order, size - (start + offset) * items_per_order)
+            day = today - timedelta(days=(start + offset) % days)
+            revenue, units, orders_count = per_day.get(day, (Decimal("0.00"), 0, 0))
+            per_day[day] = (revenue + SUPPLIER_PRICE * lines, units + lines, orders_count + 1)
+            items += [
+                OrderItem(
+                    order=order,
+                    product=product,
+                    product_name=product.name,
+                    sku=product.sku or "",
+                    price=PRICE,
+                    quantity=1,
+                    total=PRICE,
+                )
+                for _ in range(lines)
+            ]
+        OrderItem.objects.bulk_create(items, batch_size=5000)
+
+    # The buckets rollup_analytics would have produced for these sales.
+    buckets = {}
+    for day, values in per_day.items():
+        for granularity, start in (("day", day_start(day)), ("month", month_start(day)), ("all", ALL_TIME)):
+            revenue, units, orders_count = buckets.get((granularity, start), (Decimal("0.00"), 0, 0))
+            buckets[(granularity, start)] = (revenue + values[0], units + values[1], orders_count + values[2])
+    AnalyticsRollup.objects.bulk_create(
+        [
+            AnalyticsRollup(
+                scope=AnalyticsRollup.Scope.SUPPLIER,
+                subject_id=str(supplier.id),
+                granularity=granularity,
+                bucket_start=start,
+                revenue=revenue,
+                units_sold=units,
+                orders_count=orders_count,
+            )
+            for (granularity, start), (revenue, units, orders_count) in buckets.items()
+        ],
+        batch_size=1000,
+    )
+    total = sum((values[0] for values in per_day.values()), Decimal("0.00"))
+    BalanceService.record_earnings({supplier.id: total})
+    return supplier
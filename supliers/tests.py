@@ -1,10 +1,15 @@
 from decimal import Decimal
 
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
 from rest_framework.test import APIClient
 
 from account.models import User
+from analytics.models import AnalyticsRollup
+from analytics.rollup import ALL_TIME, month_start
 from catalog.models import Product, ProductVariant
+from payment.services.balances import BalanceService
 
 
 class SupplierAPITests(TestCase):
@@ -106,3 +111,31 @@ class SupplierAPITests(TestCase):
         self.assertIn("this_month_revenue", response.data)
         self.assertEqual(len(response.data["cards"]), 5)
 
+    def test_supplier_dashboard_reads_rollups_and_balance(self):
+        cache.clear()
+        for granularity, bucket_start, revenue in (
+            (AnalyticsRollup.Granularity.ALL, ALL_TIME, Decimal("900.00")),
+            (AnalyticsRollup.Granularity.MONTH, month_start(timezone.localdate()), Decimal("300.00")),
+        ):
+            AnalyticsRollup.objects.create(
+                scope=AnalyticsRollup.Scope.SUPPLIER,
+                subject_id=str(self.supplier.id),
+                granularity=granularity,
+                bucket_start=bucket_start,
+                revenue=revenue,
+                units_sold=15,
+                orders_count=4,
+            )
+        BalanceService.record_earnings({self.supplier.id: Decimal("900.00")})
+        BalanceService.reserve({self.supplier.id: Decimal("200.00")})
+        self.client.force_authenticate(user=self.supplier)
+
+        with self.assertNumQueries(2):
+            response = self.client.get("/supliers/dashboard/")
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data["total_earnings"], "900.00")
+        self.assertEqual(response.data["pending_payout"], "700.00")
+        self.assertEqual(response.data["this_month_revenue"], "300.00")
+        self.assertEqual((response.data["total_units_sold"], response.data["orders_supplied"]), (15, 4))
+
@@ -1,7 +1,7 @@
 from django.urls import path
 
-from analytics.api import SupplierAnalyticsDashboardView
 from .views import (
+    SupplierDashboardView,
     SupplierLowStockAlertView,
     SupplierProductDetailView,
     SupplierProductListCreateView,
@@ -12,7 +12,7 @@ from .views import (
 
 
 urlpatterns = [
-    path("dashboard/", SupplierAnalyticsDashboardView.as_view(), name="supplier-dashboard"),
+    path("dashboard/", SupplierDashboardView.as_view(), name="supplier-dashboard"),
     path("products/", SupplierProductListCreateView.as_view(), name="supplier-products"),
     path("products/<uuid:pk>/", SupplierProductDetailView.as_view(), name="supplier-product-detail"),
     path("products/<uuid:pk>/variants/", SupplierProductVariantCreateView.as_view(), name="supplier-product-variants"),
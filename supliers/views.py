@@ -1,15 +1,15 @@
 from decimal import Decimal
 
-from django.db.models import Q
-from django.utils import timezone
 from rest_framework import permissions, status
 from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIView
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from analytics.cache import DashboardCache
+from analytics.models import AnalyticsRollup
+from analytics.selectors import get_supplier_analytics
 from catalog.models import Product, ProductMedia, ProductVariant
-from order.models import Order, OrderItem
-from payment.models import Earning, Payment
+from payment.services.balances import BalanceService
 
 from .serializers import (
     SupplierDashboardSerializer,
@@ -25,97 +25,45 @@ class IsSupplier(permissions.BasePermission):
         return bool(request.user and request.user.is_authenticated and request.user.role == "SUPPLIER")
 
 
-def _supplier_order_items(user):
-    return OrderItem.objects.select_related("order", "product", "variant__product").filter(
-        Q(product__supplier=user) | Q(variant__product__supplier=user)
-    )
+def _money(value) -> Decimal:
+    return Decimal(str(value or "0")).quantize(Decimal("0.01"))
 
 
 class SupplierDashboardView(APIView):
+    """
+    Supplier earnings cards from the supplier rollups and the materialized balance.
+
+    Sales figures come from the cached supplier dashboard buckets (all-time and
+    current month AnalyticsRollup rows) and money from UserBalance, so a
+    request costs at most two queries however many items the supplier sold.
+    """
+
     permission_classes = [permissions.IsAuthenticated, IsSupplier]
 
     def get(self, request):
         supplier = request.user
-        sale_statuses = {
-            Order.Status.PAID,
-            Order.Status.CONFIRMED,
-            Order.Status.PROCESSING,
-            Order.Status.SHIPPED,
-            Order.Status.DELIVERED,
-        }
-        orders_supplied_statuses = sale_statuses | {Order.Status.REFUNDED}
-
-        items = list(_supplier_order_items(supplier))
-        if not items:
-            payload = {
-                "total_earnings": Decimal("0.00"),
-                "total_units_sold": 0,
-                "orders_supplied": 0,
-                "pending_payout": Decimal("0.00"),
-                "this_month_revenue": Decimal("0.00"),
-                "cards": [
-                    {"title": "💰 Total Earnings", "value": "0.00"},
-                    {"title": "📦 Total Units Sold", "value": 0},
-                    {"title": "🛒 Orders Supplied", "value": 0},
-                    {"title": "⏳ Pending Payout", "value": "0.00"},
-                    {"title": "📊 This Month Revenue", "value": "0.00"},
-                ],
-            }
-            return Response(SupplierDashboardSerializer(payload).data)
-
-        order_ids = {item.order_id for item in items}
-        payment_map = {}
-        for payment in Payment.objects.filter(order_id__in=order_ids).order_by("-created_at"):
-            payment_map.setdefault(payment.order_id, payment)
-
-        now = timezone.now()
-        month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-
-        total_earnings = Decimal("0.00")
-        total_units_sold = 0
-        pending_payout = Decimal("0.00")
-        this_month_revenue = Decimal("0.00")
-        supplied_orders = set()
-
-        for item in items:
-            product = item.product if item.product else (item.variant.product if item.variant else None)
-            if not product:
-                continue
-            order = item.order
-            line_amount = (product.supplier_price if product.supplier_price is not None else item.price) * item.quantity
-
-            if order.status in orders_supplied_statuses:
-                supplied_orders.add(order.id)
-
-            if order.status in sale_statuses:
-                total_earnings += Decimal(str(line_amount))
-                total_units_sold += int(item.quantity)
-                if order.created_at >= month_start:
-                    this_month_revenue += Decimal(str(line_amount))
-
-                payment = payment_map.get(order.id)
-                if payment and payment.status == Payment.Status.COMPLETED:
-                    pass
-
-        earning_rows = Earning.objects.filter(user=supplier)
-        total_earnings = sum((row.amount for row in earning_rows), Decimal("0.00"))
-        pending_payout = sum(
-            (row.amount for row in earning_rows.filter(status=Earning.Status.AVAILABLE)),
-            Decimal("0.00"),
+        analytics, _ = DashboardCache.get(
+            AnalyticsRollup.Scope.SUPPLIER,
+            supplier.id,
+            lambda: get_supplier_analytics(supplier),
         )
+        balance = BalanceService.balance_for(supplier)
+        total_earnings = _money(balance.available + balance.reserved + balance.paid_out)
+        pending_payout = _money(balance.available)
+        this_month_revenue = _money(analytics["this_month_revenue"])
 
         payload = {
-            "total_earnings": total_earnings.quantize(Decimal("0.01")),
-            "total_units_sold": total_units_sold,
-            "orders_supplied": len(supplied_orders),
-            "pending_payout": pending_payout.quantize(Decimal("0.01")),
-            "this_month_revenue": this_month_revenue.quantize(Decimal("0.01")),
+            "total_earnings": total_earnings,
+            "total_units_sold": analytics["units_sold"],
+            "orders_supplied": analytics["orders_count"],
+            "pending_payout": pending_payout,
+            "this_month_revenue": this_month_revenue,
             "cards": [
-                {"title": "💰 Total Earnings", "value": str(total_earnings.quantize(Decimal("0.01")))},
-                {"title": "📦 Total Units Sold", "value": total_units_sold},
-                {"title": "🛒 Orders Supplied", "value": len(supplied_orders)},
-                {"title": "⏳ Pending Payout", "value": str(pending_payout.quantize(Decimal("0.01")))},
-                {"title": "📊 This Month Revenue", "value": str(this_month_revenue.quantize(Decimal("0.01")))},
+                {"title": "💰 Total Earnings", "value": str(total_earnings)},
+                {"title": "📦 Total Units Sold", "value": analytics["units_sold"]},
+                {"title": "🛒 Orders Supplied", "value": analytics["orders_count"]},
+                {"title": "⏳ Pending Payout", "value": str(pending_payout)},
+                {"title": "📊 This Month Revenue", "value": str(this_month_revenue)},
             ],
         }
         return Response(SupplierDashboardSerializer(payload).data)